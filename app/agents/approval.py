@@ -4,6 +4,7 @@ from typing import Dict, Any, List
 from app.database import db
 from app.models.invoice import InvoiceStatus, InvoiceData
 from app.models.config import ApprovalRule
+from app.models.policy import ApprovalIndex
 from app.tools.notification_tool import notification_tool
 
 logger = logging.getLogger(__name__)
@@ -32,13 +33,13 @@ class ApprovalAgent:
             data: InvoiceData = InvoiceData(**invoice.data.model_dump())
             amount = data.total
             
-            # 1. Fetch Matrix
-            config = await db.config.get_by_field("company_id", company_id)
-            if not config:
+            # 1. Resolve approvers from the tenant's compiled approval matrix
+            policy = await db.config.get_policy(company_id)
+            if not policy:
                 logger.warning("No config found, routing to default admin")
                 approvers = ["admin"]
             else:
-                approvers = self._determine_approvers(amount, config.approval_matrix.rules)
+                approvers = policy.approvers_for(amount)
             
             # 2. SoD Check (Mock: ensure creator != approver)
             # In real system, we'd check audit logs for who uploaded/created
@@ -63,11 +64,15 @@ class ApprovalAgent:
             # 4. Update State
             # We don't change 'status' here if it's already AWAITING_APPROVAL or passed in to become so.
             # But the node responsibility is to ensure it IS awaiting approval.
-            await db.invoices.update(invoice_id, {
-                "status": InvoiceStatus.AWAITING_APPROVAL,
-                "human_approval_required": True
-                # Store assigned_approvers in DB ideally
-            })
+            updated = await db.invoices.transition(
+                invoice_id, invoice.status, InvoiceStatus.AWAITING_APPROVAL,
+                {"human_approval_required": True}, # Store assigned_approvers in DB ideally
+                expected_version=invoice.version
+            )
+            if not updated:
+                logger.warning(f"Invoice {invoice_id} was modified concurrently, skipping approval routing")
+                state["errors"] = [f"Stale transition for {invoice_id}"]
+                return state
             
             state["current_state"] = InvoiceStatus.AWAITING_APPROVAL
             state["human_approval_required"] = True
@@ -82,19 +87,9 @@ class ApprovalAgent:
     def _determine_approvers(self, amount: float, rules: List[ApprovalRule]) -> List[str]:
         """
         Matches amount against rules to find approvers.
+        Routing uses the tenant's cached policy; this compiles an ad-hoc index for one-off checks.
         """
-        required = set()
-        for rule in rules:
-            # Check min
-            if amount >= rule.amount_min:
-                # Check max (if None, it's infinity)
-                if rule.amount_max is None or amount <= rule.amount_max:
-                    if rule.specific_approvers:
-                        required.update(rule.specific_approvers)
-                    elif rule.required_role:
-                        # In real app, look up users by role
-                        required.add(f"role:{rule.required_role}")
-        
-        return list(required)
+        # Roles resolve to "role:<name>"; in real app, look up users by role
+        return sorted(ApprovalIndex(rules).approvers_for(amount))
 
 approval_agent = ApprovalAgent()
@@ -3,11 +3,16 @@ import json
 import io
 from typing import Dict, Any, Optional
 from datetime import datetime
+from pymongo.errors import DuplicateKeyError
 
 from app.database import db
 from app.models.invoice import Invoice, InvoiceStatus, InvoiceData, ValidationResults
+from app.models.policy import DEFAULT_POLICY
 from app.tools.ocr_tool import ocr_tool
 from app.tools.groq_llm import groq_tool
+from app.tools.duplicate_detector import duplicate_fingerprint
+from app.tools.minhash import line_item_signature, lsh_bands
+from app.tools.velocity import velocity_tracker
 from app.memory.context_manager import context_manager
 
 logger = logging.getLogger(__name__)
@@ -34,7 +39,8 @@ Required Output Schema (JSON):
             "unit_price": float,
             "line_total": float,
             "gl_code": "string (optional)",
-            "category": "string (optional)"
+            "category": "string (optional)",
+            "tax_code": "S | R | Z | E | O (optional; standard 20%, reduced 5%, zero, exempt, outside scope)"
         }}
     ],
     "subtotal": float,
@@ -78,8 +84,14 @@ class ExtractionAgent:
                  # Already processing? 
                  pass
 
-            # Update status
-            await db.invoices.update(invoice_id, {"status": InvoiceStatus.EXTRACTION, "previous_state": invoice.status})
+            # Claim the invoice for extraction (rejects concurrent retries)
+            invoice = await db.invoices.transition(
+                invoice_id, invoice.status, InvoiceStatus.EXTRACTION, expected_version=invoice.version
+            )
+            if not invoice:
+                logger.warning(f"Invoice {invoice_id} was modified concurrently, skipping extraction")
+                state["errors"] = [f"Stale transition for {invoice_id}"]
+                return state
 
             # 2. Get File Content
             # Assuming file_path stores GridFS ID
@@ -109,12 +121,9 @@ class ExtractionAgent:
                 logger.warning(f"OCR yielded no text for {invoice_id}")
                 # Could flag as manual review needed
                 state["errors"] = ["OCR Extracted Empty Text"]
-                await db.invoices.update(invoice_id, {"status": InvoiceStatus.EXCEPTION})
+                await db.invoices.transition(invoice_id, InvoiceStatus.EXTRACTION, InvoiceStatus.EXCEPTION)
                 return state
 
-            # Store raw text
-            await db.invoices.update(invoice_id, {"raw_text": raw_text})
-
             # 4. LLM Extraction
             state["raw_text"] = raw_text
             context = await context_manager.prepare_context_for_llm(state, "EXTRACTION: Extract invoice fields")
@@ -129,11 +138,41 @@ class ExtractionAgent:
                 # Recalculate totals check
                 calc_total = invoice_data.calculate_totals()
                 
-                # Update Invoice
-                await db.invoices.update(invoice_id, {
-                    "data": invoice_data.dict(),
-                    "status": InvoiceStatus.VALIDATION # Move to next stage
-                })
+                # Link the canonical vendor so copies of this invoice share a duplicate fingerprint.
+                # Exact matches only: a linked vendor_id is what validation approves and payment pays.
+                vendor = await db.vendors.resolve(invoice.company_id, vendor_id=invoice_data.vendor_id,
+                                                  name=invoice_data.vendor_name, fuzzy=False)
+                if vendor:
+                    invoice_data.vendor_id = vendor.vendor_id
+
+                # Update Invoice and store raw text, moving to next stage
+                fields = {
+                    "data": invoice_data.model_dump(),
+                    "raw_text": raw_text,
+                    "duplicate_fingerprint": duplicate_fingerprint(
+                        invoice.company_id, invoice_data.vendor_name, invoice_data.invoice_number, invoice_data.vendor_id
+                    )
+                }
+                # Line-item signature for the fuzzy duplicate search
+                signature = line_item_signature(invoice_data.line_items)
+                if signature:
+                    fields["line_item_minhash"] = signature
+                    fields["line_item_lsh"] = lsh_bands(signature)
+                try:
+                    await db.invoices.transition(invoice_id, InvoiceStatus.EXTRACTION, InvoiceStatus.VALIDATION,
+                                                 fields, expected_version=invoice.version)
+                except DuplicateKeyError:
+                    # A live invoice already holds the fingerprint; validation flags this one as its duplicate
+                    del fields["duplicate_fingerprint"]
+                    await db.invoices.transition(invoice_id, InvoiceStatus.EXTRACTION, InvoiceStatus.VALIDATION,
+                                                 fields, expected_version=invoice.version)
+
+                # Count the invoice towards its vendor's velocity before validation scores it
+                policy = await db.config.get_policy(invoice.company_id) or DEFAULT_POLICY
+                await velocity_tracker.record(invoice_id, invoice.company_id, invoice_data.vendor_name,
+                                              invoice_data.vendor_id, invoice_data.total, invoice.created_at, policy)
+                await db.vendor_features.record_invoice(invoice_id, invoice.company_id, invoice_data.vendor_name,
+                                                        invoice_data.vendor_id, invoice_data.total, invoice_data.vat_rate, vendor)
                 
                 # Update State
                 state["invoice_data"] = invoice_data.model_dump()
@@ -145,7 +184,7 @@ class ExtractionAgent:
                 logger.error(f"Validation of extracted data failed: {e}")
                 state["errors"] = [f"Data validation failed: {e}"]
                 # Flag for manual review?
-                await db.invoices.update(invoice_id, {"status": InvoiceStatus.EXCEPTION})
+                await db.invoices.transition(invoice_id, InvoiceStatus.EXTRACTION, InvoiceStatus.EXCEPTION, {"raw_text": raw_text})
 
         except Exception as e:
             logger.error(f"Extraction process failed: {e}")
@@ -3,9 +3,11 @@ from typing import Dict, Any, List, Optional, Tuple
 from datetime import datetime
 
 from app.database import db
-from app.models.invoice import InvoiceStatus, InvoiceData, MatchingResults, LineItem
+from app.models.invoice import Invoice, InvoiceStatus, InvoiceData, MatchingResults, LineItem
 from app.models.purchase_order import PurchaseOrder
-from app.models.grn import GoodsReceiptNote
+from app.models.grn import ReceivedLine
+from app.models.policy import DEFAULT_POLICY, TenantPolicy
+from app.tools.matching_engine import three_way_match
 
 logger = logging.getLogger(__name__)
 
@@ -45,45 +47,47 @@ class MatchingAgent:
                 logger.info(f"No PO reference for {invoice_id}")
                 
                 # Check if PO required for this amount
-                config = await db.config.get_by_field("company_id", company_id)
-                require_po_limit = config.validation_rules.require_po_above if config else 0
+                policy = await db.config.get_policy(company_id)
+                require_po_limit = policy.require_po_above if policy else 0
                 
                 if data.total > require_po_limit:
                     msg = "Non-PO invoice above threshold. Manager approval required."
                     # Route to AWAITING_APPROVAL instead of EXCEPTION
                     # The Approval Node/UI handles strict approval
-                    await self._update_invoice(invoice_id, InvoiceStatus.AWAITING_APPROVAL, 
+                    await self._update_invoice(invoice, InvoiceStatus.AWAITING_APPROVAL, 
                                                MatchingResults(has_po=False, match_status="NON_PO_APPROVAL_NEEDED", details=msg))
                     state["current_state"] = InvoiceStatus.AWAITING_APPROVAL
                     state["matching_results"] = {"has_po": False, "match_status": "NON_PO_APPROVAL_NEEDED", "details": msg}
                     return state
                 else:
                     # Small enough to bypass PO? -> Go to Approval Routing
-                    await self._update_invoice(invoice_id, InvoiceStatus.APPROVAL_ROUTING,
+                    await self._update_invoice(invoice, InvoiceStatus.APPROVAL_ROUTING,
                                                 MatchingResults(has_po=False, match_status="NO_PO_ALLOWED", auto_approvable=False))
                     state["current_state"] = InvoiceStatus.APPROVAL_ROUTING
                     state["matching_results"] = {"has_po": False, "match_status": "NO_PO_ALLOWED"}
                     return state
 
-            # 3. Fetch PO
-            po = await db.db["purchase_orders"].find_one({"po_number": po_number, "company_id": company_id})
-            if not po:
+            # A re-matched invoice gives back what it drew last time before drawing again
+            if invoice.matching and invoice.matching.po_usage:
+                await self.release_po_usage(invoice_id, invoice.company_id)
+
+            # 3. Fetch PO with quantities received against it
+            found = await db.purchase_orders.get_with_receipts(po_number, company_id)
+            if not found:
                 msg = f"PO {po_number} not found"
-                await self._update_invoice(invoice_id, InvoiceStatus.EXCEPTION,
+                await self._update_invoice(invoice, InvoiceStatus.EXCEPTION,
                                            MatchingResults(has_po=False, match_status="PO_NOT_FOUND", details=msg))
                 state["current_state"] = InvoiceStatus.EXCEPTION
                 return state
                 
-            po_obj = PurchaseOrder(**po)
-            
-            # 4. Fetch GRNs
-            grn_cursor = db.db["goods_receipt_notes"].find({"po_number": po_number, "company_id": company_id})
-            grns = [GoodsReceiptNote(**doc) for doc in await grn_cursor.to_list(100)]
+            po_obj, received = found
             
-            # 5. Perform 3-Way Match
-            match_results = self._three_way_match(data, po_obj, grns, await self._get_tolerances(company_id))
+            # 4. Perform 3-Way Match
+            policy = await self._get_policy(company_id)
+            match_results = self._three_way_match(data, po_obj, received, policy)
+            self._check_po_balance(po_obj, match_results, policy)
             
-            # 6. Determine Next State
+            # 5. Determine Next State
             next_state = InvoiceStatus.APPROVAL_ROUTING
             
             if match_results.match_status == "VARIANCE":
@@ -101,8 +105,13 @@ class MatchingAgent:
             elif match_results.match_status == "FAILED":
                  next_state = InvoiceStatus.EXCEPTION
 
-            # Update DB
-            await self._update_invoice(invoice_id, next_state, match_results)
+            # Update DB. Usage is counted first so a crash leaves the ledger over- rather than under-drawn.
+            await db.purchase_orders.record_usage(po_number, company_id, match_results.po_usage)
+            try:
+                await self._update_invoice(invoice, next_state, match_results)
+            except Exception:
+                await db.purchase_orders.record_usage(po_number, company_id, match_results.po_usage, sign=-1)
+                raise
             
             # Update State
             state["matching_results"] = match_results.model_dump()
@@ -115,93 +124,38 @@ class MatchingAgent:
             
         return state
 
-    async def _update_invoice(self, invoice_id: str, status: str, results: MatchingResults):
-        await db.invoices.update(invoice_id, {
-            "status": status, 
-            "matching": results.model_dump()
-        })
-
-    async def _get_tolerances(self, company_id: str):
-        config = await db.config.get_by_field("company_id", company_id)
-        if config:
-            return config.matching_tolerances
-        # Defaults
-        from app.models.config import MatchingTolerances
-        return MatchingTolerances()
-
-    def _three_way_match(self, invoice: InvoiceData, po: PurchaseOrder, grns: List[GoodsReceiptNote], tolerances: Any) -> MatchingResults:
-        """Core logic for matching amounts and quantities."""
-        
-        results = MatchingResults(has_po=True, match_status="MATCHED", auto_approvable=True)
-        details = []
-        is_variance = False
-        is_fail = False
-        
-        # 1. Total Amount Check
-        # Compare Invoice Total vs PO Total (Note: PO might have multiple invoices, so we should check remaining balance ideally)
-        # For simplicity, we compare Invoice Total vs (Sum of GRN matched items or PO line totals)
-        # Let's verify Unit Prices matches first (Invoice Unit Price vs PO Unit Price)
-        
-        # We need to map invoice lines to PO lines. Assuming description or product code match? 
-        # Or simplistic: check total invoice amount vs PO amount expected for those quantities.
-        
-        # Simple Aggregation Approach:
-        # Expected Total = Sum(Invoice Qty * PO Unit Price)
-        # Actual Total = Invoice Total
-        
-        # Build Item Map from PO
-        po_items_map = {item.description: item.unit_price for item in po.line_items} # Description as key is risky but common in MVP
-        
-        calc_expected_total = 0.0
-        
-        for item in invoice.line_items:
-            expected_price = po_items_map.get(item.description)
-            if expected_price is None:
-                # Item not on PO?
-                # Try fuzzy? Or just fail
-                # For now, assume if not found, it's a variance
-                pass
-            else:
-                # Price Variance Check
-                price_diff_percent = abs(item.unit_price - expected_price) / expected_price * 100
-                if price_diff_percent > tolerances.price_variance_percent:
-                    is_variance = True
-                    details.append(f"Price variance on {item.description}: {price_diff_percent:.2f}%")
-            
-            # Check GRN Quantity
-            # Sum quantity received for this item from all GRNs
-            qty_received = sum(
-                grn_item.quantity 
-                for grn in grns 
-                for grn_item in grn.line_items 
-                if grn_item.description == item.description
-            )
-            
-            # Quantity Variance Check
-            # Invoice Qty vs Received Qty
-            if item.quantity > qty_received:
-                # Invoiced for more than received?
-                is_variance = True
-                details.append(f"Qty variance on {item.description}: Invoiced {item.quantity}, Received {qty_received}")
-                
-            calc_expected_total += item.quantity * (expected_price if expected_price else item.unit_price)
+    async def _update_invoice(self, invoice: Invoice, status: str, results: MatchingResults):
+        updated = await db.invoices.transition(
+            invoice.invoice_id, invoice.status, status, {"matching": results.model_dump()},
+            expected_version=invoice.version
+        )
+        if not updated:
+            # Another worker moved the invoice on; surface it rather than overwrite
+            raise RuntimeError(f"Stale transition for {invoice.invoice_id}")
+        return updated
 
-        # Total Variance Check
-        total_diff = abs(invoice.total - po.total) # Simple Invoice vs PO check? 
-        # Better: Invoice Total vs Calculated Expected Total (based on PO prices)
-        
-        total_diff_abs = abs(invoice.subtotal - calc_expected_total)
-        if total_diff_abs > tolerances.total_amount_variance: # e.g. £1.00
-             # Is it a big percentage?
-             pass
+    async def release_po_usage(self, invoice_id: str, company_id: str):
+        """Take an invoice's usage back out of its PO ledger, e.g. on rejection. Safe to call repeatedly."""
+        claimed = await db.invoices.claim_po_usage(invoice_id)
+        if claimed and claimed.po_number:
+            await db.purchase_orders.record_usage(claimed.po_number, company_id, claimed.po_usage, sign=-1)
 
-        if is_variance:
+    def _check_po_balance(self, po: PurchaseOrder, results: MatchingResults, policy: TenantPolicy):
+        """Flag invoices that would take the PO past its net total, using the ledger's running total."""
+        drawn = sum(line.amount for line in (results.po_usage or {}).values())
+        remaining = po.calculate_remaining_balance()
+        if drawn > remaining + policy.total_amount_variance:
             results.match_status = "VARIANCE"
-            results.auto_approvable = False # Be strict for now
-            results.details = "; ".join(details)
-            results.price_variance = 0.0 # Fill real calc
-            results.quantity_variance = 0.0 # Fill real calc
+            results.auto_approvable = False
+            detail = f"Exceeds remaining PO balance: {drawn:.2f} against {remaining:.2f}"
+            results.details = "; ".join(filter(None, [results.details, detail]))
+
+    async def _get_policy(self, company_id: str) -> TenantPolicy:
+        # Falls back to the default tolerances
+        return await db.config.get_policy(company_id) or DEFAULT_POLICY
 
-        return results
+    def _three_way_match(self, invoice: InvoiceData, po: PurchaseOrder, received: List[ReceivedLine], policy: TenantPolicy) -> MatchingResults:
+        """Core logic for matching amounts and quantities, see tools/matching_engine.py."""
+        return three_way_match(invoice, po, received, policy)
 
 matching_agent = MatchingAgent()
@@ -1,6 +1,6 @@
 import logging
 import uuid
-from typing import Dict, Any, Optional
+from typing import Dict, Any, List, Optional
 from datetime import datetime, timedelta
 
 from app.database import db
@@ -43,7 +43,7 @@ class PaymentAgent:
                pass
             
             # Helper to find vendor
-            vendor = await self._find_vendor(data.vendor_name, invoice.company_id)
+            vendor = await self._find_vendor(data.vendor_name, invoice.company_id, data.vendor_id)
             
             if not vendor or not vendor.bank_details:
                 # Can't pay without bank details
@@ -62,6 +62,15 @@ class PaymentAgent:
                 state["current_state"] = InvoiceStatus.EXCEPTION # Or a specific FRAUD_CHECK state
                 return state
 
+            # 2b. Never pay into an account another vendor also uses
+            shared_with = await self._shared_bank_account(vendor, invoice.company_id)
+            if shared_with:
+                msg = f"Bank account shared with vendor(s) {', '.join(shared_with)} - Requires Verification"
+                logger.warning(msg)
+                state["errors"] = [msg]
+                state["current_state"] = InvoiceStatus.EXCEPTION
+                return state
+
             # 3. Calculate Payment Date
             payment_date = self._calculate_payment_date(data.invoice_date, vendor.payment_terms)
             
@@ -93,10 +102,15 @@ class PaymentAgent:
             # Save to GridFS or Audit log?
             # For now, just log success
             
-            await db.invoices.update(invoice_id, {
-                "status": InvoiceStatus.SCHEDULING_PAYMENT, # or PAID/SCHEDULED
-                "payment": instruction.model_dump()
-            })
+            updated = await db.invoices.transition(
+                invoice_id, invoice.status, InvoiceStatus.SCHEDULING_PAYMENT, # or PAID/SCHEDULED
+                {"payment": instruction.model_dump()},
+                expected_version=invoice.version
+            )
+            if not updated:
+                logger.warning(f"Invoice {invoice_id} was modified concurrently, payment not scheduled")
+                state["errors"] = [f"Stale transition for {invoice_id}"]
+                return state
             
             # Auto-processed to complete for this flow?
             # Or wait for batch runner?
@@ -115,12 +129,17 @@ class PaymentAgent:
 
         return state
 
-    async def _find_vendor(self, name: str, company_id: str) -> Optional[Vendor]:
-        # Simple lookup
-        doc = await db.db["vendors"].find_one({"name": name, "company_id": company_id})
-        if doc:
-            return Vendor(**doc)
-        return None
+    async def _find_vendor(self, name: str, company_id: str, vendor_id: Optional[str] = None) -> Optional[Vendor]:
+        # ID linked at validation, else exact (normalised) name; never pay a fuzzy name match
+        vendor = await db.vendors.resolve(company_id, vendor_id=vendor_id, name=name, fuzzy=False)
+        if vendor is None:
+            return None
+        # Bank details as stored now: the directory can lag a bank change by up to its refresh interval
+        return await db.vendors.get_by_field("vendor_id", vendor.vendor_id)
+
+    async def _shared_bank_account(self, vendor: Vendor, company_id: str) -> List[str]:
+        """Other vendors paid into the same account; an in-memory lookup in the tenant's vendor directory."""
+        return await db.vendors.sharing_bank_account(company_id, vendor)
 
     def _check_bank_details_change(self, vendor: Vendor, days: int = 30) -> bool:
         """Returns True if bank details changed recently."""
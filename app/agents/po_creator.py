@@ -65,7 +65,7 @@ class POCreator:
         logger.info(f"Created Retrospective PO {po_number} for Invoice {invoice_id}")
         
         # Link PO to Invoice
-        await db.invoices.update(invoice_id, {
+        await db.invoices.transition(invoice_id, invoice.status, invoice.status, {
             "data.po_reference": po_number,
             "matching.has_po": True,
             "matching.match_status": "RETRO_PO_CREATED"
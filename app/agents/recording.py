@@ -5,7 +5,7 @@ from datetime import datetime
 
 from app.database import db
 from app.models.invoice import InvoiceStatus, InvoiceData
-from app.models.config import GLMapping
+from app.models.policy import DEFAULT_POLICY, TenantPolicy
 from app.models.accounting import JournalEntry, JournalLine, EntryType
 
 logger = logging.getLogger(__name__)
@@ -32,15 +32,11 @@ class RecordingAgent:
 
             data: InvoiceData = InvoiceData(**invoice.data.model_dump())
             
-            # Fetch Config for GL Mapping
-            config = await db.config.get_by_field("company_id", company_id)
-            if not config:
-                gl_map = GLMapping() # Default
-            else:
-                gl_map = config.gl_mapping
+            # Compiled tenant policy for GL Mapping (defaults if no config)
+            policy = await db.config.get_policy(company_id) or DEFAULT_POLICY
 
             # Create Journal Entry
-            je = self._create_journal_entry(data, invoice.invoice_id, gl_map)
+            je = self._create_journal_entry(data, invoice.invoice_id, policy)
             
             # Validate
             if not je.validate_balance():
@@ -62,7 +58,7 @@ class RecordingAgent:
             logger.info(f"Journal Entry created: {je.entry_id}")
             
             # Log in invoice?
-            await db.invoices.update(invoice_id, {
+            await db.invoices.transition(invoice_id, invoice.status, invoice.status, {
                 "journal_entry_id": je.entry_id
             })
             
@@ -79,15 +75,13 @@ class RecordingAgent:
 
         return state
 
-    def _create_journal_entry(self, data: InvoiceData, source_doc: str, gl_map: GLMapping) -> JournalEntry:
+    def _create_journal_entry(self, data: InvoiceData, source_doc: str, policy: TenantPolicy) -> JournalEntry:
         lines: List[JournalLine] = []
         
         # 1. Expense Lines (Debits)
         for item in data.line_items:
             # Determine GL
-            gl_code = gl_map.default_expense_gl
-            if item.category and item.category in gl_map.category_map:
-                gl_code = gl_map.category_map[item.category]
+            gl_code = policy.gl_code_for(item.category)
             
             lines.append(JournalLine(
                 gl_code=gl_code,
@@ -100,7 +94,7 @@ class RecordingAgent:
         # 2. VAT (Debit)
         if data.vat_amount > 0:
             lines.append(JournalLine(
-                gl_code=gl_map.vat_recoverable_gl,
+                gl_code=policy.vat_recoverable_gl,
                 account_name="VAT Recoverable",
                 description=f"VAT on {source_doc}",
                 type=EntryType.DEBIT,
@@ -125,7 +119,7 @@ class RecordingAgent:
         if abs(diff) > 0.001:
              # Rounding line
              lines.append(JournalLine(
-                gl_code=gl_map.default_expense_gl, # Or specific rounding GL
+                gl_code=policy.default_expense_gl, # Or specific rounding GL
                 account_name="Rounding Adjustment",
                 description="Rounding",
                 type=EntryType.DEBIT if diff < 0 else EntryType.CREDIT,
@@ -140,7 +134,7 @@ class RecordingAgent:
              pass
 
         lines.append(JournalLine(
-            gl_code=gl_map.accounts_payable_gl,
+            gl_code=policy.accounts_payable_gl,
             account_name="Accounts Payable",
             description=f"Liability for {source_doc}",
             type=EntryType.CREDIT,
@@ -1,104 +1,194 @@
 import logging
 import asyncio
 from datetime import datetime, timedelta
-from typing import List, Dict, Any
+from typing import Any, Dict, List, Optional, Set, Tuple
 from app.database import db
-from app.models.invoice import Invoice, InvoiceStatus
+from app.models.invoice import InvoiceStatus
+from app.models.policy import DEFAULT_POLICY, TenantPolicy
+from app.repositories.base import DEFAULT_BATCH_SIZE
 from app.tools.notification_tool import notification_tool
+from app.repositories.indexes import declare_indexes
+from pymongo import ASCENDING, IndexModel
 
 logger = logging.getLogger(__name__)
 
+# Approval SLAs select by status and how long since status_changed_at; invoices written
+# before that field existed fall back to updated_at
+declare_indexes("invoices", IndexModel([("status", ASCENDING), ("status_changed_at", ASCENDING)]))
+declare_indexes("invoices", IndexModel([("status", ASCENDING), ("updated_at", ASCENDING)]))
+# Payment deadlines select open invoices due soon, and escalated ones whose due date moved out
+declare_indexes("invoices", IndexModel([("status", ASCENDING), ("data.due_date", ASCENDING)]))
+declare_indexes("invoices", IndexModel([("status", ASCENDING), ("urgency", ASCENDING)]))
+
+OPEN_STATUSES = {"$nin": [InvoiceStatus.PAID, InvoiceStatus.REJECTED]}
+ESCALATED_URGENCIES = ["WARNING", "URGENT", "CRITICAL"]
+AT_RISK_SHARE = 0.75 # Share of the approval SLA after which an invoice is AT_RISK
+
+# (invoice_id, reason, urgency, extra $set fields)
+Escalation = Tuple[str, str, str, Dict[str, Any]]
+
+def payment_urgency(due_date: datetime, now: datetime, policy: TenantPolicy = DEFAULT_POLICY) -> str:
+    """NORMAL, WARNING, URGENT or CRITICAL for an invoice due at `due_date`."""
+    remaining = due_date - now
+    if remaining < policy.payment_critical:
+        return "CRITICAL"
+    if remaining < policy.payment_urgent:
+        return "URGENT"
+    if remaining < policy.payment_warning:
+        return "WARNING"
+    return "NORMAL"
+
 class SLAMonitor:
     """
     Background monitor for payment deadlines and approval SLAs.
+    Sweeps stream only the invoices near a threshold, through indexed range queries, and
+    write escalations in batched bulk writes. Notifications are sent in the background;
+    drain() waits for them.
     """
-    
-    async def check_payment_deadlines(self):
+    def __init__(self):
+        self._notifying: Set[asyncio.Task] = set()
+
+    async def check_payment_deadlines(self, now: Optional[datetime] = None, batch_size: int = DEFAULT_BATCH_SIZE):
         """
         Calculates days until payment due and updates urgency.
+        Only open invoices due within the warning window, or already escalated, are read.
         """
-        now = datetime.utcnow()
-        # Find all unpaid/unrejected invoices
-        query = {
-            "status": {"$notin": [InvoiceStatus.PAID, InvoiceStatus.REJECTED]}
-        }
-        invoices_data = await db.db["invoices"].find(query).to_list(None)
-        
-        for doc in invoices_data:
-            invoice = Invoice(**doc)
-            if not invoice.data or not invoice.data.due_date:
-                continue
-                
-            diff = invoice.data.due_date - now
-            days = diff.total_seconds() / (24 * 3600)
-            hours = diff.total_seconds() / 3600
-            
-            new_urgency = "NORMAL"
-            if hours < 24:
-                new_urgency = "CRITICAL"
-            elif days < 3:
-                new_urgency = "URGENT"
-            elif days < 7:
-                new_urgency = "WARNING"
-            
-            if new_urgency != invoice.urgency:
-                await self.escalate_invoice(
-                    invoice.invoice_id, 
-                    reason=f"Payment deadline approaching ({days:.1f} days remaining)", 
-                    urgency=new_urgency
-                )
-
-    async def check_approval_slas(self, sla_hours: int = 48):
+        now = now or datetime.utcnow()
+        horizon = now + DEFAULT_POLICY.payment_warning
+        query = {"$or": [
+            {"status": OPEN_STATUSES, "data.due_date": {"$lt": horizon}},
+            # Escalated before the due date moved back out of the window
+            {"status": OPEN_STATUSES, "urgency": {"$in": ESCALATED_URGENCIES}, "data.due_date": {"$gte": horizon}},
+        ]}
+        projection = {"invoice_id": 1, "urgency": 1, "data.due_date": 1, "_id": 0}
+        escalations: List[Escalation] = []
+        async for doc in db.invoices.collection.find(query, projection).batch_size(batch_size):
+            due_date = doc["data"]["due_date"]
+            new_urgency = payment_urgency(due_date, now)
+            if new_urgency != doc.get("urgency", "NORMAL"):
+                days = (due_date - now).total_seconds() / (24 * 3600)
+                escalations.append((
+                    doc["invoice_id"],
+                    f"Payment deadline approaching ({days:.1f} days remaining)",
+                    new_urgency,
+                    {}
+                ))
+            if len(escalations) >= batch_size:
+                await self._apply_escalations(escalations)
+                escalations = []
+
+        await self._apply_escalations(escalations)
+
+    async def check_approval_slas(self, sla_hours: int = 48, now: Optional[datetime] = None,
+                                  batch_size: int = DEFAULT_BATCH_SIZE):
         """
         Monitors invoices pending approval.
+        Only those waiting past the at-risk point and not yet breached are read. The wait is
+        measured from status_changed_at, so escalation writes do not restart the clock.
         """
-        now = datetime.utcnow()
+        now = now or datetime.utcnow()
+        cutoff = now - timedelta(hours=sla_hours * AT_RISK_SHARE)
         query = {
-            "status": InvoiceStatus.AWAITING_APPROVAL
+            "$or": [
+                {"status": InvoiceStatus.AWAITING_APPROVAL, "status_changed_at": {"$lte": cutoff}},
+                {"status": InvoiceStatus.AWAITING_APPROVAL, "status_changed_at": None, "updated_at": {"$lte": cutoff}},
+            ],
+            "sla_status": {"$ne": "BREACHED"}
         }
-        pending_invoices = await db.db["invoices"].find(query).to_list(None)
-        
-        for doc in pending_invoices:
-            invoice = Invoice(**doc)
-            pending_since = invoice.updated_at
-            waited_hours = (now - pending_since).total_seconds() / 3600
+        projection = {"invoice_id": 1, "status_changed_at": 1, "updated_at": 1, "sla_status": 1, "_id": 0}
+        escalations: List[Escalation] = []
+        at_risk: List[Tuple[Dict[str, Any], Dict[str, Any]]] = []
+
+        async for doc in db.invoices.collection.find(query, projection).batch_size(batch_size):
+            entered = doc.get("status_changed_at") or doc["updated_at"]
+            waited_hours = (now - entered).total_seconds() / 3600
+            sla_status = doc.get("sla_status", "COMPLIANT")
             
             if waited_hours > sla_hours:
                 # Breach!
-                if invoice.sla_status != "BREACHED":
-                    await self.escalate_invoice(
-                        invoice.invoice_id,
-                        reason=f"Approval SLA breached ({waited_hours:.1f}h / {sla_hours}h)",
-                        urgency="CRITICAL"
-                    )
-                    await db.invoices.update(invoice.invoice_id, {"sla_status": "BREACHED"})
-            elif waited_hours > (sla_hours * 0.75):
+                escalations.append((
+                    doc["invoice_id"],
+                    f"Approval SLA breached ({waited_hours:.1f}h / {sla_hours}h)",
+                    "CRITICAL",
+                    {"sla_status": "BREACHED"}
+                ))
+            elif waited_hours > (sla_hours * AT_RISK_SHARE) and sla_status == "COMPLIANT":
                 # At Risk
-                if invoice.sla_status == "COMPLIANT":
-                    await db.invoices.update(invoice.invoice_id, {"sla_status": "AT_RISK"})
-                    logger.info(f"Invoice {invoice.invoice_id} is AT RISK for SLA breach.")
+                at_risk.append(({"invoice_id": doc["invoice_id"]}, {"sla_status": "AT_RISK"}))
+                logger.info(f"Invoice {doc['invoice_id']} is AT RISK for SLA breach.")
+            if len(escalations) + len(at_risk) >= batch_size:
+                await self._apply_escalations(escalations, extra_updates=at_risk)
+                escalations, at_risk = [], []
+
+        await self._apply_escalations(escalations, extra_updates=at_risk)
 
-    async def escalate_invoice(self, invoice_id: str, reason: str, urgency: str):
+    async def escalate_invoice(self, invoice_id: str, reason: str, urgency: str,
+                               extra_fields: Optional[Dict[str, Any]] = None):
         """
-        Updates invoice urgency and sends notifications.
+        Updates invoice urgency (and any extra fields) and sends notifications.
         """
         logger.warning(f"Escalating {invoice_id} to {urgency}. Reason: {reason}")
         
         # Update Invoice
+        update = self._escalation_update(reason, urgency)
+        update["$set"].update(extra_fields or {})
+        await db.db["invoices"].update_one({"invoice_id": invoice_id}, update)
+        await self._notify_escalation(invoice_id, reason, urgency)
+
+    async def _apply_escalations(self, escalations: List[Escalation],
+                                 extra_updates: List[Tuple[Dict[str, Any], Dict[str, Any]]] = None):
+        """
+        Writes a sweep's escalations (invoice_id, reason, urgency, extra $set fields) and any
+        plain field updates in batched bulk writes, then hands the notifications off to the background.
+        """
+        updates = list(extra_updates or [])
+        for invoice_id, reason, urgency, extra_fields in escalations:
+            logger.warning(f"Escalating {invoice_id} to {urgency}. Reason: {reason}")
+            update = self._escalation_update(reason, urgency)
+            update["$set"].update(extra_fields)
+            updates.append(({"invoice_id": invoice_id}, update))
+
+        if not updates:
+            return
+
+        summary = await db.invoices.bulk_update(updates)
+        for error in summary.errors:
+            logger.error(f"SLA update failed for {updates[error['index']][0]}: {error['message']}")
+        failed = {error["index"] for error in summary.errors}
+
+        offset = len(updates) - len(escalations)
+        notifications = [(invoice_id, reason, urgency)
+                         for index, (invoice_id, reason, urgency, _) in enumerate(escalations)
+                         if offset + index not in failed]
+        if notifications:
+            task = asyncio.create_task(self._send_notifications(notifications))
+            self._notifying.add(task)
+            task.add_done_callback(self._notifying.discard)
+
+    async def _send_notifications(self, notifications: List[Tuple[str, str, str]]):
+        for invoice_id, reason, urgency in notifications:
+            try:
+                await self._notify_escalation(invoice_id, reason, urgency)
+            except Exception as e:
+                logger.error(f"SLA notification failed for {invoice_id}: {e}")
+
+    async def drain(self):
+        """Wait until every notification handed off by earlier sweeps has been sent."""
+        while self._notifying:
+            await asyncio.gather(*self._notifying)
+
+    def _escalation_update(self, reason: str, urgency: str) -> Dict[str, Any]:
         escalation_entry = {
             "urgency": urgency,
             "reason": reason,
             "timestamp": datetime.utcnow()
         }
-        
-        await db.db["invoices"].update_one(
-            {"invoice_id": invoice_id},
-            {
-                "$set": {"urgency": urgency},
-                "$push": {"escalation_history": escalation_entry}
-            }
-        )
-        
+        return {
+            "$set": {"urgency": urgency},
+            "$push": {"escalation_history": escalation_entry}
+        }
+
+    async def _notify_escalation(self, invoice_id: str, reason: str, urgency: str):
         # Determine recipients
         recipients = ["finance_team@company.com"] # Default
         if urgency == "CRITICAL":
@@ -131,7 +221,7 @@ class SLAMonitor:
         Calculates SLA compliance metrics.
         """
         # In a real app, this would use aggregation framework
-        invoices = await db.db["invoices"].find({}).to_list(None)
+        invoices = await db.db["invoices"].find({}, {"sla_status": 1, "urgency": 1, "_id": 0}).to_list(None)
         total = len(invoices)
         if total == 0:
             return {"compliance_rate": 1.0}
@@ -0,0 +1,226 @@
+"""
+Deadline timers for SLA escalations, so thresholds fire as they are crossed instead of being found by a sweep.
+
+An open invoice has up to four timers: payment WARNING, URGENT and CRITICAL ahead of its due date,
+and the approval SLA breach after it entered AWAITING_APPROVAL. Timers sit in a heap ordered by
+fire time and one task sleeps until the earliest, so scheduling and firing a threshold is
+O(log n) however many invoices are open. Thresholds are the default policy's, as in the sweeps.
+
+Timers are written to the sla_timers collection, and the wheel runs in a single process
+(SLA_TIMER_WHEEL, or scripts/sla_timer_wheel.py). That process loads every timer at start-up, so a
+restart fires whatever came due while it was down, and polls every SLA_TIMER_POLL_SECONDS for timers
+the other processes persisted; they hold none in memory. Firing re-reads the invoice and skips timers
+that no longer apply (paid, approved, due date moved, already escalated), so timers are never
+cancelled. The SLAMonitor sweeps remain the backstop.
+"""
+import asyncio
+import heapq
+import itertools
+import logging
+import time
+from datetime import datetime, timedelta
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+from pymongo import ASCENDING, IndexModel, UpdateOne
+
+from app.agents.sla_monitor import payment_urgency, sla_monitor
+from app.config import settings
+from app.database import db
+from app.models.invoice import InvoiceStatus
+from app.models.policy import DEFAULT_POLICY
+from app.repositories.indexes import declare_indexes
+
+logger = logging.getLogger(__name__)
+
+# One live timer per invoice and threshold; rescheduling overwrites it. The runner polls by fire_at.
+declare_indexes("sla_timers", IndexModel([("invoice_id", ASCENDING), ("kind", ASCENDING)], unique=True),
+                IndexModel([("fire_at", ASCENDING)]))
+
+APPROVAL_BREACH = "APPROVAL_BREACH"
+URGENCY_RANK = {"NORMAL": 0, "WARNING": 1, "URGENT": 2, "CRITICAL": 3}
+
+class SLATimer(NamedTuple):
+    fire_at: datetime
+    invoice_id: str
+    kind: str # WARNING, URGENT, CRITICAL or APPROVAL_BREACH
+
+def _severity(timer: SLATimer) -> int:
+    return URGENCY_RANK.get(timer.kind, 0)
+
+class SLATimerWheel:
+    """
+    Upcoming SLA thresholds of every open invoice, fired by run() at the moment they are crossed.
+    With hold=False timers are only persisted, for the process running the wheel to pick up.
+    """
+    def __init__(self, hold: bool = True, poll_seconds: float = settings.SLA_TIMER_POLL_SECONDS):
+        self.hold = hold
+        self.poll_seconds = poll_seconds
+        self._heap: List[Tuple[datetime, int, SLATimer]] = []
+        # The live timer per (invoice, kind); heap entries that differ were rescheduled and are skipped
+        self._timers: Dict[Tuple[str, str], SLATimer] = {}
+        self._order = itertools.count() # Breaks fire_at ties without comparing timers
+        self._wake = asyncio.Event()
+
+    def __len__(self) -> int:
+        return len(self._timers)
+
+    @property
+    def collection(self):
+        return db.db.sla_timers
+
+    def next_fire_at(self) -> Optional[datetime]:
+        """When the earliest live timer is due; None when there are none."""
+        while self._heap:
+            timer = self._heap[0][2]
+            if self._timers.get((timer.invoice_id, timer.kind)) == timer:
+                return timer.fire_at
+            heapq.heappop(self._heap)
+        return None
+
+    def _push(self, timer: SLATimer):
+        self._timers[(timer.invoice_id, timer.kind)] = timer
+        heapq.heappush(self._heap, (timer.fire_at, next(self._order), timer))
+
+    async def schedule_payment(self, invoice_id: str, due_date: datetime, now: Optional[datetime] = None):
+        """Start the payment deadline clock, e.g. once extraction found a due date."""
+        now = now or datetime.utcnow()
+        timers = [
+            SLATimer(due_date - DEFAULT_POLICY.payment_warning, invoice_id, "WARNING"),
+            SLATimer(due_date - DEFAULT_POLICY.payment_urgent, invoice_id, "URGENT"),
+            SLATimer(due_date - DEFAULT_POLICY.payment_critical, invoice_id, "CRITICAL"),
+        ]
+        # Of the thresholds already crossed only the most severe fires; the rest would be overtaken at once
+        passed = [timer for timer in timers if timer.fire_at <= now]
+        await self._schedule([timer for timer in timers if timer.fire_at > now] + passed[-1:])
+
+    async def schedule_approval(self, invoice_id: str, requested_at: datetime):
+        """Start the approval SLA clock for an invoice entering AWAITING_APPROVAL."""
+        await self._schedule([SLATimer(requested_at + DEFAULT_POLICY.approval_sla, invoice_id, APPROVAL_BREACH)])
+
+    async def _schedule(self, timers: List[SLATimer]):
+        if not timers:
+            return
+        await self.collection.bulk_write([
+            UpdateOne({"invoice_id": timer.invoice_id, "kind": timer.kind}, {"$set": {"fire_at": timer.fire_at}}, upsert=True)
+            for timer in timers
+        ], ordered=False)
+        if not self.hold:
+            return
+        for timer in timers:
+            self._push(timer)
+        self._wake.set()
+
+    async def load(self) -> int:
+        """Replace the in-memory timers with the persisted ones, e.g. at start-up. Returns how many."""
+        self._timers.clear()
+        async for doc in self.collection.find({}, {"_id": 0, "invoice_id": 1, "kind": 1, "fire_at": 1}):
+            timer = SLATimer(doc["fire_at"], doc["invoice_id"], doc["kind"])
+            self._timers[(timer.invoice_id, timer.kind)] = timer
+        self._heap = [(timer.fire_at, next(self._order), timer) for timer in self._timers.values()]
+        heapq.heapify(self._heap)
+        self._wake.set()
+        logger.info(f"Loaded {len(self)} SLA timers")
+        return len(self)
+
+    async def poll(self, now: Optional[datetime] = None) -> int:
+        """Pick up persisted timers due within the next poll interval that this process does not hold. Returns how many."""
+        now = now or datetime.utcnow()
+        added = 0
+        query = {"fire_at": {"$lte": now + timedelta(seconds=self.poll_seconds)}}
+        async for doc in self.collection.find(query, {"_id": 0, "invoice_id": 1, "kind": 1, "fire_at": 1}):
+            timer = SLATimer(doc["fire_at"], doc["invoice_id"], doc["kind"])
+            if self._timers.get((timer.invoice_id, timer.kind)) != timer:
+                self._push(timer)
+                added += 1
+        return added
+
+    async def fire_due(self, now: Optional[datetime] = None) -> int:
+        """Fire every timer due by `now`. Returns how many invoices were escalated."""
+        now = now or datetime.utcnow()
+        due: List[SLATimer] = []
+        while self._heap and self._heap[0][0] <= now:
+            timer = heapq.heappop(self._heap)[2]
+            key = (timer.invoice_id, timer.kind)
+            if self._timers.get(key) == timer:
+                del self._timers[key]
+                due.append(timer)
+        if not due:
+            return 0
+
+        # After downtime several payment thresholds of one invoice can be due; only the most severe fires
+        firing: Dict[Tuple[str, bool], SLATimer] = {}
+        for timer in due:
+            key = (timer.invoice_id, timer.kind == APPROVAL_BREACH)
+            if key not in firing or _severity(timer) > _severity(firing[key]):
+                firing[key] = timer
+        escalated = 0
+        for timer in firing.values():
+            try:
+                escalated += await self._fire(timer, now)
+            except Exception as e:
+                logger.error(f"SLA timer {timer.kind} for {timer.invoice_id} failed: {e}")
+
+        # Matching on fire_at leaves timers rescheduled meanwhile in place
+        await self.collection.delete_many({"$or": [
+            {"invoice_id": timer.invoice_id, "kind": timer.kind, "fire_at": timer.fire_at} for timer in due
+        ]})
+        return escalated
+
+    async def _fire(self, timer: SLATimer, now: datetime) -> bool:
+        doc = await db.invoices.collection.find_one(
+            {"invoice_id": timer.invoice_id},
+            {"_id": 0, "status": 1, "urgency": 1, "sla_status": 1, "status_changed_at": 1, "updated_at": 1, "data.due_date": 1}
+        )
+        if not doc:
+            return False
+
+        if timer.kind == APPROVAL_BREACH:
+            if doc["status"] != InvoiceStatus.AWAITING_APPROVAL or doc.get("sla_status") == "BREACHED":
+                return False
+            # Timed from entering AWAITING_APPROVAL; other writes while it waits leave the clock running
+            entered = doc.get("status_changed_at") or doc["updated_at"]
+            waited = now - entered
+            if waited < DEFAULT_POLICY.approval_sla:
+                # Re-entered since this timer was set: keep a timer for the current visit
+                await self.schedule_approval(timer.invoice_id, entered)
+                return False
+            sla_hours = DEFAULT_POLICY.approval_sla.total_seconds() / 3600
+            await sla_monitor.escalate_invoice(
+                timer.invoice_id, f"Approval SLA breached ({waited.total_seconds() / 3600:.1f}h / {sla_hours:g}h)",
+                "CRITICAL", {"sla_status": "BREACHED"}
+            )
+            return True
+
+        due_date = (doc.get("data") or {}).get("due_date")
+        if doc["status"] in (InvoiceStatus.PAID, InvoiceStatus.REJECTED) or not due_date:
+            return False
+        urgency = payment_urgency(due_date, now)
+        # A due date moved out, or an escalation the sweep already made, leaves nothing to do
+        if URGENCY_RANK[urgency] < _severity(timer) or URGENCY_RANK[urgency] <= URGENCY_RANK.get(doc.get("urgency"), 0):
+            return False
+        days = (due_date - now).total_seconds() / (24 * 3600)
+        await sla_monitor.escalate_invoice(timer.invoice_id, f"Payment deadline approaching ({days:.1f} days remaining)", urgency)
+        return True
+
+    async def run(self):
+        """Fire timers as they come due, polling for those other processes schedule, until cancelled."""
+        next_poll = time.monotonic()
+        while True:
+            self._wake.clear()
+            try:
+                if time.monotonic() >= next_poll:
+                    next_poll = time.monotonic() + self.poll_seconds
+                    await self.poll()
+                await self.fire_due()
+            except Exception as e:
+                logger.error(f"SLA timer wheel: {e}")
+            next_at = self.next_fire_at()
+            timeout = max(next_poll - time.monotonic(), 0.0)
+            if next_at is not None:
+                timeout = min(timeout, max((next_at - datetime.utcnow()).total_seconds(), 0.0))
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+
+sla_timers = SLATimerWheel(hold=settings.SLA_TIMER_WHEEL)
@@ -4,9 +4,11 @@ from typing import Dict, Any, List
 from app.database import db
 from app.models.invoice import InvoiceStatus, InvoiceData, ValidationResults
 from app.models.vendor import VerificationStatus
+from app.repositories.vendor_features import RECORDED_INVOICE
 from app.tools.vat_validator import vat_validator
 from app.tools.duplicate_detector import duplicate_detector
 from app.tools.fraud_detector import fraud_detector
+from app.tools.velocity import velocity_tracker
 from app.tools.verification_tool import verification_tool
 from app.agents.vat_corrector import vat_corrector
 from app.memory.semantic_memory import semantic_memory
@@ -46,32 +48,43 @@ class ValidationAgent:
                 data.invoice_number, 
                 data.total, 
                 data.invoice_date,
-                data.line_items
+                data.line_items,
+                company_id=invoice.company_id,
+                vendor_id=data.vendor_id
             )
             
-            # 3. VAT Validation
-            vat_result = vat_validator.validate_vat(data)
+            # 3. VAT Validation, against the rates this vendor usually charges
+            vendor_features = await db.vendor_features.get(invoice.company_id, data.vendor_name, data.vendor_id)
+            # Extraction already counted this invoice; judge it against the vendor's other invoices
+            if vendor_features and RECORDED_INVOICE in invoice.vendor_features_recorded:
+                vendor_features = vendor_features.excluding(data.total, data.vat_rate)
+            vat_result = vat_validator.validate_vat(data, vendor_features)
             
             # 4. Vendor Validation
-            # Try to lookup vendor by name if ID not present
+            # Resolve by ID, else by exact (normalised) name from the tenant's vendor directory.
+            # A name that only resembles a vendor's (OCR misspellings) is left to a reviewer, never linked.
             vendor_approved = False
-            vendor = None
-            if data.vendor_id:
-                vendor = await db.vendors.get_by_field("vendor_id", data.vendor_id)
-            elif data.vendor_name:
-                vendor = await db.vendors.get_by_field("name", data.vendor_name)
+            invoice_updates = {}
+            vendor = await db.vendors.resolve(invoice.company_id, vendor_id=data.vendor_id, name=data.vendor_name, fuzzy=False)
+            fuzzy_match = None
+            if vendor is None and data.vendor_name:
+                fuzzy_match = await db.vendors.resolve(invoice.company_id, name=data.vendor_name)
 
             if vendor and vendor.approval_status == "APPROVED":
                 vendor_approved = True
-                # Link vendor ID if not already linked
+                # Link vendor ID if not already linked (written with the stage transition)
                 if not data.vendor_id:
                     data.vendor_id = vendor.vendor_id
-                    await db.invoices.update(invoice_id, {"data.vendor_id": vendor.vendor_id})
+                    invoice_updates["data.vendor_id"] = vendor.vendor_id
             
             # 5. Fraud Analysis
             bank_change_detected = False
+            shared_with = []
             if vendor:
-                bank_change_detected = await fraud_detector.check_bank_details_change(vendor.vendor_id)
+                shared_with = await fraud_detector.check_shared_bank_account(vendor, invoice.company_id)
+                if shared_with:
+                    logger.warning(f"Bank account of vendor {vendor.vendor_id} is also on file for {', '.join(shared_with)}")
+                bank_change_detected = await fraud_detector.check_bank_details_change(vendor.vendor_id, company_id=invoice.company_id)
                 if bank_change_detected:
                     logger.warning(f"Bank details changed for vendor {vendor.vendor_id}. Initiating verification.")
                     await verification_tool.initiate_verification(
@@ -83,15 +96,25 @@ class ValidationAgent:
             fraud_result = fraud_detector.analyze_fraud_risk(
                 data, 
                 vendor=vendor, 
-                bank_change_detected=bank_change_detected
+                bank_change_detected=bank_change_detected,
+                velocity=velocity_tracker.snapshot(invoice.company_id, data.vendor_name, data.vendor_id),
+                shared_bank_account=bool(shared_with),
+                vendor_features=vendor_features
             )
             
             # 6. Aggregate Results
             flags = fraud_result["flags"]
             if not vat_result["valid"]:
                 flags.append(f"VAT_MISMATCH: {vat_result['details']}")
+            elif vat_result.get("unusual_for_vendor"):
+                flags.append(f"VAT_RATE_UNUSUAL_FOR_VENDOR: {vat_result['details']}")
+            elif vat_result.get("mixed_rates"):
+                # Inferred rather than read from tax codes, so left visible to reviewers
+                flags.append(f"VAT_MIXED_RATES: {vat_result['details']}")
             if not vendor_approved:
                 flags.append("VENDOR_NOT_APPROVED")
+            if fuzzy_match:
+                flags.append(f"VENDOR_FUZZY_MATCH: {fuzzy_match.name} ({fuzzy_match.vendor_id})")
             if dup_result["is_duplicate"]:
                 flags.append(f"POTENTIAL_DUPLICATE: {dup_result['match_type']}")
             
@@ -126,17 +149,23 @@ class ValidationAgent:
             elif not vat_result["valid"] and data.vat_amount > 0:
                  # Trigger automated correction request
                  logger.warning(f"VAT mismatch for {invoice_id}. Sending correction request.")
-                 await vat_corrector.generate_correction_request(invoice)
+                 corrected = await vat_corrector.generate_correction_request(invoice)
+                 if corrected:
+                     invoice = corrected
                  next_state = InvoiceStatus.AWAITING_CORRECTION
             elif not vendor_approved:
                  # If vendor unknown, might need to create it or review
                  next_state = InvoiceStatus.AWAITING_APPROVAL # Or some onboarding state
             
             # Update DB
-            await db.invoices.update(invoice_id, {
-                "status": next_state,
-                "validation": validation_results.model_dump()
-            })
+            invoice_updates["validation"] = validation_results.model_dump()
+            updated = await db.invoices.transition(
+                invoice_id, invoice.status, next_state, invoice_updates, expected_version=invoice.version
+            )
+            if not updated:
+                logger.warning(f"Invoice {invoice_id} was modified concurrently, discarding validation result")
+                state["errors"] = [f"Stale transition for {invoice_id}"]
+                return state
             
             # Update State
             state["validation_results"] = validation_results.model_dump()
@@ -148,7 +177,7 @@ class ValidationAgent:
         except Exception as e:
             logger.error(f"Validation failed: {e}")
             state["errors"] = [str(e)]
-            await db.invoices.update(invoice_id, {"status": InvoiceStatus.EXCEPTION})
+            await db.invoices.transition(invoice_id, None, InvoiceStatus.EXCEPTION)
             
         return state
 
@@ -1,7 +1,11 @@
 import logging
 from datetime import datetime, timedelta
 from typing import Dict, Any, Optional
-from app.models.invoice import Invoice, InvoiceData
+from pymongo import ASCENDING, IndexModel
+from app.models.invoice import Invoice, InvoiceData, InvoiceStatus
+from app.repositories.base import DEFAULT_BATCH_SIZE
+from app.repositories.indexes import declare_indexes
+from app.tools.vat_engine import check_invoice
 from app.tools.vat_validator import vat_validator
 from app.tools.vendor_communication import vendor_communication
 from app.database import db
@@ -10,6 +14,9 @@ from app.models.memory import Memory, MemoryType
 
 logger = logging.getLogger(__name__)
 
+# The timeout sweep reads only the corrections already overdue
+declare_indexes("invoices", IndexModel([("status", ASCENDING), ("correction_tracking.due_date", ASCENDING)]))
+
 class VATCorrector:
     """
     Agent responsible for detecting VAT errors and coordinating corrections with vendors.
@@ -17,11 +24,9 @@ class VATCorrector:
     
     def calculate_correct_vat(self, invoice_data: InvoiceData) -> float:
         """
-        Calculates the expected VAT based on standard UK rate (20%).
+        Calculates the expected VAT from the line tax codes, charging uncoded lines the standard UK rate (20%).
         """
-        # Note: In a production system, this would look up the specific rate applied 
-        # or use the line-item level tax codes if available.
-        return round(invoice_data.subtotal * 0.20, 2)
+        return check_invoice(invoice_data).expected_vat
 
     async def detect_vat_error(self, invoice: Invoice) -> Optional[Dict[str, Any]]:
         """
@@ -44,6 +49,7 @@ class VATCorrector:
     async def generate_correction_request(self, invoice: Invoice, timeout_days: int = 7):
         """
         Generates and tracks a correction request for a flawed VAT invoice.
+        Returns the invoice as moved to AWAITING_CORRECTION, or None if no request was made.
         """
         error = await self.detect_vat_error(invoice)
         if not error:
@@ -51,7 +57,7 @@ class VATCorrector:
             return
 
         # Fetch vendor details for email
-        vendor = await db.vendors.get_by_field("vendor_id", invoice.data.vendor_id)
+        vendor = await db.vendors.get_by_vendor_id(invoice.data.vendor_id, invoice.company_id)
         if not vendor or not vendor.contact or not vendor.contact.email:
             logger.error(f"Cannot send correction request for invoice {invoice.invoice_id}: Vendor contact missing.")
             return
@@ -72,10 +78,10 @@ class VATCorrector:
         
         # Track status in invoice metadata
         due_date = datetime.utcnow() + timedelta(days=timeout_days)
+        existing_flags = invoice.validation.flags if invoice.validation else []
         update_data = {
-            "status": "AWAITING_CORRECTION",
             "validation.vat_valid": False,
-            "validation.flags": list(set(invoice.validation.flags + ["VAT_MISMATCH", "CORRECTION_REQUESTED"])),
+            "validation.flags": list(set(existing_flags + ["VAT_MISMATCH", "CORRECTION_REQUESTED"])),
             "correction_tracking": {
                 "request_id": email_id,
                 "requested_at": datetime.utcnow(),
@@ -84,7 +90,13 @@ class VATCorrector:
                 "overridden": False
             }
         }
-        await db.invoices.update(invoice.invoice_id, update_data)
+        updated = await db.invoices.transition(
+            invoice.invoice_id, invoice.status, InvoiceStatus.AWAITING_CORRECTION, update_data,
+            expected_version=invoice.version
+        )
+        if not updated:
+            logger.warning(f"Invoice {invoice.invoice_id} was modified concurrently, correction tracking not stored")
+            return None
         logger.info(f"Correction request {email_id} sent for invoice {invoice.invoice_id}. Due: {due_date}")
 
         # Store learning in Semantic Memory
@@ -101,32 +113,63 @@ class VATCorrector:
         except Exception as e:
             logger.warning(f"Failed to store learning in semantic memory: {e}")
 
+        return updated
+
     async def handle_timeout(self, invoice_id: str):
         """
-        Fires if vendor hasn't responded by due_date. 
-        In practice, would be called by a cron/scheduled task.
+        Fires if vendor hasn't responded by due_date, for a single invoice.
+        sweep_timeouts() does the same for every overdue invoice.
         """
         invoice = await db.invoices.get_by_field("invoice_id", invoice_id)
         if not invoice or invoice.status != "AWAITING_CORRECTION":
             return
             
-        tracking = getattr(invoice, "correction_tracking", {})
-        if not tracking or tracking.get("overridden"):
+        tracking = invoice.correction_tracking
+        if not tracking or tracking.overridden:
             return
             
-        if datetime.utcnow() > tracking.get("due_date", datetime.utcnow()):
+        if datetime.utcnow() > tracking.due_date:
              logger.warning(f"VAT Correction timeout for {invoice_id}. Escalating.")
-             await db.invoices.update(invoice_id, {
-                 "status": "EXCEPTION",
+             await db.invoices.transition(invoice_id, InvoiceStatus.AWAITING_CORRECTION, InvoiceStatus.EXCEPTION, {
                  "correction_tracking.status": "TIMEOUT_ESCALATED"
              })
 
+    async def sweep_timeouts(self, now: Optional[datetime] = None, batch_size: int = DEFAULT_BATCH_SIZE) -> int:
+        """
+        Escalate every correction request past its due date to EXCEPTION, e.g. hourly from cron.
+        Only overdue invoices are read, through the (status, due_date) index, and they are
+        escalated together in one bulk write. Returns how many were escalated.
+        """
+        now = now or datetime.utcnow()
+        query = {
+            "status": InvoiceStatus.AWAITING_CORRECTION,
+            "correction_tracking.due_date": {"$lte": now},
+            "correction_tracking.overridden": {"$ne": True}
+        }
+        overdue = [doc["invoice_id"] async for doc in
+                   db.invoices.collection.find(query, {"invoice_id": 1, "_id": 0}).batch_size(batch_size)]
+        if not overdue:
+            logger.info("VAT correction sweep: no overdue invoices")
+            return 0
+
+        # What transition() writes, applied in bulk; the status filter skips invoices resolved meanwhile
+        summary = await db.invoices.bulk_update([
+            ({"invoice_id": invoice_id, "status": InvoiceStatus.AWAITING_CORRECTION},
+             {"$set": {"status": InvoiceStatus.EXCEPTION, "previous_state": InvoiceStatus.AWAITING_CORRECTION,
+                       "updated_at": now, "status_changed_at": now, "correction_tracking.status": "TIMEOUT_ESCALATED"},
+              "$inc": {"version": 1}})
+            for invoice_id in overdue
+        ], batch_size=batch_size)
+        for error in summary.errors:
+            logger.error(f"VAT correction timeout escalation failed for {overdue[error['index']]}: {error['message']}")
+        logger.warning(f"VAT correction sweep: escalated {summary.modified_count} of {len(overdue)} overdue invoices")
+        return summary.modified_count
+
     async def manual_override(self, invoice_id: str, reason: str, approver: str):
         """
         Allows a user to override the VAT error and proceed to matching.
         """
-        await db.invoices.update(invoice_id, {
-            "status": "MATCHING",
+        await db.invoices.transition(invoice_id, InvoiceStatus.AWAITING_CORRECTION, InvoiceStatus.MATCHING, {
             "validation.vat_valid": True, # Force valid
             "correction_tracking.overridden": True,
             "correction_tracking.override_reason": reason,
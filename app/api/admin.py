@@ -12,7 +12,7 @@ async def onboard_company(
     config: CompanyConfig,
     current_user: User = Depends(get_admin_user)
 ):
-    existing = await db.config.get_by_field("company_id", config.company_id)
+    existing = await db.config.get_by_company_id(config.company_id, fresh=True)
     if existing:
         raise HTTPException(status_code=400, detail="Company already exists")
     
@@ -24,7 +24,7 @@ async def get_company_config(
     company_id: str,
     current_user: User = Depends(get_admin_user)
 ):
-    config = await db.config.get_by_field("company_id", company_id)
+    config = await db.config.get_by_company_id(company_id, fresh=True)
     if not config:
         raise HTTPException(status_code=404, detail="Company config not found")
     return config
@@ -35,11 +35,14 @@ async def update_company_config(
     update_data: Dict[str, Any] = Body(...),
     current_user: User = Depends(get_admin_user)
 ):
-    config = await db.config.get_by_field("company_id", company_id)
+    # Also drops this process's cached copy; other processes catch up via TTL or change stream
+    config = await db.config.update_by_company_id(company_id, update_data)
     if not config:
         raise HTTPException(status_code=404, detail="Company config not found")
     
-    await db.config.update(company_id, update_data) # Note: repo update usually takes ID, check implementation
-    # Config repo might need 'update_by_company_id' if ID is not _id
-    
     return {"message": "Config updated"}
+
+@router.get("/diagnostics/db")
+async def database_diagnostics(current_user: User = Depends(get_admin_user)):
+    """Connection pool size, usage and wire compression of the Mongo client."""
+    return db.pool_snapshot()
@@ -6,13 +6,16 @@ from pydantic import BaseModel
 
 from app.database import db
 from app.api.auth import get_current_active_user, get_admin_user, User
-from app.models.invoice import Invoice, InvoiceStatus, ValidationResults
+from app.models.invoice import Invoice, InvoiceStatus, InvoiceSummary, ValidationResults
 from app.workflow.graph import invoice_workflow
 from app.workflow.state import InvoiceState
 from app.guardrails.permissions import Permission
 from app.guardrails.permissions import Permission
 from app.guardrails.decorators import require_permission, enforce_sod
 from app.agents.po_creator import po_creator
+from app.agents.matching import matching_agent
+from app.repositories.indexes import declare_indexes
+from pymongo import ASCENDING, IndexModel
 
 router = APIRouter(prefix="/api/approvals", tags=["Approvals"])
 
@@ -53,11 +56,13 @@ async def resume_workflow_approval(invoice_id: str, approved: bool, comments: st
     
     pass
 
-@router.get("/pending", response_model=List[Invoice])
-async def list_pending_approvals(current_user: User = Depends(get_current_active_user)):
+declare_indexes("invoices", IndexModel([("status", ASCENDING), ("updated_at", ASCENDING)]))
+
+@router.get("/pending", response_model=List[InvoiceSummary])
+async def list_pending_approvals(limit: int = 100, current_user: User = Depends(get_current_active_user)):
     # Filter for AWAITING_APPROVAL
     # In real world, filter by user/role permissions too
-    return await db.invoices.find({"status": InvoiceStatus.AWAITING_APPROVAL})
+    return await db.invoices.list({"status": InvoiceStatus.AWAITING_APPROVAL}, limit=limit, view=InvoiceSummary)
 
 @router.post("/{invoice_id}/approve", response_model=ApprovalResponse)
 @enforce_sod(action="approve")
@@ -89,7 +94,8 @@ async def approve_invoice(
 
     # Move State
     new_status = InvoiceStatus.PAYMENT_PREPARATION
-    await db.invoices.update(invoice_id, {"status": new_status})
+    if not await db.invoices.transition(invoice_id, InvoiceStatus.AWAITING_APPROVAL, new_status):
+        raise HTTPException(status_code=409, detail="Invoice was modified concurrently")
     
     # TODO: Resume workflow if needed, or if we just manually stepped it forward
     
@@ -117,8 +123,12 @@ async def reject_invoice(
 
     # Move State
     new_status = InvoiceStatus.REJECTED
-    await db.invoices.update(invoice_id, {"status": new_status})
-    
+    if not await db.invoices.transition(invoice_id, InvoiceStatus.AWAITING_APPROVAL, new_status):
+        raise HTTPException(status_code=409, detail="Invoice was modified concurrently")
+    # Rejected spend no longer draws on the PO
+    await matching_agent.release_po_usage(invoice_id, invoice.company_id)
+
+    return {"message": "Invoice Rejected", "invoice_status": new_status}
 
 from fastapi.responses import HTMLResponse
 
@@ -1,3 +1,4 @@
+import re
 import uuid
 from typing import List, Optional
 from datetime import datetime
@@ -7,7 +8,8 @@ from pydantic import BaseModel
 
 from app.database import db
 from app.api.auth import get_current_active_user, User
-from app.models.invoice import Invoice, InvoiceStatus
+from app.models.invoice import Invoice, InvoiceStatus, InvoiceSummary
+from app.repositories.base import Page
 from app.workflow.graph import invoice_workflow
 from app.workflow.state import InvoiceState
 
@@ -80,24 +82,30 @@ async def upload_invoice(
     
     return new_invoice
 
-@router.get("/", response_model=List[Invoice])
+@router.get("/", response_model=Page[InvoiceSummary])
 async def list_invoices(
+    company_id: str = "acme_corp", # TODO: Get from context/auth
     status: Optional[InvoiceStatus] = None,
     vendor_name: Optional[str] = None,
-    limit: int = 50,
-    skip: int = 0,
+    limit: int = Query(50, ge=1, le=500),
+    cursor: Optional[str] = None,
+    include_total: bool = False,
     current_user: User = Depends(get_current_active_user)
 ):
     query = {}
     if status:
         query["status"] = status
     if vendor_name:
-        query["data.vendor_name"] = {"$regex": vendor_name, "$options": "i"}
+        # A substring match; the client's text is never a pattern
+        query["data.vendor_name"] = {"$regex": re.escape(vendor_name), "$options": "i"}
 
-    # TODO: Implement complex filtering in Repo or directly here mock for now
-    # Using find without complex pagination logic for MVP
-    invoices = await db.invoices.find(query) # Repositories usually handle skip/limit
-    return invoices[skip: skip+limit]
+    # Keyset pagination: pass next_cursor from the previous page to continue
+    try:
+        return await db.invoices.list_page(
+            company_id, query, cursor=cursor, limit=limit, view=InvoiceSummary, with_total=include_total
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
 @router.get("/{invoice_id}", response_model=Invoice)
 async def get_invoice(invoice_id: str, current_user: User = Depends(get_current_active_user)):
@@ -120,15 +128,16 @@ async def retry_invoice(
     if invoice.status not in [InvoiceStatus.EXCEPTION, InvoiceStatus.REJECTED]:
          raise HTTPException(status_code=400, detail="Only failed invoices can be retried")
 
-    # update status
-    await db.invoices.update(invoice_id, {
-        "status": InvoiceStatus.INGESTION, 
-        "retry_count": invoice.retry_count + 1,
-        "previous_state": invoice.status
-    })
+    # update status (previous_state is recorded by the transition)
+    updated = await db.invoices.transition(
+        invoice_id, invoice.status, InvoiceStatus.INGESTION,
+        {"retry_count": invoice.retry_count + 1},
+        expected_version=invoice.version
+    )
+    if not updated:
+        raise HTTPException(status_code=409, detail="Invoice was modified concurrently")
     
     # Trigger workflow
     background_tasks.add_task(trigger_workflow, invoice_id)
     
-    # Return updated (fetching fresh)
-    return await db.invoices.get_by_field("invoice_id", invoice_id)
+    return updated
@@ -4,8 +4,9 @@ from fastapi.responses import HTMLResponse, RedirectResponse
 from fastapi.templating import Jinja2Templates
 
 from app.database import db
-from app.models.invoice import InvoiceStatus
+from app.models.invoice import InvoiceStatus, InvoiceSummary
 from app.api.auth import get_current_active_user, User
+from app.agents.matching import matching_agent
 
 router = APIRouter(prefix="/ui", tags=["UI"])
 
@@ -34,14 +35,15 @@ templates = Jinja2Templates(directory="templates")
 @router.get("/approvals", response_class=HTMLResponse)
 async def approval_dashboard(
     request: Request,
-    status_filter: Optional[str] = None
+    status_filter: Optional[str] = None,
+    limit: int = 100
 ):
     query = {"status": InvoiceStatus.AWAITING_APPROVAL}
     if status_filter:
         # Override if user wants to see other statuses
         query["status"] = status_filter
         
-    invoices = await db.invoices.find(query)
+    invoices = await db.invoices.list(query, limit=limit, view=InvoiceSummary)
     
     return templates.TemplateResponse(
         "approval_dashboard.html", 
@@ -94,7 +96,10 @@ async def handle_approval_response(
         return RedirectResponse(url=f"/ui/invoices/{invoice_id}", status_code=303)
 
     # Perform Update
-    await db.invoices.update(invoice_id, {"status": next_status})
+    if not await db.invoices.transition(invoice_id, invoice.status, next_status, expected_version=invoice.version):
+        raise HTTPException(status_code=409, detail="Invoice was modified concurrently")
+    if next_status == InvoiceStatus.REJECTED:
+        await matching_agent.release_po_usage(invoice_id, invoice.company_id)
     
     await db.audit.log_action(
         company_id=invoice.company_id,
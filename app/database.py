@@ -1,13 +1,85 @@
+import asyncio
+import importlib.util
+import logging
+from typing import Any, Dict, List
 from motor.motor_asyncio import AsyncIOMotorClient, AsyncIOMotorGridFSBucket
+from pymongo import monitoring
+from pymongo.read_preferences import read_pref_mode_from_name, make_read_preference
 from app.config import settings
 from app.repositories.invoice import InvoiceRepository
 from app.repositories.vendor import VendorRepository
 from app.repositories.audit import AuditLogger
 from app.repositories.config import ConfigRepository
+from app.repositories.purchase_order import PurchaseOrderRepository
+from app.repositories.vendor_features import VendorFeatureRepository
 from app.models.invoice import Invoice
-from app.models.vendor import Vendor
+from app.models.vendor import Vendor, VendorFeatures
 from app.models.audit import AuditEvent
 from app.models.config import CompanyConfig
+from app.models.purchase_order import PurchaseOrder
+
+logger = logging.getLogger(__name__)
+
+# Python packages the optional wire compressors need
+COMPRESSOR_MODULES = {"zstd": "zstandard", "snappy": "snappy", "zlib": "zlib"}
+
+def available_compressors(preferred: str) -> List[str]:
+    """Keep the configured compressors whose codec is installed, in order."""
+    names = [name.strip() for name in preferred.split(",") if name.strip()]
+    return [name for name in names if importlib.util.find_spec(COMPRESSOR_MODULES.get(name, name))]
+
+class PoolStats(monitoring.ConnectionPoolListener):
+    """Connection pool counters from the driver's CMAP events, for diagnostics."""
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.created = 0
+        self.closed = 0
+        self.checked_out = 0
+        self.checkout_failed = 0
+        self.pools_cleared = 0
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "open": self.created - self.closed,
+            "in_use": self.checked_out,
+            "created": self.created,
+            "closed": self.closed,
+            "checkout_failed": self.checkout_failed,
+            "pools_cleared": self.pools_cleared,
+        }
+
+    def connection_created(self, event):
+        self.created += 1
+
+    def connection_closed(self, event):
+        self.closed += 1
+
+    def connection_checked_out(self, event):
+        self.checked_out += 1
+
+    def connection_checked_in(self, event):
+        self.checked_out -= 1
+
+    def connection_check_out_failed(self, event):
+        self.checkout_failed += 1
+
+    def pool_cleared(self, event):
+        self.pools_cleared += 1
+
+    # Remaining CMAP events are not tracked
+    def pool_created(self, event): pass
+    def pool_ready(self, event): pass
+    def pool_closed(self, event): pass
+    def connection_ready(self, event): pass
+    def connection_check_out_started(self, event): pass
+
+class ReportingRepositories:
+    """Repositories for dashboard reads, which may be served by secondaries."""
+    def __init__(self, db):
+        self.invoices = InvoiceRepository(db.invoices, Invoice)
+        self.audit = AuditLogger(db.audit_log, AuditEvent)
 
 class Database:
     client: AsyncIOMotorClient = None
@@ -18,6 +90,11 @@ class Database:
     vendors: VendorRepository = None
     audit: AuditLogger = None
     config: ConfigRepository = None
+    purchase_orders: PurchaseOrderRepository = None
+    vendor_features: VendorFeatureRepository = None
+    reporting: ReportingRepositories = None
+    pool_stats: PoolStats = None
+    compressors: List[str] = []
     _db = None
     
     @property
@@ -26,8 +103,37 @@ class Database:
     
     def connect(self):
         """Initialize database connection and repositories."""
-        self.client = AsyncIOMotorClient(settings.MONGODB_URL)
-        self._db = self.client[settings.DB_NAME]
+        self.pool_stats = PoolStats()
+        self.compressors = compressors = available_compressors(settings.MONGO_COMPRESSORS)
+        client = AsyncIOMotorClient(
+            settings.MONGODB_URL,
+            maxPoolSize=settings.MONGO_MAX_POOL_SIZE,
+            minPoolSize=settings.MONGO_MIN_POOL_SIZE,
+            maxIdleTimeMS=settings.MONGO_MAX_IDLE_TIME_MS,
+            connectTimeoutMS=settings.MONGO_CONNECT_TIMEOUT_MS,
+            serverSelectionTimeoutMS=settings.MONGO_SERVER_SELECTION_TIMEOUT_MS,
+            waitQueueTimeoutMS=settings.MONGO_WAIT_QUEUE_TIMEOUT_MS,
+            compressors=compressors or None,
+            event_listeners=[self.pool_stats]
+        )
+        self.bind(client)
+        print(f"Connected to MongoDB (pool {settings.MONGO_MIN_POOL_SIZE}-{settings.MONGO_MAX_POOL_SIZE}, "
+              f"compressors: {', '.join(compressors) or 'none'})")
+
+    async def warm_up(self, connections: int = settings.MONGO_MIN_POOL_SIZE):
+        """
+        Open `connections` pooled connections before serving traffic, so the first requests
+        do not pay for server selection, TCP/TLS and auth handshakes.
+        """
+        if connections <= 0:
+            return
+        # Concurrent commands each check out their own connection
+        await asyncio.gather(*[self.client.admin.command("ping") for _ in range(connections)])
+
+    def bind(self, client: AsyncIOMotorClient, name: str = settings.DB_NAME):
+        """Point the repositories at database `name` on an existing client."""
+        self.client = client
+        self._db = self.client[name]
         db = self._db
         self.fs = AsyncIOMotorGridFSBucket(db)
         
@@ -36,13 +142,28 @@ class Database:
         self.vendors = VendorRepository(db.vendors, Vendor)
         self.audit = AuditLogger(db.audit_log, AuditEvent)
         self.config = ConfigRepository(db.company_config, CompanyConfig)
+        self.purchase_orders = PurchaseOrderRepository(db.purchase_orders, PurchaseOrder)
+        self.vendor_features = VendorFeatureRepository(db.vendor_features, VendorFeatures, invoices=db.invoices)
+
+        read_preference = make_read_preference(read_pref_mode_from_name(settings.MONGO_DASHBOARD_READ_PREFERENCE), None)
+        self.reporting = ReportingRepositories(self.client.get_database(name, read_preference=read_preference))
         
-        print("Connected to MongoDB")
-        
+    def pool_snapshot(self) -> Dict[str, Any]:
+        """Pool counters plus the configured limits, for the diagnostics endpoint."""
+        options = self.client.options.pool_options if self.client else None
+        return {
+            "connected": self.client is not None,
+            "max_pool_size": options.max_pool_size if options else None,
+            "min_pool_size": options.min_pool_size if options else None,
+            "compressors": self.compressors,
+            **(self.pool_stats.snapshot() if self.pool_stats else {}),
+        }
+
     def close(self):
         """Close database connection."""
         if self.client:
             self.client.close()
+            self.client = None
             print("Disconnected from MongoDB")
 
 db = Database()
@@ -141,11 +141,8 @@ class AuditLogger:
     async def get_audit_trail(self, invoice_id: str) -> List[AuditEvent]:
         if not db.audit:
             return []
-        # sort by timestamp
-        query = {"invoice_id": invoice_id}
-        cursor = db.db["audit_events"].find(query).sort("timestamp", 1)
-        results = await cursor.to_list(None)
-        return [AuditEvent(**doc) for doc in results]
+        # Same collection and (invoice_id, timestamp) index as AuditLogger.get_for_invoice
+        return await db.audit.get_for_invoice(invoice_id)
 
     async def generate_audit_report(self, invoice_id: str, format: str = "PDF") -> str:
         """
@@ -4,6 +4,8 @@ import logging
 from app.api.auth import User
 from app.database import db
 from app.models.audit import Actor
+from app.repositories.indexes import declare_indexes
+from pymongo import ASCENDING, IndexModel
 
 logger = logging.getLogger(__name__)
 
@@ -49,6 +51,9 @@ ROLE_PERMISSIONS = {
     ]
 }
 
+# check_sod filters the audit trail by invoice and actor type
+declare_indexes("audit_log", IndexModel([("invoice_id", ASCENDING), ("action.performed_by.type", ASCENDING)]))
+
 class PermissionChecker:
     def __init__(self):
         pass
@@ -90,7 +95,7 @@ class PermissionChecker:
         # ActionType: USER_ACTION, Details like "Uploaded..." or "Created..."
         # Or check invoice.created_by if we store it (we assume audit log is source of truth)
         
-        cursor = db.db["audit_events"].find({
+        cursor = db.audit.collection.find({
             "invoice_id": invoice_id,
             "action.performed_by.type": "USER"
         })
@@ -1,19 +1,50 @@
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 import uvicorn
+import asyncio
 import logging
 
 from app.config import settings
+from app.database import db
+from app.repositories.indexes import ensure_indexes
+from app.tools.velocity import velocity_tracker
+from app.agents.sla_timers import sla_timers
 from app.api import invoices, approvals, dashboard, admin, auth, ui
 
 # Setup Logging
 logging.basicConfig(level=settings.LOG_LEVEL)
 logger = logging.getLogger(__name__)
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    db.connect()
+    # Open the minimum pool up front so the first requests skip connection setup
+    await db.warm_up()
+    # Indexes are declared next to the queries that use them; create any that are missing
+    await ensure_indexes(db.db)
+    # Fraud scoring reads vendor velocity from memory; seed it with the last 30 days
+    await velocity_tracker.rebuild()
+    # Optional push invalidation of cached company configs and vendor directories
+    watchers = []
+    if settings.CONFIG_CHANGE_STREAM:
+        watchers.append(asyncio.create_task(db.config.watch_invalidations()))
+    if settings.VENDOR_CHANGE_STREAM:
+        watchers.append(asyncio.create_task(db.vendors.watch_directories()))
+    # SLA thresholds fire from in-memory timers in one process only; reload those persisted before a restart
+    if settings.SLA_TIMER_WHEEL:
+        await sla_timers.load()
+        watchers.append(asyncio.create_task(sla_timers.run()))
+    yield
+    for watcher in watchers:
+        watcher.cancel()
+    db.close()
+
 app = FastAPI(
     title="AI AP Employee API",
     description="Backend API for Autonomous Accounts Payable Agent",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
 # CORS Config
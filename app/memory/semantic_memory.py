@@ -3,9 +3,14 @@ import asyncio
 from typing import List, Dict, Any, Optional
 from app.models.memory import Memory, MemoryType
 from app.database import db
+from app.repositories.indexes import declare_indexes
+from pymongo import ASCENDING, IndexModel
 
 logger = logging.getLogger(__name__)
 
+# get_vendor_patterns; vector search uses the separate Atlas search index
+declare_indexes("memories", IndexModel([("vendor_name", ASCENDING), ("type", ASCENDING)]))
+
 class SemanticMemory:
     """
     Handles storage and retrieval of AP learnings using vector embeddings.
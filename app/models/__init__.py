@@ -1,5 +1,5 @@
 from app.models.base import MongoModel
-from app.models.invoice import Invoice, InvoiceData, LineItem, ValidationResults, MatchingResults, PaymentInstruction, InvoiceStatus, InvoiceState
+from app.models.invoice import Invoice, InvoiceData, LineItem, ValidationResults, MatchingResults, PaymentInstruction, InvoiceStatus, InvoiceState, InvoiceSummary
 from app.models.vendor import Vendor, BankDetails, VendorRiskProfile, VendorContact, VerificationStatus
 from app.models.purchase_order import PurchaseOrder, POStatus
 from app.models.audit import AuditEvent, Action, Decision, Actor, ActionType
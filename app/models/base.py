@@ -1,4 +1,5 @@
-from typing import Annotated, Any, Dict, Type, TypeVar
+import types
+from typing import Annotated, Any, Dict, Optional, Type, TypeVar, Union, get_args, get_origin
 from pydantic import BaseModel, BeforeValidator, Field, ConfigDict
 from bson import ObjectId
 
@@ -23,11 +24,28 @@ class MongoModel(BaseModel):
 
     @classmethod
     def from_mongo(cls: Type[T], data: Dict[str, Any]) -> T:
-        """Convert MongoDB document to Pydantic model."""
+        """Convert MongoDB document to Pydantic model, with full validation. `data` is left untouched."""
         if not data:
             return None
-        id = data.pop("_id", None)
-        return cls(id=id, **data)
+        return cls.model_validate(data)
+
+    @classmethod
+    def projection(cls) -> Dict[str, int]:
+        """
+        Mongo projection selecting only the fields this model declares.
+        Nested models are projected field by field using dotted paths.
+        """
+        fields = {}
+        for name, info in cls.model_fields.items():
+            key = info.alias or name
+            if key == "_id":
+                continue # Always returned
+            nested = _nested_model(info.annotation)
+            if nested:
+                fields.update({f"{key}.{sub}": 1 for sub in nested.projection()})
+            else:
+                fields[key] = 1
+        return fields
 
     def to_mongo(self, exclude_none: bool = False) -> Dict[str, Any]:
         """Convert Pydantic model to MongoDB document."""
@@ -35,3 +53,12 @@ class MongoModel(BaseModel):
         if data.get("_id") is None:
             data.pop("_id", None)
         return data
+
+def _nested_model(annotation: Any) -> Optional[Type[MongoModel]]:
+    """Return the MongoModel behind `X` or `Optional[X]`, None for anything else (lists, scalars)."""
+    if get_origin(annotation) in (Union, types.UnionType):
+        args = [arg for arg in get_args(annotation) if arg is not type(None)]
+        annotation = args[0] if len(args) == 1 else None
+    if isinstance(annotation, type) and issubclass(annotation, MongoModel):
+        return annotation
+    return None
@@ -70,3 +70,6 @@ class CompanyConfig(MongoModel):
     
     system_enabled: bool = True
     notification_email: Optional[str] = None
+
+    # Bumped on every update so compiled policies can be cached per version
+    version: int = 0
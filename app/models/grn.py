@@ -1,7 +1,7 @@
 from datetime import datetime
 from enum import Enum
 from typing import List, Optional
-from pydantic import Field
+from pydantic import BaseModel, Field
 from app.models.base import MongoModel
 from app.models.invoice import LineItem
 
@@ -28,4 +28,12 @@ class GoodsReceiptNote(MongoModel):
     status: GRNStatus = Field(default=GRNStatus.RECEIVED)
     
     delivery_note_ref: Optional[str] = None
+    ledger_applied: bool = Field(False, description="Received quantities added to the PO ledger")
     created_at: datetime = Field(default_factory=datetime.utcnow)
+
+class ReceivedLine(BaseModel):
+    """Quantity received for one PO line, summed over all GRNs against the PO."""
+    description: str
+    product_code: Optional[str] = None
+    quantity: float = 0.0
+    grn_count: int = Field(0, description="Number of GRNs that received this line")
@@ -23,11 +23,13 @@ class LineItem(MongoModel):
     """Represents a single line item on an invoice."""
     item_id: int = Field(..., description="Line number or ID")
     description: str = Field(..., description="Description of the goods/service")
+    product_code: Optional[str] = Field(None, description="SKU or part number, preferred over description for matching")
     quantity: float = Field(..., ge=0)
     unit_price: float = Field(..., ge=0)
     line_total: float = Field(..., ge=0)
     gl_code: Optional[str] = Field(None, description="General Ledger code")
     category: Optional[str] = Field(None, description="Expense category")
+    tax_code: Optional[str] = Field(None, description="VAT code of the line: S (20%), R (5%), Z, E or O (0%)")
 
     @field_validator('line_total')
     @classmethod
@@ -50,14 +52,21 @@ class ValidationResults(MongoModel):
     duplicate_of_id: Optional[str] = Field(None, description="ID of the original invoice if duplicate")
     validation_timestamp: datetime = Field(default_factory=datetime.utcnow)
 
+class POLineUsage(MongoModel):
+    """What one invoice draws from one PO line."""
+    quantity: float = 0.0
+    amount: float = 0.0
+
 class MatchingResults(MongoModel):
     """Results from the 3-way matching agent."""
     has_po: bool = False
     match_status: str = Field("PENDING", description="MATCHED, VARIANCE, NO_PO")
-    quantity_variance: float = 0.0
-    price_variance: float = 0.0
+    quantity_variance: float = Field(0.0, description="Units invoiced beyond goods received")
+    price_variance: float = Field(0.0, description="Amount invoiced above (or below) PO prices")
     auto_approvable: bool = False
     details: str = ""
+    po_number: Optional[str] = None
+    po_usage: Optional[Dict[str, POLineUsage]] = Field(None, description="Usage per PO line index, while counted in the PO ledger")
 
 class PaymentInstruction(MongoModel):
     """Final payment details derived from invoice and vendor data."""
@@ -97,6 +106,17 @@ class InvoiceData(MongoModel):
         """Recalculate total from line items."""
         return sum(item.line_total for item in self.line_items)
 
+class CorrectionTracking(MongoModel):
+    """A VAT correction requested from the vendor, see agents/vat_corrector.py."""
+    request_id: Optional[str] = Field(None, description="ID of the correction request email")
+    requested_at: datetime = Field(default_factory=datetime.utcnow)
+    due_date: datetime
+    status: str = Field("AWAITING_REPLACEMENT", description="AWAITING_REPLACEMENT, TIMEOUT_ESCALATED, RESOLVED_ON_REVALIDATION")
+    overridden: bool = False
+    override_reason: Optional[str] = None
+    overridden_by: Optional[str] = None
+    overridden_at: Optional[datetime] = None
+
 class Invoice(MongoModel):
     """
     Main Invoice document representing the end-to-end lifecycle.
@@ -116,6 +136,7 @@ class Invoice(MongoModel):
     validation: Optional[ValidationResults] = None
     matching: Optional[MatchingResults] = None
     payment: Optional[PaymentInstruction] = None
+    correction_tracking: Optional[CorrectionTracking] = None
     
     # SLA & Escalation
     urgency: str = Field("NORMAL", description="NORMAL, WARNING, URGENT, CRITICAL")
@@ -125,8 +146,14 @@ class Invoice(MongoModel):
     # Metadata
     created_at: datetime = Field(default_factory=datetime.utcnow)
     updated_at: datetime = Field(default_factory=datetime.utcnow)
+    status_changed_at: Optional[datetime] = Field(None, description="When the invoice entered its current status")
     retry_count: int = 0
-    
+    version: int = Field(0, description="Optimistic concurrency counter, bumped on every transition")
+    duplicate_fingerprint: Optional[str] = Field(None, description="Held by at most one live invoice, see duplicate_detector")
+    line_item_minhash: Optional[List[int]] = Field(None, description="MinHash of line item descriptions, see tools/minhash.py")
+    line_item_lsh: List[int] = Field(default_factory=list, description="LSH band keys of line_item_minhash")
+    vendor_features_recorded: List[str] = Field(default_factory=list, description="Counts this invoice added to vendor_features: INVOICE, EXCEPTION")
+
     class Config:
         json_schema_extra = {
             "example": {
@@ -142,6 +169,47 @@ class Invoice(MongoModel):
             }
         }
 
+class InvoiceDataSummary(MongoModel):
+    """Header fields of InvoiceData, without line items."""
+    vendor_name: str
+    vendor_id: Optional[str] = None
+    invoice_number: str
+    invoice_date: datetime
+    due_date: Optional[datetime] = None
+    total: float = 0.0
+    currency: str = "GBP"
+    po_reference: Optional[str] = None
+
+class ValidationSummary(MongoModel):
+    """Risk indicators shown in list views."""
+    is_duplicate: bool = False
+    fraud_score: float = 0.0
+
+class InvoiceSummary(MongoModel):
+    """
+    Slim read model for list views, dashboards and sweeps.
+    Leaves out raw_text, line items, escalation history and workflow result payloads.
+    """
+    invoice_id: str
+    company_id: str
+    status: InvoiceStatus = InvoiceStatus.INGESTION
+    data: Optional[InvoiceDataSummary] = None
+    validation: Optional[ValidationSummary] = None
+    urgency: str = "NORMAL"
+    sla_status: str = "COMPLIANT"
+    created_at: datetime = Field(default_factory=datetime.utcnow)
+    updated_at: datetime = Field(default_factory=datetime.utcnow)
+    version: int = 0
+
+class InvoiceDateSummary(MongoModel):
+    invoice_date: datetime
+
+class LineItemSignature(MongoModel):
+    """Read model for duplicate detection on line items: the candidate's date and MinHash signature."""
+    invoice_id: str
+    data: Optional[InvoiceDateSummary] = None
+    line_item_minhash: Optional[List[int]] = None
+
 # TypedDict for LangGraph context
 class InvoiceState(TypedDict):
     invoice_id: str
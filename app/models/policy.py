@@ -0,0 +1,146 @@
+"""
+Compiled, read-only form of a CompanyConfig used by the agents on every invoice.
+
+Compiling once per config version turns the approval matrix into a sorted interval
+index, the GL mapping into a plain dict and the tolerances into ready-to-compare
+thresholds, so per-invoice decisions are lookups rather than loops over Pydantic models.
+"""
+from bisect import bisect_right
+from collections import Counter
+from datetime import timedelta
+from types import MappingProxyType
+from typing import Dict, FrozenSet, List, Optional, Tuple
+
+from app.models.config import (
+    ApprovalRule, CompanyConfig, GLMapping, MatchingTolerances, SLASettings, ValidationRules
+)
+
+class ApprovalIndex:
+    """
+    Approvers for any amount in O(log n), equivalent to checking every rule with
+    amount_min <= amount <= amount_max (amount_max None meaning unbounded).
+
+    Rule bounds split the amount axis into elementary segments: each bound itself and the
+    open gap after it. Every segment holds the approver set it resolves to, so a lookup is
+    one bisect. Segments with identical sets share one frozenset.
+    """
+    __slots__ = ("_bounds", "_at", "_after")
+
+    def __init__(self, rules: List[ApprovalRule]):
+        starts: Dict[float, List[Tuple[str, ...]]] = {}
+        ends: Dict[float, List[Tuple[str, ...]]] = {}
+        for rule in rules:
+            approvers = tuple(rule.specific_approvers) or (
+                (f"role:{rule.required_role}",) if rule.required_role else ()
+            )
+            if not approvers:
+                continue
+            starts.setdefault(rule.amount_min, []).append(approvers)
+            if rule.amount_max is not None:
+                ends.setdefault(rule.amount_max, []).append(approvers)
+
+        interned: Dict[FrozenSet[str], FrozenSet[str]] = {}
+        active: Counter = Counter()
+        current = frozenset()
+        bounds, at, after = [], [], []
+        for bound in sorted(starts.keys() | ends.keys()):
+            if bound in starts:
+                for approvers in starts[bound]:
+                    active.update(approvers)
+                current = frozenset(+active)
+                current = interned.setdefault(current, current)
+            # Rules ending here still match the bound itself (amount_max is inclusive)
+            at.append(current)
+            if bound in ends:
+                for approvers in ends[bound]:
+                    active.subtract(approvers)
+                current = frozenset(+active)
+                current = interned.setdefault(current, current)
+            after.append(current)
+            bounds.append(bound)
+
+        self._bounds = tuple(bounds)
+        self._at = tuple(at)
+        self._after = tuple(after)
+
+    def __len__(self) -> int:
+        return len(self._bounds)
+
+    def approvers_for(self, amount: float) -> FrozenSet[str]:
+        i = bisect_right(self._bounds, amount) - 1
+        if i < 0:
+            return frozenset()
+        return self._at[i] if self._bounds[i] == amount else self._after[i]
+
+    def next_bound(self, amount: float) -> Optional[float]:
+        """Lowest rule bound above `amount`, i.e. the next point the approvers can change; None past the last."""
+        i = bisect_right(self._bounds, amount)
+        return self._bounds[i] if i < len(self._bounds) else None
+
+class TenantPolicy:
+    """
+    Immutable policy compiled from one version of a tenant's CompanyConfig.
+    Shared between concurrent invoices; never mutate it, recompile instead.
+    """
+    __slots__ = (
+        "company_id", "version", "base_currency",
+        "max_invoice_amount", "vat_tolerance", "duplicate_window", "approved_vendors_only", "require_po_above",
+        "price_variance_percent", "quantity_variance_percent", "total_amount_variance",
+        "approval_index", "gl_by_category", "default_expense_gl", "vat_recoverable_gl", "accounts_payable_gl",
+        "approval_sla", "payment_warning", "payment_urgent", "payment_critical"
+    )
+
+    def __init__(self, company_id: Optional[str], version: int, base_currency: str,
+                 validation: ValidationRules, tolerances: MatchingTolerances,
+                 rules: List[ApprovalRule], gl: GLMapping, sla: SLASettings):
+        setattr_ = object.__setattr__
+        setattr_(self, "company_id", company_id)
+        setattr_(self, "version", version)
+        setattr_(self, "base_currency", base_currency)
+
+        setattr_(self, "max_invoice_amount", validation.max_invoice_amount)
+        setattr_(self, "vat_tolerance", validation.vat_tolerance)
+        setattr_(self, "duplicate_window", timedelta(days=validation.duplicate_detection_window_days))
+        setattr_(self, "approved_vendors_only", validation.approved_vendors_only)
+        setattr_(self, "require_po_above", validation.require_po_above)
+
+        setattr_(self, "price_variance_percent", tolerances.price_variance_percent)
+        setattr_(self, "quantity_variance_percent", tolerances.quantity_variance_percent)
+        setattr_(self, "total_amount_variance", tolerances.total_amount_variance)
+
+        setattr_(self, "approval_index", ApprovalIndex(rules))
+        setattr_(self, "gl_by_category", MappingProxyType(dict(gl.category_map)))
+        setattr_(self, "default_expense_gl", gl.default_expense_gl)
+        setattr_(self, "vat_recoverable_gl", gl.vat_recoverable_gl)
+        setattr_(self, "accounts_payable_gl", gl.accounts_payable_gl)
+
+        setattr_(self, "approval_sla", timedelta(hours=sla.default_approval_sla_hours))
+        setattr_(self, "payment_warning", timedelta(days=sla.payment_warning_days))
+        setattr_(self, "payment_urgent", timedelta(days=sla.payment_urgent_days))
+        setattr_(self, "payment_critical", timedelta(hours=sla.payment_critical_hours))
+
+    def __setattr__(self, name, value):
+        raise AttributeError("TenantPolicy is immutable")
+
+    def __delattr__(self, name):
+        raise AttributeError("TenantPolicy is immutable")
+
+    def approvers_for(self, amount: float) -> List[str]:
+        """Everyone whose approval rule covers `amount`, in a stable order."""
+        return sorted(self.approval_index.approvers_for(amount))
+
+    def gl_code_for(self, category: Optional[str]) -> str:
+        """GL account for an expense category, falling back to the default expense account."""
+        return self.gl_by_category.get(category, self.default_expense_gl) if category else self.default_expense_gl
+
+def compile_policy(config: Optional[CompanyConfig]) -> TenantPolicy:
+    """Compile a tenant's config, or the system defaults when there is none."""
+    if config is None:
+        return TenantPolicy(None, 0, "GBP", ValidationRules(), MatchingTolerances(), [], GLMapping(), SLASettings())
+    return TenantPolicy(
+        config.company_id, config.version, config.base_currency,
+        config.validation_rules, config.matching_tolerances, config.approval_matrix.rules,
+        config.gl_mapping, config.sla_settings
+    )
+
+DEFAULT_POLICY = compile_policy(None)
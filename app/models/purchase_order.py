@@ -14,6 +14,13 @@ class POStatus(str, Enum):
     CLOSED = "CLOSED"
     CANCELLED = "CANCELLED"
 
+class POLineLedger(MongoModel):
+    """Running totals for one PO line, maintained with $inc by PurchaseOrderRepository."""
+    invoiced_quantity: float = 0.0
+    invoiced_amount: float = 0.0
+    received_quantity: float = 0.0
+    received_amount: float = 0.0
+
 class PurchaseOrder(MongoModel):
     """
     Purchase Order document for 3-way matching.
@@ -40,11 +47,19 @@ class PurchaseOrder(MongoModel):
     
     status: POStatus = Field(default=POStatus.ISSUED)
     
+    # Consumption ledger: keyed by line index as a string, so lines can be $inc'ed by path
+    ledger: Dict[str, POLineLedger] = Field(default_factory=dict)
+    invoiced_amount: float = Field(0.0, description="Net amount of matched, unrejected invoices")
+    received_amount: float = Field(0.0, description="Net value of goods received, at PO prices")
+    receipted_grns: List[str] = Field(default_factory=list, description="GRNs already added to the ledger")
+
     notes: Optional[str] = None
     metadata: Optional[Dict[str, Any]] = Field(default_factory=dict)
     created_at: datetime = Field(default_factory=datetime.utcnow)
     updated_at: datetime = Field(default_factory=datetime.utcnow)
 
-    def calculate_remaining_balance(self, invoiced_amount: float) -> float:
-        """Calculate remaining budget on this PO."""
-        return max(0.0, self.total - invoiced_amount)
+    def calculate_remaining_balance(self, invoiced_amount: Optional[float] = None) -> float:
+        """Remaining net budget on this PO, by default after everything in the ledger."""
+        if invoiced_amount is None:
+            invoiced_amount = self.invoiced_amount
+        return max(0.0, self.subtotal - invoiced_amount)
@@ -1,6 +1,7 @@
+import math
 from datetime import datetime
 from enum import Enum
-from typing import Optional, List, Dict
+from typing import Optional, List, Dict, Tuple
 from pydantic import Field, EmailStr, HttpUrl
 from app.models.base import MongoModel
 
@@ -57,3 +58,66 @@ class Vendor(MongoModel):
     
     created_at: datetime = Field(default_factory=datetime.utcnow)
     updated_at: datetime = Field(default_factory=datetime.utcnow)
+
+def vat_rate_key(rate: float) -> str:
+    """VAT rate as a field name: basis points, e.g. 0.2 -> '2000' (Mongo keys cannot hold dots)."""
+    return str(round(rate * 10000))
+
+class VendorFeatures(MongoModel):
+    """
+    Running statistics of one vendor's invoices within a tenant, kept up to date with $inc
+    as invoices are extracted and raise exceptions, plus the vendor facts seen last.
+    Keyed by (company_id, vendor_key), the same canonical vendor as duplicate fingerprints.
+    """
+    company_id: str
+    vendor_key: str
+    vendor_id: Optional[str] = None
+
+    invoice_count: int = 0
+    amount_sum: float = 0.0
+    amount_sum_squares: float = 0.0
+    vat_rates: Dict[str, int] = Field(default_factory=dict, description="vat_rate_key -> invoices at that rate")
+    exception_count: int = 0
+
+    approval_status: Optional[str] = None
+    payment_terms: Optional[str] = None
+    last_bank_change: Optional[datetime] = None
+    updated_at: datetime = Field(default_factory=datetime.utcnow)
+
+    @property
+    def amount_mean(self) -> float:
+        return self.amount_sum / self.invoice_count if self.invoice_count else 0.0
+
+    @property
+    def amount_stddev(self) -> float:
+        """Population standard deviation of invoice totals."""
+        if not self.invoice_count:
+            return 0.0
+        mean = self.amount_sum / self.invoice_count
+        return math.sqrt(max(self.amount_sum_squares / self.invoice_count - mean * mean, 0.0))
+
+    @property
+    def exception_rate(self) -> float:
+        return min(self.exception_count / self.invoice_count, 1.0) if self.invoice_count else 0.0
+
+    def excluding(self, amount: float, vat_rate: Optional[float] = None) -> "VendorFeatures":
+        """A copy without one invoice counted, to score that invoice against the rest of the history."""
+        rates = dict(self.vat_rates)
+        if vat_rate is not None and rates.get(vat_rate_key(vat_rate), 0) > 0:
+            key = vat_rate_key(vat_rate)
+            rates[key] -= 1
+            if not rates[key]:
+                del rates[key]
+        return self.model_copy(update={
+            "invoice_count": max(self.invoice_count - 1, 0),
+            "amount_sum": self.amount_sum - amount,
+            "amount_sum_squares": self.amount_sum_squares - amount * amount,
+            "vat_rates": rates,
+        })
+
+    def usual_vat_rate(self) -> Optional[Tuple[float, float]]:
+        """(Most common VAT rate, share of invoices charging it), or None without history."""
+        if not self.vat_rates:
+            return None
+        key, count = max(self.vat_rates.items(), key=lambda item: item[1])
+        return int(key) / 10000, count / sum(self.vat_rates.values())
@@ -7,6 +7,7 @@ from app.models.invoice import InvoiceStatus
 logger = logging.getLogger(__name__)
 
 class ObservabilityMetrics:
+    # Dashboard aggregates read through db.reporting, which honours MONGO_DASHBOARD_READ_PREFERENCE
     def __init__(self):
         pass
 
@@ -22,7 +23,7 @@ class ObservabilityMetrics:
             {"$match": {"company_id": company_id}},
             {"$group": {"_id": "$status", "count": {"$sum": 1}}}
         ]
-        status_counts = await db.invoices.collection.aggregate(pipeline).to_list(length=None)
+        status_counts = await db.reporting.invoices.collection.aggregate(pipeline).to_list(length=None)
         status_map = {item["_id"]: item["count"] for item in status_counts}
 
         # 2. Success/Failure in last 24h
@@ -38,7 +39,7 @@ class ObservabilityMetrics:
                 "paid": {"$sum": {"$cond": [{"$eq": ["$status", InvoiceStatus.PAID]}, 1, 0]}}
             }}
         ]
-        results = await db.invoices.collection.aggregate(period_pipeline).to_list(length=None)
+        results = await db.reporting.invoices.collection.aggregate(period_pipeline).to_list(length=None)
         period_stats = results[0] if results else {"total": 0, "exceptions": 0, "paid": 0}
 
         success_rate = 0.0
@@ -73,7 +74,7 @@ class ObservabilityMetrics:
                 "count": {"$sum": 1}
             }}
         ]
-        results = await db.audit.collection.aggregate(pipeline).to_list(length=None)
+        results = await db.reporting.audit.collection.aggregate(pipeline).to_list(length=None)
         
         success_count = 0
         failure_count = 0
@@ -98,7 +99,7 @@ class ObservabilityMetrics:
         Track LLM costs. For MVP, we estimate based on extraction counts.
         Assuming $0.01 per successful extraction for demo purposes.
         """
-        count = await db.invoices.count({"company_id": company_id, "status": {"$ne": InvoiceStatus.INGESTION}})
+        count = await db.reporting.invoices.count({"company_id": company_id, "status": {"$ne": InvoiceStatus.INGESTION}})
         estimated_cost = count * 0.01 # Mock cost factor
         
         return {
@@ -115,7 +116,7 @@ class ObservabilityMetrics:
             {"$match": {"company_id": company_id}},
             {"$group": {"_id": "$sla_status", "count": {"$sum": 1}}}
         ]
-        results = await db.invoices.collection.aggregate(pipeline).to_list(length=None)
+        results = await db.reporting.invoices.collection.aggregate(pipeline).to_list(length=None)
         
         # Ensure we return 0 for missing categories
         compliance_map = {
@@ -133,7 +134,7 @@ class ObservabilityMetrics:
         """
         Return count of fraud alerts.
         """
-        high_risk_count = await db.invoices.count({
+        high_risk_count = await db.reporting.invoices.count({
             "company_id": company_id,
             "validation.fraud_score": {"$gt": 0.7}
         })
@@ -145,7 +146,7 @@ class ObservabilityMetrics:
             {"$sort": {"count": -1}},
             {"$limit": 5}
         ]
-        top_flags = await db.invoices.collection.aggregate(flag_pipeline).to_list(length=None)
+        top_flags = await db.reporting.invoices.collection.aggregate(flag_pipeline).to_list(length=None)
 
         return {
             "high_risk_invoices": high_risk_count,
@@ -1,9 +1,12 @@
 from typing import List
+from pymongo import ASCENDING, IndexModel
 from app.repositories.base import BaseRepository
+from app.repositories.indexes import uses_indexes
 from app.models.audit import AuditEvent, Action, Actor, ActionType
 
 class AuditLogger(BaseRepository[AuditEvent]):
     
+    @uses_indexes("audit_log", IndexModel([("event_id", ASCENDING)], unique=True))
     async def log_event(self, event: AuditEvent):
         """Log an event to the audit trail."""
         await self.create(event)
@@ -32,6 +35,8 @@ class AuditLogger(BaseRepository[AuditEvent]):
         )
         await self.create(event)
 
+    @uses_indexes("audit_log", IndexModel([("invoice_id", ASCENDING), ("timestamp", ASCENDING)]))
     async def get_for_invoice(self, invoice_id: str) -> List[AuditEvent]:
-        """Retrieve all audit events for a specific invoice."""
-        return await self.get_all_by_field("invoice_id", invoice_id)
+        """Retrieve all audit events for a specific invoice, oldest first."""
+        docs = await self.collection.find({"invoice_id": invoice_id}).sort("timestamp", ASCENDING).to_list(None)
+        return [self._hydrate(doc) for doc in docs]
@@ -1,30 +1,156 @@
-from typing import Generic, TypeVar, Any, Dict, List, Optional
+import base64
+import time
+from collections import OrderedDict
+from typing import Generic, TypeVar, Any, Collection, Dict, List, Optional, Sequence, Tuple, Type
 from motor.motor_asyncio import AsyncIOMotorCollection
+import bson
 from bson import ObjectId
+from pydantic import BaseModel, Field
+from pymongo import ASCENDING, InsertOne, UpdateOne
+from pymongo.errors import BulkWriteError
 from app.models.base import MongoModel
 
 T = TypeVar("T", bound=MongoModel)
 
+DEFAULT_BATCH_SIZE = 1000
+COUNT_CACHE_TTL_SECONDS = 30
+COUNT_CACHE_MAX_ENTRIES = 256 # Filters come from clients; the least recently used are dropped beyond this
+
+class BulkWriteSummary(BaseModel):
+    """Aggregated outcome of a batched bulk_write, including per-operation failures."""
+    inserted_count: int = 0
+    matched_count: int = 0
+    modified_count: int = 0
+    upserted_count: int = 0
+    batches: int = 0
+    errors: List[Dict[str, Any]] = Field(default_factory=list, description="index (into the input list), code, message")
+    upserted_indexes: List[int] = Field(default_factory=list, description="Input indexes whose upsert inserted a document")
+
+    @property
+    def ok(self) -> bool:
+        return not self.errors
+
+    def _merge(self, result: Dict[str, Any], offset: int):
+        self.batches += 1
+        self.inserted_count += result.get("nInserted", 0)
+        self.matched_count += result.get("nMatched", 0)
+        self.modified_count += result.get("nModified", 0)
+        self.upserted_count += result.get("nUpserted", 0)
+        self.upserted_indexes.extend(offset + upsert["index"] for upsert in result.get("upserted", []))
+        for err in result.get("writeErrors", []):
+            self.errors.append({
+                "index": offset + err["index"],
+                "code": err.get("code"),
+                "message": err.get("errmsg")
+            })
+
+class Page(BaseModel, Generic[T]):
+    """One page of a keyset-paginated listing."""
+    items: List[T]
+    next_cursor: Optional[str] = Field(None, description="Opaque token for the next page, None on the last page")
+    total: Optional[int] = Field(None, description="Cached estimate of matching documents, only when requested")
+
+def encode_cursor(sort: Sequence[Tuple[str, int]], values: List[Any]) -> str:
+    """Opaque, URL-safe token holding the sort keys of the last document on a page."""
+    raw = bson.encode({"s": [key for key, _ in sort], "k": values})
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+def decode_cursor(sort: Sequence[Tuple[str, int]], token: str) -> List[Any]:
+    """Inverse of encode_cursor. Raises ValueError for malformed tokens or tokens from another ordering."""
+    try:
+        doc = bson.decode(base64.urlsafe_b64decode(token + "=" * (-len(token) % 4)))
+    except Exception:
+        raise ValueError("Invalid cursor")
+    if doc.get("s") != [key for key, _ in sort] or len(doc.get("k", [])) != len(sort):
+        raise ValueError("Cursor does not match this listing")
+    return doc["k"]
+
+def _seek_filter(sort: Sequence[Tuple[str, int]], values: List[Any]) -> Dict[str, Any]:
+    """
+    Documents strictly after `values` in `sort` order, e.g. for (created_at desc, _id desc):
+    created_at < c OR (created_at == c AND _id < id).
+    """
+    clauses = []
+    for i, (key, direction) in enumerate(sort):
+        clause = {prev_key: prev for (prev_key, _), prev in zip(sort[:i], values[:i])}
+        clause[key] = {"$gt" if direction == ASCENDING else "$lt": values[i]}
+        clauses.append(clause)
+    return {"$or": clauses}
+
+def _get_path(doc: Dict[str, Any], path: str) -> Any:
+    for part in path.split("."):
+        doc = doc.get(part) if isinstance(doc, dict) else None
+    return doc
+
 class BaseRepository(Generic[T]):
     def __init__(self, collection: AsyncIOMotorCollection, model_cls: type[T]):
         self.collection = collection
         self.model_cls = model_cls
+        self._count_cache: "OrderedDict[str, Tuple[float, int]]" = OrderedDict()
 
-    async def get(self, id: str) -> Optional[T]:
-        """Get a document by ID."""
-        doc = await self.collection.find_one({"_id": ObjectId(id)})
-        return self.model_cls.from_mongo(doc) if doc else None
+    async def get(self, id: str, view: Optional[Type[MongoModel]] = None) -> Optional[T]:
+        """Get a document by ID. Pass a slim `view` model to fetch and hydrate only its fields."""
+        doc = await self.collection.find_one({"_id": ObjectId(id)}, self._projection(view))
+        return self._hydrate(doc, view) if doc else None
     
-    async def get_by_field(self, field: str, value: Any) -> Optional[T]:
-        """Get a document by a specific field."""
-        doc = await self.collection.find_one({field: value})
-        return self.model_cls.from_mongo(doc) if doc else None
-
-    async def list(self, filter: Dict[str, Any] = {}, skip: int = 0, limit: int = 100) -> List[T]:
-        """List documents with optional filter and pagination."""
-        cursor = self.collection.find(filter).skip(skip).limit(limit)
+    async def get_by_field(self, field: str, value: Any, view: Optional[Type[MongoModel]] = None) -> Optional[T]:
+        """Get a document by a specific field, optionally as a slim `view` model."""
+        doc = await self.collection.find_one({field: value}, self._projection(view))
+        return self._hydrate(doc, view) if doc else None
+
+    async def list(self, filter: Dict[str, Any] = {}, skip: int = 0, limit: int = 100,
+                   view: Optional[Type[MongoModel]] = None) -> List[T]:
+        """List documents with optional filter and pagination, optionally as a slim `view` model."""
+        cursor = self.collection.find(filter, self._projection(view)).skip(skip).limit(limit)
         docs = await cursor.to_list(length=limit)
-        return [self.model_cls.from_mongo(doc) for doc in docs]
+        return [self._hydrate(doc, view) for doc in docs]
+
+    async def paginate(self, filter: Dict[str, Any], sort: Sequence[Tuple[str, int]], cursor: Optional[str] = None,
+                       limit: int = 50, view: Optional[Type[MongoModel]] = None, with_total: bool = False) -> Page:
+        """
+        Keyset (seek) pagination: each page resumes after the last sort key of the previous one,
+        so cost depends on `limit` rather than on how deep the page is. The last sort key must be
+        unique (normally _id), and an index on the filter + sort fields keeps every page an index range scan.
+        """
+        query = filter
+        if cursor:
+            query = {"$and": [filter, _seek_filter(sort, decode_cursor(sort, cursor))]}
+        projection = self._projection(view)
+        if projection is not None:
+            # Sort keys are needed to build the next cursor
+            projection = {**projection, **{key: 1 for key, _ in sort if key != "_id"}}
+
+        # Fetch one extra document to learn whether another page exists
+        docs = await self.collection.find(query, projection).sort(list(sort)).limit(limit + 1).to_list(length=limit + 1)
+        next_cursor = None
+        if len(docs) > limit:
+            docs = docs[:limit]
+            next_cursor = encode_cursor(sort, [_get_path(docs[-1], key) for key, _ in sort])
+
+        total = await self.count_estimate(filter) if with_total else None
+        return Page(items=[self._hydrate(doc, view) for doc in docs], next_cursor=next_cursor, total=total)
+
+    async def count_estimate(self, filter: Dict[str, Any] = {}, ttl: float = COUNT_CACHE_TTL_SECONDS) -> int:
+        """
+        Document count for listings, cached per filter for `ttl` seconds, for at most
+        COUNT_CACHE_MAX_ENTRIES filters. Unfiltered counts use collection metadata instead of scanning.
+        """
+        key = repr(sorted(filter.items()))
+        cached = self._count_cache.get(key)
+        now = time.monotonic()
+        if cached and now - cached[0] < ttl:
+            self._count_cache.move_to_end(key)
+            return cached[1]
+
+        if filter:
+            total = await self.collection.count_documents(filter)
+        else:
+            total = await self.collection.estimated_document_count()
+        self._count_cache[key] = (now, total)
+        self._count_cache.move_to_end(key)
+        if len(self._count_cache) > COUNT_CACHE_MAX_ENTRIES:
+            self._count_cache.popitem(last=False)
+        return total
 
     async def create(self, model: T) -> T:
         """Create a new document."""
@@ -55,3 +181,68 @@ class BaseRepository(Generic[T]):
     async def count(self, filter: Dict[str, Any] = {}) -> int:
         """Count documents matching a filter."""
         return await self.collection.count_documents(filter)
+
+    async def bulk_create(self, models: Sequence[T], ordered: bool = False,
+                          batch_size: int = DEFAULT_BATCH_SIZE) -> BulkWriteSummary:
+        """Insert many documents, batch_size per round trip. Successfully inserted models get their id set."""
+        docs = [model.to_mongo() for model in models]
+        for doc in docs:
+            # Assign ids client-side so they are known without reading the batch back
+            doc.setdefault("_id", ObjectId())
+        summary = await self._bulk_write([InsertOne(doc) for doc in docs], ordered, batch_size)
+
+        failed = {err["index"] for err in summary.errors}
+        attempted = len(docs) if not (ordered and failed) else min(failed)
+        for index in range(attempted):
+            if index not in failed:
+                models[index].id = str(docs[index]["_id"])
+        return summary
+
+    async def bulk_update(self, updates: Sequence[Tuple[Dict[str, Any], Dict[str, Any]]], ordered: bool = False,
+                          batch_size: int = DEFAULT_BATCH_SIZE) -> BulkWriteSummary:
+        """
+        Apply many (filter, update) pairs with update_one semantics.
+        Updates without operators are wrapped in $set, like `update`; pipelines (lists) are sent as they are.
+        """
+        operations = [
+            UpdateOne(filter, update if isinstance(update, list) or any(key.startswith("$") for key in update)
+                      else {"$set": update})
+            for filter, update in updates
+        ]
+        return await self._bulk_write(operations, ordered, batch_size)
+
+    async def bulk_upsert(self, models: Sequence[T], key_fields: Sequence[str], ordered: bool = False,
+                          batch_size: int = DEFAULT_BATCH_SIZE, insert_only: Collection[str] = ()) -> BulkWriteSummary:
+        """
+        Insert or overwrite many documents, matched on their natural key (e.g. ["vendor_id"]).
+        Fields in `insert_only` are written when a document is created and left alone otherwise.
+        """
+        operations = []
+        for model in models:
+            doc = model.to_mongo()
+            doc.pop("_id", None)
+            update = {"$set": {k: v for k, v in doc.items() if k not in insert_only}}
+            if insert_only:
+                update["$setOnInsert"] = {k: v for k, v in doc.items() if k in insert_only}
+            operations.append(UpdateOne({key: doc[key] for key in key_fields}, update, upsert=True))
+        return await self._bulk_write(operations, ordered, batch_size)
+
+    def _projection(self, view: Optional[Type[MongoModel]]) -> Optional[Dict[str, int]]:
+        return view.projection() if view else None
+
+    def _hydrate(self, doc: Dict[str, Any], view: Optional[Type[MongoModel]] = None):
+        return (view or self.model_cls).from_mongo(doc)
+
+    async def _bulk_write(self, operations: List[Any], ordered: bool, batch_size: int) -> BulkWriteSummary:
+        summary = BulkWriteSummary()
+        for offset in range(0, len(operations), batch_size):
+            try:
+                result = await self.collection.bulk_write(operations[offset:offset + batch_size], ordered=ordered)
+                summary._merge(result.bulk_api_result, offset)
+            except BulkWriteError as e:
+                # Counts for the writes that did succeed are still reported in details
+                summary._merge(e.details, offset)
+                if ordered:
+                    # Ordered writes stop at the first failure, later batches are not attempted
+                    break
+        return summary
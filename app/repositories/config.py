@@ -1,8 +1,102 @@
-from typing import Optional
+import logging
+import time
+from typing import Any, Dict, Optional, Tuple
+from pymongo import ASCENDING, IndexModel, ReturnDocument
+from pymongo.errors import OperationFailure
+from app.config import settings
 from app.repositories.base import BaseRepository
+from app.repositories.indexes import uses_indexes
 from app.models.config import CompanyConfig
+from app.models.policy import TenantPolicy, compile_policy
+
+logger = logging.getLogger(__name__)
 
 class ConfigRepository(BaseRepository[CompanyConfig]):
-    async def get_by_company_id(self, company_id: str) -> Optional[CompanyConfig]:
+    """
+    Tenant configuration, cached per process for CONFIG_CACHE_TTL_SECONDS.
+    Cached configs are shared between callers and must be treated as read-only.
+    """
+    def __init__(self, *args, ttl: float = settings.CONFIG_CACHE_TTL_SECONDS, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.ttl = ttl
+        self._cache: Dict[str, Tuple[float, CompanyConfig]] = {}
+        # company_id -> (the config compiled, its policy)
+        self._policies: Dict[str, Tuple[CompanyConfig, TenantPolicy]] = {}
+
+    @uses_indexes("company_config", IndexModel([("company_id", ASCENDING)], unique=True))
+    async def get_by_company_id(self, company_id: str, fresh: bool = False) -> Optional[CompanyConfig]:
+        """Config for `company_id`, from the cache unless expired or `fresh` is set."""
+        cached = self._cache.get(company_id)
+        if cached and not fresh and time.monotonic() - cached[0] < self.ttl:
+            return cached[1]
+
         doc = await self.collection.find_one({"company_id": company_id})
-        return self.model_cls.from_mongo(doc) if doc else None
+        config = self._hydrate(doc) if doc else None
+        if config:
+            self._cache[company_id] = (time.monotonic(), config)
+        else:
+            self._cache.pop(company_id, None)
+        return config
+
+    async def get_policy(self, company_id: str) -> Optional[TenantPolicy]:
+        """
+        Compiled policy for the tenant's current config, or None if the company does not exist.
+        Compiled once per config content, so TTL refreshes of an unchanged config reuse it.
+        Compared by content rather than version, since not every writer bumps the version.
+        """
+        config = await self.get_by_company_id(company_id)
+        if not config:
+            return None
+        cached = self._policies.get(company_id)
+        if cached and (cached[0] is config or cached[0] == config):
+            return cached[1]
+        policy = compile_policy(config)
+        self._policies[company_id] = (config, policy)
+        return policy
+
+    async def update_by_company_id(self, company_id: str, update_data: Dict[str, Any]) -> Optional[CompanyConfig]:
+        """
+        Apply a partial update, bump the config version and refresh the cached copy.
+        Returns None if the company does not exist.
+        """
+        update_data = {k: v for k, v in update_data.items() if k != "version"}
+        doc = await self.collection.find_one_and_update(
+            {"company_id": company_id},
+            {"$set": update_data, "$inc": {"version": 1}},
+            return_document=ReturnDocument.AFTER
+        )
+        self.invalidate(company_id)
+        if not doc:
+            return None
+        config = self._hydrate(doc)
+        self._cache[company_id] = (time.monotonic(), config)
+        return config
+
+    async def create(self, model: CompanyConfig) -> CompanyConfig:
+        created = await super().create(model)
+        self.invalidate(model.company_id)
+        return created
+
+    def invalidate(self, company_id: Optional[str] = None):
+        """Drop one tenant's cached config and compiled policies, or all of them."""
+        if company_id is None:
+            self._cache.clear()
+            self._policies.clear()
+        else:
+            self._cache.pop(company_id, None)
+            self._policies.pop(company_id, None)
+
+    async def watch_invalidations(self):
+        """
+        Invalidate cached configs as soon as any process changes them, using a change stream.
+        Runs until cancelled. Change streams need a replica set; on a standalone mongod this
+        logs and returns, leaving the TTL as the only bound on staleness.
+        """
+        try:
+            async with self.collection.watch(full_document="updateLookup") as stream:
+                async for change in stream:
+                    company_id = (change.get("fullDocument") or {}).get("company_id")
+                    # Deletes only carry the _id, so drop everything
+                    self.invalidate(company_id)
+        except OperationFailure as e:
+            logger.warning(f"Config change stream unavailable, relying on TTL: {e}")
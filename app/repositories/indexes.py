@@ -0,0 +1,52 @@
+"""
+Index declarations live next to the queries that depend on them and are applied at startup.
+
+Repository methods use the `uses_indexes` decorator; modules querying raw collections
+call `declare_indexes` beside the query. `ensure_indexes` creates whatever is missing.
+"""
+import logging
+from typing import Any, Callable, Dict, List
+from pymongo import IndexModel
+from pymongo.errors import OperationFailure
+
+logger = logging.getLogger(__name__)
+
+# collection name -> index name -> IndexModel
+_DECLARED: Dict[str, Dict[str, IndexModel]] = {}
+
+def declare_indexes(collection: str, *indexes: IndexModel):
+    """Register indexes that queries on `collection` rely on. Declaring the same index twice is harmless."""
+    registry = _DECLARED.setdefault(collection, {})
+    for index in indexes:
+        registry[index.document["name"]] = index
+
+def uses_indexes(collection: str, *indexes: IndexModel) -> Callable:
+    """Decorator form of declare_indexes for repository methods. The method itself is unchanged."""
+    declare_indexes(collection, *indexes)
+
+    def decorator(fn: Callable) -> Callable:
+        return fn
+    return decorator
+
+def declared_indexes() -> Dict[str, List[IndexModel]]:
+    """Everything declared so far, by collection."""
+    return {collection: list(indexes.values()) for collection, indexes in _DECLARED.items()}
+
+async def ensure_indexes(database: Any) -> Dict[str, List[str]]:
+    """
+    Create every declared index that does not exist yet, matched by index name.
+    Cheap enough to run on every startup. Returns the index names created per collection.
+    """
+    created = {}
+    for collection, indexes in _DECLARED.items():
+        existing = await database[collection].index_information()
+        missing = [index for name, index in indexes.items() if name not in existing]
+        if not missing:
+            continue
+        try:
+            created[collection] = await database[collection].create_indexes(missing)
+            logger.info(f"Created indexes on {collection}: {created[collection]}")
+        except OperationFailure as e:
+            # Typically the same keys already indexed under other options; needs a manual migration
+            logger.error(f"Could not create indexes on {collection}: {e}")
+    return created
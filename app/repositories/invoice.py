@@ -1,13 +1,80 @@
-from typing import List, Optional
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional, Union
 from motor.motor_asyncio import AsyncIOMotorClientSession
-from app.repositories.base import BaseRepository
-from app.models.invoice import Invoice
+from pymongo import ASCENDING, DESCENDING, IndexModel, ReturnDocument
+from app.repositories.base import BaseRepository, Page
+from app.repositories.indexes import uses_indexes
+from app.models.base import MongoModel
+from app.models.invoice import Invoice, InvoiceStatus, LineItemSignature, MatchingResults
+
+# Newest first; _id breaks ties between invoices created in the same millisecond.
+# Backed by the (company_id[, status], created_at, _id) indexes declared on list_page.
+LIST_ORDER = [("created_at", DESCENDING), ("_id", DESCENDING)]
 
 class InvoiceRepository(BaseRepository[Invoice]):
-    
+
+    @uses_indexes("invoices", IndexModel([("company_id", ASCENDING), ("data.invoice_number", ASCENDING)]))
     async def get_by_invoice_number(self, invoice_number: str, company_id: str) -> Optional[Invoice]:
-        return await self.get_by_field("invoice_number", invoice_number) # Should also filter by company_id ideally in finding
+        doc = await self.collection.find_one({"company_id": company_id, "data.invoice_number": invoice_number})
+        return self._hydrate(doc) if doc else None
+
+    @uses_indexes("invoices", IndexModel(
+        [("duplicate_fingerprint", ASCENDING)], unique=True,
+        # Invoices without a fingerprint (not yet extracted, or rejected) are left out of the index
+        partialFilterExpression={"duplicate_fingerprint": {"$type": "string"}}
+    ))
+    async def get_by_fingerprint(self, fingerprint: str, exclude_invoice_id: Optional[str] = None) -> Optional[Invoice]:
+        """The live invoice holding a duplicate fingerprint, other than `exclude_invoice_id`."""
+        filter: Dict[str, Any] = {"duplicate_fingerprint": fingerprint}
+        if exclude_invoice_id:
+            filter["invoice_id"] = {"$ne": exclude_invoice_id}
+        doc = await self.collection.find_one(filter)
+        return self._hydrate(doc) if doc else None
+
+    @uses_indexes("invoices", IndexModel([("company_id", ASCENDING), ("data.vendor_name", ASCENDING),
+                                          ("line_item_lsh", ASCENDING), ("data.invoice_date", ASCENDING)]))
+    async def get_by_line_item_bands(self, company_id: Optional[str], vendor_name: str, bands: List[int],
+                                     date_start: datetime, date_end: datetime, exclude_invoice_id: Optional[str] = None,
+                                     limit: int = 20) -> List[LineItemSignature]:
+        """
+        Live invoices from the vendor dated within the range and sharing an LSH band, i.e. with
+        similar line items. The date range is part of the query, so `limit` only cuts true candidates.
+        """
+        filter: Dict[str, Any] = {
+            "data.vendor_name": vendor_name,
+            "line_item_lsh": {"$in": bands},
+            "data.invoice_date": {"$gte": date_start, "$lte": date_end},
+            "status": {"$ne": InvoiceStatus.REJECTED}
+        }
+        if company_id:
+            filter["company_id"] = company_id
+        if exclude_invoice_id:
+            filter["invoice_id"] = {"$ne": exclude_invoice_id}
+        return await self.list(filter, limit=limit, view=LineItemSignature)
 
+    @uses_indexes("invoices", IndexModel([("data.vendor_name", ASCENDING), ("line_item_lsh", ASCENDING)]))
+    async def get_screening_candidates(self, vendor_names: List[str], fingerprints: List[str], totals: List[float],
+                                       date_start: datetime, date_end: datetime, bands: List[int],
+                                       exclude_invoice_ids: List[str] = []) -> List[Invoice]:
+        """
+        Every live invoice that could duplicate one of a batch from the same vendor, in one query:
+        a fingerprint hit, a total in `totals` within the date range, or a shared LSH band.
+        Each $or branch is served by the fingerprint, (vendor, total, date) or (vendor, LSH) index.
+        """
+        branches: List[Dict[str, Any]] = [
+            {"duplicate_fingerprint": {"$in": fingerprints}},
+            {"data.vendor_name": {"$in": vendor_names}, "data.total": {"$in": totals},
+             "data.invoice_date": {"$gte": date_start, "$lte": date_end}},
+        ]
+        if bands:
+            branches.append({"data.vendor_name": {"$in": vendor_names}, "line_item_lsh": {"$in": bands}})
+        filter = {"$or": branches, "status": {"$ne": InvoiceStatus.REJECTED}}
+        if exclude_invoice_ids:
+            filter["invoice_id"] = {"$nin": exclude_invoice_ids}
+        docs = await self.collection.find(filter).to_list(length=None)
+        return [self._hydrate(doc) for doc in docs]
+
+    @uses_indexes("invoices", IndexModel([("data.vendor_name", ASCENDING), ("data.total", ASCENDING), ("data.invoice_date", ASCENDING)]))
     async def get_duplicate_candidates(self, vendor_name: str, total_amount: float, date_range_start, date_range_end) -> List[Invoice]:
         """Find invoices that might be duplicates based on vendor, amount, and date window."""
         filter = {
@@ -18,6 +85,18 @@ class InvoiceRepository(BaseRepository[Invoice]):
         }
         return await self.list(filter, limit=10)
 
+    @uses_indexes(
+        "invoices",
+        IndexModel([("company_id", ASCENDING), ("created_at", DESCENDING), ("_id", DESCENDING)]),
+        IndexModel([("company_id", ASCENDING), ("status", ASCENDING), ("created_at", DESCENDING), ("_id", DESCENDING)])
+    )
+    async def list_page(self, company_id: str, filter: Dict[str, Any] = {}, cursor: Optional[str] = None,
+                        limit: int = 50, view: Optional[type[MongoModel]] = None, with_total: bool = False) -> Page:
+        """One page of a tenant's invoices, newest first. Pass the returned next_cursor to continue."""
+        return await self.paginate({"company_id": company_id, **filter}, LIST_ORDER, cursor=cursor,
+                                   limit=limit, view=view, with_total=with_total)
+
+    @uses_indexes("invoices", IndexModel([("invoice_id", ASCENDING)], unique=True))
     async def update_status(self, invoice_id: str, status: str, session: AsyncIOMotorClientSession = None) -> bool:
         """Update invoice status transactionally."""
         result = await self.collection.update_one(
@@ -26,3 +105,67 @@ class InvoiceRepository(BaseRepository[Invoice]):
             session=session
         )
         return result.modified_count > 0
+
+    async def transition(self,
+                         invoice_id: str,
+                         expected_from: Union[InvoiceStatus, Iterable[InvoiceStatus], None],
+                         to: InvoiceStatus,
+                         set_fields: Optional[Dict[str, Any]] = None,
+                         expected_version: Optional[int] = None,
+                         session: AsyncIOMotorClientSession = None) -> Optional[Invoice]:
+        """
+        Atomically move an invoice to status `to` and apply `set_fields` in one round trip.
+
+        The write only applies if the invoice is currently in `expected_from` (a status,
+        a list of statuses, or None for any) and, when given, still at `expected_version`.
+        `previous_state`, `status_changed_at`, `updated_at` and `version` are maintained here, and rejected invoices
+        release their duplicate fingerprint. Returns the updated invoice, or None if the transition was stale.
+        Raises DuplicateKeyError if `set_fields` claims a fingerprint another live invoice holds.
+        """
+        filter: Dict[str, Any] = {"invoice_id": invoice_id}
+        if expected_from is not None:
+            if isinstance(expected_from, (str, InvoiceStatus)):
+                filter["status"] = expected_from
+            else:
+                filter["status"] = {"$in": list(expected_from)}
+        if expected_version is not None:
+            # Documents written before versioning have no field; treat them as version 0
+            filter["version"] = {"$in": [0, None]} if expected_version == 0 else expected_version
+
+        # Pipeline update so previous_state can be taken from the stored status.
+        # User supplied values are wrapped in $literal so they are never parsed as expressions.
+        fields = {key: {"$literal": value} for key, value in (set_fields or {}).items()}
+        now = datetime.utcnow()
+        fields.update({
+            "previous_state": {"$cond": [{"$eq": ["$status", to]}, "$previous_state", "$status"]},
+            # Same-status writes keep the clock of the current status running
+            "status_changed_at": {"$cond": [{"$eq": ["$status", to]}, {"$ifNull": ["$status_changed_at", "$updated_at"]}, now]},
+            "status": to,
+            "updated_at": now,
+            "version": {"$add": [{"$ifNull": ["$version", 0]}, 1]},
+        })
+        if to == InvoiceStatus.REJECTED:
+            # Lets a corrected re-submission of the same invoice through
+            fields["duplicate_fingerprint"] = "$$REMOVE"
+
+        doc = await self.collection.find_one_and_update(
+            filter,
+            [{"$set": fields}],
+            return_document=ReturnDocument.AFTER,
+            session=session
+        )
+        return self._hydrate(doc) if doc else None
+
+    async def claim_po_usage(self, invoice_id: str) -> Optional[MatchingResults]:
+        """
+        Atomically clear the invoice's recorded PO usage and return the matching results
+        that held it, so the caller can release it from the PO ledger exactly once.
+        None if the invoice has no usage counted. Does not bump the invoice version.
+        """
+        doc = await self.collection.find_one_and_update(
+            {"invoice_id": invoice_id, "matching.po_usage": {"$type": "object"}},
+            {"$set": {"matching.po_usage": None}},
+            projection={"matching": 1},
+            return_document=ReturnDocument.BEFORE
+        )
+        return MatchingResults.from_mongo(doc["matching"]) if doc else None
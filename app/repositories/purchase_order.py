@@ -0,0 +1,148 @@
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+from pymongo import ASCENDING, IndexModel, UpdateOne
+from app.repositories.base import DEFAULT_BATCH_SIZE, BaseRepository
+from app.repositories.indexes import declare_indexes, uses_indexes
+from app.models.purchase_order import PurchaseOrder
+from app.models.grn import GoodsReceiptNote, ReceivedLine
+from app.models.invoice import LineItem, POLineUsage
+from app.tools.matching_engine import POIndex
+
+# The $lookup in get_with_receipts seeks GRNs by PO number within the tenant
+declare_indexes("goods_receipt_notes", IndexModel([("po_number", ASCENDING), ("company_id", ASCENDING)]))
+
+class PurchaseOrderRepository(BaseRepository[PurchaseOrder]):
+    @uses_indexes("purchase_orders", IndexModel([("po_number", ASCENDING)], unique=True))
+    async def get_with_receipts(self, po_number: str, company_id: str) -> Optional[Tuple[PurchaseOrder, List[ReceivedLine]]]:
+        """
+        A PO and the quantities received against each of its lines, in one round trip.
+        GRN lines are summed server-side per (product code, description), so however many
+        GRNs a PO has, only one row per distinct line comes back. None if the PO does not exist.
+        """
+        pipeline = [
+            {"$match": {"po_number": po_number, "company_id": company_id}},
+            {"$limit": 1},
+            {"$lookup": {
+                "from": "goods_receipt_notes",
+                "localField": "po_number",
+                "foreignField": "po_number",
+                "pipeline": [
+                    {"$match": {"company_id": company_id}},
+                    {"$unwind": "$line_items"},
+                    {"$group": {
+                        "_id": {"product_code": "$line_items.product_code", "description": "$line_items.description"},
+                        "quantity": {"$sum": "$line_items.quantity"},
+                        "grns": {"$addToSet": "$grn_number"}
+                    }},
+                    {"$project": {
+                        "_id": 0, "product_code": "$_id.product_code", "description": "$_id.description",
+                        "quantity": 1, "grn_count": {"$size": "$grns"}
+                    }}
+                ],
+                "as": "received"
+            }}
+        ]
+        docs = await self.collection.aggregate(pipeline).to_list(length=1)
+        if not docs:
+            return None
+        doc = docs[0]
+        received = [ReceivedLine(**line) for line in doc.pop("received", [])]
+        return self._hydrate(doc), received
+
+    async def record_usage(self, po_number: str, company_id: str, usage: Dict[str, POLineUsage], sign: int = 1):
+        """
+        Add an invoice's usage of PO lines to the ledger, or with sign=-1 take it back out,
+        in one atomic $inc. Balance checks then read the running totals off the PO.
+        """
+        if not usage:
+            return
+        inc = {"invoiced_amount": round(sign * sum(line.amount for line in usage.values()), 2)}
+        for row, line in usage.items():
+            inc[f"ledger.{row}.invoiced_quantity"] = sign * line.quantity
+            inc[f"ledger.{row}.invoiced_amount"] = sign * line.amount
+        await self.collection.update_one(
+            {"po_number": po_number, "company_id": company_id},
+            {"$inc": inc, "$set": {"updated_at": datetime.utcnow()}}
+        )
+
+    @property
+    def grns(self):
+        return self.collection.database["goods_receipt_notes"]
+
+    async def post_grn(self, grn: GoodsReceiptNote) -> GoodsReceiptNote:
+        """Store a GRN and add what it received to the PO ledger."""
+        await self.grns.insert_one(grn.to_mongo())
+        await self.record_receipts([grn])
+        return grn
+
+    async def apply_pending_receipts(self, query: Dict[str, Any],
+                                     batch_size: int = DEFAULT_BATCH_SIZE) -> List[GoodsReceiptNote]:
+        """
+        record_receipts for the stored GRNs matching `query` that are not on their PO's ledger yet:
+        those stored before their PO, or left behind by a run that stopped in between.
+        Returns the GRNs still waiting for their PO.
+        """
+        pending = [GoodsReceiptNote.from_mongo(doc) async for doc in self.grns.find({**query, "ledger_applied": {"$ne": True}})]
+        return await self.record_receipts(pending, batch_size=batch_size) if pending else []
+
+    async def record_receipts(self, grns: Sequence[GoodsReceiptNote],
+                              batch_size: int = DEFAULT_BATCH_SIZE) -> List[GoodsReceiptNote]:
+        """
+        Add what stored GRNs received, valued at PO prices, to their POs' ledgers, and flag them
+        ledger_applied. One read for all the POs involved, then one $inc per GRN that also adds it
+        to the PO's receipted_grns, and is skipped if already there: recording a GRN twice counts it once.
+        GRN lines not on the PO are skipped. Returns the GRNs whose PO does not exist (yet).
+        """
+        po_numbers = sorted({grn.po_number for grn in grns})
+        po_lines: Dict[Tuple[str, str], List[LineItem]] = {}
+        if po_numbers:
+            cursor = self.collection.find({"po_number": {"$in": po_numbers}}, {"po_number": 1, "company_id": 1, "line_items": 1})
+            async for doc in cursor:
+                po_lines[(doc["po_number"], doc["company_id"])] = [LineItem.from_mongo(line) for line in doc.get("line_items", [])]
+
+        now = datetime.utcnow()
+        orphans: List[GoodsReceiptNote] = []
+        applying: List[GoodsReceiptNote] = []
+        operations = []
+        indexes: Dict[Tuple[str, str], POIndex] = {}
+        for grn in grns:
+            key = (grn.po_number, grn.company_id)
+            if key not in po_lines:
+                orphans.append(grn)
+                continue
+            lines = po_lines[key]
+            if key not in indexes:
+                indexes[key] = POIndex(lines)
+            index = indexes[key]
+            inc: Dict[str, float] = {}
+            for item in grn.line_items:
+                row = index.po_row(item)
+                if row < 0:
+                    continue # Not on the PO; nothing to draw down
+                amount = round(item.quantity * lines[row].unit_price, 2)
+                for field, value in ((f"ledger.{row}.received_quantity", item.quantity),
+                                     (f"ledger.{row}.received_amount", amount), ("received_amount", amount)):
+                    inc[field] = inc.get(field, 0.0) + value
+            update: Dict[str, Any] = {"$set": {"updated_at": now}, "$addToSet": {"receipted_grns": grn.grn_number}}
+            if inc:
+                update["$inc"] = inc
+            operations.append(UpdateOne(
+                {"po_number": grn.po_number, "company_id": grn.company_id, "receipted_grns": {"$ne": grn.grn_number}}, update
+            ))
+            applying.append(grn)
+
+        if operations:
+            summary = await self._bulk_write(operations, ordered=False, batch_size=batch_size)
+            failed = {error["index"] for error in summary.errors}
+            # Flagged only once on the ledger; a GRN whose write failed is picked up by the next apply_pending_receipts
+            applied: Dict[str, List[str]] = {}
+            for i, grn in enumerate(applying):
+                if i not in failed:
+                    applied.setdefault(grn.company_id, []).append(grn.grn_number)
+            if applied:
+                # GRN numbers are only unique within a tenant
+                await self.grns.update_many(
+                    {"$or": [{"grn_number": {"$in": numbers}, "company_id": company_id} for company_id, numbers in applied.items()]},
+                    {"$set": {"ledger_applied": True}}
+                )
+        return orphans
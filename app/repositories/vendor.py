@@ -1,8 +1,280 @@
-from typing import Optional
+import asyncio
+import logging
+import re
+import time
+import unicodedata
+from collections import Counter
+from datetime import datetime
+from typing import Dict, List, Optional, Set, Tuple
+from pymongo import ASCENDING, IndexModel
+from pymongo.errors import OperationFailure
+from app.config import settings
 from app.repositories.base import BaseRepository
-from app.models.vendor import Vendor
+from app.repositories.indexes import declare_indexes, uses_indexes
+from app.models.vendor import BankDetails, Vendor
+
+logger = logging.getLogger(__name__)
+
+# Vendors are looked up by business id (get_by_field("vendor_id", ...)) and VAT number throughout the agents
+declare_indexes(
+    "vendors",
+    IndexModel([("vendor_id", ASCENDING)], unique=True),
+    IndexModel([("vat_number", ASCENDING)]),
+)
+
+# Trailing words that OCR and humans add or drop freely ("Acme Ltd" vs "ACME Limited")
+LEGAL_SUFFIXES = {
+    "ltd", "limited", "plc", "llp", "llc", "inc", "incorporated", "corp", "corporation",
+    "co", "company", "gmbh", "ag", "sa", "sarl", "bv", "nv", "pty"
+}
+FUZZY_MATCH_THRESHOLD = 0.6 # Dice similarity over name trigrams
+
+def normalise_name(name: str) -> str:
+    """Case, accent, punctuation and legal-suffix insensitive form of a vendor name."""
+    ascii_name = unicodedata.normalize("NFKD", name).encode("ascii", "ignore").decode()
+    words = re.sub(r"[^0-9a-z]+", " ", ascii_name.lower().replace("&", " and ")).split()
+    while len(words) > 1 and words[-1] in LEGAL_SUFFIXES:
+        words.pop()
+    return " ".join(words)
+
+def vendor_key(vendor_name: str, vendor_id: Optional[str] = None) -> str:
+    """Canonical vendor: the vendor_id when resolved, else the normalised name."""
+    return f"id:{vendor_id}" if vendor_id else f"name:{normalise_name(vendor_name)}"
+
+def normalise_vat(vat_number: str) -> str:
+    """VAT number without spacing or punctuation, e.g. 'GB 123 4567-89' -> 'GB123456789'."""
+    return re.sub(r"[^0-9A-Z]", "", vat_number.upper())
+
+def bank_account_keys(bank_details: Optional[BankDetails]) -> Set[str]:
+    """
+    Normalised identifiers of a bank account: 'uk:<sort code><account>' and 'iban:<IBAN>'.
+    GB IBANs embed the sort code and account, so they also yield the 'uk:' key and match
+    a vendor that gave the same account the domestic way.
+    """
+    if not bank_details:
+        return set()
+    keys = set()
+    sort_code = re.sub(r"[^0-9]", "", bank_details.sort_code or "")
+    account = re.sub(r"[^0-9]", "", bank_details.account_number or "")
+    if len(sort_code) == 6 and account:
+        keys.add(f"uk:{sort_code}{account.zfill(8)}") # 7-digit accounts are paid with a leading zero
+    iban = re.sub(r"[^0-9A-Z]", "", (bank_details.iban or "").upper())
+    if iban:
+        keys.add(f"iban:{iban}")
+        if iban.startswith("GB") and len(iban) == 22:
+            keys.add(f"uk:{iban[8:22]}")
+    return keys
+
+def trigrams(normalised: str) -> Set[str]:
+    # Padding lets short names and word starts contribute trigrams too
+    padded = f"  {normalised} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+class VendorDirectory:
+    """
+    In-memory index of one tenant's vendors: O(1) lookup by vendor_id, VAT number,
+    normalised name and bank account, plus trigram-indexed fuzzy name matching for OCR'd names.
+    Vendors held here are shared between callers and must be treated as read-only.
+    """
+    def __init__(self, company_id: str):
+        self.company_id = company_id
+        self.synced_to: Optional[datetime] = None # Latest updated_at applied
+        self.refreshed_at = 0.0
+        self._by_id: Dict[str, Vendor] = {}
+        self._by_vat: Dict[str, str] = {}
+        self._by_name: Dict[str, Set[str]] = {}
+        self._trigrams: Dict[str, Set[str]] = {} # trigram -> normalised names
+        self._name_grams: Dict[str, int] = {}
+        self._by_account: Dict[str, Set[str]] = {} # bank_account_keys -> vendor ids
+
+    def __len__(self) -> int:
+        return len(self._by_id)
+
+    def put(self, vendor: Vendor):
+        """Add or replace a vendor."""
+        self.remove(vendor.vendor_id)
+        self._by_id[vendor.vendor_id] = vendor
+        if vendor.vat_number:
+            self._by_vat[normalise_vat(vendor.vat_number)] = vendor.vendor_id
+        for name in {normalise_name(n) for n in (vendor.name, vendor.legal_name) if n}:
+            ids = self._by_name.setdefault(name, set())
+            if not ids:
+                grams = trigrams(name)
+                self._name_grams[name] = len(grams)
+                for gram in grams:
+                    self._trigrams.setdefault(gram, set()).add(name)
+            ids.add(vendor.vendor_id)
+        for key in bank_account_keys(vendor.bank_details):
+            self._by_account.setdefault(key, set()).add(vendor.vendor_id)
+        if self.synced_to is None or vendor.updated_at > self.synced_to:
+            self.synced_to = vendor.updated_at
+
+    def remove(self, vendor_id: str):
+        vendor = self._by_id.pop(vendor_id, None)
+        if not vendor:
+            return
+        if vendor.vat_number and self._by_vat.get(normalise_vat(vendor.vat_number)) == vendor_id:
+            del self._by_vat[normalise_vat(vendor.vat_number)]
+        for name in {normalise_name(n) for n in (vendor.name, vendor.legal_name) if n}:
+            ids = self._by_name.get(name, set())
+            ids.discard(vendor_id)
+            if not ids:
+                self._by_name.pop(name, None)
+                self._name_grams.pop(name, None)
+                for gram in trigrams(name):
+                    names = self._trigrams.get(gram)
+                    if names is not None:
+                        names.discard(name)
+                        if not names:
+                            del self._trigrams[gram]
+        for key in bank_account_keys(vendor.bank_details):
+            ids = self._by_account.get(key)
+            if ids is not None:
+                ids.discard(vendor_id)
+                if not ids:
+                    del self._by_account[key]
+
+    def get(self, vendor_id: str) -> Optional[Vendor]:
+        return self._by_id.get(vendor_id)
+
+    def by_vat(self, vat_number: str) -> Optional[Vendor]:
+        vendor_id = self._by_vat.get(normalise_vat(vat_number))
+        return self._by_id.get(vendor_id) if vendor_id else None
+
+    def by_name(self, name: str) -> Optional[Vendor]:
+        """Exact match on the normalised name. None if unknown or shared by several vendors."""
+        ids = self._by_name.get(normalise_name(name))
+        if not ids or len(ids) > 1:
+            return None
+        return self._by_id[next(iter(ids))]
+
+    def sharing_bank_account(self, vendor: Vendor) -> List[str]:
+        """Ids of the other vendors paid into any of `vendor`'s bank accounts, sorted."""
+        shared = set()
+        for key in bank_account_keys(vendor.bank_details):
+            shared.update(self._by_account.get(key, ()))
+        shared.discard(vendor.vendor_id)
+        return sorted(shared)
+
+    def match(self, name: str, threshold: float = FUZZY_MATCH_THRESHOLD, limit: int = 5) -> List[Tuple[Vendor, float]]:
+        """
+        Vendors whose name is similar to `name`, best first, scored by Dice similarity
+        of their trigram sets. Only names sharing a trigram with `name` are scored.
+        """
+        grams = trigrams(normalise_name(name))
+        if not grams:
+            return []
+        shared = Counter()
+        for gram in grams:
+            shared.update(self._trigrams.get(gram, ()))
+
+        scored: Dict[str, float] = {}
+        for candidate, count in shared.items():
+            score = 2 * count / (len(grams) + self._name_grams[candidate])
+            if score >= threshold:
+                for vendor_id in self._by_name[candidate]:
+                    scored[vendor_id] = max(score, scored.get(vendor_id, 0.0))
+        best = sorted(scored.items(), key=lambda item: item[1], reverse=True)[:limit]
+        return [(self._by_id[vendor_id], score) for vendor_id, score in best]
+
+    def resolve(self, vendor_id: Optional[str] = None, name: Optional[str] = None,
+                vat_number: Optional[str] = None, fuzzy: bool = True) -> Optional[Vendor]:
+        """
+        Best single vendor for the given identifiers, trying id, VAT number, exact name and
+        then (if `fuzzy`) the closest name. Ambiguous fuzzy matches resolve to None.
+        """
+        vendor = (vendor_id and self.get(vendor_id)) or (vat_number and self.by_vat(vat_number)) \
+            or (name and self.by_name(name))
+        if vendor or not (fuzzy and name):
+            return vendor or None
+        matches = self.match(name, limit=2)
+        if len(matches) == 1 or (len(matches) == 2 and matches[0][1] > matches[1][1]):
+            return matches[0][0]
+        return None
 
 class VendorRepository(BaseRepository[Vendor]):
+    """
+    Vendor master data. Agents read vendors through per-tenant VendorDirectory objects that
+    are loaded once and then topped up with vendors whose updated_at moved, at most every
+    VENDOR_DIRECTORY_REFRESH_SECONDS. Writers must bump updated_at for changes to be picked up.
+    """
+    def __init__(self, *args, refresh_interval: float = settings.VENDOR_DIRECTORY_REFRESH_SECONDS, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.refresh_interval = refresh_interval
+        self._directories: Dict[str, VendorDirectory] = {}
+        self._locks: Dict[str, asyncio.Lock] = {}
+
+    @uses_indexes("vendors", IndexModel([("company_id", ASCENDING), ("name", ASCENDING)]))
     async def get_by_name(self, name: str, company_id: str) -> Optional[Vendor]:
         doc = await self.collection.find_one({"name": name, "company_id": company_id})
-        return self.model_cls.from_mongo(doc) if doc else None
+        return self._hydrate(doc) if doc else None
+
+    @uses_indexes("vendors", IndexModel([("company_id", ASCENDING), ("updated_at", ASCENDING)]))
+    async def directory(self, company_id: str) -> VendorDirectory:
+        """The tenant's vendor directory, loading it on first use and refreshing it incrementally."""
+        directory = self._directories.get(company_id)
+        if directory and time.monotonic() - directory.refreshed_at < self.refresh_interval:
+            return directory
+
+        async with self._locks.setdefault(company_id, asyncio.Lock()):
+            directory = self._directories.get(company_id)
+            if directory and time.monotonic() - directory.refreshed_at < self.refresh_interval:
+                return directory # Refreshed while we waited
+
+            query = {"company_id": company_id}
+            if directory is None:
+                directory = VendorDirectory(company_id)
+            elif directory.synced_to is not None:
+                # $gte: writes sharing the last timestamp may have landed after the previous read
+                query["updated_at"] = {"$gte": directory.synced_to}
+            async for doc in self.collection.find(query):
+                directory.put(self._hydrate(doc))
+            directory.refreshed_at = time.monotonic()
+            self._directories[company_id] = directory
+            return directory
+
+    async def resolve(self, company_id: str, vendor_id: Optional[str] = None, name: Optional[str] = None,
+                      vat_number: Optional[str] = None, fuzzy: bool = True) -> Optional[Vendor]:
+        """Resolve an invoice's vendor through the tenant directory, see VendorDirectory.resolve."""
+        directory = await self.directory(company_id)
+        return directory.resolve(vendor_id=vendor_id, name=name, vat_number=vat_number, fuzzy=fuzzy)
+
+    async def sharing_bank_account(self, company_id: str, vendor: Vendor) -> List[str]:
+        """Other vendors of the tenant with the same bank account, see VendorDirectory.sharing_bank_account."""
+        return (await self.directory(company_id)).sharing_bank_account(vendor)
+
+    async def get_by_vendor_id(self, vendor_id: str, company_id: Optional[str] = None) -> Optional[Vendor]:
+        """Vendor by business id, from the tenant directory when the tenant is known or already loaded."""
+        if company_id:
+            return (await self.directory(company_id)).get(vendor_id)
+        for directory in self._directories.values():
+            vendor = directory.get(vendor_id)
+            if vendor:
+                return vendor
+        return await self.get_by_field("vendor_id", vendor_id)
+
+    def invalidate(self, company_id: Optional[str] = None):
+        """Drop one tenant's directory, or all of them; the next read reloads it."""
+        if company_id is None:
+            self._directories.clear()
+        else:
+            self._directories.pop(company_id, None)
+
+    async def watch_directories(self):
+        """
+        Apply vendor changes to loaded directories as they happen, including deletes, which
+        incremental refreshes cannot see. Needs a replica set; otherwise logs and returns.
+        """
+        try:
+            async with self.collection.watch(full_document="updateLookup") as stream:
+                async for change in stream:
+                    doc = change.get("fullDocument")
+                    if doc:
+                        directory = self._directories.get(doc.get("company_id"))
+                        if directory:
+                            directory.put(self._hydrate(doc))
+                    else:
+                        # Deletes only carry the _id
+                        self.invalidate()
+        except OperationFailure as e:
+            logger.warning(f"Vendor change stream unavailable, relying on incremental refresh: {e}")
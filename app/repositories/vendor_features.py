@@ -0,0 +1,132 @@
+import time
+from datetime import datetime
+from typing import Any, AsyncIterable, Dict, Optional, Tuple
+from motor.motor_asyncio import AsyncIOMotorCollection
+from pymongo import ASCENDING, IndexModel, ReturnDocument
+from app.config import settings
+from app.repositories.base import BaseRepository
+from app.repositories.indexes import uses_indexes
+from app.repositories.vendor import vendor_key
+from app.models.invoice import InvoiceStatus
+from app.models.vendor import Vendor, VendorFeatures, vat_rate_key
+
+# Markers in Invoice.vendor_features_recorded, one per count an invoice has added
+RECORDED_INVOICE = "INVOICE"
+RECORDED_EXCEPTION = "EXCEPTION"
+
+class VendorFeatureRepository(BaseRepository[VendorFeatures]):
+    """
+    Per-vendor invoice statistics for fraud and VAT checks, so they need no history scans.
+    Reads are cached per process for VENDOR_FEATURES_CACHE_SECONDS; this process's own
+    updates refresh its cache immediately. Cached features are shared and read-only.
+    Each invoice is counted at most once, however often it is retried: recording first
+    claims a marker on the invoice document in `invoices`.
+    """
+    def __init__(self, *args, invoices: AsyncIOMotorCollection = None,
+                 ttl: float = settings.VENDOR_FEATURES_CACHE_SECONDS, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.invoices = invoices
+        self.ttl = ttl
+        self._cache: Dict[Tuple[str, str], Tuple[float, Optional[VendorFeatures]]] = {}
+
+    @uses_indexes("vendor_features", IndexModel([("company_id", ASCENDING), ("vendor_key", ASCENDING)], unique=True))
+    async def get(self, company_id: str, vendor_name: str, vendor_id: Optional[str] = None) -> Optional[VendorFeatures]:
+        """The vendor's features, from the cache unless expired. None for a vendor without invoices."""
+        key = (company_id, vendor_key(vendor_name, vendor_id))
+        cached = self._cache.get(key)
+        if cached and time.monotonic() - cached[0] < self.ttl:
+            return cached[1]
+        doc = await self.collection.find_one({"company_id": key[0], "vendor_key": key[1]})
+        features = self._hydrate(doc) if doc else None
+        self._cache[key] = (time.monotonic(), features)
+        return features
+
+    async def record_invoice(self, invoice_id: str, company_id: str, vendor_name: str, vendor_id: Optional[str],
+                             amount: float, vat_rate: Optional[float] = None,
+                             vendor: Optional[Vendor] = None) -> Optional[VendorFeatures]:
+        """
+        Count one invoice in a single upsert, refreshing the vendor facts when the vendor is known.
+        None, changing nothing, if the invoice was counted already.
+        """
+        if not await self._claim(invoice_id, RECORDED_INVOICE):
+            return None
+        inc: Dict[str, Any] = {"invoice_count": 1, "amount_sum": amount, "amount_sum_squares": amount * amount}
+        if vat_rate is not None:
+            inc[f"vat_rates.{vat_rate_key(vat_rate)}"] = 1
+        return await self._update(company_id, vendor_name, vendor_id, inc, self._vendor_facts(vendor))
+
+    async def record_exception(self, invoice_id: str, company_id: str, vendor_name: str,
+                               vendor_id: Optional[str] = None) -> Optional[VendorFeatures]:
+        """Count an invoice of this vendor ending up in EXCEPTION. None if it was counted already."""
+        if not await self._claim(invoice_id, RECORDED_EXCEPTION):
+            return None
+        return await self._update(company_id, vendor_name, vendor_id, {"exception_count": 1}, {})
+
+    async def _claim(self, invoice_id: str, marker: str) -> bool:
+        """
+        Mark the invoice as counted, True only for the one caller that set the marker.
+        A crash before the $inc loses that count rather than doubling it; rebuild() restores it.
+        """
+        result = await self.invoices.update_one(
+            {"invoice_id": invoice_id, "vendor_features_recorded": {"$ne": marker}},
+            {"$addToSet": {"vendor_features_recorded": marker}}
+        )
+        return result.modified_count == 1
+
+    async def _update(self, company_id: str, vendor_name: str, vendor_id: Optional[str],
+                      inc: Dict[str, Any], set_fields: Dict[str, Any]) -> VendorFeatures:
+        key = (company_id, vendor_key(vendor_name, vendor_id))
+        doc = await self.collection.find_one_and_update(
+            {"company_id": key[0], "vendor_key": key[1]},
+            {"$inc": inc, "$set": {**set_fields, "updated_at": datetime.utcnow()}},
+            upsert=True,
+            return_document=ReturnDocument.AFTER
+        )
+        features = self._hydrate(doc)
+        self._cache[key] = (time.monotonic(), features)
+        return features
+
+    @staticmethod
+    def _vendor_facts(vendor: Optional[Vendor]) -> Dict[str, Any]:
+        if vendor is None:
+            return {}
+        return {
+            "vendor_id": vendor.vendor_id,
+            "approval_status": vendor.approval_status,
+            "payment_terms": vendor.payment_terms,
+            "last_bank_change": vendor.bank_details.last_updated if vendor.bank_details else None,
+        }
+
+    async def rebuild(self, invoice_docs: AsyncIterable[Dict[str, Any]]) -> int:
+        """
+        Recompute the statistics of every vendor in `invoice_docs` (company_id, status and the
+        data total, vat_rate, vendor_name and vendor_id), e.g. to backfill history. Counting
+        starts from zero, so pass all of each vendor's invoices. Returns the vendors written.
+        """
+        features: Dict[Tuple[str, str], VendorFeatures] = {}
+        async for doc in invoice_docs:
+            data = doc.get("data") or {}
+            key = (doc["company_id"], vendor_key(data.get("vendor_name", ""), data.get("vendor_id")))
+            entry = features.get(key)
+            if entry is None:
+                entry = features[key] = VendorFeatures(company_id=key[0], vendor_key=key[1], vendor_id=data.get("vendor_id"))
+            amount = data.get("total") or 0.0
+            entry.invoice_count += 1
+            entry.amount_sum += amount
+            entry.amount_sum_squares += amount * amount
+            if data.get("vat_rate") is not None:
+                rate = vat_rate_key(data["vat_rate"])
+                entry.vat_rates[rate] = entry.vat_rates.get(rate, 0) + 1
+            if doc.get("status") == InvoiceStatus.EXCEPTION:
+                entry.exception_count += 1
+
+        # Vendor facts are left as record_invoice last saw them
+        summary = await self.bulk_upsert(
+            list(features.values()), key_fields=["company_id", "vendor_key"],
+            insert_only={"vendor_id", "approval_status", "payment_terms", "last_bank_change"}
+        )
+        self._cache.clear()
+        return summary.upserted_count + summary.matched_count
+
+    def invalidate(self):
+        self._cache.clear()
@@ -1,83 +1,247 @@
+import re
 from typing import Dict, Any, List, Optional
 from datetime import datetime, timedelta
 from app.database import db
-from app.models.invoice import InvoiceStatus
+from app.models.invoice import Invoice, InvoiceStatus
+from app.repositories.indexes import declare_indexes
+from app.repositories.vendor import vendor_key
+from app.tools.minhash import MinHashLSH, estimated_similarity, line_item_signature, lsh_bands
+from pymongo import ASCENDING, IndexModel
 
 from difflib import SequenceMatcher
 
+# Exact match on vendor + number when the tenant is unknown; the fuzzy pass uses the
+# index from get_duplicate_candidates. Fingerprint lookups use get_by_fingerprint's index.
+declare_indexes(
+    "invoices",
+    IndexModel([("data.vendor_name", ASCENDING), ("data.invoice_number", ASCENDING)]),
+    IndexModel([("data.vendor_name", ASCENDING), ("data.total", ASCENDING), ("data.invoice_date", ASCENDING)]),
+)
+
+# Line items more similar than this make an amount/date match a near-certain duplicate.
+# MinHash estimates Jaccard similarity of shingles; see tests/performance/test_minhash_similarity.py
+MINHASH_ITEM_THRESHOLD = 0.7
+SEQUENCE_ITEM_THRESHOLD = 0.8 # difflib ratio, for invoices stored without a signature
+# Stricter bar when the totals differ
+LSH_DUPLICATE_THRESHOLD = 0.8
+
+NOT_DUPLICATE = {"is_duplicate": False, "confidence": 0.0}
+
+def normalise_invoice_number(invoice_number: str) -> str:
+    """'inv-000123 ' -> 'INV123': punctuation, spacing, case and zero padding removed."""
+    compact = re.sub(r"[^0-9A-Z]", "", invoice_number.upper())
+    return re.sub(r"(?<![0-9])0+(?=[0-9])", "", compact)
+
+def duplicate_fingerprint(company_id: str, vendor_name: str, invoice_number: str,
+                          vendor_id: Optional[str] = None) -> str:
+    """
+    Key shared by every copy of the same invoice: tenant, canonical vendor (vendor_id when
+    resolved, else the normalised name) and normalised invoice number. The total is left out,
+    so a resubmission with a changed amount is still an exact duplicate.
+    """
+    return f"{company_id}|{vendor_key(vendor_name, vendor_id)}|{normalise_invoice_number(invoice_number)}"
+
+FUZZY_DATE_WINDOW = timedelta(days=3)
+
 class DuplicateDetector:
     def __init__(self):
         pass
 
     async def check_duplicates(self, invoice_id: str, vendor_name: str, invoice_number: str, 
-                             total: float, invoice_date: datetime, line_items: List[Any] = []) -> Dict[str, Any]:
+                             total: float, invoice_date: datetime, line_items: List[Any] = [],
+                             company_id: Optional[str] = None, vendor_id: Optional[str] = None) -> Dict[str, Any]:
         """
         Checks for potential duplicates in the database.
         Returns dict with 'is_duplicate', 'match_type', 'conflicting_invoice_id', 'confidence'.
         """
         
-        # 1. Exact Match: Vendor + Invoice Number
-        existing_exact = await db.invoices.list({
-            "data.vendor_name": vendor_name,
-            "data.invoice_number": invoice_number,
-            "invoice_id": {"$ne": invoice_id}
-        })
+        # 1. Exact Match: one indexed lookup of the fingerprint claimed at extraction,
+        # which also catches vendor name spelling variants and reformatted numbers
+        if company_id:
+            fingerprint = duplicate_fingerprint(company_id, vendor_name, invoice_number, vendor_id)
+            holder = await db.invoices.get_by_fingerprint(fingerprint, exclude_invoice_id=invoice_id)
+            existing_exact = [holder] if holder else []
+        else:
+            existing_exact = await db.invoices.list({
+                "data.vendor_name": vendor_name,
+                "data.invoice_number": invoice_number,
+                "invoice_id": {"$ne": invoice_id},
+                "status": {"$ne": InvoiceStatus.REJECTED}
+            })
         
         if existing_exact:
-            for inv in existing_exact:
-                if inv.status != InvoiceStatus.REJECTED:
-                    return {
-                        "is_duplicate": True,
-                        "match_type": "EXACT_NUMBER",
-                        "conflicting_invoice_id": inv.invoice_id,
-                        "confidence": 1.0,
-                        "details": f"Invoice number {invoice_number} already exists for {vendor_name}"
-                    }
+            return self._exact_result(existing_exact[0], vendor_name, invoice_number)
 
         # 2. Fuzzy Match: Vendor + Amount + Date (within 3 days)
-        date_start = invoice_date - timedelta(days=3)
-        date_end = invoice_date + timedelta(days=3)
-        
         existing_fuzzy = await db.invoices.list({
             "data.vendor_name": vendor_name,
             "data.total": total,
-            "data.invoice_date": {"$gte": date_start, "$lte": date_end},
-            "invoice_id": {"$ne": invoice_id}
+            "data.invoice_date": {"$gte": invoice_date - FUZZY_DATE_WINDOW, "$lte": invoice_date + FUZZY_DATE_WINDOW},
+            "invoice_id": {"$ne": invoice_id},
+            "status": {"$ne": InvoiceStatus.REJECTED}
         })
 
+        signature = line_item_signature(line_items) if line_items else None
         if existing_fuzzy:
-             for inv in existing_fuzzy:
-                if inv.status != InvoiceStatus.REJECTED:
-                    # 3. Line Item Similarity Check (Tie-breaker for fuzzy dates)
-                    # If line items are provided, comparing them increases confidence
-                    confidence = 0.8 # Base for Date+Amount+Vendor match
-                    
-                    if line_items and inv.data and inv.data.line_items:
-                        # Extract description strings
-                        items_a = " ".join([i.description for i in line_items]).lower()
-                        items_b = " ".join([i.description for i in inv.data.line_items]).lower()
-                        
-                        ratio = SequenceMatcher(None, items_a, items_b).ratio()
-                        if ratio > 0.8:
-                            confidence = 0.95
-                            match_type = "FUZZY_PLUS_ITEMS"
-                        else:
-                            # Amounts match, date close, vendor same, but items differ?
-                            # Could be recurring bill (Subscription).
-                            # If items differ significantly, maybe NOT a duplicate?
-                            # But usually same vendor+amount+close date is suspicious.
-                            match_type = "FUZZY_AMOUNT_DATE"
-                    else:
-                        match_type = "FUZZY_AMOUNT_DATE"
-
-                    return {
-                        "is_duplicate": True,
-                        "match_type": match_type,
-                        "conflicting_invoice_id": inv.invoice_id,
-                        "confidence": confidence,
-                        "details": f"Similar invoice {inv.invoice_id} found (Score: {confidence})"
-                    }
-
-        return {"is_duplicate": False, "confidence": 0.0}
+            match = existing_fuzzy[0]
+            return self._fuzzy_result(match, line_items, signature, match.line_item_minhash)
+
+        # 4. Same line items around the same date, but a different total (e.g. a misread amount):
+        # LSH band lookup within the date window
+        if signature:
+            candidates = await db.invoices.get_by_line_item_bands(
+                company_id, vendor_name, lsh_bands(signature),
+                invoice_date - FUZZY_DATE_WINDOW, invoice_date + FUZZY_DATE_WINDOW, invoice_id
+            )
+            for inv in candidates:
+                result = self._items_result(inv, invoice_date, signature, inv.line_item_minhash)
+                if result:
+                    return result
+
+        return NOT_DUPLICATE.copy()
+
+    async def screen_batch(self, invoices: List[Invoice]) -> List[Dict[str, Any]]:
+        """
+        Duplicate check for a batch of extracted invoices, e.g. a migration or mailbox backfill.
+        Returns one check_duplicates-shaped result per invoice, in input order.
+
+        Invoices are compared with the database (one query per vendor) and with each other:
+        within the batch, the earlier invoice is treated as the original. Matches against
+        stored invoices take precedence over matches within the batch.
+        """
+        entries = []
+        for inv in invoices:
+            data = inv.data
+            entries.append({
+                "invoice": inv,
+                "fingerprint": duplicate_fingerprint(inv.company_id, data.vendor_name, data.invoice_number, data.vendor_id),
+                "signature": line_item_signature(data.line_items) if data.line_items else None,
+            })
+
+        # Blocks by canonical vendor, so spelling variants of a resolved vendor are compared too
+        blocks: Dict[str, List[Dict[str, Any]]] = {}
+        for entry in entries:
+            data = entry["invoice"].data
+            blocks.setdefault(vendor_key(data.vendor_name, data.vendor_id), []).append(entry)
+
+        batch_ids = [inv.invoice_id for inv in invoices]
+        results: Dict[int, Dict[str, Any]] = {}
+        for block in blocks.values():
+            stored = await db.invoices.get_screening_candidates(
+                vendor_names=list({entry["invoice"].data.vendor_name for entry in block}),
+                fingerprints=[entry["fingerprint"] for entry in block],
+                totals=list({entry["invoice"].data.total for entry in block}),
+                date_start=min(entry["invoice"].data.invoice_date for entry in block) - FUZZY_DATE_WINDOW,
+                date_end=max(entry["invoice"].data.invoice_date for entry in block) + FUZZY_DATE_WINDOW,
+                bands=list({band for entry in block if entry["signature"] for band in lsh_bands(entry["signature"])}),
+                exclude_invoice_ids=batch_ids
+            )
+            stored_index = _CandidateIndex()
+            for inv in stored:
+                stored_index.add(inv, inv.duplicate_fingerprint, inv.line_item_minhash)
+
+            # Earlier invoices in the batch become candidates for later ones
+            batch_index = _CandidateIndex()
+            for entry in block:
+                inv = entry["invoice"]
+                result = self._match_indexed(stored_index, entry) or self._match_indexed(batch_index, entry)
+                results[id(entry)] = result or NOT_DUPLICATE.copy()
+                batch_index.add(inv, entry["fingerprint"], entry["signature"])
+
+        return [results[id(entry)] for entry in entries]
+
+    def _match_indexed(self, index: "_CandidateIndex", entry: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """check_duplicates' three rules, in the same order, against in-memory candidates."""
+        data = entry["invoice"].data
+        holder = index.by_fingerprint.get(entry["fingerprint"])
+        if holder:
+            return self._exact_result(holder, data.vendor_name, data.invoice_number)
+
+        for inv in index.by_total.get(round(data.total * 100), ()):
+            if abs(inv.data.invoice_date - data.invoice_date) <= FUZZY_DATE_WINDOW:
+                return self._fuzzy_result(inv, data.line_items, entry["signature"], index.signatures.get(inv.invoice_id))
+
+        if entry["signature"]:
+            for key, _ in index.lsh.query(entry["signature"]):
+                result = self._items_result(index.invoices[key], data.invoice_date, entry["signature"], index.signatures[key])
+                if result:
+                    return result
+        return None
+
+    def _exact_result(self, inv: Any, vendor_name: str, invoice_number: str) -> Dict[str, Any]:
+        return {
+            "is_duplicate": True,
+            "match_type": "EXACT_NUMBER",
+            "conflicting_invoice_id": inv.invoice_id,
+            "confidence": 1.0,
+            "details": f"Invoice number {invoice_number} already exists for {vendor_name}"
+        }
+
+    def _fuzzy_result(self, inv: Any, line_items: List[Any], signature: Optional[List[int]],
+                      candidate_signature: Optional[List[int]]) -> Dict[str, Any]:
+        # 3. Line Item Similarity Check (Tie-breaker for fuzzy dates)
+        # If line items are provided, comparing them increases confidence
+        confidence = 0.8 # Base for Date+Amount+Vendor match
+        match_type = "FUZZY_AMOUNT_DATE"
+        # Amounts match, date close, vendor same, but items differ?
+        # Could be recurring bill (Subscription), but usually still suspicious.
+        if line_items and inv.data and inv.data.line_items:
+            if self._line_items_match(line_items, signature, inv, candidate_signature):
+                confidence = 0.95
+                match_type = "FUZZY_PLUS_ITEMS"
+
+        return {
+            "is_duplicate": True,
+            "match_type": match_type,
+            "conflicting_invoice_id": inv.invoice_id,
+            "confidence": confidence,
+            "details": f"Similar invoice {inv.invoice_id} found (Score: {confidence})"
+        }
+
+    def _items_result(self, inv: Any, invoice_date: datetime, signature: List[int],
+                      candidate_signature: Optional[List[int]]) -> Optional[Dict[str, Any]]:
+        if not inv.data or not candidate_signature or abs(inv.data.invoice_date - invoice_date) > FUZZY_DATE_WINDOW:
+            return None
+        similarity = estimated_similarity(signature, candidate_signature)
+        if similarity <= LSH_DUPLICATE_THRESHOLD:
+            return None
+        return {
+            "is_duplicate": True,
+            "match_type": "FUZZY_ITEMS_DATE",
+            "conflicting_invoice_id": inv.invoice_id,
+            "confidence": 0.7,
+            "details": f"Invoice {inv.invoice_id} has the same line items (similarity {similarity:.2f}) with a different total"
+        }
+
+    def _line_items_match(self, line_items: List[Any], signature: Optional[List[int]], inv: Any,
+                          candidate_signature: Optional[List[int]]) -> bool:
+        """MinHash comparison when the candidate has a signature, else the old string comparison."""
+        if signature and candidate_signature:
+            return estimated_similarity(signature, candidate_signature) > MINHASH_ITEM_THRESHOLD
+        # Invoices extracted before signatures were stored
+        items_a = " ".join([i.description for i in line_items]).lower()
+        items_b = " ".join([i.description for i in inv.data.line_items]).lower()
+        return SequenceMatcher(None, items_a, items_b).ratio() > SEQUENCE_ITEM_THRESHOLD
+
+class _CandidateIndex:
+    """
+    Hash tables over one vendor's candidate invoices, for screen_batch. Signatures are kept by
+    invoice_id: batch invoices are not stored yet, so they carry no line_item_minhash of their own.
+    """
+    def __init__(self):
+        self.invoices: Dict[str, Invoice] = {}
+        self.signatures: Dict[str, List[int]] = {}
+        self.by_fingerprint: Dict[str, Invoice] = {}
+        self.by_total: Dict[int, List[Invoice]] = {}
+        self.lsh = MinHashLSH()
+
+    def add(self, inv: Invoice, fingerprint: Optional[str], signature: Optional[List[int]]):
+        self.invoices[inv.invoice_id] = inv
+        if fingerprint:
+            self.by_fingerprint.setdefault(fingerprint, inv)
+        self.by_total.setdefault(round(inv.data.total * 100), []).append(inv)
+        if signature:
+            self.signatures[inv.invoice_id] = signature
+            self.lsh.add(inv.invoice_id, signature)
 
 duplicate_detector = DuplicateDetector()
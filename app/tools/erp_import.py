@@ -0,0 +1,177 @@
+"""
+Streaming import of purchase orders and goods receipt notes exported from an ERP.
+
+Files are read lazily and handled a chunk of documents at a time: each chunk is
+validated through the Pydantic models and upserted with one bulk_write, keyed on
+(po_number | grn_number, company_id), so re-running an import is harmless.
+Rows that fail validation or writing are reported and skipped, never abort the run.
+GRNs are added to their PO's ledger once, whenever both are stored: a GRN imported before
+its PO is reported and drawn down when the PO arrives, and a re-run finishes what an
+interrupted one left.
+
+JSONL files hold one PO/GRN document per line in the model's shape. CSV files hold one
+row per line item: header columns are document fields, `line_` columns are the line
+item's fields (line_item_id, line_description, line_quantity, ...), and consecutive
+rows with the same document number make up one document.
+"""
+import csv
+import json
+import logging
+from typing import Any, Dict, Iterator, List, NamedTuple, Optional, Tuple, Type
+
+from pydantic import BaseModel, Field, ValidationError
+from pymongo import ASCENDING, IndexModel
+
+from app.database import db
+from app.models.base import MongoModel
+from app.models.grn import GoodsReceiptNote
+from app.models.purchase_order import PurchaseOrder
+from app.repositories.base import DEFAULT_BATCH_SIZE, BaseRepository
+from app.repositories.indexes import declare_indexes
+from app.repositories.purchase_order import PurchaseOrderRepository
+
+logger = logging.getLogger(__name__)
+
+# Upserts match on the document number within the tenant
+declare_indexes("goods_receipt_notes", IndexModel([("grn_number", ASCENDING), ("company_id", ASCENDING)], unique=True))
+
+LINE_PREFIX = "line_"
+# Fields an import must never overwrite: creation time, and the PO ledger with the GRNs counted in it
+INSERT_ONLY_FIELDS = {"created_at", "ledger", "invoiced_amount", "received_amount", "receipted_grns", "ledger_applied"}
+
+class ImportKind(NamedTuple):
+    model: Type[MongoModel]
+    key: str
+
+KINDS = {
+    "purchase_orders": ImportKind(PurchaseOrder, "po_number"),
+    "goods_receipt_notes": ImportKind(GoodsReceiptNote, "grn_number"),
+}
+
+class ImportReport(BaseModel):
+    """Outcome of one import run."""
+    kind: str
+    documents: int = 0
+    inserted: int = 0
+    updated: int = 0
+    unchanged: int = 0
+    errors: List[Dict[str, Any]] = Field(default_factory=list, description="row (first file row of the document), key, message")
+
+    @property
+    def ok(self) -> bool:
+        return not self.errors
+
+def _clean(row: Dict[str, Any]) -> Dict[str, Any]:
+    # Empty CSV cells mean "not given", so model defaults apply
+    return {key: value for key, value in row.items() if key and value not in ("", None)}
+
+def read_jsonl(path: str) -> Iterator[Tuple[int, Dict[str, Any]]]:
+    """(line number, document) for each non-blank line; unparsable lines yield their error."""
+    with open(path, encoding="utf-8") as f:
+        for number, line in enumerate(f, start=1):
+            if not line.strip():
+                continue
+            try:
+                yield number, json.loads(line)
+            except json.JSONDecodeError as e:
+                yield number, {"__error__": f"Invalid JSON: {e}"}
+
+def read_csv(path: str, key: str) -> Iterator[Tuple[int, Dict[str, Any]]]:
+    """(first row number, document) for each run of consecutive rows sharing `key`."""
+    current: Optional[Dict[str, Any]] = None
+    first_row = 0
+    with open(path, newline="", encoding="utf-8") as f:
+        # Row 1 is the header
+        for number, row in enumerate(csv.DictReader(f), start=2):
+            row = _clean(row)
+            line = {k[len(LINE_PREFIX):]: v for k, v in row.items() if k.startswith(LINE_PREFIX)}
+            header = {k: v for k, v in row.items() if not k.startswith(LINE_PREFIX)}
+            if current is None or header.get(key) != current.get(key):
+                if current is not None:
+                    yield first_row, current
+                current, first_row = {**header, "line_items": []}, number
+            if line:
+                current["line_items"].append(line)
+    if current is not None:
+        yield first_row, current
+
+def _error_message(error: ValidationError) -> str:
+    return "; ".join(f"{'.'.join(str(part) for part in err['loc'])}: {err['msg']}" for err in error.errors())
+
+class ERPImporter:
+    """Bulk upserts of ERP exports. Repositories default to the global db's, resolved per run."""
+    def __init__(self, purchase_orders: Optional[PurchaseOrderRepository] = None,
+                 grns: Optional[BaseRepository] = None, chunk_size: int = DEFAULT_BATCH_SIZE):
+        self._purchase_orders = purchase_orders
+        self._grns = grns
+        self.chunk_size = chunk_size
+
+    @property
+    def purchase_orders(self) -> PurchaseOrderRepository:
+        return self._purchase_orders or db.purchase_orders
+
+    @property
+    def grns(self) -> BaseRepository:
+        return self._grns or BaseRepository(db.db.goods_receipt_notes, GoodsReceiptNote)
+
+    async def import_file(self, path: str, kind: str) -> ImportReport:
+        """Import a .csv or .jsonl file of `kind` ("purchase_orders" or "goods_receipt_notes")."""
+        spec = KINDS[kind]
+        rows = read_csv(path, spec.key) if path.lower().endswith(".csv") else read_jsonl(path)
+        return await self.import_rows(rows, kind)
+
+    async def import_rows(self, rows: Iterator[Tuple[int, Dict[str, Any]]], kind: str) -> ImportReport:
+        """Import (row number, document) pairs, validating and upserting chunk_size documents at a time."""
+        spec = KINDS[kind]
+        report = ImportReport(kind=kind)
+        chunk: List[Tuple[int, Dict[str, Any]]] = []
+        for row_number, doc in rows:
+            chunk.append((row_number, doc))
+            if len(chunk) >= self.chunk_size:
+                await self._import_chunk(chunk, spec, report)
+                chunk = []
+        if chunk:
+            await self._import_chunk(chunk, spec, report)
+        logger.info(f"Imported {kind}: {report.inserted} new, {report.updated} updated, "
+                    f"{report.unchanged} unchanged, {len(report.errors)} errors")
+        return report
+
+    async def _import_chunk(self, chunk: List[Tuple[int, Dict[str, Any]]], spec: ImportKind, report: ImportReport):
+        report.documents += len(chunk)
+
+        valid: List[Tuple[int, MongoModel]] = []
+        for row_number, doc in chunk:
+            if "__error__" in doc:
+                report.errors.append({"row": row_number, "key": None, "message": doc["__error__"]})
+                continue
+            try:
+                valid.append((row_number, spec.model.model_validate(doc)))
+            except ValidationError as e:
+                report.errors.append({"row": row_number, "key": doc.get(spec.key), "message": _error_message(e)})
+        if not valid:
+            return
+
+        repo = self.purchase_orders if spec.model is PurchaseOrder else self.grns
+        summary = await repo.bulk_upsert([model for _, model in valid], key_fields=[spec.key, "company_id"],
+                                         batch_size=self.chunk_size, insert_only=INSERT_ONLY_FIELDS)
+        report.inserted += summary.upserted_count
+        report.updated += summary.modified_count
+        report.unchanged += summary.matched_count - summary.modified_count
+        for err in summary.errors:
+            row_number, model = valid[err["index"]]
+            report.errors.append({"row": row_number, "key": getattr(model, spec.key), "message": err["message"]})
+
+        failed = {err["index"] for err in summary.errors}
+        stored = {getattr(model, spec.key): row_number for i, (row_number, model) in enumerate(valid) if i not in failed}
+        if not stored:
+            return
+        if spec.model is PurchaseOrder:
+            # GRNs imported ahead of these POs
+            await self.purchase_orders.apply_pending_receipts({"po_number": {"$in": list(stored)}})
+            return
+        # New GRNs, and any an interrupted run stored without drawing down the ledger
+        for grn in await self.purchase_orders.apply_pending_receipts({"grn_number": {"$in": list(stored)}}):
+            report.errors.append({"row": stored[grn.grn_number], "key": grn.grn_number,
+                                  "message": f"PO {grn.po_number} not found; the GRN is stored and drawn down once the PO is imported"})
+
+erp_importer = ERPImporter()
@@ -1,18 +1,131 @@
-from typing import Dict, Any, List
+from typing import Dict, Any, List, Optional, Sequence
 from datetime import datetime, timedelta
+import numpy as np
 from app.database import db
-from app.models.invoice import InvoiceData
-from app.models.vendor import Vendor
+from app.models.invoice import InvoiceData, InvoiceStatus
+from app.models.vendor import Vendor, VendorFeatures
+from app.repositories.base import DEFAULT_BATCH_SIZE
+from app.repositories.vendor_features import RECORDED_INVOICE
+from app.tools.velocity import EMPTY_SNAPSHOT, VelocitySnapshot
+
+BANK_CHANGE_WINDOW_DAYS = 30
+HIGH_VALUE_THRESHOLD = 10000
+# A vendor's invoice rate is a spike at VELOCITY_HOURLY_LIMIT in an hour, or at VELOCITY_DAILY_MIN
+# in a day when that is more than VELOCITY_SPIKE_FACTOR times its 30-day daily average
+VELOCITY_HOURLY_LIMIT = 20
+VELOCITY_DAILY_MIN = 10
+VELOCITY_SPIKE_FACTOR = 5
+NEAR_THRESHOLD_DAILY_LIMIT = 3 # Invoices just under an approval bound within 24h
+# Totals this many standard deviations above the vendor's mean, once it has enough history
+OUTLIER_STDDEVS = 3
+OUTLIER_MIN_INVOICES = 10
+
+# Rule flags in the order analyze_fraud_risk appends them, with their score weights
+FRAUD_RULES = (
+    ("RECENT_BANK_CHANGE", 0.8),
+    ("ROUNDED_AMOUNT_100", 0.2),
+    ("ROUNDED_AMOUNT_10", 0.1),
+    ("WEEKEND_DATE", 0.1),
+    ("HIGH_VALUE", 0.1),
+    ("NO_LINE_ITEMS", 0.3),
+    ("VELOCITY_SPIKE", 0.3),
+    ("NEAR_THRESHOLD_PATTERN", 0.3),
+    ("SHARED_BANK_ACCOUNT", 0.8),
+    ("AMOUNT_OUTLIER", 0.2),
+)
+RULE_WEIGHTS = dict(FRAUD_RULES)
+
+def velocity_spike(count_1h, count_24h, count_30d):
+    """Burst check on a vendor's invoice counts (see tools/velocity.py); works on ints and NumPy columns alike."""
+    return (count_1h >= VELOCITY_HOURLY_LIMIT) | (
+        (count_24h >= VELOCITY_DAILY_MIN) & (count_24h * 30 > VELOCITY_SPIKE_FACTOR * count_30d)
+    )
+
+def _days_since(now: datetime, when: Optional[datetime]) -> float:
+    # Whole days as timedelta.days counts them (floored); NaN when unknown
+    return float((now - when).days) if when else np.nan
+
+class FraudFeatures:
+    """
+    Fraud rule inputs for many invoices as NumPy columns, one row per invoice:
+    amount, roundness (2 for multiples of 100, 1 for multiples of 10), invoice weekday,
+    line count, vendor age, days since the vendor's bank details changed, and whether the
+    vendor's velocity tripped the velocity rules (False without a snapshot), whether another
+    vendor shares its bank account, and the vendor's invoice count, mean and stddev from its features.
+    """
+    def __init__(self, totals: Sequence[float], invoice_dates: Sequence[datetime], line_counts: Sequence[int],
+                 vendors: Sequence[Optional[Vendor]], bank_change_detected: Optional[Sequence[bool]] = None,
+                 now: Optional[datetime] = None, velocity: Optional[Sequence[Optional[VelocitySnapshot]]] = None,
+                 shared_bank_account: Optional[Sequence[bool]] = None,
+                 vendor_features: Optional[Sequence[Optional[VendorFeatures]]] = None):
+        now = now or datetime.utcnow()
+        n = len(totals)
+        self.amount = np.asarray(totals, dtype=float)
+        # Converting datetimes to datetime64 costs more than asking each for its weekday
+        self.weekday = np.fromiter((date.weekday() for date in invoice_dates), dtype=np.int8, count=n)
+        self.line_count = np.asarray(line_counts, dtype=np.int32)
+
+        # Vendor columns are computed once per distinct vendor, then gathered per invoice
+        slots: Dict[int, int] = {}
+        vendor_age, bank_change = [np.nan], [np.nan] # Slot 0: no vendor
+        rows = np.empty(n, dtype=np.intp)
+        for i, vendor in enumerate(vendors):
+            if vendor is None:
+                rows[i] = 0
+                continue
+            slot = slots.get(id(vendor))
+            if slot is None:
+                slot = slots[id(vendor)] = len(vendor_age)
+                vendor_age.append(_days_since(now, vendor.created_at))
+                bank_change.append(_days_since(now, vendor.bank_details.last_updated) if vendor.bank_details else np.nan)
+            rows[i] = slot
+        self.vendor_age_days = np.array(vendor_age)[rows]
+        self.bank_change_days = np.array(bank_change)[rows]
+        self.bank_change_detected = np.zeros(n, dtype=bool) if bank_change_detected is None \
+            else np.asarray(bank_change_detected, dtype=bool)
+
+        self.shared_bank_account = np.zeros(n, dtype=bool) if shared_bank_account is None \
+            else np.asarray(shared_bank_account, dtype=bool)
+
+        history = vendor_features or [None] * n
+        self.history_count = np.fromiter((f.invoice_count if f else 0 for f in history), dtype=np.int64, count=n)
+        self.history_mean = np.fromiter((f.amount_mean if f else np.nan for f in history), dtype=float, count=n)
+        self.history_stddev = np.fromiter((f.amount_stddev if f else np.nan for f in history), dtype=float, count=n)
+
+        if velocity is None:
+            self.velocity_spike = np.zeros(n, dtype=bool)
+            self.near_threshold_pattern = np.zeros(n, dtype=bool)
+        else:
+            snapshots = [snapshot or EMPTY_SNAPSHOT for snapshot in velocity]
+            column = lambda field: np.fromiter((getattr(s, field) for s in snapshots), dtype=np.int64, count=n)
+            self.velocity_spike = velocity_spike(column("count_1h"), column("count_24h"), column("count_30d"))
+            self.near_threshold_pattern = column("near_threshold_24h") >= NEAR_THRESHOLD_DAILY_LIMIT
+
+        positive = self.amount > 0
+        self.roundness = np.where(positive & (self.amount % 100 == 0), 2, np.where(positive & (self.amount % 10 == 0), 1, 0))
+
+    def __len__(self) -> int:
+        return len(self.amount)
+
+    @classmethod
+    def from_invoices(cls, invoices: Sequence[InvoiceData], vendors: Sequence[Optional[Vendor]],
+                      bank_change_detected: Optional[Sequence[bool]] = None, now: Optional[datetime] = None,
+                      velocity: Optional[Sequence[Optional[VelocitySnapshot]]] = None,
+                      shared_bank_account: Optional[Sequence[bool]] = None,
+                      vendor_features: Optional[Sequence[Optional[VendorFeatures]]] = None) -> "FraudFeatures":
+        return cls([inv.total for inv in invoices], [inv.invoice_date for inv in invoices],
+                   [len(inv.line_items) for inv in invoices], vendors, bank_change_detected, now, velocity,
+                   shared_bank_account, vendor_features)
 
 class FraudDetector:
     def __init__(self):
         pass
 
-    async def check_bank_details_change(self, vendor_id: str, days: int = 30) -> bool:
+    async def check_bank_details_change(self, vendor_id: str, days: int = 30, company_id: Optional[str] = None) -> bool:
         """
         Status: HIGH RISK if bank details changed explicitly within window.
         """
-        vendor = await db.vendors.get_by_field("vendor_id", vendor_id)
+        vendor = await db.vendors.get_by_vendor_id(vendor_id, company_id)
         if not vendor or not vendor.bank_details:
             return False
             
@@ -22,52 +135,83 @@ class FraudDetector:
         diff = datetime.utcnow() - vendor.bank_details.last_updated
         return diff.days < days
 
+    async def check_shared_bank_account(self, vendor: Vendor, company_id: str) -> List[str]:
+        """
+        Status: HIGH RISK if another of the tenant's vendors is paid into the same account.
+        Returns the other vendors' ids; an in-memory lookup in the tenant's vendor directory.
+        """
+        return await db.vendors.sharing_bank_account(company_id, vendor)
+
     def analyze_fraud_risk(self, invoice_data: InvoiceData, vendor_history: Any = None, 
-                          vendor: Any = None, bank_change_detected: bool = False) -> Dict[str, Any]:
+                          vendor: Any = None, bank_change_detected: bool = False,
+                          now: Optional[datetime] = None, velocity: Optional[VelocitySnapshot] = None,
+                          shared_bank_account: bool = False,
+                          vendor_features: Optional[VendorFeatures] = None) -> Dict[str, Any]:
         """
         Analyzes the invoice for fraud patterns.
         Returns 'risk_score' (0.0 - 1.0) and 'flags' (List[str]).
+        score_batch applies the same rules to many invoices at once.
         """
+        now = now or datetime.utcnow()
         score = 0.0
         flags = []
         
         # 0. Recent Bank Change (Critical)
         if bank_change_detected:
-            score += 0.8 # Immediate High Risk
+            score += RULE_WEIGHTS["RECENT_BANK_CHANGE"] # Immediate High Risk
             flags.append("RECENT_BANK_CHANGE")
         
         # Also check if vendor object passed and logic duplicates
         if vendor and vendor.bank_details and vendor.bank_details.last_updated:
-            diff = datetime.utcnow() - vendor.bank_details.last_updated
-            if diff.days < 30 and "RECENT_BANK_CHANGE" not in flags:
-                score += 0.8
+            diff = now - vendor.bank_details.last_updated
+            if diff.days < BANK_CHANGE_WINDOW_DAYS and "RECENT_BANK_CHANGE" not in flags:
+                score += RULE_WEIGHTS["RECENT_BANK_CHANGE"]
                 flags.append("RECENT_BANK_CHANGE")
         
         # 1. Rounded Amounts (e.g. 5000.00, 100.00)
         # Often indicates fabricated invoices.
         if invoice_data.total > 0 and invoice_data.total % 100 == 0:
-            score += 0.2
+            score += RULE_WEIGHTS["ROUNDED_AMOUNT_100"]
             flags.append("ROUNDED_AMOUNT_100")
         elif invoice_data.total > 0 and invoice_data.total % 10 == 0:
-            score += 0.1
+            score += RULE_WEIGHTS["ROUNDED_AMOUNT_10"]
             flags.append("ROUNDED_AMOUNT_10")
             
         # 2. Weekend Submission
         # Check Created At or Invoice Date? 
         # Let's check Invoice Date for now (though submission timestamp is better if available from metadata)
         if invoice_data.invoice_date.weekday() >= 5: # 5=Saturday, 6=Sunday
-            score += 0.1
+            score += RULE_WEIGHTS["WEEKEND_DATE"]
             flags.append("WEEKEND_DATE")
             
         # 3. High Value (Simple threshold)
-        if invoice_data.total > 10000:
-            score += 0.1
+        if invoice_data.total > HIGH_VALUE_THRESHOLD:
+            score += RULE_WEIGHTS["HIGH_VALUE"]
             flags.append("HIGH_VALUE")
             
         # 4. No Line Items but High Total
         if not invoice_data.line_items and invoice_data.total > 0:
-             score += 0.3
+             score += RULE_WEIGHTS["NO_LINE_ITEMS"]
              flags.append("NO_LINE_ITEMS")
+
+        # 5. Velocity: a burst of invoices, or repeated amounts just under an approval limit
+        if velocity and velocity_spike(velocity.count_1h, velocity.count_24h, velocity.count_30d):
+            score += RULE_WEIGHTS["VELOCITY_SPIKE"]
+            flags.append("VELOCITY_SPIKE")
+        if velocity and velocity.near_threshold_24h >= NEAR_THRESHOLD_DAILY_LIMIT:
+            score += RULE_WEIGHTS["NEAR_THRESHOLD_PATTERN"]
+            flags.append("NEAR_THRESHOLD_PATTERN")
+
+        # 6. Bank account also on file for another vendor
+        if shared_bank_account:
+            score += RULE_WEIGHTS["SHARED_BANK_ACCOUNT"]
+            flags.append("SHARED_BANK_ACCOUNT")
+
+        # 7. Far above what this vendor usually invoices
+        if vendor_features and vendor_features.invoice_count >= OUTLIER_MIN_INVOICES and \
+                invoice_data.total > vendor_features.amount_mean + OUTLIER_STDDEVS * vendor_features.amount_stddev:
+            score += RULE_WEIGHTS["AMOUNT_OUTLIER"]
+            flags.append("AMOUNT_OUTLIER")
              
         # Normalize Score
         score = min(score, 1.0)
@@ -77,4 +221,96 @@ class FraudDetector:
             "flags": flags
         }
 
+    def score_batch(self, features: FraudFeatures) -> List[Dict[str, Any]]:
+        """
+        analyze_fraud_risk for every row of `features` at once, with identical results:
+        weights are added in the same order, so scores match to the last bit.
+        """
+        scores, patterns = self._apply_rules(features)
+        # Few distinct flag combinations occur, so build each flag list once
+        names = {p: [name for bit, (name, _) in enumerate(FRAUD_RULES) if p >> bit & 1] for p in np.unique(patterns).tolist()}
+        return [{"fraud_score": score, "flags": names[p].copy()} for score, p in zip(scores.tolist(), patterns.tolist())]
+
+    def _apply_rules(self, features: FraudFeatures):
+        """Scores and a bitmask of the FRAUD_RULES that fired, per row."""
+        rule_masks = (
+            features.bank_change_detected | (features.bank_change_days < BANK_CHANGE_WINDOW_DAYS),
+            features.roundness == 2,
+            features.roundness == 1,
+            features.weekday >= 5,
+            features.amount > HIGH_VALUE_THRESHOLD,
+            (features.line_count == 0) & (features.amount > 0),
+            features.velocity_spike,
+            features.near_threshold_pattern,
+            features.shared_bank_account,
+            # NaN history compares False
+            (features.history_count >= OUTLIER_MIN_INVOICES)
+            & (features.amount > features.history_mean + OUTLIER_STDDEVS * features.history_stddev),
+        )
+        scores = np.zeros(len(features))
+        patterns = np.zeros(len(features), dtype=np.int64)
+        for bit, ((_, weight), mask) in enumerate(zip(FRAUD_RULES, rule_masks)):
+            scores += np.where(mask, weight, 0.0)
+            patterns |= mask.astype(np.int64) << bit
+        return np.minimum(scores, 1.0), patterns
+
+    async def rescore_open_invoices(self, company_id: Optional[str] = None, batch_size: int = DEFAULT_BATCH_SIZE,
+                                    now: Optional[datetime] = None) -> int:
+        """
+        Recompute validation.fraud_score for every open, validated invoice, batch_size at a time,
+        e.g. nightly as vendors' bank details age. Only fields the rules need are read.
+        Writes only scores that changed and returns how many did. Flags are left as validated,
+        and so are the velocity rules: velocity is judged as of the invoice's arrival, not today.
+        """
+        query: Dict[str, Any] = {
+            "status": {"$nin": [InvoiceStatus.PAID, InvoiceStatus.REJECTED]},
+            "validation": {"$type": "object"}
+        }
+        if company_id:
+            query["company_id"] = company_id
+        projection = {"invoice_id": 1, "company_id": 1, "data.total": 1, "data.invoice_date": 1, "data.vendor_id": 1,
+                      "data.vendor_name": 1, "data.vat_rate": 1, "data.line_items.item_id": 1, "validation.fraud_score": 1,
+                      "validation.flags": 1, "vendor_features_recorded": 1}
+        now = now or datetime.utcnow()
+        changed = 0
+        batch: List[Dict[str, Any]] = []
+        async for doc in db.invoices.collection.find(query, projection).batch_size(batch_size):
+            batch.append(doc)
+            if len(batch) >= batch_size:
+                changed += await self._rescore(batch, now)
+                batch = []
+        if batch:
+            changed += await self._rescore(batch, now)
+        return changed
+
+    async def _rescore(self, docs: List[Dict[str, Any]], now: datetime) -> int:
+        vendors, shared, history = [], [], []
+        for doc in docs:
+            data = doc.get("data") or {}
+            # Resolved the way validation resolves it; directories and the feature cache keep these in memory
+            vendor = await db.vendors.resolve(doc["company_id"], vendor_id=data.get("vendor_id"), name=data.get("vendor_name"))
+            vendors.append(vendor)
+            shared.append(bool(vendor and await self.check_shared_bank_account(vendor, doc["company_id"])))
+            # Each invoice is judged against the vendor's other invoices, as at validation
+            others = await db.vendor_features.get(doc["company_id"], data.get("vendor_name", ""), data.get("vendor_id"))
+            if others and RECORDED_INVOICE in (doc.get("vendor_features_recorded") or []):
+                others = others.excluding(data.get("total", 0.0), data.get("vat_rate"))
+            history.append(others)
+        features = FraudFeatures([doc["data"].get("total", 0.0) for doc in docs], [doc["data"]["invoice_date"] for doc in docs],
+                                 [len(doc["data"].get("line_items") or []) for doc in docs], vendors, now=now,
+                                 shared_bank_account=shared, vendor_features=history)
+        flags = [doc["validation"].get("flags") or [] for doc in docs]
+        features.velocity_spike = np.array(["VELOCITY_SPIKE" in f for f in flags], dtype=bool)
+        features.near_threshold_pattern = np.array(["NEAR_THRESHOLD_PATTERN" in f for f in flags], dtype=bool)
+        scores, _ = self._apply_rules(features)
+
+        updates = [
+            ({"invoice_id": doc["invoice_id"]}, {"validation.fraud_score": score})
+            for doc, score in zip(docs, scores.tolist())
+            if score != doc["validation"].get("fraud_score")
+        ]
+        if updates:
+            await db.invoices.bulk_update(updates)
+        return len(updates)
+
 fraud_detector = FraudDetector()
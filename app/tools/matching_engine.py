@@ -0,0 +1,122 @@
+"""
+Indexed, vectorised 3-way matching of invoice lines against a PO and its GRNs.
+
+PO lines and received quantities are indexed once by product code and by normalised
+description, so each invoice line is a dict lookup; price and quantity variances for
+all lines are then computed as NumPy arrays.
+"""
+import re
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+from app.models.grn import GoodsReceiptNote
+from app.models.invoice import InvoiceData, LineItem, MatchingResults, POLineUsage
+from app.models.policy import TenantPolicy
+from app.models.purchase_order import PurchaseOrder
+
+def normalise_description(description: str) -> str:
+    """'Widget, Blue (x10)' -> 'widget blue x10'"""
+    return " ".join(re.sub(r"[^0-9a-z]+", " ", description.lower()).split())
+
+def grn_lines(grns: List[GoodsReceiptNote]) -> Iterator[LineItem]:
+    """Every line of every GRN, for matching against GRN documents rather than ReceivedLine totals."""
+    for grn in grns:
+        yield from grn.line_items
+
+def _keys(item: Any) -> Tuple[Optional[str], str]:
+    code = item.product_code.strip().upper() if item.product_code else None
+    return code, normalise_description(item.description)
+
+class POIndex:
+    """
+    One PO's lines and everything received against it, indexed for line lookups.
+    `received` holds GRN lines or ReceivedLine totals; anything with a description,
+    product_code and quantity.
+    """
+    def __init__(self, po_lines: List[LineItem], received: Iterable[Any] = ()):
+        self.unit_prices = np.array([item.unit_price for item in po_lines], dtype=float)
+        self._po_by_code: Dict[str, int] = {}
+        self._po_by_description: Dict[str, int] = {}
+        for row, item in enumerate(po_lines):
+            code, description = _keys(item)
+            if code:
+                self._po_by_code.setdefault(code, row)
+            self._po_by_description.setdefault(description, row)
+
+        # Received quantities aggregated once over every received line, including lines not on the PO
+        self._received_by_code: Dict[str, float] = {}
+        self._received_by_description: Dict[str, float] = {}
+        for item in received:
+            code, description = _keys(item)
+            if code:
+                self._received_by_code[code] = self._received_by_code.get(code, 0.0) + item.quantity
+            self._received_by_description[description] = self._received_by_description.get(description, 0.0) + item.quantity
+
+    def po_row(self, item: LineItem) -> int:
+        """Row of the PO line an invoice line refers to, by product code then description; -1 if none."""
+        code, description = _keys(item)
+        if code and code in self._po_by_code:
+            return self._po_by_code[code]
+        return self._po_by_description.get(description, -1)
+
+    def received(self, item: LineItem) -> float:
+        code, description = _keys(item)
+        if code and code in self._received_by_code:
+            return self._received_by_code[code]
+        return self._received_by_description.get(description, 0.0)
+
+def three_way_match(invoice: InvoiceData, po: PurchaseOrder, received: Iterable[Any],
+                    policy: TenantPolicy) -> MatchingResults:
+    """
+    Price check against the PO and quantity check against goods received, for every invoice line.
+    Lines not on the PO are only quantity-checked.
+    """
+    results = MatchingResults(has_po=True, match_status="MATCHED", auto_approvable=True,
+                              po_number=po.po_number, po_usage={})
+    lines = invoice.line_items
+    if not lines:
+        return results
+
+    index = POIndex(po.line_items, received)
+    rows = np.array([index.po_row(item) for item in lines], dtype=np.intp)
+    quantities = np.array([item.quantity for item in lines], dtype=float)
+    prices = np.array([item.unit_price for item in lines], dtype=float)
+    received = np.array([index.received(item) for item in lines], dtype=float)
+
+    on_po = rows >= 0
+    expected_prices = prices.copy() # Lines not on the PO are valued at the invoiced price
+    expected_prices[on_po] = index.unit_prices[rows[on_po]]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        # A zero PO price makes any charge an infinite variance, and a zero charge none
+        price_diff_percent = np.nan_to_num(np.abs(prices - expected_prices) / expected_prices * 100, nan=0.0)
+    price_flags = on_po & (price_diff_percent > policy.price_variance_percent)
+
+    over_received = np.maximum(quantities - received, 0.0)
+    qty_flags = quantities > received * (1 + policy.quantity_variance_percent / 100)
+
+    # Monetary difference from PO prices, and units invoiced beyond what was received
+    results.price_variance = round(float(((prices - expected_prices) * quantities).sum()), 2)
+    results.quantity_variance = float(over_received.sum())
+
+    # What this invoice draws from each PO line, for the PO ledger
+    n_po_lines = len(index.unit_prices)
+    usage_quantity = np.bincount(rows[on_po], weights=quantities[on_po], minlength=n_po_lines)
+    usage_amount = np.bincount(rows[on_po], weights=(quantities * prices)[on_po], minlength=n_po_lines)
+    results.po_usage = {
+        str(row): POLineUsage(quantity=float(usage_quantity[row]), amount=round(float(usage_amount[row]), 2))
+        for row in np.flatnonzero(np.bincount(rows[on_po], minlength=n_po_lines))
+    }
+
+    details = []
+    for i in np.flatnonzero(price_flags | qty_flags):
+        if price_flags[i]:
+            details.append(f"Price variance on {lines[i].description}: {price_diff_percent[i]:.2f}%")
+        if qty_flags[i]:
+            details.append(f"Qty variance on {lines[i].description}: Invoiced {lines[i].quantity}, Received {float(received[i])}")
+
+    if details:
+        results.match_status = "VARIANCE"
+        results.auto_approvable = False # Be strict for now
+        results.details = "; ".join(details)
+    return results
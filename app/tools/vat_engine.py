@@ -0,0 +1,228 @@
+"""
+Line-level UK VAT checks, vectorised over batches of invoices.
+
+Every invoice line is either coded (its tax_code fixes the rate) or uncoded. The lines
+of a whole batch are flattened into NumPy arrays, so checking N invoices is a few
+segment sums rather than N Python loops:
+
+1. Coded lines contribute net x rate; the uncoded remainder is tried at 20%, 5% and 0%
+   in turn, the first rate within tolerance of the declared VAT winning.
+2. Invoices still unmatched with two or more uncoded lines may be mixed-rate: some lines
+   at 20%, some at 5%, some at 0%. That is a subset-sum over pence of VAT, solved per
+   invoice by dynamic programming, and only for the few invoices step 1 left over.
+
+Lines only count when they add up to the subtotal; otherwise the subtotal is checked as one uncoded line.
+"""
+from typing import Any, Dict, Iterable, List, NamedTuple, Optional, Sequence, Tuple
+
+import numpy as np
+
+from app.models.invoice import InvoiceData
+
+STANDARD_RATE = 0.20
+REDUCED_RATE = 0.05
+ZERO_RATE = 0.0
+RATES = (STANDARD_RATE, REDUCED_RATE, ZERO_RATE) # In order of preference when several fit
+TAX_CODES = {
+    "S": STANDARD_RATE, "STANDARD": STANDARD_RATE,
+    "R": REDUCED_RATE, "REDUCED": REDUCED_RATE,
+    "Z": ZERO_RATE, "ZERO": ZERO_RATE,
+    "E": ZERO_RATE, "EXEMPT": ZERO_RATE,
+    "O": ZERO_RATE, "OUTSIDE": ZERO_RATE,
+}
+TOLERANCE = 0.05 # 5p
+# Upper bound on uncoded lines x pence of VAT a mixed-rate search may cover for one invoice
+MAX_SOLVER_CELLS = 5_000_000
+
+# How an invoice's VAT was matched
+MATCH_NONE = 0
+MATCH_RATE = 1  # Every line at one rate, none coded
+MATCH_CODES = 2 # Coded lines, with any uncoded ones at one rate
+MATCH_MIXED = 3 # Uncoded lines at a solved mix of rates
+
+def tax_rate(code: Optional[str]) -> Optional[float]:
+    """Rate of a line's tax code ('S', 'standard', '20%', '0.05' ...); None when uncoded or unknown."""
+    if not code:
+        return None
+    key = code.strip().upper()
+    if key in TAX_CODES:
+        return TAX_CODES[key]
+    try:
+        rate = float(key.rstrip("%"))
+    except ValueError:
+        return None
+    rate = rate / 100 if rate >= 1 or key.endswith("%") else rate
+    return next((r for r in RATES if abs(r - rate) < 1e-9), None)
+
+def solve_mixed_rates(net: Sequence[float], target: float, tolerance: float = TOLERANCE) -> Optional[np.ndarray]:
+    """
+    A rate from RATES for each line so that sum(net * rate) is within `tolerance` of `target`, or None.
+    Reachable VAT totals in pence are a boolean row per line; each line shifts the previous row by
+    its VAT at every rate. Gives up (None) beyond MAX_SOLVER_CELLS.
+    """
+    net = np.asarray(net, dtype=float)
+    pence = np.rint(np.outer(net, RATES) * 100).astype(np.int64)
+    hi = int(round((target + tolerance) * 100))
+    lo = max(int(round((target - tolerance) * 100)), 0)
+    if hi < 0 or len(net) * (hi + 1) > MAX_SOLVER_CELLS:
+        return None
+    reach = np.zeros((len(net) + 1, hi + 1), dtype=bool)
+    reach[0, 0] = True
+    for i, options in enumerate(pence):
+        for vat in options:
+            if vat <= hi:
+                reach[i + 1, vat:] |= reach[i, :hi + 1 - vat]
+    hits = np.flatnonzero(reach[-1, lo:]) + lo
+    if not hits.size:
+        return None
+
+    # Walk back from the total closest to the target, taking the first rate that stays reachable
+    total = int(hits[np.argmin(np.abs(hits - target * 100))])
+    rates = np.empty(len(net))
+    for i in range(len(net) - 1, -1, -1):
+        for rate, vat in zip(RATES, pence[i]):
+            if vat <= total and reach[i, total - vat]:
+                rates[i] = rate
+                total -= vat
+                break
+    return rates
+
+class VATCheck(NamedTuple):
+    """One invoice's VAT verdict."""
+    valid: bool
+    match: int # MATCH_NONE, MATCH_RATE, MATCH_CODES or MATCH_MIXED
+    expected_vat: float # What the matched rates give; unmatched, coded lines plus 20% of the rest
+    rate: Optional[float] # The one rate every line is charged at; None for mixed rates or no match
+    line_rates: Tuple[float, ...] # Rate of each line checked, when matched
+    line_numbers: Tuple[int, ...] # item_id of each line checked; empty when the subtotal stood in for the lines
+
+class VATBatchResult(NamedTuple):
+    """Per-invoice verdicts of a batch, as arrays."""
+    valid: np.ndarray
+    match: np.ndarray
+    expected_vat: np.ndarray
+    rate: np.ndarray # NaN for mixed rates or no match
+    uncoded_rate: np.ndarray # Rate the uncoded lines matched at; NaN for mixed rates, no match or none uncoded
+    mixed_rates: Dict[int, np.ndarray] # Invoice row -> solved rate of each of its lines
+
+class VATBatch:
+    """
+    The lines of many invoices as flat arrays: invoice i owns lines starts[i]:starts[i + 1].
+    Every invoice has at least one line, the subtotal standing in when its lines do not add up.
+    """
+    def __init__(self, starts: np.ndarray, net: np.ndarray, line_rate: np.ndarray,
+                 declared_vat: np.ndarray, subtotal: np.ndarray, line_numbers: Optional[List[Tuple[int, ...]]] = None):
+        self.starts = starts
+        self.net = net
+        self.line_rate = line_rate # NaN for uncoded lines
+        self.declared_vat = declared_vat
+        self.subtotal = subtotal
+        self.line_numbers = line_numbers
+
+    def __len__(self) -> int:
+        return len(self.starts)
+
+    @classmethod
+    def from_rows(cls, rows: Iterable[Tuple[float, float, Sequence[Tuple[Any, float, Optional[str]]]]]) -> "VATBatch":
+        """Build from (subtotal, declared VAT, [(item_id, line_total, tax_code), ...]) per invoice."""
+        starts, net, rates, declared, subtotals, numbers = [], [], [], [], [], []
+        for subtotal, vat, lines in rows:
+            starts.append(len(net))
+            subtotals.append(subtotal)
+            declared.append(vat)
+            if lines and abs(sum(line[1] for line in lines) - subtotal) <= TOLERANCE:
+                for _, line_total, code in lines:
+                    net.append(line_total)
+                    rate = tax_rate(code)
+                    rates.append(np.nan if rate is None else rate)
+                numbers.append(tuple(line[0] for line in lines))
+            else:
+                net.append(subtotal)
+                rates.append(np.nan)
+                numbers.append(())
+        return cls(np.array(starts, dtype=np.intp), np.array(net, dtype=float), np.array(rates, dtype=float),
+                   np.array(declared, dtype=float), np.array(subtotals, dtype=float), numbers)
+
+    @classmethod
+    def from_invoices(cls, invoices: Iterable[InvoiceData]) -> "VATBatch":
+        return cls.from_rows(
+            (data.subtotal, data.vat_amount, [(item.item_id, item.line_total, item.tax_code) for item in data.line_items])
+            for data in invoices
+        )
+
+    @classmethod
+    def from_documents(cls, docs: Iterable[Dict[str, Any]]) -> "VATBatch":
+        """From stored invoices projected to data.subtotal, data.vat_amount and data.line_items."""
+        rows = []
+        for doc in docs:
+            data = doc.get("data") or {}
+            lines = [(item.get("item_id", n), item.get("line_total", 0.0), item.get("tax_code"))
+                     for n, item in enumerate(data.get("line_items") or [], start=1)]
+            rows.append((data.get("subtotal", 0.0), data.get("vat_amount", 0.0), lines))
+        return cls.from_rows(rows)
+
+    def check(self) -> VATBatchResult:
+        """Match every invoice's declared VAT against its lines."""
+        ends = np.append(self.starts[1:], len(self.net))
+        coded = ~np.isnan(self.line_rate)
+        coded_vat = np.add.reduceat(np.where(coded, self.net * np.nan_to_num(self.line_rate), 0.0), self.starts)
+        uncoded_net = np.add.reduceat(np.where(coded, 0.0, self.net), self.starts)
+        uncoded_lines = np.add.reduceat((~coded).astype(np.intp), self.starts)
+        coded_lines = ends - self.starts - uncoded_lines
+        # NaN when no line is coded; the coded lines share one rate when min == max
+        coded_min = np.fmin.reduceat(self.line_rate, self.starts)
+        coded_max = np.fmax.reduceat(self.line_rate, self.starts)
+
+        n = len(self)
+        match = np.full(n, MATCH_NONE, dtype=np.int8)
+        rate = np.full(n, np.nan)
+        uncoded_rate = np.full(n, np.nan)
+        expected = coded_vat + uncoded_net * STANDARD_RATE
+        for candidate in RATES:
+            vat = coded_vat + uncoded_net * candidate
+            hit = (match == MATCH_NONE) & (np.abs(self.declared_vat - vat) <= TOLERANCE + 1e-9)
+            expected[hit] = vat[hit]
+            match[hit] = np.where(coded_lines[hit] > 0, MATCH_CODES, MATCH_RATE)
+            uncoded_rate[hit & (uncoded_lines > 0)] = candidate
+            single = hit & ((coded_lines == 0) | ((coded_min == coded_max) & ((uncoded_lines == 0) | (coded_min == candidate))))
+            rate[single] = np.where(uncoded_lines[single] > 0, candidate, coded_min[single])
+
+        mixed_rates: Dict[int, np.ndarray] = {}
+        for i in np.flatnonzero((match == MATCH_NONE) & (uncoded_lines >= 2)):
+            lines = slice(self.starts[i], ends[i])
+            line_rates = self.line_rate[lines].copy()
+            free = np.isnan(line_rates)
+            solved = solve_mixed_rates(self.net[lines][free], self.declared_vat[i] - coded_vat[i])
+            if solved is None:
+                continue
+            line_rates[free] = solved
+            mixed_rates[int(i)] = line_rates
+            match[i] = MATCH_MIXED
+            expected[i] = float(self.net[lines] @ line_rates)
+
+        return VATBatchResult(match != MATCH_NONE, match, np.round(expected, 2), rate, uncoded_rate, mixed_rates)
+
+    def checks(self) -> List[VATCheck]:
+        """check(), as one VATCheck per invoice."""
+        result = self.check()
+        ends = np.append(self.starts[1:], len(self.net))
+        out = []
+        for i in range(len(self)):
+            match = int(result.match[i])
+            if match == MATCH_MIXED:
+                line_rates = tuple(result.mixed_rates[i].tolist())
+            elif match != MATCH_NONE:
+                rates = self.line_rate[self.starts[i]:ends[i]]
+                line_rates = tuple(np.where(np.isnan(rates), result.uncoded_rate[i], rates).tolist())
+            else:
+                line_rates = ()
+            out.append(VATCheck(
+                valid=bool(result.valid[i]), match=match, expected_vat=float(result.expected_vat[i]),
+                rate=None if np.isnan(result.rate[i]) else float(result.rate[i]),
+                line_rates=line_rates, line_numbers=self.line_numbers[i] if self.line_numbers else ()
+            ))
+        return out
+
+def check_invoice(data: InvoiceData) -> VATCheck:
+    """Line-level VAT verdict for one invoice."""
+    return VATBatch.from_invoices([data]).checks()[0]
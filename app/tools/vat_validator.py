@@ -1,55 +1,160 @@
-from typing import List, Dict, Any, Optional
-from app.models.invoice import InvoiceData
+import logging
+from typing import List, Dict, Any, Optional, Sequence
+from pymongo import ASCENDING, IndexModel
+from app.database import db
+from app.models.invoice import InvoiceData, InvoiceStatus
+from app.models.vendor import VendorFeatures
+from app.repositories.base import DEFAULT_BATCH_SIZE
+from app.repositories.indexes import declare_indexes
+from app.tools.vat_engine import (
+    MATCH_CODES, MATCH_MIXED, MATCH_NONE, REDUCED_RATE, STANDARD_RATE, TOLERANCE, ZERO_RATE, VATBatch, VATCheck
+)
+
+logger = logging.getLogger(__name__)
+
+# Only invoices failing VAT are indexed, so the nightly revalidation reads just those
+declare_indexes("invoices", IndexModel([("validation.vat_valid", ASCENDING), ("status", ASCENDING)],
+                                       partialFilterExpression={"validation.vat_valid": False}))
+
+# A vendor "usually" charges a rate once this share of at least USUAL_RATE_MIN_INVOICES invoices did
+USUAL_RATE_SHARE = 0.9
+USUAL_RATE_MIN_INVOICES = 5
+
+RATE_DETAILS = {
+    STANDARD_RATE: "Matches Standard Rate (20%)",
+    REDUCED_RATE: "Matches Reduced Rate (5%)",
+    ZERO_RATE: "Zero Rated / Exempt",
+}
 
 class VATValidator:
+    """
+    VAT checks per line against tax codes, via the vat_engine. Lines without a code are tried
+    at one rate for the whole invoice and then, failing that, at a mix of 20%, 5% and 0%.
+    """
     def __init__(self):
         # UK VAT Rates
-        self.STANDARD_RATE = 0.20
-        self.REDUCED_RATE = 0.05
-        self.ZERO_RATE = 0.0
-        self.TOLERANCE = 0.05 # 5p tolerance
+        self.STANDARD_RATE = STANDARD_RATE
+        self.REDUCED_RATE = REDUCED_RATE
+        self.ZERO_RATE = ZERO_RATE
+        self.TOLERANCE = TOLERANCE # 5p tolerance
 
-    def validate_vat(self, invoice_data: InvoiceData) -> Dict[str, Any]:
+    def validate_vat(self, invoice_data: InvoiceData, vendor_features: Optional[VendorFeatures] = None) -> Dict[str, Any]:
         """
         Validates VAT calculations on the invoice.
-        Returns a dict with 'valid' (bool) and 'details' (str).
+        Returns a dict with 'valid' (bool), 'details' (str), 'expected_vat' and 'mixed_rates' (bool).
+        With the vendor's features, 'unusual_for_vendor' is True when a valid single rate is not the
+        one the vendor nearly always charges.
+        """
+        return self.validate_batch([invoice_data], [vendor_features])[0]
+
+    def validate_batch(self, invoices: Sequence[InvoiceData],
+                       vendor_features: Optional[Sequence[Optional[VendorFeatures]]] = None) -> List[Dict[str, Any]]:
+        """validate_vat() for many invoices, checked together in one vectorised pass."""
+        checks = VATBatch.from_invoices(invoices).checks()
+        features = vendor_features or [None] * len(checks)
+        return [self._result(data, check, vf) for data, check, vf in zip(invoices, checks, features)]
+
+    def _result(self, data: InvoiceData, check: VATCheck, vendor_features: Optional[VendorFeatures]) -> Dict[str, Any]:
+        result = {"valid": check.valid, "expected_vat": check.expected_vat, "mixed_rates": check.match == MATCH_MIXED}
+        if check.match == MATCH_NONE:
+            percentage = (data.vat_amount / data.subtotal) * 100 if data.subtotal > 0 else 0
+            if any(item.tax_code for item in data.line_items):
+                result["details"] = (f"VAT amount {data.vat_amount} does not match the line tax codes "
+                                     f"({check.expected_vat:.2f}). Implied rate: {percentage:.1f}%")
+            else:
+                result["details"] = (f"VAT amount {data.vat_amount} does not match 20% ({check.expected_vat:.2f}) "
+                                     f"or 5%. Implied rate: {percentage:.1f}%")
+            return result
+        if check.match == MATCH_MIXED:
+            result["details"] = f"Matches mixed rates: {self._describe_rates(check)}"
+        elif check.match == MATCH_CODES:
+            result["details"] = "Matches line tax codes"
+        else:
+            result["details"] = RATE_DETAILS[check.rate]
+        if check.rate is None:
+            # Mixed-rate invoices have no single rate to compare with the vendor's usual one
+            result["unusual_for_vendor"] = False
+            return result
+        return self._against_usual_rate(result, check.rate, vendor_features)
+
+    @staticmethod
+    def _describe_rates(check: VATCheck) -> str:
+        """'lines 1, 3 at 20%; line 2 at 5%'"""
+        numbers = check.line_numbers or tuple(range(1, len(check.line_rates) + 1))
+        by_rate: Dict[float, List[str]] = {}
+        for number, rate in zip(numbers, check.line_rates):
+            by_rate.setdefault(rate, []).append(str(number))
+        return "; ".join(f"{'lines' if len(lines) > 1 else 'line'} {', '.join(lines)} at {rate * 100:g}%"
+                         for rate, lines in sorted(by_rate.items(), reverse=True))
+
+    async def revalidate_open_invoices(self, company_id: Optional[str] = None,
+                                       batch_size: int = DEFAULT_BATCH_SIZE) -> int:
         """
-        # If explicit VAT amount is missing, we can't fully validate, 
-        # but we can check if it aligns with standard rate if provided.
-        
-        calculated_vat = 0.0
-        
-        # Method 1: Line item aggregation (most accurate)
-        # But our LineItem doesn't enforce a VAT Code per line yet, 
-        # so we'll infer based on 'taxable' assumption or just check global totals first.
-        
-        # Method 2: Global Check
-        # Check if declared VAT matches 20% of Subtotal
-        expected_vat_standard = invoice_data.subtotal * self.STANDARD_RATE
-        diff_standard = abs(invoice_data.vat_amount - expected_vat_standard)
-        
-        if diff_standard <= self.TOLERANCE:
-            return {"valid": True, "details": "Matches Standard Rate (20%)"}
-            
-        # Check Reduced Rate
-        expected_vat_reduced = invoice_data.subtotal * self.REDUCED_RATE
-        diff_reduced = abs(invoice_data.vat_amount - expected_vat_reduced)
-        
-        if diff_reduced <= self.TOLERANCE:
-            return {"valid": True, "details": "Matches Reduced Rate (5%)"}
-
-        # Check Zero Rate / Exempt
-        if invoice_data.vat_amount == 0.0:
-            return {"valid": True, "details": "Zero Rated / Exempt"}
-            
-        # Check if multiple mixed rates? (Complex without line item tax codes)
-        # For now, mark invalid if no single rate matches simple total logic
-        
-        percentage = (invoice_data.vat_amount / invoice_data.subtotal) * 100 if invoice_data.subtotal > 0 else 0
-        
-        return {
-            "valid": False, 
-            "details": f"VAT amount {invoice_data.vat_amount} does not match 20% ({expected_vat_standard:.2f}) or 5%. Implied rate: {percentage:.1f}%"
+        Re-check every open invoice that failed VAT, batch_size at a time, e.g. nightly for invoices
+        validated before line tax codes and mixed rates were understood. Only the amounts and line
+        tax codes are read. Invoices that now pass get validation.vat_valid and lose their
+        VAT_MISMATCH flag, gaining VAT_MIXED_RATES if they only pass at inferred mixed rates.
+        Any still awaiting a correction from the vendor move on as validation would have sent them:
+        to matching, or to approval if the vendor is not approved. Returns how many passed.
+        """
+        query: Dict[str, Any] = {
+            "validation.vat_valid": False,
+            "status": {"$nin": [InvoiceStatus.PAID, InvoiceStatus.REJECTED]}
         }
+        if company_id:
+            query["company_id"] = company_id
+        projection = {"invoice_id": 1, "status": 1, "version": 1, "validation.vendor_approved": 1,
+                      "data.subtotal": 1, "data.vat_amount": 1,
+                      "data.line_items.item_id": 1, "data.line_items.line_total": 1, "data.line_items.tax_code": 1}
+        passed = 0
+        batch: List[Dict[str, Any]] = []
+        async for doc in db.invoices.collection.find(query, projection).batch_size(batch_size):
+            batch.append(doc)
+            if len(batch) >= batch_size:
+                passed += await self._revalidate(batch)
+                batch = []
+        if batch:
+            passed += await self._revalidate(batch)
+        return passed
+
+    async def _revalidate(self, docs: List[Dict[str, Any]]) -> int:
+        checks = VATBatch.from_documents(docs).checks()
+        passing = [(doc, check) for doc, check in zip(docs, checks) if check.valid]
+        updates = []
+        for doc, check in passing:
+            # A pipeline, since the flags lose VAT_MISMATCH and may gain VAT_MIXED_RATES in one write
+            flags: Any = {"$filter": {
+                "input": {"$ifNull": ["$validation.flags", []]},
+                "cond": {"$not": [{"$regexMatch": {"input": "$$this", "regex": "^VAT_MISMATCH"}}]}
+            }}
+            if check.match == MATCH_MIXED:
+                # Inferred rather than read from tax codes, flagged as validation flags it
+                flag = f"VAT_MIXED_RATES: Matches mixed rates: {self._describe_rates(check)}"
+                flags = {"$concatArrays": [flags, [{"$literal": flag}]]}
+            updates.append(({"invoice_id": doc["invoice_id"], "validation.vat_valid": False},
+                            [{"$set": {"validation.vat_valid": True, "validation.flags": flags}}]))
+        if updates:
+            await db.invoices.bulk_update(updates)
+        for doc, _ in passing:
+            if doc.get("status") == InvoiceStatus.AWAITING_CORRECTION:
+                # No replacement invoice is needed any more. Validation checked the VAT before the
+                # vendor, so an unapproved vendor's invoice still has the approval gate ahead of it.
+                approved = (doc.get("validation") or {}).get("vendor_approved")
+                next_status = InvoiceStatus.MATCHING if approved else InvoiceStatus.AWAITING_APPROVAL
+                await db.invoices.transition(doc["invoice_id"], InvoiceStatus.AWAITING_CORRECTION, next_status, {
+                    "correction_tracking.status": "RESOLVED_ON_REVALIDATION"
+                }, expected_version=doc.get("version") or 0)
+        logger.info(f"VAT revalidation: {len(passing)} of {len(docs)} invoices now pass")
+        return len(passing)
+
+    def _against_usual_rate(self, result: Dict[str, Any], rate: float,
+                            vendor_features: Optional[VendorFeatures]) -> Dict[str, Any]:
+        usual = vendor_features.usual_vat_rate() if vendor_features else None
+        result["unusual_for_vendor"] = False
+        if usual and vendor_features.invoice_count >= USUAL_RATE_MIN_INVOICES and usual[1] >= USUAL_RATE_SHARE \
+                and abs(usual[0] - rate) > 1e-9:
+            result["unusual_for_vendor"] = True
+            result["details"] += f"; vendor usually charges {usual[0] * 100:g}%"
+        return result
 
 vat_validator = VATValidator()
@@ -0,0 +1,195 @@
+"""
+In-process sliding-window invoice velocity per (tenant, vendor).
+
+Every window is a ring of fixed-width buckets with running totals: adding an invoice
+touches one bucket, and reading a window first expires the buckets that slid out of it,
+at most one pass over the ring. Reads and writes are therefore O(1) whatever the volume.
+Windows are as precise as their bucket width: 1 minute for 1h, 30 minutes for 24h, a day for 30d.
+
+The tracker is rebuilt from the last 30 days of invoices at startup and fed by extraction
+as invoices arrive. It is per process, so with several workers each sees the invoices it
+extracted since start-up on top of the shared history.
+"""
+import logging
+from collections import deque
+from datetime import datetime, timedelta
+from typing import Deque, Dict, NamedTuple, Optional, Set, Tuple
+
+from pymongo import ASCENDING, IndexModel
+
+from app.database import db
+from app.models.policy import DEFAULT_POLICY, TenantPolicy
+from app.repositories.indexes import declare_indexes
+from app.repositories.vendor import vendor_key
+
+logger = logging.getLogger(__name__)
+
+# rebuild() reads every tenant's recent invoices in arrival order
+declare_indexes("invoices", IndexModel([("created_at", ASCENDING)]))
+
+HOUR = 3600
+DAY = 24 * HOUR
+# name -> (bucket width in seconds, buckets); width * buckets is the window length
+WINDOWS = {
+    "1h": (60, 60),
+    "24h": (30 * 60, 48),
+    "30d": (DAY, 30),
+}
+HORIZON = timedelta(days=30) # Longest window, and how far back rebuild() reads
+NEAR_THRESHOLD_MARGIN = 0.05 # Within 5% below an approval bound counts as "just under" it
+
+_EPOCH = datetime(1970, 1, 1)
+
+def _seconds(at: datetime) -> float:
+    return (at - _EPOCH).total_seconds()
+
+def near_approval_threshold(policy: TenantPolicy, amount: float) -> bool:
+    """True if `amount` sits just under the next approval bound, e.g. 4,900 under a 5,000 limit."""
+    bound = policy.approval_index.next_bound(amount)
+    return bound is not None and bound > 0 and amount >= bound * (1 - NEAR_THRESHOLD_MARGIN)
+
+class RollingWindow:
+    """Invoice count, amount sum and near-threshold count over the last `buckets` x `width` seconds."""
+    __slots__ = ("width", "size", "head", "_ids", "_counts", "_amounts", "_near", "count", "amount", "near")
+
+    def __init__(self, width: int, buckets: int):
+        self.width = width
+        self.size = buckets
+        self.head: Optional[int] = None # Id of the newest bucket (seconds // width)
+        self._ids = [-1] * buckets
+        self._counts = [0] * buckets
+        self._amounts = [0.0] * buckets
+        self._near = [0] * buckets
+        self.count = 0
+        self.amount = 0.0
+        self.near = 0
+
+    def advance(self, seconds: float):
+        """Slide the window forward to `seconds`, expiring what falls out of it."""
+        bucket = int(seconds // self.width)
+        if self.head is not None and bucket <= self.head:
+            return
+        oldest = bucket - self.size + 1
+        if self.head is None or bucket - self.head >= self.size:
+            slots = range(self.size)
+        else:
+            # Only the slots the new buckets reuse can hold expired data
+            slots = (b % self.size for b in range(self.head + 1, bucket + 1))
+        for slot in slots:
+            if self._ids[slot] != -1 and self._ids[slot] < oldest:
+                self.count -= self._counts[slot]
+                self.amount -= self._amounts[slot]
+                self.near -= self._near[slot]
+                self._ids[slot], self._counts[slot], self._amounts[slot], self._near[slot] = -1, 0, 0.0, 0
+        self.head = bucket
+        if not self.count:
+            self.amount = 0.0 # Drop float residue once the window is empty
+
+    def add(self, seconds: float, amount: float, near: bool):
+        """Count one invoice at `seconds`. Invoices older than the window are ignored."""
+        self.advance(seconds)
+        bucket = int(seconds // self.width)
+        if bucket <= self.head - self.size:
+            return
+        slot = bucket % self.size
+        self._ids[slot] = bucket
+        self._counts[slot] += 1
+        self._amounts[slot] += amount
+        self._near[slot] += near
+        self.count += 1
+        self.amount += amount
+        self.near += near
+
+class VelocitySnapshot(NamedTuple):
+    """One vendor's invoice velocity at a point in time, the current invoice included once recorded."""
+    count_1h: int = 0
+    amount_1h: float = 0.0
+    count_24h: int = 0
+    amount_24h: float = 0.0
+    count_30d: int = 0
+    amount_30d: float = 0.0
+    near_threshold_24h: int = 0 # Invoices just under an approval bound
+
+EMPTY_SNAPSHOT = VelocitySnapshot()
+
+class VelocityTracker:
+    """Sliding-window counters for every (tenant, vendor), fed by extraction and read by fraud scoring."""
+    def __init__(self):
+        self._windows: Dict[Tuple[str, str], Dict[str, RollingWindow]] = {}
+        # Invoices already counted, so re-extraction does not count them twice
+        self._seen: Set[str] = set()
+        self._seen_order: Deque[Tuple[float, str]] = deque()
+
+    def __len__(self) -> int:
+        return len(self._windows)
+
+    def add(self, invoice_id: str, company_id: str, vendor_name: str, vendor_id: Optional[str],
+            amount: float, at: datetime, near_threshold: bool = False) -> bool:
+        """Count an invoice against its vendor. False if it was already counted."""
+        seconds = _seconds(at)
+        while self._seen_order and self._seen_order[0][0] < seconds - HORIZON.total_seconds():
+            self._seen.discard(self._seen_order.popleft()[1])
+        if invoice_id in self._seen:
+            return False
+        self._seen.add(invoice_id)
+        self._seen_order.append((seconds, invoice_id))
+
+        key = (company_id, vendor_key(vendor_name, vendor_id))
+        windows = self._windows.get(key)
+        if windows is None:
+            windows = self._windows[key] = {name: RollingWindow(*spec) for name, spec in WINDOWS.items()}
+        for window in windows.values():
+            window.add(seconds, amount, near_threshold)
+        return True
+
+    async def record(self, invoice_id: str, company_id: str, vendor_name: str, vendor_id: Optional[str],
+                     amount: float, at: datetime, policy: Optional[TenantPolicy] = None) -> bool:
+        """add(), judging near-threshold amounts against the tenant's approval policy."""
+        if policy is None:
+            policy = await db.config.get_policy(company_id) or DEFAULT_POLICY
+        return self.add(invoice_id, company_id, vendor_name, vendor_id, amount, at,
+                        near_approval_threshold(policy, amount))
+
+    def snapshot(self, company_id: str, vendor_name: str, vendor_id: Optional[str] = None,
+                 now: Optional[datetime] = None) -> VelocitySnapshot:
+        """The vendor's current velocity; a dict lookup plus expiring stale buckets."""
+        windows = self._windows.get((company_id, vendor_key(vendor_name, vendor_id)))
+        if windows is None:
+            return EMPTY_SNAPSHOT
+        seconds = _seconds(now or datetime.utcnow())
+        hour, day, month = windows["1h"], windows["24h"], windows["30d"]
+        for window in (hour, day, month):
+            window.advance(seconds)
+        return VelocitySnapshot(hour.count, round(hour.amount, 2), day.count, round(day.amount, 2),
+                                month.count, round(month.amount, 2), day.near)
+
+    def clear(self):
+        self._windows.clear()
+        self._seen.clear()
+        self._seen_order.clear()
+
+    async def rebuild(self, now: Optional[datetime] = None) -> int:
+        """
+        Reload the counters from every invoice created in the last 30 days, in arrival order.
+        Only the fields the counters need are read. Returns how many invoices were counted.
+        """
+        now = now or datetime.utcnow()
+        self.clear()
+        policies: Dict[str, TenantPolicy] = {}
+        projection = {"invoice_id": 1, "company_id": 1, "created_at": 1,
+                      "data.total": 1, "data.vendor_name": 1, "data.vendor_id": 1}
+        cursor = db.invoices.collection.find(
+            {"created_at": {"$gte": now - HORIZON}, "data": {"$type": "object"}}, projection
+        ).sort("created_at", ASCENDING)
+        counted = 0
+        async for doc in cursor:
+            company_id, data = doc["company_id"], doc["data"]
+            if company_id not in policies:
+                policies[company_id] = await db.config.get_policy(company_id) or DEFAULT_POLICY
+            counted += await self.record(doc["invoice_id"], company_id, data.get("vendor_name", ""),
+                                         data.get("vendor_id"), data.get("total", 0.0), doc["created_at"],
+                                         policies[company_id])
+        logger.info(f"Velocity counters rebuilt from {counted} invoices across {len(self)} vendors")
+        return counted
+
+velocity_tracker = VelocityTracker()
@@ -6,9 +6,13 @@ from typing import Optional
 from app.database import db
 from app.models.verification import VerificationRequest, VerificationStatus, VerificationMethod
 from app.tools.notification_tool import notification_tool
+from app.repositories.indexes import declare_indexes
+from pymongo import ASCENDING, IndexModel
 
 logger = logging.getLogger(__name__)
 
+declare_indexes("verification_requests", IndexModel([("invoice_id", ASCENDING)]))
+
 class BankDetailVerification:
     def __init__(self):
         pass
@@ -40,7 +44,7 @@ class BankDetailVerification:
     async def request_email_confirmation(self, request: VerificationRequest, vendor_id: str):
         """Sends email to vendor."""
         # Fetch vendor email
-        vendor = await db.vendors.get_by_field("vendor_id", vendor_id)
+        vendor = await db.vendors.get_by_vendor_id(vendor_id)
         email = vendor.contact.email if vendor and vendor.contact else "unknown@vendor.com"
         
         await notification_tool.send_notification(
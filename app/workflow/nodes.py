@@ -1,4 +1,5 @@
 import logging
+from datetime import datetime
 from typing import Dict, Any
 
 from app.workflow.state import InvoiceState
@@ -12,6 +13,7 @@ from app.agents.approval import approval_agent
 from app.agents.payment import payment_agent
 from app.agents.recording import recording_agent
 from app.agents.reflection import reflection_agent
+from app.agents.sla_timers import sla_timers
 
 logger = logging.getLogger(__name__)
 
@@ -24,6 +26,19 @@ async def recording_node(state: InvoiceState) -> InvoiceState:
     await reflection_agent.reflect_on_success(state['invoice_id'])
     return res
 
+async def _start_sla_clocks(state: InvoiceState, payment: bool = False) -> InvoiceState:
+    """Schedule the SLA timers a node just made the invoice subject to; never blocks the workflow."""
+    try:
+        if payment:
+            due_date = (state.get('invoice_data') or {}).get('due_date')
+            if due_date and state.get('current_state') != InvoiceStatus.EXCEPTION:
+                await sla_timers.schedule_payment(state['invoice_id'], due_date)
+        if state.get('current_state') == InvoiceStatus.AWAITING_APPROVAL:
+            await sla_timers.schedule_approval(state['invoice_id'], datetime.utcnow())
+    except Exception as e:
+        logger.warning(f"Could not schedule SLA timers for {state['invoice_id']}: {e}")
+    return state
+
 # Define Node Wrappers
 # These simple wrappers calling the agent's logic allow us to keep the agent code independent of LangGraph if needed
 # and handle edge cases or state translation here.
@@ -35,7 +50,7 @@ async def ingestion_node(state: InvoiceState) -> InvoiceState:
 
 async def extraction_node(state: InvoiceState) -> InvoiceState:
     logger.info(f"Node: Extraction for {state['invoice_id']}")
-    return await extraction_agent.extraction_node(state)
+    return await _start_sla_clocks(await extraction_agent.extraction_node(state), payment=True)
 
 async def validation_node(state: InvoiceState) -> InvoiceState:
     logger.info(f"Node: Validation for {state['invoice_id']}")
@@ -47,15 +62,15 @@ async def validation_node(state: InvoiceState) -> InvoiceState:
             logger.info(f"Applying {len(hints)} learning hints to {state['invoice_id']}")
             state.setdefault("flags", []).extend(hints)
             
-    return await validation_agent.validation_node(state)
+    return await _start_sla_clocks(await validation_agent.validation_node(state))
 
 async def matching_node(state: InvoiceState) -> InvoiceState:
     logger.info(f"Node: Matching for {state['invoice_id']}")
-    return await matching_agent.matching_node(state)
+    return await _start_sla_clocks(await matching_agent.matching_node(state))
 
 async def approval_routing_node(state: InvoiceState) -> InvoiceState:
     logger.info(f"Node: Approval Routing for {state['invoice_id']}")
-    return await approval_agent.approval_routing_node(state)
+    return await _start_sla_clocks(await approval_agent.approval_routing_node(state))
 
 async def payment_prep_node(state: InvoiceState) -> InvoiceState:
     logger.info(f"Node: Payment Prep for {state['invoice_id']}")
@@ -65,6 +80,15 @@ async def exception_handler_node(state: InvoiceState) -> InvoiceState:
     logger.error(f"Node: Exception for {state['invoice_id']}. Errors: {state.get('errors')}")
     # Logic to notify or park the invoice
     state['current_state'] = InvoiceStatus.EXCEPTION
+
+    # Feeds the vendor's exception rate; never let bookkeeping block exception handling
+    data = state.get('invoice_data')
+    if data and state.get('company_id'):
+        try:
+            await db.vendor_features.record_exception(state['invoice_id'], state['company_id'], data.get('vendor_name', ''),
+                                                     data.get('vendor_id'))
+        except Exception as e:
+            logger.warning(f"Could not count exception for {state['invoice_id']}: {e}")
     
     # Trigger reflection on failure
     await reflection_agent.reflect_on_failure(
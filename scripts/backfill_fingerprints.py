@@ -0,0 +1,41 @@
+import sys
+import os
+sys.path.append(os.getcwd())
+import asyncio
+from pymongo.errors import DuplicateKeyError
+
+from app.database import db
+from app.models.invoice import InvoiceStatus
+from app.tools.duplicate_detector import duplicate_fingerprint
+
+async def backfill_fingerprints():
+    """
+    Fingerprint live invoices extracted before fingerprints existed, and re-key those holding
+    an outdated one (fingerprints used to include the total). Oldest first so originals win;
+    a later copy that now collides gives up its fingerprint.
+    """
+    claimed = duplicates = 0
+    cursor = db.invoices.collection.find(
+        {"data": {"$ne": None}, "status": {"$ne": InvoiceStatus.REJECTED}},
+        {"invoice_id": 1, "company_id": 1, "data": 1, "duplicate_fingerprint": 1}
+    ).sort("created_at", 1)
+    async for doc in cursor:
+        data = doc["data"]
+        fingerprint = duplicate_fingerprint(doc["company_id"], data["vendor_name"], data["invoice_number"], data.get("vendor_id"))
+        if doc.get("duplicate_fingerprint") == fingerprint:
+            continue
+        try:
+            await db.invoices.collection.update_one({"_id": doc["_id"]}, {"$set": {"duplicate_fingerprint": fingerprint}})
+            claimed += 1
+        except DuplicateKeyError:
+            print(f"{doc['invoice_id']} duplicates the invoice holding {fingerprint}")
+            await db.invoices.collection.update_one({"_id": doc["_id"]}, {"$unset": {"duplicate_fingerprint": ""}})
+            duplicates += 1
+    print(f"Fingerprinted {claimed} invoices, {duplicates} duplicates left unclaimed.")
+
+if __name__ == "__main__":
+    db.connect()
+    try:
+        asyncio.run(backfill_fingerprints())
+    finally:
+        db.close()
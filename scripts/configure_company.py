@@ -15,7 +15,7 @@ async def configure_company(company_id: str):
     
     await db.config.collection.update_one(
         {"company_id": company_id},
-        {"$set": config},
+        {"$set": config, "$inc": {"version": 1}}, # A new version is recompiled by every process
         upsert=True
     )
     print("Configuration updated successfully.")
@@ -0,0 +1,35 @@
+import sys
+import os
+sys.path.append(os.getcwd())
+import argparse
+import asyncio
+
+from app.database import db
+from app.tools.erp_import import KINDS, erp_importer
+
+async def import_erp(kind: str, paths):
+    """Import each file in turn. GRNs for POs not imported yet are reported, and drawn down once their PO is."""
+    failed = False
+    for path in paths:
+        report = await erp_importer.import_file(path, kind)
+        print(f"{path}: {report.documents} documents, {report.inserted} new, {report.updated} updated, "
+              f"{report.unchanged} unchanged, {len(report.errors)} errors")
+        for error in report.errors:
+            print(f"  row {error['row']} ({error['key']}): {error['message']}")
+        failed = failed or not report.ok
+    return failed
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Import purchase orders or GRNs from ERP CSV/JSONL exports")
+    parser.add_argument("kind", choices=sorted(KINDS), help="What the files contain")
+    parser.add_argument("paths", nargs="+", help=".csv or .jsonl files")
+    parser.add_argument("--chunk-size", type=int, default=erp_importer.chunk_size, help="Documents per bulk write")
+    args = parser.parse_args()
+
+    erp_importer.chunk_size = args.chunk_size
+    db.connect()
+    try:
+        failed = asyncio.run(import_erp(args.kind, args.paths))
+    finally:
+        db.close()
+    sys.exit(1 if failed else 0)
@@ -0,0 +1,25 @@
+import sys
+import os
+sys.path.append(os.getcwd())
+import asyncio
+import logging
+import time
+
+from app.database import db
+from app.tools.fraud_detector import fraud_detector
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+async def run_nightly_fraud_rescore():
+    """Rescore every open invoice, so risk tracks vendor changes made since it was validated."""
+    start = time.perf_counter()
+    changed = await fraud_detector.rescore_open_invoices()
+    logger.info(f"Fraud rescore complete: {changed} scores changed in {time.perf_counter() - start:.1f}s")
+
+if __name__ == "__main__":
+    db.connect()
+    try:
+        asyncio.run(run_nightly_fraud_rescore())
+    finally:
+        db.close()
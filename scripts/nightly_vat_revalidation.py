@@ -0,0 +1,25 @@
+import sys
+import os
+sys.path.append(os.getcwd())
+import asyncio
+import logging
+import time
+
+from app.database import db
+from app.tools.vat_validator import vat_validator
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+async def run_nightly_vat_revalidation():
+    """Re-check VAT on every open invoice that failed it, against line tax codes and mixed rates."""
+    start = time.perf_counter()
+    passed = await vat_validator.revalidate_open_invoices()
+    logger.info(f"VAT revalidation complete: {passed} invoices now pass in {time.perf_counter() - start:.1f}s")
+
+if __name__ == "__main__":
+    db.connect()
+    try:
+        asyncio.run(run_nightly_vat_revalidation())
+    finally:
+        db.close()
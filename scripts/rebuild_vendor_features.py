@@ -0,0 +1,31 @@
+import sys
+import os
+sys.path.append(os.getcwd())
+import asyncio
+import logging
+import time
+
+from app.database import db
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+async def rebuild_vendor_features():
+    """
+    Recompute every vendor's invoice statistics from the full invoice history, e.g. after first
+    deploying them. Run it while nothing is being extracted, or those invoices may be miscounted.
+    """
+    start = time.perf_counter()
+    projection = {"company_id": 1, "status": 1, "data.total": 1, "data.vat_rate": 1,
+                  "data.vendor_name": 1, "data.vendor_id": 1}
+    # Full pass over the collection on purpose; extraction keeps the features current afterwards
+    docs = db.invoices.collection.find({"data": {"$type": "object"}}, projection)
+    written = await db.vendor_features.rebuild(docs)
+    logger.info(f"Vendor features rebuilt for {written} vendors in {time.perf_counter() - start:.1f}s")
+
+if __name__ == "__main__":
+    db.connect()
+    try:
+        asyncio.run(rebuild_vendor_features())
+    finally:
+        db.close()
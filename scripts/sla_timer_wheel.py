@@ -0,0 +1,29 @@
+import sys
+import os
+sys.path.append(os.getcwd())
+import asyncio
+import logging
+
+from app.config import settings
+from app.database import db
+from app.agents.sla_timers import sla_timers
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+async def run_sla_timer_wheel():
+    """
+    Fire SLA escalations as thresholds are crossed, as the one process running the wheel.
+    The API workers then keep SLA_TIMER_WHEEL off and only persist the timers they schedule.
+    """
+    sla_timers.hold = True
+    await sla_timers.load()
+    logger.info(f"SLA timer wheel running, polling every {settings.SLA_TIMER_POLL_SECONDS:g}s")
+    await sla_timers.run()
+
+if __name__ == "__main__":
+    db.connect()
+    try:
+        asyncio.run(run_sla_timer_wheel())
+    finally:
+        db.close()
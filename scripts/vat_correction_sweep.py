@@ -0,0 +1,25 @@
+import sys
+import os
+sys.path.append(os.getcwd())
+import asyncio
+import logging
+import time
+
+from app.database import db
+from app.agents.vat_corrector import vat_corrector
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+async def run_vat_correction_sweep():
+    """Escalate VAT correction requests the vendor has not answered by their due date. Run e.g. hourly."""
+    start = time.perf_counter()
+    escalated = await vat_corrector.sweep_timeouts()
+    logger.info(f"VAT correction sweep complete: {escalated} invoices escalated in {time.perf_counter() - start:.1f}s")
+
+if __name__ == "__main__":
+    db.connect()
+    try:
+        asyncio.run(run_vat_correction_sweep())
+    finally:
+        db.close()
@@ -42,6 +42,8 @@ def mock_db():
         mock.vendors = AsyncMock()
         mock.audit = AsyncMock()
         mock.config = AsyncMock()
+        mock.vendor_features = AsyncMock()
+        mock.vendor_features.get.return_value = None # No invoice history
         mock.fs = MagicMock() # GridFS mock
         mock._db = MagicMock() # The raw motor database object
         yield mock
@@ -85,3 +87,22 @@ def mock_semantic_memory():
         mock.store_learning = AsyncMock()
         mock.retrieve_similar_cases = AsyncMock(return_value=[])
         yield mock
+
+@pytest.fixture
+async def live_db():
+    """Throwaway database on a local mongod for benchmarks; skips when none is reachable."""
+    import uuid
+    from motor.motor_asyncio import AsyncIOMotorClient
+    from app.config import settings
+
+    client = AsyncIOMotorClient(settings.MONGODB_URL, serverSelectionTimeoutMS=500)
+    try:
+        await client.admin.command("ping")
+    except Exception:
+        client.close()
+        pytest.skip("No local mongod reachable at MONGODB_URL")
+
+    name = f"{settings.DB_NAME}_test_{uuid.uuid4().hex[:8]}"
+    yield client[name]
+    await client.drop_database(name)
+    client.close()
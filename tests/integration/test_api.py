@@ -5,6 +5,7 @@ import pytest
 from httpx import AsyncClient
 from unittest.mock import AsyncMock, patch
 from app.main import app
+from app.repositories.base import Page
 
 @pytest.mark.asyncio
 async def test_health_check():
@@ -35,13 +36,18 @@ async def test_list_invoices_authorized():
         
         # 2. Mock DB (since endpoints hit DB)
         with patch("app.api.invoices.db") as mock_db:
-             mock_db.invoices.find = AsyncMock(return_value=[])
+             mock_db.invoices.list_page = AsyncMock(return_value=Page(items=[]))
              
              headers = {"Authorization": f"Bearer {token}"}
              response = await ac.get("/api/invoices/", headers=headers)
+             # Vendor names are matched literally, not as patterns
+             await ac.get("/api/invoices/", params={"vendor_name": "A+B (UK)"}, headers=headers)
+             query = mock_db.invoices.list_page.call_args.args[1]
              
     assert response.status_code == 200
-    assert response.json() == []
+    assert response.json()["items"] == []
+    assert response.json()["next_cursor"] is None
+    assert query["data.vendor_name"] == {"$regex": r"A\+B\ \(UK\)", "$options": "i"}
 
 @pytest.mark.asyncio
 async def test_upload_invoice():
@@ -69,3 +75,39 @@ async def test_upload_invoice():
              
     assert response.status_code == 201
     assert response.json()["invoice_id"].startswith("INV-")
+
+@pytest.mark.asyncio
+async def test_rejection_releases_po_usage_and_approval_keeps_it():
+    from app.models.invoice import Invoice, InvoiceStatus, MatchingResults, POLineUsage
+    usage = {
+        "INV-A": MatchingResults(po_number="PO-1", po_usage={"0": POLineUsage(quantity=5, amount=50.0)}),
+        "INV-R": MatchingResults(po_number="PO-1", po_usage={"0": POLineUsage(quantity=7, amount=70.0)}),
+    }
+    po = {"invoiced_amount": 120.0} # Both invoices counted at matching
+
+    async def claim_po_usage(invoice_id):
+        return usage.pop(invoice_id, None)
+    async def record_usage(po_number, company_id, lines, sign=1):
+        po["invoiced_amount"] += sign * sum(line.amount for line in lines.values())
+    async def get_invoice(field, invoice_id):
+        return Invoice(invoice_id=invoice_id, company_id="acme", status=InvoiceStatus.AWAITING_APPROVAL)
+
+    async with AsyncClient(app=app, base_url="http://test") as ac:
+        auth_response = await ac.post("/api/auth/token", data={"username": "admin", "password": "secret"})
+        headers = {"Authorization": f"Bearer {auth_response.json()['access_token']}"}
+        with patch("app.api.approvals.db") as api_db, \
+             patch("app.agents.matching.db") as matching_db, \
+             patch("app.guardrails.decorators.permission_checker.check_sod", AsyncMock(return_value=True)):
+            api_db.invoices.get_by_field = AsyncMock(side_effect=get_invoice)
+            api_db.invoices.transition = AsyncMock(return_value=True)
+            api_db.audit.log_action = AsyncMock()
+            matching_db.invoices.claim_po_usage = AsyncMock(side_effect=claim_po_usage)
+            matching_db.purchase_orders.record_usage = AsyncMock(side_effect=record_usage)
+
+            approved = await ac.post("/api/approvals/INV-A/approve", json={"approved": True}, headers=headers)
+            rejected = await ac.post("/api/approvals/INV-R/reject", json={"approved": False}, headers=headers)
+
+    assert approved.status_code == 200 and rejected.status_code == 200
+    # Approved spend stays on the PO; rejected spend is released
+    assert po["invoiced_amount"] == 50.0
+    assert "INV-A" in usage
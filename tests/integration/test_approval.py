@@ -7,6 +7,7 @@ from datetime import datetime
 from app.agents.approval import ApprovalAgent
 from app.models.invoice import InvoiceStatus, InvoiceData
 from app.models.config import ApprovalRule, ApprovalMatrix, CompanyConfig
+from app.models.policy import compile_policy
 
 @pytest.mark.asyncio
 async def test_approval_routing_logic():
@@ -20,7 +21,7 @@ async def test_approval_routing_logic():
         )
         mock_invoice.data = data
         mock_db.invoices.get_by_field = AsyncMock(return_value=mock_invoice)
-        mock_db.invoices.update = AsyncMock()
+        mock_db.invoices.transition = AsyncMock()
         
         # Mock Config
         # Rules:
@@ -38,7 +39,7 @@ async def test_approval_routing_logic():
         ]
         matrix = ApprovalMatrix(rules=rules)
         config = CompanyConfig(company_id="acme", company_name="Acme", approval_matrix=matrix)
-        mock_db.config.get_by_field = AsyncMock(return_value=config)
+        mock_db.config.get_policy = AsyncMock(return_value=compile_policy(config))
         
         # Mock Notification
         with patch("app.agents.approval.notification_tool") as mock_notify:
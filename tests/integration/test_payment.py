@@ -20,7 +20,7 @@ async def test_payment_prep_success():
         )
         mock_invoice.data = data
         mock_db.invoices.get_by_field = AsyncMock(return_value=mock_invoice)
-        mock_db.invoices.update = AsyncMock()
+        mock_db.invoices.transition = AsyncMock()
         
         # Mock Vendor with Bank Details (old enough)
         bank = BankDetails(
@@ -41,6 +41,7 @@ async def test_payment_prep_success():
         
         # Bypass DB lookup for vendor
         agent._find_vendor = AsyncMock(return_value=vendor)
+        mock_db.vendors.sharing_bank_account = AsyncMock(return_value=[])
         
         state = {"invoice_id": "inv_pay", "company_id": "acme"}
         result = await agent.payment_prep_node(state)
@@ -50,6 +51,30 @@ async def test_payment_prep_success():
         assert result["current_state"] == InvoiceStatus.PAID
         assert result["payment_details"]["status"] == "SCHEDULED"
 
+@pytest.mark.asyncio
+async def test_payment_blocked_for_shared_bank_account():
+    with patch("app.agents.payment.db") as mock_db:
+        mock_invoice = MagicMock()
+        mock_invoice.company_id = "acme"
+        mock_invoice.data = InvoiceData(
+            vendor_name="Honest Co", invoice_number="100", invoice_date=datetime.now(), total=500.0, currency="GBP"
+        )
+        mock_db.invoices.get_by_field = AsyncMock(return_value=mock_invoice)
+        mock_db.invoices.transition = AsyncMock()
+        vendor = Vendor(vendor_id="v1", company_id="acme", name="Honest Co", bank_details=BankDetails(
+            account_name="Honest Co", account_number="12345678", sort_code="10-10-10", last_updated=datetime(2020, 1, 1)
+        ))
+        mock_db.vendors.sharing_bank_account = AsyncMock(return_value=["v7"])
+
+        agent = PaymentAgent()
+        agent._find_vendor = AsyncMock(return_value=vendor)
+        result = await agent.payment_prep_node({"invoice_id": "inv_pay", "company_id": "acme"})
+
+        assert result["current_state"] == InvoiceStatus.EXCEPTION
+        assert result["errors"] == ["Bank account shared with vendor(s) v7 - Requires Verification"]
+        mock_db.vendors.sharing_bank_account.assert_awaited_once_with("acme", vendor)
+        mock_db.invoices.transition.assert_not_called()
+
 @pytest.mark.asyncio
 async def test_bank_change_fraud_check():
     agent = PaymentAgent()
@@ -68,3 +93,21 @@ async def test_bank_change_fraud_check():
     # Old Change
     bank.last_updated = datetime(2020, 1, 1)
     assert agent._check_bank_details_change(vendor) == False
+
+@pytest.mark.asyncio
+async def test_find_vendor_rereads_bank_details():
+    cached = Vendor(vendor_id="v1", company_id="acme", name="Honest Co",
+                    bank_details=BankDetails(account_name="Honest Co", account_number="12345678",
+                                             last_updated=datetime(2020, 1, 1)))
+    stored = cached.model_copy(update={"bank_details": BankDetails(account_name="Honest Co", account_number="87654321",
+                                                                   last_updated=datetime.utcnow())})
+    with patch("app.agents.payment.db") as mock_db:
+        mock_db.vendors.resolve = AsyncMock(return_value=cached)
+        mock_db.vendors.get_by_field = AsyncMock(return_value=stored)
+
+        vendor = await PaymentAgent()._find_vendor("Honest Co", "acme", "v1")
+
+    assert mock_db.vendors.resolve.await_args.kwargs["fuzzy"] is False
+    mock_db.vendors.get_by_field.assert_awaited_once_with("vendor_id", "v1")
+    # A bank change newer than the directory is still caught
+    assert PaymentAgent()._check_bank_details_change(vendor)
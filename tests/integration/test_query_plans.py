@@ -0,0 +1,145 @@
+import sys
+import os
+sys.path.append(os.getcwd())
+import uuid
+import pytest
+from datetime import datetime
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import monitoring
+
+from app.config import settings
+from app.database import db
+from app.repositories.indexes import ensure_indexes
+from app.models.invoice import Invoice, InvoiceData, InvoiceStatus, InvoiceSummary, POLineUsage
+from app.models.purchase_order import PurchaseOrder
+from app.api.auth import User
+
+# Commands whose query plans we check; writes by _id or insert are not interesting
+PLANNED_COMMANDS = {"find", "aggregate", "count", "update", "findAndModify", "delete"}
+# Keys the driver adds that explain does not accept
+DRIVER_KEYS = {"$db", "lsid", "$clusterTime", "$readPreference", "txnNumber", "autocommit", "startTransaction"}
+
+class QueryRecorder(monitoring.CommandListener):
+    def __init__(self):
+        self.commands = []
+
+    def started(self, event):
+        if event.command_name in PLANNED_COMMANDS:
+            self.commands.append({k: v for k, v in event.command.items() if k not in DRIVER_KEYS})
+
+    def succeeded(self, event):
+        pass
+
+    def failed(self, event):
+        pass
+
+def _collscans(node) -> bool:
+    """True if any winning plan in an explain() output contains a COLLSCAN stage."""
+    if isinstance(node, dict):
+        plan = node.get("winningPlan")
+        if plan is not None and "COLLSCAN" in str(plan):
+            return True
+        return any(_collscans(v) for k, v in node.items() if k != "rejectedPlans")
+    if isinstance(node, list):
+        return any(_collscans(v) for v in node)
+    return False
+
+@pytest.fixture
+async def recorded_db():
+    """Binds the global db to a throwaway database on a client that records every query."""
+    recorder = QueryRecorder()
+    client = AsyncIOMotorClient(settings.MONGODB_URL, serverSelectionTimeoutMS=500, event_listeners=[recorder])
+    try:
+        await client.admin.command("ping")
+    except Exception:
+        client.close()
+        pytest.skip("No local mongod reachable at MONGODB_URL")
+
+    name = f"{settings.DB_NAME}_plans_{uuid.uuid4().hex[:8]}"
+    db.bind(client, name)
+    await ensure_indexes(db.db)
+    yield recorder
+    await client.drop_database(name)
+    client.close()
+    db.__dict__.clear() # Back to the unconnected class defaults
+
+@pytest.mark.asyncio
+async def test_repository_queries_use_indexes(recorded_db):
+    """
+    Runs the queries the repositories, agents and guardrails issue, then explains each one.
+    Fails if any of them would scan the whole collection.
+    """
+    from app.tools.duplicate_detector import duplicate_detector
+    from app.tools.fraud_detector import fraud_detector
+    from app.tools.velocity import velocity_tracker
+    from app.tools.vat_validator import vat_validator
+    from app.agents.matching import matching_agent
+    from app.agents.payment import payment_agent
+    from app.agents.sla_monitor import sla_monitor
+    from app.agents.vat_corrector import vat_corrector
+    from app.agents.sla_timers import sla_timers
+    from app.guardrails.audit_logger import audit_logger
+    from app.guardrails.permissions import permission_checker
+    from app.tools.verification_tool import verification_tool
+    from app.memory.semantic_memory import semantic_memory
+
+    data = InvoiceData(vendor_name="Acme", invoice_number="N-1", invoice_date=datetime(2024, 1, 1),
+                       total=120.0, po_reference="PO-1")
+    await db.invoices.create(Invoice(invoice_id="INV-1", company_id="acme", status=InvoiceStatus.MATCHING, data=data))
+    await db.db.purchase_orders.insert_one(PurchaseOrder(
+        po_number="PO-1", company_id="acme", vendor_id="V1", vendor_name="Acme", requester_email="a@acme.test",
+        department="Ops", po_date=datetime(2024, 1, 1), subtotal=100.0, vat_amount=20.0, total=120.0
+    ).to_mongo())
+    recorded_db.commands.clear()
+
+    # Invoices
+    await db.invoices.get_by_field("invoice_id", "INV-1")
+    await db.invoices.get_by_invoice_number("N-1", "acme")
+    await db.invoices.get_duplicate_candidates("Acme", 120.0, datetime(2023, 12, 29), datetime(2024, 1, 4))
+    page = await db.invoices.list_page("acme", limit=1, view=InvoiceSummary)
+    await db.invoices.list_page("acme", {"status": InvoiceStatus.MATCHING}, cursor=page.next_cursor)
+    await db.invoices.list({"status": InvoiceStatus.AWAITING_APPROVAL}, view=InvoiceSummary)
+    await duplicate_detector.check_duplicates("INV-2", "Acme", "N-1", 120.0, datetime(2024, 1, 1))
+    await duplicate_detector.check_duplicates("INV-2", "Acme", "N-2", 120.0, datetime(2024, 1, 1))
+    await duplicate_detector.check_duplicates("INV-2", "Acme", "N-1", 120.0, datetime(2024, 1, 1), company_id="acme")
+    await db.invoices.get_by_line_item_bands("acme", "Acme", [1, 2], datetime(2023, 12, 29), datetime(2024, 1, 4), "INV-2")
+    await duplicate_detector.screen_batch([Invoice(invoice_id="INV-3", company_id="acme", data=data)])
+    await db.purchase_orders.get_with_receipts("PO-1", "acme")
+    await db.purchase_orders.record_usage("PO-1", "acme", {"0": POLineUsage(quantity=1, amount=1.0)})
+    await db.purchase_orders.apply_pending_receipts({"po_number": {"$in": ["PO-1"]}})
+    await db.purchase_orders.apply_pending_receipts({"grn_number": {"$in": ["G-1"]}})
+    await db.invoices.claim_po_usage("INV-1")
+    await matching_agent.matching_node({"invoice_id": "INV-1", "company_id": "acme"})
+    await sla_monitor.check_payment_deadlines()
+    await fraud_detector.rescore_open_invoices()
+    await velocity_tracker.rebuild()
+    await vat_validator.revalidate_open_invoices()
+    await vat_corrector.sweep_timeouts()
+    await sla_timers.schedule_payment("INV-1", datetime(2024, 1, 10), now=datetime(2024, 1, 1))
+    await sla_timers.schedule_approval("INV-1", datetime(2024, 1, 1))
+    await sla_timers.poll(datetime(2024, 1, 5))
+    await sla_timers.fire_due(datetime(2024, 1, 5))
+    await sla_monitor.check_approval_slas()
+
+    # Vendors, config, audit, verification, memory
+    await db.vendors.get_by_field("vendor_id", "V1")
+    await db.vendors.get_by_name("Acme", "acme")
+    await db.vendor_features.record_invoice("INV-1", "acme", "Acme", "V1", 120.0, 0.2)
+    db.vendor_features.invalidate()
+    await db.vendor_features.get("acme", "Acme", "V1")
+    await payment_agent._find_vendor("Acme", "acme")
+    db.vendors.refresh_interval = 0 # Next read tops the directory up by updated_at
+    await db.vendors.directory("acme")
+    await db.config.get_by_company_id("acme")
+    await audit_logger.get_audit_trail("INV-1")
+    await permission_checker.check_sod("INV-1", User(username="u1", role="approver"), "approve")
+    await verification_tool.verify_step("INV-1", "email", "u1", "")
+    await semantic_memory.get_vendor_patterns("Acme")
+
+    assert recorded_db.commands
+    scans = []
+    for command in recorded_db.commands:
+        explain = await db.db.command({"explain": command, "verbosity": "queryPlanner"})
+        if _collscans(explain):
+            scans.append(command)
+    assert not scans, f"Queries without a usable index: {scans}"
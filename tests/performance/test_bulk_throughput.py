@@ -0,0 +1,51 @@
+import sys
+import os
+sys.path.append(os.getcwd())
+import pytest
+import time
+from datetime import datetime
+from app.repositories.invoice import InvoiceRepository
+from app.models.invoice import Invoice, InvoiceData, InvoiceStatus, LineItem
+
+N_DOCS = 5000
+
+def _invoices(prefix: str):
+    return [
+        Invoice(
+            invoice_id=f"{prefix}-{i}",
+            company_id="acme",
+            status=InvoiceStatus.AWAITING_APPROVAL,
+            data=InvoiceData(
+                vendor_name=f"Vendor {i % 50}", invoice_number=f"N-{i}", invoice_date=datetime(2024, 1, 1),
+                line_items=[LineItem(item_id=1, description="Widget", quantity=1, unit_price=10.0, line_total=10.0)],
+                subtotal=10.0, vat_amount=2.0, total=12.0
+            )
+        )
+        for i in range(N_DOCS)
+    ]
+
+@pytest.mark.asyncio
+async def test_bulk_create_throughput(live_db):
+    """
+    Documents per second for one-by-one inserts vs bulk_create against a local mongod.
+    """
+    repo = InvoiceRepository(live_db.invoices, Invoice)
+
+    start = time.perf_counter()
+    for invoice in _invoices("SINGLE"):
+        await repo.create(invoice)
+    single_rate = N_DOCS / (time.perf_counter() - start)
+
+    start = time.perf_counter()
+    summary = await repo.bulk_create(_invoices("BULK"))
+    bulk_rate = N_DOCS / (time.perf_counter() - start)
+
+    start = time.perf_counter()
+    updates = [({"invoice_id": f"BULK-{i}"}, {"urgency": "WARNING"}) for i in range(N_DOCS)]
+    update_summary = await repo.bulk_update(updates)
+    update_rate = N_DOCS / (time.perf_counter() - start)
+
+    print(f"\ninsert_one: {single_rate:,.0f} docs/s | bulk_create: {bulk_rate:,.0f} docs/s | bulk_update: {update_rate:,.0f} docs/s")
+    assert summary.inserted_count == N_DOCS
+    assert update_summary.modified_count == N_DOCS
+    assert bulk_rate > single_rate
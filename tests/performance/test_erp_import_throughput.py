@@ -0,0 +1,55 @@
+import sys
+import os
+sys.path.append(os.getcwd())
+import json
+import pytest
+import time
+from app.repositories.base import BaseRepository
+from app.repositories.indexes import ensure_indexes
+from app.repositories.purchase_order import PurchaseOrderRepository
+from app.models.grn import GoodsReceiptNote
+from app.models.purchase_order import PurchaseOrder
+from app.tools.erp_import import ERPImporter
+
+N_POS = 10_000
+N_SINGLE = 1_000
+
+def _po(i: int) -> dict:
+    return {
+        "po_number": f"PO-{i}", "company_id": "acme", "vendor_id": f"V{i % 100}", "vendor_name": f"Vendor {i % 100}",
+        "requester_email": "buyer@acme.test", "department": "Ops", "po_date": "2024-01-01T00:00:00",
+        "subtotal": 30.0, "vat_amount": 6.0, "total": 36.0,
+        "line_items": [{"item_id": n, "description": f"Part {n}", "quantity": 3, "unit_price": 10 / 3, "line_total": 10.0}
+                       for n in range(3)]
+    }
+
+@pytest.mark.asyncio
+async def test_erp_import_throughput(live_db, tmp_path):
+    """
+    POs per second through the chunked bulk importer vs validating and writing one
+    document at a time, against a local mongod. The second import run is a no-op re-sync.
+    """
+    await ensure_indexes(live_db)
+    path = tmp_path / "pos.jsonl"
+    path.write_text("\n".join(json.dumps(_po(i)) for i in range(N_POS)))
+    importer = ERPImporter(PurchaseOrderRepository(live_db.purchase_orders, PurchaseOrder),
+                           BaseRepository(live_db.goods_receipt_notes, GoodsReceiptNote))
+
+    start = time.perf_counter()
+    for i in range(N_SINGLE):
+        doc = PurchaseOrder.model_validate(_po(N_POS + i)).to_mongo()
+        await live_db.purchase_orders.update_one({"po_number": doc["po_number"], "company_id": "acme"},
+                                                 {"$set": doc}, upsert=True)
+    single_rate = N_SINGLE / (time.perf_counter() - start)
+
+    start = time.perf_counter()
+    report = await importer.import_file(str(path), "purchase_orders")
+    bulk_rate = N_POS / (time.perf_counter() - start)
+
+    again = await importer.import_file(str(path), "purchase_orders")
+
+    print(f"\none at a time: {single_rate:,.0f} POs/s | bulk import: {bulk_rate:,.0f} POs/s")
+    assert report.ok and report.inserted == N_POS
+    assert again.ok and again.inserted == 0 and again.updated + again.unchanged == N_POS
+    assert await live_db.purchase_orders.count_documents({}) == N_POS + N_SINGLE
+    assert bulk_rate > single_rate * 3
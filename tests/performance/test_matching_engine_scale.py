@@ -0,0 +1,72 @@
+import sys
+import os
+sys.path.append(os.getcwd())
+import random
+import time
+from datetime import datetime
+from app.models.invoice import InvoiceData, LineItem
+from app.models.purchase_order import PurchaseOrder
+from app.models.grn import GoodsReceiptNote
+from app.models.policy import DEFAULT_POLICY
+from app.tools.matching_engine import grn_lines, three_way_match
+
+N_LINES = 5_000
+N_GRNS = 50
+
+def _nested_loop_details(invoice, po, grns, policy):
+    """Line-by-line scan of every GRN per invoice line, as MatchingAgent did before indexing."""
+    po_prices = {item.description: item.unit_price for item in po.line_items}
+    details = []
+    for item in invoice.line_items:
+        expected = po_prices.get(item.description)
+        if expected is not None:
+            diff = abs(item.unit_price - expected) / expected * 100
+            if diff > policy.price_variance_percent:
+                details.append(f"Price variance on {item.description}: {diff:.2f}%")
+        received = sum(g.quantity for grn in grns for g in grn.line_items if g.description == item.description)
+        if item.quantity > received * (1 + policy.quantity_variance_percent / 100):
+            details.append(f"Qty variance on {item.description}: Invoiced {item.quantity}, Received {received}")
+    return "; ".join(details)
+
+def test_indexed_matching_large_po():
+    """A 5k-line PO received over 50 GRNs, invoiced in full with a few price and quantity variances."""
+    rng = random.Random(1)
+    po_lines = [LineItem(item_id=i, description=f"part {i}", quantity=50, unit_price=round(rng.uniform(1, 100), 2),
+                         line_total=0) for i in range(N_LINES)]
+    po = PurchaseOrder(po_number="PO-BIG", company_id="acme", vendor_id="v1", vendor_name="ABC",
+                       requester_email="a@a.com", department="IT", po_date=datetime.now(),
+                       subtotal=0, vat_amount=0, total=0, line_items=po_lines)
+    # Each line delivered in one to three GRNs
+    deliveries = [[] for _ in range(N_GRNS)]
+    for line in po_lines:
+        split = rng.randint(1, 3)
+        for grn in rng.sample(range(N_GRNS), split):
+            deliveries[grn].append(LineItem(item_id=line.item_id, description=line.description,
+                                            quantity=line.quantity / split, unit_price=line.unit_price, line_total=0))
+    grns = [GoodsReceiptNote(grn_number=f"G{i}", po_number="PO-BIG", company_id="acme", vendor_id="v1",
+                             received_by="warehouse", line_items=lines) for i, lines in enumerate(deliveries)]
+    invoice_lines = []
+    for line in po_lines:
+        price = line.unit_price * (1.2 if rng.random() < 0.01 else 1.0)
+        quantity = line.quantity + (10 if rng.random() < 0.01 else 0)
+        invoice_lines.append(LineItem(item_id=line.item_id, description=line.description, quantity=quantity,
+                                      unit_price=price, line_total=0))
+    invoice = InvoiceData(vendor_name="ABC", invoice_number="1", invoice_date=datetime.now(),
+                          subtotal=0, total=0, line_items=invoice_lines)
+
+    start = time.perf_counter()
+    results = three_way_match(invoice, po, grn_lines(grns), DEFAULT_POLICY)
+    indexed_time = time.perf_counter() - start
+
+    # The nested loop is quadratic, so time it on a slice of the invoice
+    sample = invoice.model_copy(update={"line_items": invoice_lines[:250]})
+    start = time.perf_counter()
+    expected = _nested_loop_details(sample, po, grns, DEFAULT_POLICY)
+    scan_time = (time.perf_counter() - start) * N_LINES / len(sample.line_items)
+
+    print(f"\n{N_LINES} lines x {N_GRNS} GRNs: indexed {indexed_time * 1000:.0f}ms vs "
+          f"nested loop ~{scan_time * 1000:.0f}ms (extrapolated)")
+    assert three_way_match(sample, po, grn_lines(grns), DEFAULT_POLICY).details == (expected or None)
+    assert results.match_status == "VARIANCE"
+    assert results.price_variance > 0 and results.quantity_variance > 0
+    assert indexed_time * 20 < scan_time
@@ -0,0 +1,79 @@
+import sys
+import os
+sys.path.append(os.getcwd())
+import random
+import time
+from difflib import SequenceMatcher
+from types import SimpleNamespace
+from app.tools.minhash import MinHashLSH, line_item_signature
+from app.tools.duplicate_detector import MINHASH_ITEM_THRESHOLD, SEQUENCE_ITEM_THRESHOLD
+
+N_HISTORY = 5_000 # One vendor's invoices
+N_QUERIES = 300 # Each of: OCR'd re-sends (duplicates) and revised orders (not duplicates)
+WORDS = ("office chair desk lamp paper a4 ream toner cartridge black cyan stapler pens blue gel laptop stand "
+         "monitor cable hdmi usb hub mouse keyboard wireless cleaning service monthly window coffee beans "
+         "milk sugar cups bin bags printer maintenance visit").split()
+OCR_ERRORS = {"l": "1", "o": "0", "i": "l", "s": "5", "m": "rn", "e": "c"}
+
+def test_minhash_precision_recall_vs_sequence_matcher():
+    """
+    Duplicate search over a vendor's history: LSH + MinHash against the SequenceMatcher
+    comparison it replaces. Duplicates are re-sent invoices with shuffled lines and ~5% OCR
+    character errors; non-duplicates are the same orders with half the lines changed.
+    """
+    rng = random.Random(3)
+    def item():
+        return f"{' '.join(rng.sample(WORDS, rng.randint(2, 4)))} sku-{rng.randint(1000, 9999)}"
+    def ocr(text):
+        return "".join(OCR_ERRORS[c] if c in OCR_ERRORS and rng.random() < 0.05 else c for c in text)
+    def signature(items):
+        return line_item_signature([SimpleNamespace(description=d) for d in items])
+    def ratio(a, b):
+        return SequenceMatcher(None, " ".join(a).lower(), " ".join(b).lower()).ratio()
+
+    history = [[item() for _ in range(rng.randint(3, 8))] for _ in range(N_HISTORY)]
+    index = MinHashLSH()
+    for key, items in enumerate(history):
+        index.add(key, signature(items))
+
+    queries = [] # (items, source invoice, is duplicate)
+    for source in rng.sample(range(N_HISTORY), N_QUERIES):
+        resent = [ocr(d) for d in history[source]]
+        rng.shuffle(resent)
+        queries.append((resent, source, True))
+    for source in rng.sample(range(N_HISTORY), N_QUERIES):
+        revised = list(history[source])
+        for line in rng.sample(range(len(revised)), len(revised) // 2 or 1):
+            revised[line] = item()
+        queries.append((revised, source, False))
+
+    def score(predictions):
+        tp = sum(1 for p, (_, _, dup) in zip(predictions, queries) if p and dup)
+        fp = sum(1 for p, (_, _, dup) in zip(predictions, queries) if p and not dup)
+        return tp / max(tp + fp, 1), tp / N_QUERIES
+
+    # LSH over the whole history; a hit is only correct if it is the source invoice
+    start = time.perf_counter()
+    lsh_predictions = []
+    for items, source, _ in queries:
+        matches = index.query(signature(items), threshold=MINHASH_ITEM_THRESHOLD)
+        lsh_predictions.append(bool(matches) and matches[0][0] == source)
+    lsh_query_ms = (time.perf_counter() - start) * 1000 / len(queries)
+
+    # SequenceMatcher given the source invoice directly (no search at all), its best case
+    seq_predictions = [ratio(items, history[source]) > SEQUENCE_ITEM_THRESHOLD for items, source, _ in queries]
+    start = time.perf_counter()
+    for candidate in history[:500]:
+        ratio(queries[0][0], candidate)
+    seq_scan_ms = (time.perf_counter() - start) * 1000 * N_HISTORY / 500
+
+    lsh_precision, lsh_recall = score(lsh_predictions)
+    seq_precision, seq_recall = score(seq_predictions)
+    print(f"\nMinHash/LSH: precision {lsh_precision:.2f} recall {lsh_recall:.2f}, "
+          f"{lsh_query_ms:.2f}ms per query incl. signature ({len(index)} invoices)")
+    print(f"SequenceMatcher: precision {seq_precision:.2f} recall {seq_recall:.2f}, "
+          f"{seq_scan_ms:.0f}ms to scan the same history")
+
+    assert lsh_recall >= 0.9 and lsh_precision >= 0.95
+    assert lsh_recall > seq_recall
+    assert lsh_query_ms < seq_scan_ms / 100
@@ -0,0 +1,54 @@
+import sys
+import os
+sys.path.append(os.getcwd())
+import pytest
+import time
+from datetime import datetime, timedelta
+from pymongo import ASCENDING, DESCENDING, IndexModel
+from app.repositories.invoice import InvoiceRepository
+from app.models.invoice import Invoice, InvoiceStatus, InvoiceSummary
+
+PAGE_SIZE = 50
+PAGES = 40
+
+async def _seed(repo: InvoiceRepository, company_id: str, n: int):
+    start = datetime(2024, 1, 1)
+    await repo.bulk_create([
+        Invoice(invoice_id=f"{company_id}-{i}", company_id=company_id, status=InvoiceStatus.AWAITING_APPROVAL,
+                created_at=start + timedelta(seconds=i))
+        for i in range(n)
+    ])
+
+async def _walk(repo: InvoiceRepository, company_id: str) -> list:
+    """Per-page latencies for the first PAGES pages, following next_cursor."""
+    latencies, cursor = [], None
+    for _ in range(PAGES):
+        start = time.perf_counter()
+        page = await repo.list_page(company_id, cursor=cursor, limit=PAGE_SIZE, view=InvoiceSummary)
+        latencies.append(time.perf_counter() - start)
+        cursor = page.next_cursor
+    return sorted(latencies)
+
+@pytest.mark.asyncio
+async def test_keyset_latency_flat_with_collection_size(live_db):
+    """
+    p99 page latency should not grow with tenant size when pages seek on the
+    (company_id, created_at, _id) index instead of skipping.
+    """
+    await live_db.invoices.create_indexes([
+        IndexModel([("company_id", ASCENDING), ("created_at", DESCENDING), ("_id", DESCENDING)])
+    ])
+    repo = InvoiceRepository(live_db.invoices, Invoice)
+    await _seed(repo, "small", 3000)
+    await _seed(repo, "large", 100_000)
+
+    small = await _walk(repo, "small")
+    large = await _walk(repo, "large")
+    p99 = lambda xs: xs[int(len(xs) * 0.99) - 1]
+
+    print(f"\np99 page latency 3k: {p99(small) * 1000:.1f} ms | 100k: {p99(large) * 1000:.1f} ms")
+    assert p99(large) < p99(small) * 3 + 0.005
+
+    explain = await live_db.invoices.find({"company_id": "large"}).sort(
+        [("created_at", DESCENDING), ("_id", DESCENDING)]).limit(PAGE_SIZE).explain()
+    assert "COLLSCAN" not in str(explain["queryPlanner"]["winningPlan"])
@@ -0,0 +1,91 @@
+import sys
+import os
+sys.path.append(os.getcwd())
+import pytest
+import time
+from datetime import datetime
+import bson
+from app.repositories.invoice import InvoiceRepository
+from app.models.invoice import Invoice, InvoiceData, InvoiceStatus, InvoiceSummary, LineItem, ValidationResults
+
+N_DOCS = 10000
+
+def _invoice(i: int) -> Invoice:
+    return Invoice(
+        invoice_id=f"INV-{i}",
+        company_id="acme",
+        status=InvoiceStatus.AWAITING_APPROVAL,
+        raw_text="Lorem ipsum invoice body " * 80,
+        data=InvoiceData(
+            vendor_name=f"Vendor {i % 50}", invoice_number=f"N-{i}", invoice_date=datetime(2024, 1, 1),
+            line_items=[
+                LineItem(item_id=n, description=f"Widget {n}", quantity=1, unit_price=10.0, line_total=10.0)
+                for n in range(10)
+            ],
+            subtotal=100.0, vat_amount=20.0, total=120.0
+        ),
+        validation=ValidationResults(vat_valid=True, flags=["HIGH_VALUE"]),
+        escalation_history=[{"reason": "Payment deadline approaching", "urgency": "WARNING"}]
+    )
+
+def _project(doc: dict, projection: dict) -> dict:
+    """Apply a dotted inclusion projection the way mongod would."""
+    out = {"_id": doc["_id"]}
+    for path in projection:
+        src, dst = doc, out
+        parts = path.split(".")
+        for part in parts[:-1]:
+            if not isinstance(src.get(part), dict):
+                break
+            src, dst = src[part], dst.setdefault(part, {})
+        else:
+            if parts[-1] in src:
+                dst[parts[-1]] = src[parts[-1]]
+    return out
+
+def test_summary_projection_bytes_and_hydration():
+    """
+    Wire bytes and hydration time for a 10k invoice list, full document vs InvoiceSummary.
+    Runs offline by applying the projection client-side.
+    """
+    docs = [_invoice(i).to_mongo() for i in range(N_DOCS)]
+    for doc in docs:
+        doc["_id"] = bson.ObjectId()
+    projection = InvoiceSummary.projection()
+    slim_docs = [_project(doc, projection) for doc in docs]
+
+    full_bytes = sum(len(bson.encode(doc)) for doc in docs)
+    slim_bytes = sum(len(bson.encode(doc)) for doc in slim_docs)
+
+    start = time.perf_counter()
+    for doc in docs:
+        Invoice.from_mongo(doc)
+    full_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for doc in slim_docs:
+        InvoiceSummary.from_mongo(doc)
+    slim_time = time.perf_counter() - start
+
+    print(f"\nfull: {full_bytes / 1e6:.1f} MB, {full_time * 1000:.0f} ms | "
+          f"summary: {slim_bytes / 1e6:.1f} MB, {slim_time * 1000:.0f} ms")
+    assert slim_bytes < full_bytes / 3
+    assert slim_time < full_time
+
+@pytest.mark.asyncio
+async def test_summary_list_against_mongod(live_db):
+    """End to end list latency, full documents vs the summary view."""
+    repo = InvoiceRepository(live_db.invoices, Invoice)
+    await repo.bulk_create([_invoice(i) for i in range(N_DOCS)])
+
+    start = time.perf_counter()
+    full = await repo.list({}, limit=N_DOCS)
+    full_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    slim = await repo.list({}, limit=N_DOCS, view=InvoiceSummary)
+    slim_time = time.perf_counter() - start
+
+    print(f"\nlist full: {full_time * 1000:.0f} ms | list summary: {slim_time * 1000:.0f} ms")
+    assert len(full) == len(slim) == N_DOCS
+    assert slim_time < full_time
@@ -0,0 +1,55 @@
+import sys
+import os
+sys.path.append(os.getcwd())
+import pytest
+import time
+from datetime import datetime, timedelta
+from unittest.mock import AsyncMock, MagicMock, patch
+from app.agents.sla_monitor import SLAMonitor
+from app.repositories.base import BulkWriteSummary
+
+N_DOCS = 20_000
+BATCH_SIZE = 1000
+
+class StreamedCursor:
+    """Yields projected documents one at a time, as a driver cursor does, without holding them."""
+    def __init__(self, now: datetime):
+        self.now = now
+
+    def batch_size(self, size):
+        return self
+
+    async def __aiter__(self):
+        for i in range(N_DOCS):
+            yield {"invoice_id": f"INV-{i}", "urgency": "NORMAL",
+                   "data": {"due_date": self.now + timedelta(hours=i % (24 * 7))}}
+
+@pytest.mark.asyncio
+async def test_payment_sweep_streams_in_bounded_batches():
+    """
+    Sweep 20k invoices due this week, all needing escalation. Writes go out batch by batch
+    as the cursor streams, so at most a batch of updates is held rather than the whole open book.
+    """
+    now = datetime(2024, 6, 12, 9, 30)
+    batch_sizes = []
+
+    async def bulk_update(updates):
+        batch_sizes.append(len(updates))
+        return BulkWriteSummary(matched_count=len(updates), modified_count=len(updates))
+
+    monitor = SLAMonitor()
+    with patch("app.agents.sla_monitor.db") as mock_db, \
+         patch.object(monitor, "_notify_escalation", AsyncMock()) as notify:
+        mock_db.invoices.collection.find = MagicMock(return_value=StreamedCursor(now))
+        mock_db.invoices.bulk_update = bulk_update
+
+        start = time.perf_counter()
+        await monitor.check_payment_deadlines(now=now, batch_size=BATCH_SIZE)
+        sweep_time = time.perf_counter() - start
+        queued = notify.await_count
+        await monitor.drain()
+
+    print(f"\n{N_DOCS} escalations: {sweep_time * 1000:.0f}ms in {len(batch_sizes)} bulk writes, "
+          f"{N_DOCS - queued} notifications left to the background")
+    assert sum(batch_sizes) == N_DOCS and max(batch_sizes) <= BATCH_SIZE
+    assert notify.await_count == N_DOCS
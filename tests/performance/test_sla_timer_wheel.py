@@ -0,0 +1,48 @@
+import sys
+import os
+sys.path.append(os.getcwd())
+import gc
+import pytest
+import random
+import time
+from datetime import datetime, timedelta
+from unittest.mock import AsyncMock, patch
+from app.agents.sla_timers import SLATimer, SLATimerWheel
+
+N_INVOICES = 200_000
+N_DUE = 1_000
+
+@pytest.mark.asyncio
+async def test_firing_cost_is_per_crossing_not_per_open_invoice():
+    """
+    200k open invoices with timers spread over the next 30 days; 1k cross a threshold now.
+    Firing reads and escalates those 1k only, where a sweep would stream all 200k.
+    """
+    rng = random.Random(9)
+    now = datetime(2024, 6, 12, 9, 30)
+    wheel = SLATimerWheel()
+    for i in range(N_INVOICES):
+        offset = timedelta(seconds=-rng.randint(1, 60)) if i < N_DUE else timedelta(seconds=rng.randint(1, 30 * 24 * 3600))
+        wheel._push(SLATimer(now + offset, f"INV-{i}", "CRITICAL"))
+
+    fired = AsyncMock(return_value=True)
+    with patch.object(wheel, "_fire", fired), patch("app.agents.sla_timers.db") as mock_db:
+        mock_db.db.sla_timers.delete_many = AsyncMock()
+        gc.collect()
+        gc.disable()
+        try:
+            start = time.perf_counter()
+            escalated = await wheel.fire_due(now)
+            fire_time = time.perf_counter() - start
+            start = time.perf_counter()
+            idle = await wheel.fire_due(now)
+            idle_time = time.perf_counter() - start
+        finally:
+            gc.enable()
+
+    print(f"\n{N_INVOICES} timers: fired {escalated} in {fire_time * 1000:.1f}ms, "
+          f"idle check {idle_time * 1e6:.0f}us")
+    assert escalated == N_DUE and fired.await_count == N_DUE and idle == 0
+    assert len(wheel) == N_INVOICES - N_DUE
+    # Nothing due is one heap peek, however many timers are pending
+    assert idle_time < 0.001
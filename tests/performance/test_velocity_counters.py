@@ -0,0 +1,45 @@
+import sys
+import os
+sys.path.append(os.getcwd())
+import gc
+import random
+import time
+from datetime import datetime, timedelta
+from app.tools.velocity import VelocityTracker
+
+N_VENDORS = 1000
+N_LOOKUPS = 20_000
+START = datetime(2024, 5, 1)
+
+def _filled(n_invoices: int, rng: random.Random) -> VelocityTracker:
+    tracker = VelocityTracker()
+    step = timedelta(days=30) / n_invoices
+    for i in range(n_invoices):
+        tracker.add(f"INV-{i}", "acme", f"Vendor {rng.randrange(N_VENDORS)}", None, 100.0, START + step * i)
+    return tracker
+
+def _time_lookups(tracker: VelocityTracker, rng: random.Random) -> float:
+    now = START + timedelta(days=30)
+    names = [f"Vendor {rng.randrange(N_VENDORS)}" for _ in range(N_LOOKUPS)]
+    gc.collect()
+    gc.disable()
+    try:
+        start = time.perf_counter()
+        for name in names:
+            tracker.snapshot("acme", name, now=now)
+        return time.perf_counter() - start
+    finally:
+        gc.enable()
+
+def test_snapshot_cost_does_not_grow_with_history():
+    """Fraud scoring reads velocity per invoice; a lookup must cost the same at 10k or 300k invoices of history."""
+    rng = random.Random(11)
+    small, large = _filled(10_000, rng), _filled(300_000, rng)
+    _time_lookups(small, rng), _time_lookups(large, rng) # First reads expire the stale buckets
+
+    small_time = _time_lookups(small, rng)
+    large_time = _time_lookups(large, rng)
+    print(f"\n{N_LOOKUPS} snapshots: {small_time / N_LOOKUPS * 1e6:.1f}us each over 10k invoices, "
+          f"{large_time / N_LOOKUPS * 1e6:.1f}us over 300k")
+    assert large_time < small_time * 2
+    assert large_time / N_LOOKUPS < 50e-6
@@ -5,6 +5,7 @@ import pytest
 from unittest.mock import AsyncMock, MagicMock, patch
 from datetime import datetime
 from app.agents.validation import ValidationAgent
+from app.tools.minhash import line_item_signature
 from app.models.invoice import InvoiceData, LineItem, InvoiceStatus
 
 @pytest.mark.asyncio
@@ -20,9 +21,11 @@ async def test_duplicate_exact(mock_db, sample_invoice):
         
         mock_db_local.invoices = mock_db.invoices
         mock_db_local.vendors = mock_db.vendors
+        mock_db_local.vendor_features = mock_db.vendor_features
         
         mock_dup.check_duplicates = AsyncMock(return_value={"is_duplicate": True, "match_type": "EXACT", "conflicting_invoice_id": "OLD-123"})
         mock_fraud.check_bank_details_change = AsyncMock(return_value=False)
+        mock_fraud.check_shared_bank_account = AsyncMock(return_value=[])
         mock_vat.validate_vat = MagicMock(return_value={"valid": True})
         mock_fraud.analyze_fraud_risk = MagicMock(return_value={"fraud_score": 0.0, "flags": []})
         
@@ -55,6 +58,7 @@ async def test_fuzzy_duplicate_items(mock_db):
         inv_existing.invoice_id = "inv_exist"
         inv_existing.status = InvoiceStatus.PAID
         inv_existing.data.line_items = [LineItem(item_id=1, description="Office Chairs", quantity=1, unit_price=100, line_total=100)]
+        inv_existing.line_item_minhash = line_item_signature(inv_existing.data.line_items)
         
         # Mock .list()
         mock_db_local.invoices.list = AsyncMock(side_effect=lambda query: [inv_existing] if "data.total" in query else [])
@@ -8,14 +8,15 @@ from app.agents.matching import MatchingAgent
 from app.agents.po_creator import POCreator
 from app.models.invoice import InvoiceStatus, InvoiceData, LineItem
 from app.models.config import ValidationRules, CompanyConfig
+from app.models.policy import compile_policy
 
 @pytest.mark.asyncio
 async def test_matching_non_po_high_value():
     with patch("app.agents.matching.db") as mock_db:
         # Config: Require PO above 1000
-        mock_config = MagicMock()
-        mock_config.validation_rules = ValidationRules(require_po_above=1000.0)
-        mock_db.config.get_by_field = AsyncMock(return_value=mock_config)
+        mock_config = CompanyConfig(company_id="acme", company_name="Acme",
+                                    validation_rules=ValidationRules(require_po_above=1000.0))
+        mock_db.config.get_policy = AsyncMock(return_value=compile_policy(mock_config))
         
         # Invoice: No PO, Amount 5000
         invoice_data = InvoiceData(
@@ -23,9 +24,10 @@ async def test_matching_non_po_high_value():
             po_reference=None
         )
         mock_invoice = MagicMock()
+        mock_invoice.invoice_id = "inv_high"
         mock_invoice.data = invoice_data
         mock_db.invoices.get_by_field = AsyncMock(return_value=mock_invoice)
-        mock_db.invoices.update = AsyncMock()
+        mock_db.invoices.transition = AsyncMock()
         
         agent = MatchingAgent()
         state = {"invoice_id": "inv_high", "company_id": "c1"}
@@ -37,10 +39,10 @@ async def test_matching_non_po_high_value():
         assert result["matching_results"]["match_status"] == "NON_PO_APPROVAL_NEEDED"
         
         # Verify DB update call
-        mock_db.invoices.update.assert_called()
-        args = mock_db.invoices.update.call_args[0]
+        mock_db.invoices.transition.assert_called()
+        args = mock_db.invoices.transition.call_args[0]
         assert args[0] == "inv_high"
-        assert args[1]["status"] == InvoiceStatus.AWAITING_APPROVAL
+        assert args[2] == InvoiceStatus.AWAITING_APPROVAL
 
 @pytest.mark.asyncio
 async def test_po_creator_retrospective():
@@ -58,7 +60,7 @@ async def test_po_creator_retrospective():
         mock_invoice.data = invoice_data
         mock_db.invoices.get_by_field = AsyncMock(return_value=mock_invoice)
         mock_db.db["purchase_orders"].insert_one = AsyncMock()
-        mock_db.invoices.update = AsyncMock()
+        mock_db.invoices.transition = AsyncMock()
         
         po = await creator.create_retrospective_po("inv_high", "c1", "manager1")
         
@@ -69,6 +71,6 @@ async def test_po_creator_retrospective():
         assert len(po.line_items) == 1
         
         # Verify Link call
-        mock_db.invoices.update.assert_called()
-        link_args = mock_db.invoices.update.call_args[0]
-        assert link_args[1]["data.po_reference"] == po.po_number
+        mock_db.invoices.transition.assert_called()
+        link_args = mock_db.invoices.transition.call_args[0]
+        assert link_args[3]["data.po_reference"] == po.po_number
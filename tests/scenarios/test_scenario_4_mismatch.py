@@ -6,6 +6,9 @@ from unittest.mock import AsyncMock, MagicMock, patch
 from datetime import datetime
 from app.agents.matching import MatchingAgent
 from app.models.invoice import InvoiceStatus
+from app.models.purchase_order import PurchaseOrder
+from app.models.config import CompanyConfig, MatchingTolerances
+from app.models.policy import compile_policy
 
 @pytest.mark.asyncio
 async def test_scenario_4_matching_mismatch(mock_db, sample_invoice):
@@ -37,13 +40,12 @@ async def test_scenario_4_matching_mismatch(mock_db, sample_invoice):
     
     with patch("app.agents.matching.db") as mock_db_local:
         mock_db_local.invoices = mock_db.invoices
-        mock_db_local.db.__getitem__.return_value.find_one = AsyncMock(return_value=po_doc)
-        mock_db_local.db.__getitem__.return_value.find.return_value = AsyncMock() # For GRN
-        mock_db_local.db.__getitem__.return_value.find.return_value.to_list = AsyncMock(return_value=[])
-        mock_config = MagicMock()
-        mock_config.matching_tolerances.price_variance_percent = 5.0
-        mock_config.matching_tolerances.total_amount_variance = 1.0
-        mock_db_local.config.get_by_field = AsyncMock(return_value=mock_config)
+        # No goods received yet
+        mock_db_local.purchase_orders.get_with_receipts = AsyncMock(return_value=(PurchaseOrder(**po_doc), []))
+        mock_db_local.purchase_orders.record_usage = AsyncMock()
+        mock_config = CompanyConfig(company_id="acme", company_name="Acme",
+                                    matching_tolerances=MatchingTolerances(price_variance_percent=5.0, total_amount_variance=1.0))
+        mock_db_local.config.get_policy = AsyncMock(return_value=compile_policy(mock_config))
         
         # 3. Run matching
         state = {"invoice_id": sample_invoice.invoice_id, "company_id": "acme"}
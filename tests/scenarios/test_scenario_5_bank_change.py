@@ -22,7 +22,7 @@ async def test_bank_detail_change_detection():
     )
     
     with patch("app.tools.fraud_detector.db") as mock_db:
-        mock_db.vendors.get_by_field = AsyncMock(return_value=vendor)
+        mock_db.vendors.get_by_vendor_id = AsyncMock(return_value=vendor)
         
         detector = FraudDetector()
         is_change = await detector.check_bank_details_change("v1", days=30)
@@ -37,7 +37,8 @@ async def test_validation_triggers_verification():
          patch("app.agents.validation.vat_validator.validate_vat", return_value={"valid": True}), \
          patch("app.tools.verification_tool.db") as mock_ver_db, \
          patch.object(verification_tool, "initiate_verification", new_callable=AsyncMock) as mock_init_ver, \
-         patch.object(fraud_detector, "check_bank_details_change", new_callable=AsyncMock) as mock_check_bank:
+         patch.object(fraud_detector, "check_bank_details_change", new_callable=AsyncMock) as mock_check_bank, \
+         patch.object(fraud_detector, "check_shared_bank_account", new_callable=AsyncMock, return_value=[]):
          
         mock_check_bank.return_value = True # Simulate Bank Change Detected
         
@@ -62,13 +63,14 @@ async def test_validation_triggers_verification():
         
         # Mock DB returns
         mock_db.invoices.get_by_field = AsyncMock(return_value=mock_invoice)
-        mock_db.vendors.get_by_field = AsyncMock(return_value=vendor) 
-        mock_db.invoices.update = AsyncMock()
+        mock_db.vendors.resolve = AsyncMock(return_value=vendor) 
+        mock_db.vendor_features.get = AsyncMock(return_value=None)
+        mock_db.invoices.transition = AsyncMock()
         mock_dup.check_duplicates = AsyncMock(return_value={"is_duplicate": False})
         
         # Mock Verification DB insert
         mock_ver_db.db.__getitem__.return_value.insert_one = AsyncMock()
-        mock_ver_db.vendors.get_by_field = AsyncMock(return_value=vendor) # For verify tool email
+        mock_ver_db.vendors.get_by_vendor_id = AsyncMock(return_value=vendor) # For verify tool email
         
         agent = ValidationAgent()
         state = {"invoice_id": "inv1"}
@@ -76,7 +78,7 @@ async def test_validation_triggers_verification():
         result = await agent.validation_node(state)
         
         # Assertions
-        mock_check_bank.assert_called_with("v1")
+        mock_check_bank.assert_called_with("v1", company_id=mock_invoice.company_id)
         mock_init_ver.assert_called()
         
         assert "RECENT_BANK_CHANGE" in result["validation_results"]["flags"]
@@ -97,7 +99,7 @@ async def test_verification_tool_steps():
             "email_verification_status": "PENDING", "callback_verification_status": "PENDING",
             "cfo_approval_status": "PENDING", "overall_status": "PENDING", "notes": []
         })
-        mock_db.vendors.get_by_field = AsyncMock(return_value=MagicMock(contact=MagicMock(email="test@vendor.com")))
+        mock_db.vendors.get_by_vendor_id = AsyncMock(return_value=MagicMock(contact=MagicMock(email="test@vendor.com")))
         
         await tool.initiate_verification("inv1", "v1", "TEST")
         
@@ -38,16 +38,18 @@ async def test_vat_discrepancy_triggers_corrector():
          
         # Mock DB
         mock_db.invoices.get_by_field = AsyncMock(return_value=invoice)
-        mock_db.vendors.get_by_field = AsyncMock(return_value=vendor)
-        mock_db.invoices.update = AsyncMock()
+        mock_db.vendors.resolve = AsyncMock(return_value=vendor)
+        mock_db.vendor_features.get = AsyncMock(return_value=None)
+        mock_db.invoices.transition = AsyncMock()
         
-        mock_corr_db.vendors.get_by_field = AsyncMock(return_value=vendor)
-        mock_corr_db.invoices.update = AsyncMock()
+        mock_corr_db.vendors.get_by_vendor_id = AsyncMock(return_value=vendor)
+        mock_corr_db.invoices.transition = AsyncMock()
         
         # Mock validators
         mock_dup.check_duplicates = AsyncMock(return_value={"is_duplicate": False})
         mock_fraud.analyze_fraud_risk = MagicMock(return_value={"fraud_score": 0.1, "flags": []})
         mock_fraud.check_bank_details_change = AsyncMock(return_value=False)
+        mock_fraud.check_shared_bank_account = AsyncMock(return_value=[])
         
         # VAT Validator should return invalid
         mock_vat_val.return_value = {
@@ -70,8 +72,8 @@ async def test_vat_discrepancy_triggers_corrector():
         mock_notif.send_notification.assert_called()
         
         # Check if invoice was updated with flags
-        args, kwargs = mock_db.invoices.update.call_args
-        actual_flags = args[1]["validation"]["flags"]
+        args, kwargs = mock_db.invoices.transition.call_args
+        actual_flags = args[3]["validation"]["flags"]
         assert any("VAT_MISMATCH" in flag for flag in actual_flags)
         
         # Check corrector's self track (if we had a way to access it, but we use DB)
@@ -1,11 +1,13 @@
 import sys
 import os
 sys.path.append(os.getcwd())
+import asyncio
 import pytest
-from unittest.mock import AsyncMock, MagicMock, patch, PropertyMock
+from unittest.mock import AsyncMock, MagicMock, patch
 from datetime import datetime, timedelta
 from app.agents.sla_monitor import sla_monitor
 from app.models.invoice import Invoice, InvoiceStatus, InvoiceData
+from app.repositories.base import BulkWriteSummary
 
 @pytest.mark.asyncio
 async def test_check_payment_deadlines_critical():
@@ -25,22 +27,25 @@ async def test_check_payment_deadlines_critical():
     with patch("app.agents.sla_monitor.db") as mock_db_instance, \
          patch("app.tools.notification_tool.notification_tool.send_notification") as mock_notif:
          
-        # mock_db_instance is the DATABASE instance from app.database
-        mock_raw_db = MagicMock()
-        type(mock_db_instance).db = PropertyMock(return_value=mock_raw_db)
-        
-        # Mock find result (as async iterable/cursor)
+        # Mock find result as a streamed cursor
         mock_cursor = MagicMock()
-        mock_cursor.to_list = AsyncMock(return_value=[invoice.model_dump(by_alias=True)])
-        mock_raw_db.__getitem__.return_value.find.return_value = mock_cursor
-        mock_raw_db.__getitem__.return_value.update_one = AsyncMock()
+        mock_cursor.__aiter__.return_value = [invoice.model_dump(by_alias=True)]
+        mock_db_instance.invoices.collection.find.return_value.batch_size.return_value = mock_cursor
+        mock_db_instance.invoices.bulk_update = AsyncMock(return_value=BulkWriteSummary())
         
         await sla_monitor.check_payment_deadlines()
+        await sla_monitor.drain()
+        
+        # Only invoices due within the warning window (or already escalated) are read
+        query, projection = mock_db_instance.invoices.collection.find.call_args[0]
+        assert "data.due_date" in query["$or"][0]
+        assert "data.due_date" in projection and "data.line_items" not in projection
         
-        # Verify escalation to CRITICAL
-        mock_raw_db.__getitem__.return_value.update_one.assert_called()
-        args, kwargs = mock_raw_db.__getitem__.return_value.update_one.call_args
-        assert args[1]["$set"]["urgency"] == "CRITICAL"
+        # Verify escalation to CRITICAL, written as one batch
+        mock_db_instance.invoices.bulk_update.assert_called_once()
+        updates = mock_db_instance.invoices.bulk_update.call_args[0][0]
+        assert updates[0][0] == {"invoice_id": "inv_critical"}
+        assert updates[0][1]["$set"]["urgency"] == "CRITICAL"
         
         # Verify notification sent to CFO
         mock_notif.assert_called()
@@ -60,19 +65,73 @@ async def test_check_approval_sla_breach():
     with patch("app.agents.sla_monitor.db") as mock_db_instance, \
          patch("app.tools.notification_tool.notification_tool.send_notification") as mock_notif:
          
-        mock_raw_db = MagicMock()
-        type(mock_db_instance).db = PropertyMock(return_value=mock_raw_db)
-        
         mock_cursor = MagicMock()
-        mock_cursor.to_list = AsyncMock(return_value=[invoice.model_dump(by_alias=True)])
-        mock_raw_db.__getitem__.return_value.find.return_value = mock_cursor
-        mock_raw_db.__getitem__.return_value.update_one = AsyncMock()
+        mock_cursor.__aiter__.return_value = [invoice.model_dump(by_alias=True)]
         
         # Mock repository
         mock_db_instance.invoices = MagicMock()
-        mock_db_instance.invoices.update = AsyncMock()
+        mock_db_instance.invoices.collection.find.return_value.batch_size.return_value = mock_cursor
+        mock_db_instance.invoices.bulk_update = AsyncMock(return_value=BulkWriteSummary())
         
         await sla_monitor.check_approval_slas(sla_hours=48)
+        await sla_monitor.drain()
+        
+        # Only invoices waiting past the at-risk point are read, by status_changed_at or, before it was kept, updated_at
+        since_status, legacy = mock_db_instance.invoices.collection.find.call_args[0][0]["$or"]
+        assert since_status["status"] == InvoiceStatus.AWAITING_APPROVAL and "$lte" in since_status["status_changed_at"]
+        assert legacy["status_changed_at"] is None and "$lte" in legacy["updated_at"]
         
-        # Verify sla_status updated to BREACHED via repository
-        mock_db_instance.invoices.update.assert_called_with("inv_breached", {"sla_status": "BREACHED"})
+        # Verify sla_status updated to BREACHED alongside the escalation via repository
+        updates = mock_db_instance.invoices.bulk_update.call_args[0][0]
+        assert updates == [({"invoice_id": "inv_breached"}, updates[0][1])]
+        assert updates[0][1]["$set"] == {"urgency": "CRITICAL", "sla_status": "BREACHED"}
+        mock_notif.assert_called()
+
+@pytest.mark.asyncio
+async def test_approval_wait_ignores_later_writes():
+    # Escalated yesterday (updated_at), but waiting for approval for 50 hours
+    now = datetime.utcnow()
+    invoice = Invoice(
+        invoice_id="inv_waiting", company_id="c1", status=InvoiceStatus.AWAITING_APPROVAL,
+        status_changed_at=now - timedelta(hours=50), updated_at=now - timedelta(hours=20), sla_status="AT_RISK"
+    )
+
+    with patch("app.agents.sla_monitor.db") as mock_db_instance, \
+         patch("app.tools.notification_tool.notification_tool.send_notification"):
+        mock_cursor = MagicMock()
+        mock_cursor.__aiter__.return_value = [invoice.model_dump(by_alias=True)]
+        mock_db_instance.invoices.collection.find.return_value.batch_size.return_value = mock_cursor
+        mock_db_instance.invoices.bulk_update = AsyncMock(return_value=BulkWriteSummary())
+
+        await sla_monitor.check_approval_slas(sla_hours=48, now=now)
+        await sla_monitor.drain()
+
+        updates = mock_db_instance.invoices.bulk_update.call_args[0][0]
+        assert updates[0][1]["$set"] == {"urgency": "CRITICAL", "sla_status": "BREACHED"}
+
+@pytest.mark.asyncio
+async def test_sweep_writes_before_notifications_finish():
+    # A slow notification channel must not hold up the sweep
+    invoice = Invoice(
+        invoice_id="inv_slow", company_id="c1", status=InvoiceStatus.AWAITING_APPROVAL,
+        updated_at=datetime.utcnow() - timedelta(hours=50)
+    )
+    sent = []
+
+    async def slow_send(**kwargs):
+        await asyncio.sleep(0.05)
+        sent.append(kwargs["subject"])
+
+    with patch("app.agents.sla_monitor.db") as mock_db_instance, \
+         patch("app.tools.notification_tool.notification_tool.send_notification", side_effect=slow_send):
+        mock_cursor = MagicMock()
+        mock_cursor.__aiter__.return_value = [invoice.model_dump(by_alias=True)]
+        mock_db_instance.invoices.collection.find.return_value.batch_size.return_value = mock_cursor
+        mock_db_instance.invoices.bulk_update = AsyncMock(return_value=BulkWriteSummary())
+
+        await sla_monitor.check_approval_slas(sla_hours=48)
+        mock_db_instance.invoices.bulk_update.assert_awaited_once()
+        assert sent == []
+
+        await sla_monitor.drain()
+        assert sent == ["[CRITICAL] SLA Escalation: Invoice inv_slow"]
@@ -5,7 +5,7 @@ import pytest
 from unittest.mock import AsyncMock, MagicMock, patch
 from datetime import datetime
 from app.guardrails.audit_logger import AuditLogger
-from app.models.audit import ActionType
+from app.models.audit import ActionType, AuditEvent
 
 @pytest.mark.asyncio
 async def test_log_event():
@@ -61,7 +61,6 @@ async def test_generate_report_pdf():
     
     # Mock db fetch
     with patch("app.guardrails.audit_logger.db") as mock_db:
-        mock_cursor = MagicMock()
         # Mock event data
         evt_data = {
             "event_id": "1",
@@ -71,8 +70,7 @@ async def test_generate_report_pdf():
             "actor": {"id": "u1", "name": "User", "type": "USER"},
             "action": {"action_type": "USER_ACTION", "performed_by": {"id": "u1", "name": "User", "type": "USER"}, "details": "Test Action"}
         }
-        mock_cursor.to_list = AsyncMock(return_value=[evt_data]) 
-        mock_db.db["audit_events"].find.return_value.sort.return_value = mock_cursor
+        mock_db.audit.get_for_invoice = AsyncMock(return_value=[AuditEvent(**evt_data)])
         
         # Test PDF generation
         filename = await logger.generate_audit_report("inv_1", "PDF")
@@ -0,0 +1,197 @@
+import pytest
+from unittest.mock import AsyncMock, MagicMock
+from pymongo.errors import BulkWriteError
+from app.repositories.base import BaseRepository
+from app.models.vendor import Vendor
+
+def _result(**counts):
+    result = MagicMock()
+    result.bulk_api_result = {"nInserted": 0, "nMatched": 0, "nModified": 0, "nUpserted": 0, "writeErrors": [], **counts}
+    return result
+
+def _vendors(n):
+    return [Vendor(vendor_id=f"V{i}", company_id="acme", name=f"Vendor {i}") for i in range(n)]
+
+@pytest.mark.asyncio
+async def test_bulk_create_batches_and_sets_ids():
+    collection = MagicMock()
+    collection.bulk_write = AsyncMock(side_effect=[_result(nInserted=2), _result(nInserted=1)])
+    repo = BaseRepository(collection, Vendor)
+    vendors = _vendors(3)
+
+    summary = await repo.bulk_create(vendors, batch_size=2)
+
+    assert collection.bulk_write.call_count == 2
+    assert summary.inserted_count == 3
+    assert summary.batches == 2
+    assert summary.ok
+    # ids are assigned client-side, so they are known without a re-read
+    assert all(v.id for v in vendors)
+
+@pytest.mark.asyncio
+async def test_bulk_create_reports_partial_failure_unordered():
+    collection = MagicMock()
+    error = BulkWriteError({
+        "nInserted": 1, "nMatched": 0, "nModified": 0, "nUpserted": 0,
+        "writeErrors": [{"index": 1, "code": 11000, "errmsg": "E11000 duplicate key"}]
+    })
+    collection.bulk_write = AsyncMock(side_effect=[_result(nInserted=2), error])
+    repo = BaseRepository(collection, Vendor)
+    vendors = _vendors(4)
+
+    summary = await repo.bulk_create(vendors, batch_size=2)
+
+    assert summary.inserted_count == 3
+    assert summary.errors == [{"index": 3, "code": 11000, "message": "E11000 duplicate key"}]
+    assert vendors[3].id is None
+    assert vendors[2].id is not None
+
+@pytest.mark.asyncio
+async def test_bulk_update_ordered_stops_after_failed_batch():
+    collection = MagicMock()
+    error = BulkWriteError({"nMatched": 0, "nModified": 0, "writeErrors": [{"index": 0, "code": 2, "errmsg": "bad"}]})
+    collection.bulk_write = AsyncMock(side_effect=[error, _result(nMatched=1, nModified=1)])
+    repo = BaseRepository(collection, Vendor)
+
+    summary = await repo.bulk_update(
+        [({"vendor_id": "V1"}, {"name": "A"}), ({"vendor_id": "V2"}, {"$set": {"name": "B"}})],
+        ordered=True, batch_size=1
+    )
+
+    assert collection.bulk_write.call_count == 1
+    assert not summary.ok
+    op = collection.bulk_write.call_args[0][0][0]
+    assert op._doc == {"$set": {"name": "A"}}
+
+@pytest.mark.asyncio
+async def test_bulk_update_passes_pipelines_through():
+    collection = MagicMock()
+    collection.bulk_write = AsyncMock(return_value=_result(nMatched=1, nModified=1))
+    repo = BaseRepository(collection, Vendor)
+    pipeline = [{"$set": {"name": {"$concat": ["$name", " Ltd"]}}}]
+
+    await repo.bulk_update([({"vendor_id": "V1"}, pipeline)])
+
+    op = collection.bulk_write.call_args[0][0][0]
+    assert op._doc == pipeline
+
+@pytest.mark.asyncio
+async def test_bulk_upsert_keys_on_natural_id():
+    collection = MagicMock()
+    collection.bulk_write = AsyncMock(return_value=_result(nUpserted=1))
+    repo = BaseRepository(collection, Vendor)
+
+    summary = await repo.bulk_upsert(_vendors(1), key_fields=["vendor_id"])
+
+    op = collection.bulk_write.call_args[0][0][0]
+    assert op._filter == {"vendor_id": "V0"}
+    assert op._upsert is True
+    assert "_id" not in op._doc["$set"]
+    assert summary.upserted_count == 1
+
+@pytest.mark.asyncio
+async def test_bulk_upsert_insert_only_fields():
+    collection = MagicMock()
+    collection.bulk_write = AsyncMock(return_value=_result(nUpserted=1, upserted=[{"index": 1, "_id": "x"}]))
+    repo = BaseRepository(collection, Vendor)
+
+    summary = await repo.bulk_upsert(_vendors(2), key_fields=["vendor_id"], insert_only={"created_at"})
+
+    op = collection.bulk_write.call_args[0][0][0]
+    assert "created_at" not in op._doc["$set"] and "name" in op._doc["$set"]
+    assert set(op._doc["$setOnInsert"]) == {"created_at"}
+    assert summary.upserted_indexes == [1]
+
+@pytest.mark.asyncio
+async def test_list_with_view_projects_and_hydrates_summary():
+    from app.models.invoice import InvoiceSummary
+    cursor = MagicMock()
+    cursor.skip.return_value.limit.return_value.to_list = AsyncMock(return_value=[{
+        "_id": "65f000000000000000000001", "invoice_id": "INV-1", "company_id": "acme", "status": "AWAITING_APPROVAL",
+        "data": {"vendor_name": "Acme", "invoice_number": "N-1", "invoice_date": "2024-01-01T00:00:00", "total": 12.0}
+    }])
+    collection = MagicMock()
+    collection.find.return_value = cursor
+    repo = BaseRepository(collection, Vendor)
+
+    invoices = await repo.list({"status": "AWAITING_APPROVAL"}, view=InvoiceSummary)
+
+    projection = collection.find.call_args[0][1]
+    assert projection["data.total"] == 1
+    assert "raw_text" not in projection and "data.line_items" not in projection
+    assert isinstance(invoices[0], InvoiceSummary)
+    assert invoices[0].data.total == 12.0
+
+def _cursor(docs):
+    cursor = MagicMock()
+    cursor.sort.return_value.limit.return_value.to_list = AsyncMock(return_value=docs)
+    return cursor
+
+@pytest.mark.asyncio
+async def test_paginate_seeks_from_cursor():
+    from datetime import datetime
+    from bson import ObjectId
+    from pymongo import DESCENDING
+    sort = [("created_at", DESCENDING), ("_id", DESCENDING)]
+    docs = [{"_id": ObjectId(), "vendor_id": f"V{i}", "company_id": "acme", "name": "V",
+             "created_at": datetime(2024, 1, 3 - i)} for i in range(3)]
+    second_id = docs[1]["_id"] # from_mongo pops _id while hydrating
+    collection = MagicMock()
+    collection.find.return_value = _cursor(docs)
+    repo = BaseRepository(collection, Vendor)
+
+    page = await repo.paginate({"company_id": "acme"}, sort, limit=2)
+
+    assert [v.vendor_id for v in page.items] == ["V0", "V1"]
+    assert page.next_cursor
+    collection.find.return_value.sort.return_value.limit.assert_called_with(3)
+
+    collection.find.return_value = _cursor(docs[2:])
+    page = await repo.paginate({"company_id": "acme"}, sort, cursor=page.next_cursor, limit=2)
+
+    query = collection.find.call_args[0][0]
+    assert query["$and"][0] == {"company_id": "acme"}
+    assert query["$and"][1]["$or"][1] == {"created_at": datetime(2024, 1, 2), "_id": {"$lt": second_id}}
+    assert page.next_cursor is None
+
+@pytest.mark.asyncio
+async def test_paginate_rejects_foreign_cursor():
+    from app.repositories.base import encode_cursor
+    repo = BaseRepository(MagicMock(), Vendor)
+    token = encode_cursor([("name", 1)], ["x"])
+
+    with pytest.raises(ValueError):
+        await repo.paginate({}, [("created_at", -1), ("_id", -1)], cursor=token)
+    with pytest.raises(ValueError):
+        await repo.paginate({}, [("created_at", -1), ("_id", -1)], cursor="not-a-cursor")
+
+@pytest.mark.asyncio
+async def test_count_estimate_is_cached():
+    collection = MagicMock()
+    collection.count_documents = AsyncMock(return_value=42)
+    collection.estimated_document_count = AsyncMock(return_value=1000)
+    repo = BaseRepository(collection, Vendor)
+
+    assert await repo.count_estimate({"company_id": "acme"}) == 42
+    assert await repo.count_estimate({"company_id": "acme"}) == 42
+    assert await repo.count_estimate() == 1000
+    collection.count_documents.assert_called_once()
+
+@pytest.mark.asyncio
+async def test_count_cache_is_bounded(monkeypatch):
+    monkeypatch.setattr("app.repositories.base.COUNT_CACHE_MAX_ENTRIES", 3)
+    collection = MagicMock()
+    collection.count_documents = AsyncMock(return_value=1)
+    repo = BaseRepository(collection, Vendor)
+
+    for name in ["a", "b", "c"]:
+        await repo.count_estimate({"name": name})
+    await repo.count_estimate({"name": "a"}) # Cached, and now most recently used
+    await repo.count_estimate({"name": "d"})
+
+    assert len(repo._count_cache) == 3
+    assert collection.count_documents.await_count == 4
+    await repo.count_estimate({"name": "a"})
+    assert collection.count_documents.await_count == 4
+    await repo.count_estimate({"name": "b"}) # The least recently used was dropped
+    assert collection.count_documents.await_count == 5
@@ -0,0 +1,68 @@
+import pytest
+from unittest.mock import AsyncMock, MagicMock
+from app.repositories.config import ConfigRepository
+from app.models.config import CompanyConfig
+
+def _doc(name="Acme"):
+    return {"_id": "65f000000000000000000001", "company_id": "acme", "company_name": name}
+
+def _repo(ttl=60):
+    collection = MagicMock()
+    collection.find_one = AsyncMock(return_value=_doc())
+    return ConfigRepository(collection, CompanyConfig, ttl=ttl), collection
+
+@pytest.mark.asyncio
+async def test_config_is_read_once_within_ttl():
+    repo, collection = _repo()
+
+    first = await repo.get_by_company_id("acme")
+    second = await repo.get_by_company_id("acme")
+
+    assert first is second
+    collection.find_one.assert_called_once()
+
+@pytest.mark.asyncio
+async def test_expired_or_fresh_reads_hit_the_database():
+    repo, collection = _repo(ttl=0)
+
+    await repo.get_by_company_id("acme")
+    await repo.get_by_company_id("acme")
+    assert collection.find_one.call_count == 2
+
+    repo.ttl = 60
+    await repo.get_by_company_id("acme", fresh=True)
+    assert collection.find_one.call_count == 3
+
+@pytest.mark.asyncio
+async def test_update_refreshes_cached_config():
+    repo, collection = _repo()
+    await repo.get_by_company_id("acme")
+    collection.find_one_and_update = AsyncMock(return_value=_doc("Acme Ltd"))
+
+    await repo.update_by_company_id("acme", {"company_name": "Acme Ltd"})
+    config = await repo.get_by_company_id("acme")
+
+    assert config.company_name == "Acme Ltd"
+    collection.find_one.assert_called_once()
+
+@pytest.mark.asyncio
+async def test_policy_is_compiled_once_per_config():
+    repo, collection = _repo(ttl=0)
+
+    first = await repo.get_policy("acme")
+    second = await repo.get_policy("acme")
+    assert first is second # Config re-read after the TTL, but unchanged
+
+    collection.find_one = AsyncMock(return_value={**_doc(), "version": 1})
+    assert (await repo.get_policy("acme")) is not first
+    assert list(repo._policies) == ["acme"]
+
+@pytest.mark.asyncio
+async def test_policy_follows_writes_that_keep_the_version():
+    repo, collection = _repo(ttl=0)
+    first = await repo.get_policy("acme")
+
+    # e.g. scripts writing company_config with a plain $set
+    collection.find_one = AsyncMock(return_value=_doc("Acme Ltd"))
+
+    assert (await repo.get_policy("acme")) is not first
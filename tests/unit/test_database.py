@@ -0,0 +1,42 @@
+import pytest
+from unittest.mock import AsyncMock, MagicMock
+from app.database import Database, PoolStats, available_compressors
+
+def test_available_compressors_skips_missing_codecs(monkeypatch):
+    import importlib.util
+    installed = {"zlib"}
+    monkeypatch.setattr(importlib.util, "find_spec", lambda name: name in installed or None)
+
+    assert available_compressors("zstd, snappy,zlib") == ["zlib"]
+    installed.add("zstandard")
+    assert available_compressors("zstd,snappy,zlib") == ["zstd", "zlib"]
+
+def test_pool_stats_counts_cmap_events():
+    stats = PoolStats()
+    for _ in range(3):
+        stats.connection_created(None)
+    stats.connection_checked_out(None)
+    stats.connection_checked_out(None)
+    stats.connection_checked_in(None)
+    stats.connection_closed(None)
+
+    snapshot = stats.snapshot()
+    assert snapshot["open"] == 2
+    assert snapshot["in_use"] == 1
+    assert snapshot["created"] == 3
+
+@pytest.mark.asyncio
+async def test_warm_up_opens_one_connection_per_ping():
+    database = Database()
+    database.client = MagicMock()
+    database.client.admin.command = AsyncMock(return_value={"ok": 1})
+
+    await database.warm_up(5)
+
+    assert database.client.admin.command.call_count == 5
+
+def test_pool_snapshot_when_disconnected():
+    snapshot = Database().pool_snapshot()
+
+    assert snapshot["connected"] is False
+    assert snapshot["max_pool_size"] is None
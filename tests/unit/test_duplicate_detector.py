@@ -1,7 +1,8 @@
 import pytest
 from unittest.mock import AsyncMock, patch, MagicMock
-from app.tools.duplicate_detector import DuplicateDetector
+from app.tools.duplicate_detector import DuplicateDetector, duplicate_fingerprint, normalise_invoice_number
 from datetime import datetime
+from app.models.invoice import Invoice, InvoiceData, InvoiceStatus, LineItem
 
 @pytest.mark.asyncio
 async def test_check_duplicates_none_found(mock_db):
@@ -35,3 +36,73 @@ async def test_check_duplicates_exact_match(mock_db):
         assert result["conflicting_invoice_id"] == "INV-OLD"
 
 
+
+def test_fingerprint_normalises_number_vendor_and_amount():
+    a = duplicate_fingerprint("acme", "Acme Supplies Ltd", "INV-000123")
+    b = duplicate_fingerprint("acme", "ACME SUPPLIES LIMITED", "inv 123")
+    assert a == b == "acme|name:acme supplies|INV123"
+    assert duplicate_fingerprint("acme", "Acme", "123", vendor_id="V1") == "acme|id:V1|123"
+    assert normalise_invoice_number("10-05") == "1005"
+
+@pytest.mark.asyncio
+async def test_exact_match_is_a_fingerprint_lookup(mock_db):
+    with patch("app.tools.duplicate_detector.db") as mock_db_local:
+        mock_db_local.invoices = mock_db.invoices
+        mock_db_local.invoices.get_by_fingerprint = AsyncMock(return_value=MagicMock(invoice_id="INV-OLD"))
+        mock_db_local.invoices.list = AsyncMock(return_value=[])
+
+        result = await DuplicateDetector().check_duplicates(
+            "INV-NEW", "Vendor A", "NUM-0123", 100.0, datetime.now(), [], company_id="acme", vendor_id="V1"
+        )
+
+        mock_db_local.invoices.get_by_fingerprint.assert_awaited_once_with("acme|id:V1|NUM123", exclude_invoice_id="INV-NEW")
+        mock_db_local.invoices.list.assert_not_called()
+        assert result["match_type"] == "EXACT_NUMBER"
+        assert result["conflicting_invoice_id"] == "INV-OLD"
+
+def _extracted(invoice_id, vendor_name, number, total, day=1, items=("Office chairs", "Standing desk")):
+    return Invoice(
+        invoice_id=invoice_id, company_id="acme", status=InvoiceStatus.VALIDATION,
+        data=InvoiceData(vendor_name=vendor_name, invoice_number=number, invoice_date=datetime(2024, 1, day), total=total,
+                         line_items=[LineItem(item_id=i, description=d, quantity=1, unit_price=1.0, line_total=1.0)
+                                     for i, d in enumerate(items)])
+    )
+
+@pytest.mark.asyncio
+async def test_screen_batch_finds_in_batch_and_stored_duplicates():
+    stored = _extracted("INV-OLD", "Globex", "G-7", 50.0)
+    stored.duplicate_fingerprint = duplicate_fingerprint("acme", "Globex", "G-7")
+    batch = [
+        _extracted("B1", "Acme Ltd", "INV-001", 120.0),
+        _extracted("B2", "ACME LIMITED", "inv 1", 120.0),                        # B1 re-sent
+        _extracted("B3", "Acme Ltd", "INV-002", 120.0, day=3),                   # Same total 2 days later
+        _extracted("B4", "Acme Ltd", "INV-003", 99.0, day=30, items=("Toner",)), # Unrelated
+        _extracted("B5", "Globex", "G-0007", 55.0),                              # Already stored, amount changed
+    ]
+
+    with patch("app.tools.duplicate_detector.db") as mock_db:
+        mock_db.invoices.get_screening_candidates = AsyncMock(side_effect=lambda vendor_names, **kw: [stored] if "Globex" in vendor_names else [])
+        results = await DuplicateDetector().screen_batch(batch)
+
+    # One query per vendor block; name variants of Acme share a block
+    assert mock_db.invoices.get_screening_candidates.await_count == 2
+    assert results[0] == {"is_duplicate": False, "confidence": 0.0}
+    assert (results[1]["match_type"], results[1]["conflicting_invoice_id"]) == ("EXACT_NUMBER", "B1")
+    assert (results[2]["match_type"], results[2]["conflicting_invoice_id"]) == ("FUZZY_PLUS_ITEMS", "B1")
+    assert results[3]["is_duplicate"] is False
+    assert (results[4]["match_type"], results[4]["conflicting_invoice_id"]) == ("EXACT_NUMBER", "INV-OLD")
+
+@pytest.mark.asyncio
+async def test_screen_batch_matches_line_items_within_the_batch():
+    items = ("Office chairs", "Standing desk", "Monitor arm", "Desk lamp")
+    batch = [
+        _extracted("B1", "Acme Ltd", "INV-001", 120.0, items=items),
+        _extracted("B2", "Acme Ltd", "INV-002", 210.0, day=2, items=items), # Same items, misread total
+    ]
+
+    with patch("app.tools.duplicate_detector.db") as mock_db:
+        mock_db.invoices.get_screening_candidates = AsyncMock(return_value=[])
+        results = await DuplicateDetector().screen_batch(batch)
+
+    assert results[0]["is_duplicate"] is False
+    assert (results[1]["match_type"], results[1]["conflicting_invoice_id"]) == ("FUZZY_ITEMS_DATE", "B1")
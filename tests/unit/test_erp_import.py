@@ -0,0 +1,91 @@
+import sys
+import os
+sys.path.append(os.getcwd())
+import json
+import pytest
+from unittest.mock import AsyncMock, MagicMock
+from app.repositories.base import BulkWriteSummary
+from app.tools.erp_import import ERPImporter, read_csv, read_jsonl
+
+PO_CSV = """po_number,company_id,vendor_id,vendor_name,requester_email,department,po_date,subtotal,vat_amount,total,line_item_id,line_description,line_product_code,line_quantity,line_unit_price,line_line_total
+PO-1,acme,V1,Acme,a@acme.test,Ops,2024-01-01,30,6,36,1,Widget,W-1,2,10,20
+PO-1,acme,V1,Acme,a@acme.test,Ops,2024-01-01,30,6,36,2,Bolts,,10,1,10
+PO-2,acme,V1,Acme,a@acme.test,Ops,not a date,10,2,12,1,Widget,W-1,1,10,10
+PO-3,acme,V1,Acme,a@acme.test,Ops,2024-01-02,10,2,12,1,Widget,W-1,1,10,10
+"""
+
+def _importer(summary: BulkWriteSummary, chunk_size: int = 1000):
+    purchase_orders = MagicMock()
+    purchase_orders.bulk_upsert = AsyncMock(return_value=summary)
+    purchase_orders.apply_pending_receipts = AsyncMock(return_value=[])
+    grns = MagicMock()
+    grns.bulk_upsert = AsyncMock(return_value=summary)
+    return ERPImporter(purchase_orders, grns, chunk_size=chunk_size), purchase_orders, grns
+
+def test_read_csv_groups_line_rows(tmp_path):
+    path = tmp_path / "pos.csv"
+    path.write_text(PO_CSV)
+
+    docs = list(read_csv(str(path), "po_number"))
+
+    assert [(row, doc["po_number"], len(doc["line_items"])) for row, doc in docs] == [(2, "PO-1", 2), (4, "PO-2", 1), (5, "PO-3", 1)]
+    # Empty cells are left out so defaults apply
+    assert docs[0][1]["line_items"][1] == {"item_id": "2", "description": "Bolts", "quantity": "10",
+                                           "unit_price": "1", "line_total": "10"}
+
+def test_read_jsonl_reports_bad_lines(tmp_path):
+    path = tmp_path / "grns.jsonl"
+    path.write_text('{"grn_number": "G1"}\n\n{not json\n')
+
+    docs = list(read_jsonl(str(path)))
+
+    assert docs[0] == (1, {"grn_number": "G1"})
+    assert docs[1][0] == 3 and "Invalid JSON" in docs[1][1]["__error__"]
+
+@pytest.mark.asyncio
+async def test_import_upserts_chunks_and_reports_row_errors(tmp_path):
+    path = tmp_path / "pos.csv"
+    path.write_text(PO_CSV)
+    importer, purchase_orders, _ = _importer(None, chunk_size=2)
+    purchase_orders.bulk_upsert.side_effect = [
+        BulkWriteSummary(upserted_count=1, upserted_indexes=[0]),
+        # PO-3 already belongs to another tenant
+        BulkWriteSummary(errors=[{"index": 0, "code": 11000, "message": "E11000 duplicate key"}]),
+    ]
+
+    report = await importer.import_file(str(path), "purchase_orders")
+
+    # Chunk one holds PO-1 and PO-2, of which only PO-1 is valid; chunk two holds PO-3
+    assert purchase_orders.bulk_upsert.await_count == 2
+    first, second = purchase_orders.bulk_upsert.await_args_list
+    assert [po.po_number for po in first.args[0]] == ["PO-1"]
+    assert first.kwargs["key_fields"] == ["po_number", "company_id"]
+    assert {"ledger", "invoiced_amount", "received_amount", "created_at"} <= set(first.kwargs["insert_only"])
+    assert report.documents == 3 and report.inserted == 1
+    assert report.errors[0]["row"] == 4 and report.errors[0]["key"] == "PO-2" and "po_date" in report.errors[0]["message"]
+    assert report.errors[1] == {"row": 5, "key": "PO-3", "message": "E11000 duplicate key"}
+    # GRNs imported ahead of the stored PO are drawn down now
+    purchase_orders.apply_pending_receipts.assert_awaited_once_with({"po_number": {"$in": ["PO-1"]}})
+
+@pytest.mark.asyncio
+async def test_grns_not_on_the_ledger_draw_it_down(tmp_path):
+    path = tmp_path / "grns.jsonl"
+    path.write_text("\n".join(json.dumps({
+        "grn_number": f"G{i}", "po_number": f"PO-{i}", "company_id": "acme", "vendor_id": "V1", "received_by": "wh",
+        "line_items": [{"item_id": 1, "description": "Widget", "quantity": 1, "unit_price": 10, "line_total": 10}]
+    }) for i in range(3)))
+    # G0 and G2 are new, G1 was imported before
+    importer, purchase_orders, grns = _importer(BulkWriteSummary(upserted_count=2, matched_count=1, upserted_indexes=[0, 2]))
+    pending = purchase_orders.apply_pending_receipts
+    pending.side_effect = lambda query: [grn for grn in grns.bulk_upsert.await_args.args[0] if grn.po_number == "PO-2"]
+
+    report = await importer.import_file(str(path), "goods_receipt_notes")
+
+    assert grns.bulk_upsert.await_args.kwargs["key_fields"] == ["grn_number", "company_id"]
+    assert {"ledger_applied", "receipted_grns"} <= set(grns.bulk_upsert.await_args.kwargs["insert_only"])
+    # Every stored GRN is offered; the repository skips those already on the ledger
+    pending.assert_awaited_once_with({"grn_number": {"$in": ["G0", "G1", "G2"]}})
+    assert report.inserted == 2 and report.unchanged == 1
+    # PO-2 is not imported yet
+    assert report.errors == [{"row": 3, "key": "G2",
+                              "message": "PO PO-2 not found; the GRN is stored and drawn down once the PO is imported"}]
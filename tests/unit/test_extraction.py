@@ -16,15 +16,23 @@ async def test_extraction_node_success(mock_db, sample_invoice):
     sample_invoice.file_path = "507f1f77bcf86cd799439011"
     sample_invoice.status = InvoiceStatus.INGESTION
     mock_db.invoices.get_by_field.return_value = sample_invoice
+    mock_db.invoices.transition.return_value = sample_invoice
     
     # Mock Tools Locally in the agent module
     with patch("app.agents.extraction.ocr_tool") as mock_ocr, \
          patch("app.agents.extraction.groq_tool") as mock_groq, \
          patch("app.agents.extraction.context_manager") as mock_cm, \
+         patch("app.agents.extraction.velocity_tracker") as mock_velocity, \
          patch("app.agents.extraction.db") as mock_db_local:
         
         mock_db_local.invoices = mock_db.invoices
         mock_db_local.fs = mock_db.fs
+        mock_db_local.vendors = mock_db.vendors
+        mock_db_local.vendor_features = mock_db.vendor_features
+        mock_db_local.config = mock_db.config
+        mock_db.vendors.resolve.return_value = None # Unknown vendor, fingerprinted by name
+        mock_db.config.get_policy.return_value = None
+        mock_velocity.record = AsyncMock(return_value=True)
         
         # GridFS mock (Sync open, Async read)
         mock_stream = MagicMock()
@@ -61,6 +69,12 @@ async def test_extraction_node_success(mock_db, sample_invoice):
         
         assert "invoice_data" in result
         assert result["current_state"] == InvoiceStatus.VALIDATION
+        fields = mock_db.invoices.transition.call_args.args[3]
+        assert fields["duplicate_fingerprint"] == "COMP-A|name:test vendor|123"
+        # Counted towards the vendor's velocity under the invoice's arrival time
+        args = mock_velocity.record.call_args.args
+        assert args[:6] == ("inv_123", "COMP-A", "Test Vendor", None, 120.0, sample_invoice.created_at)
+        mock_db.vendor_features.record_invoice.assert_awaited_once_with("inv_123", "COMP-A", "Test Vendor", None, 120.0, 0.2, None)
 
 @pytest.mark.asyncio
 async def test_extraction_node_ocr_failure(mock_db, sample_invoice):
@@ -0,0 +1,116 @@
+import sys
+import os
+sys.path.append(os.getcwd())
+import random
+import pytest
+from datetime import datetime, timedelta
+from unittest.mock import AsyncMock, MagicMock, patch
+from app.models.invoice import InvoiceData, InvoiceStatus, LineItem
+from app.models.vendor import BankDetails, Vendor, VendorFeatures
+from app.tools.fraud_detector import FraudDetector, FraudFeatures
+from app.tools.velocity import VelocitySnapshot
+
+NOW = datetime(2024, 6, 12, 9, 30)
+
+def _vendor(bank_days_ago=None, age_days=400):
+    bank = None
+    if bank_days_ago is not None:
+        bank = BankDetails(account_name="A", account_number="1", last_updated=NOW - timedelta(days=bank_days_ago))
+    return Vendor(vendor_id="V1", company_id="acme", name="Acme", bank_details=bank, created_at=NOW - timedelta(days=age_days))
+
+def _invoice(total, date, lines=1):
+    items = [LineItem(item_id=i, description="x", quantity=1, unit_price=total / lines, line_total=total / lines)
+             for i in range(lines)]
+    return InvoiceData(vendor_name="Acme", invoice_number="1", invoice_date=date, total=total, line_items=items)
+
+def test_batch_matches_single_invoice_path():
+    rng = random.Random(7)
+    amounts = [0.0, 10.0, 100.0, 5000.0, 10000.0, 10010.0, 10100.0, 99.99, 0.1 + 0.2, 250.5, 12345.6]
+    bank_ages = [None, -1, 0, 0.5, 29, 29.99, 30, 31, 365]
+    invoices, vendors, detected, velocity, shared, history = [], [], [], [], [], []
+    # Vendor histories averaging 1000 +- 300, with and without enough invoices to judge outliers
+    histories = [None] + [
+        VendorFeatures(company_id="acme", vendor_key="id:V1", invoice_count=count, amount_sum=1000.0 * count,
+                       amount_sum_squares=(1000.0 ** 2 + 300.0 ** 2) * count)
+        for count in (3, 10, 500)
+    ]
+    for _ in range(2000):
+        invoices.append(_invoice(rng.choice(amounts + [round(rng.uniform(0, 20000), 2)]),
+                                 NOW - timedelta(days=rng.randint(0, 30)), lines=rng.choice([0, 1, 3])))
+        vendors.append(rng.choice([None, _vendor(rng.choice(bank_ages))]))
+        detected.append(rng.random() < 0.05)
+        shared.append(rng.random() < 0.05)
+        history.append(rng.choice(histories))
+        day = rng.choice([0, 5, 9, 10, 11, 30])
+        velocity.append(rng.choice([None, VelocitySnapshot(
+            count_1h=rng.choice([0, 1, 19, 20]), count_24h=day, count_30d=day + rng.choice([0, 50, 60, 61, 300]),
+            near_threshold_24h=rng.choice([0, 2, 3])
+        )]))
+
+    detector = FraudDetector()
+    features = FraudFeatures.from_invoices(invoices, vendors, detected, now=NOW, velocity=velocity, shared_bank_account=shared,
+                                           vendor_features=history)
+    batch = detector.score_batch(features)
+    single = [detector.analyze_fraud_risk(inv, vendor=vendor, bank_change_detected=flag, now=NOW, velocity=snapshot,
+                                          shared_bank_account=is_shared, vendor_features=vendor_history)
+              for inv, vendor, flag, snapshot, is_shared, vendor_history in zip(invoices, vendors, detected, velocity, shared, history)]
+
+    assert batch == single
+    assert {flag for result in batch for flag in result["flags"]} == {
+        "RECENT_BANK_CHANGE", "ROUNDED_AMOUNT_100", "ROUNDED_AMOUNT_10", "WEEKEND_DATE", "HIGH_VALUE", "NO_LINE_ITEMS",
+        "VELOCITY_SPIKE", "NEAR_THRESHOLD_PATTERN", "SHARED_BANK_ACCOUNT",
+        "AMOUNT_OUTLIER"
+    }
+
+def test_velocity_rules():
+    detector = FraudDetector()
+    invoice = _invoice(12.5, datetime(2024, 6, 10))
+    flags = lambda snapshot: detector.analyze_fraud_risk(invoice, now=NOW, velocity=snapshot)["flags"]
+
+    assert flags(None) == []
+    assert flags(VelocitySnapshot(count_1h=20, count_24h=20, count_30d=600)) == ["VELOCITY_SPIKE"]
+    # A new vendor's ten invoices in a day vs a vendor who always sends ten a day
+    assert flags(VelocitySnapshot(count_1h=2, count_24h=10, count_30d=10)) == ["VELOCITY_SPIKE"]
+    assert flags(VelocitySnapshot(count_1h=2, count_24h=10, count_30d=300)) == []
+    assert flags(VelocitySnapshot(count_24h=3, count_30d=3, near_threshold_24h=3)) == ["NEAR_THRESHOLD_PATTERN"]
+
+def test_feature_columns():
+    features = FraudFeatures.from_invoices(
+        [_invoice(200.0, datetime(2024, 6, 8), lines=2), _invoice(15.0, datetime(2024, 6, 10), lines=0)],
+        [_vendor(bank_days_ago=3, age_days=10), None], now=NOW
+    )
+
+    assert features.roundness.tolist() == [2, 0]
+    assert features.weekday.tolist() == [5, 0]
+    assert features.line_count.tolist() == [2, 0]
+    assert features.vendor_age_days[0] == 10 and features.bank_change_days[0] == 3
+    assert all(x != x for x in (features.vendor_age_days[1], features.bank_change_days[1])) # NaN without a vendor
+
+@pytest.mark.asyncio
+async def test_rescore_open_invoices_writes_changed_scores():
+    docs = [
+        # Bank details changed 3 days ago; stored score predates it
+        {"invoice_id": "INV-1", "company_id": "acme", "validation": {"fraud_score": 0.0},
+         "data": {"total": 12.5, "invoice_date": datetime(2024, 6, 10), "line_items": [{"item_id": 1}]}},
+        {"invoice_id": "INV-2", "company_id": "acme", "validation": {"fraud_score": 0.0},
+         "data": {"total": 12.5, "invoice_date": datetime(2024, 6, 10), "vendor_id": "V2", "line_items": [{"item_id": 1}]}},
+        # Velocity flagged at validation still counts, however quiet the vendor is now
+        {"invoice_id": "INV-3", "company_id": "acme", "validation": {"fraud_score": 0.3, "flags": ["VELOCITY_SPIKE"]},
+         "data": {"total": 12.5, "invoice_date": datetime(2024, 6, 10), "line_items": [{"item_id": 1}]}},
+    ]
+    cursor = MagicMock()
+    cursor.__aiter__.return_value = docs
+    with patch("app.tools.fraud_detector.db") as mock_db:
+        mock_db.invoices.collection.find.return_value.batch_size.return_value = cursor
+        mock_db.vendors.resolve = AsyncMock(side_effect=[_vendor(bank_days_ago=3), None, None])
+        mock_db.vendors.sharing_bank_account = AsyncMock(return_value=[])
+        mock_db.vendor_features.get = AsyncMock(return_value=None)
+        mock_db.invoices.bulk_update = AsyncMock()
+
+        changed = await FraudDetector().rescore_open_invoices(now=NOW)
+
+        query, projection = mock_db.invoices.collection.find.call_args[0]
+        assert query["status"] == {"$nin": [InvoiceStatus.PAID, InvoiceStatus.REJECTED]}
+        assert "data.line_items.item_id" in projection and "data.line_items" not in projection
+        assert changed == 1
+        mock_db.invoices.bulk_update.assert_awaited_once_with([({"invoice_id": "INV-1"}, {"validation.fraud_score": 0.8})])
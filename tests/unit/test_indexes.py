@@ -0,0 +1,42 @@
+import pytest
+from unittest.mock import AsyncMock, MagicMock
+from pymongo import ASCENDING, IndexModel
+from app.repositories import indexes
+from app.repositories.indexes import declare_indexes, declared_indexes, ensure_indexes, uses_indexes
+
+@pytest.fixture
+def registry(monkeypatch):
+    monkeypatch.setattr(indexes, "_DECLARED", {})
+
+def _database(existing):
+    collection = MagicMock()
+    collection.index_information = AsyncMock(return_value=existing)
+    collection.create_indexes = AsyncMock(side_effect=lambda models: [m.document["name"] for m in models])
+    database = MagicMock()
+    database.__getitem__.return_value = collection
+    return database, collection
+
+def test_declarations_are_deduplicated(registry):
+    declare_indexes("invoices", IndexModel([("invoice_id", ASCENDING)], unique=True))
+
+    @uses_indexes("invoices", IndexModel([("invoice_id", ASCENDING)], unique=True))
+    async def get(invoice_id):
+        return invoice_id
+
+    assert [i.document["name"] for i in declared_indexes()["invoices"]] == ["invoice_id_1"]
+
+@pytest.mark.asyncio
+async def test_ensure_indexes_only_creates_missing(registry):
+    declare_indexes(
+        "invoices",
+        IndexModel([("invoice_id", ASCENDING)], unique=True),
+        IndexModel([("data.vendor_name", ASCENDING), ("data.invoice_number", ASCENDING)]),
+    )
+    database, collection = _database({"_id_": {}, "invoice_id_1": {}})
+
+    created = await ensure_indexes(database)
+
+    assert created == {"invoices": ["data.vendor_name_1_data.invoice_number_1"]}
+    collection.index_information.return_value = {"_id_": {}, "invoice_id_1": {}, "data.vendor_name_1_data.invoice_number_1": {}}
+    assert await ensure_indexes(database) == {}
+    assert collection.create_indexes.call_count == 1
@@ -0,0 +1,97 @@
+import pytest
+from datetime import datetime
+from unittest.mock import AsyncMock, MagicMock
+from pymongo import ReturnDocument
+from app.repositories.invoice import InvoiceRepository
+from app.models.invoice import Invoice, InvoiceStatus
+
+@pytest.mark.asyncio
+async def test_transition_single_round_trip():
+    collection = MagicMock()
+    collection.find_one_and_update = AsyncMock(return_value={
+        "_id": "65f000000000000000000001",
+        "invoice_id": "INV-1",
+        "company_id": "acme",
+        "status": "MATCHING",
+        "previous_state": "VALIDATION",
+        "version": 3
+    })
+    repo = InvoiceRepository(collection, Invoice)
+
+    invoice = await repo.transition(
+        "INV-1", InvoiceStatus.VALIDATION, InvoiceStatus.MATCHING,
+        {"validation": {"vat_valid": True}}, expected_version=2
+    )
+
+    assert invoice.status == InvoiceStatus.MATCHING
+    assert invoice.version == 3
+    collection.find_one_and_update.assert_called_once()
+    args, kwargs = collection.find_one_and_update.call_args
+    assert args[0] == {"invoice_id": "INV-1", "status": InvoiceStatus.VALIDATION, "version": 2}
+    stage = args[1][0]["$set"]
+    assert stage["status"] == InvoiceStatus.MATCHING
+    assert stage["validation"] == {"$literal": {"vat_valid": True}}
+    assert stage["version"] == {"$add": [{"$ifNull": ["$version", 0]}, 1]}
+    # The status clock restarts only when the status changes
+    assert stage["status_changed_at"]["$cond"][0] == {"$eq": ["$status", InvoiceStatus.MATCHING]}
+    assert stage["status_changed_at"]["$cond"][2] == stage["updated_at"]
+    assert kwargs["return_document"] == ReturnDocument.AFTER
+
+@pytest.mark.asyncio
+async def test_transition_multiple_sources_and_legacy_version():
+    collection = MagicMock()
+    collection.find_one_and_update = AsyncMock(return_value=None)
+    repo = InvoiceRepository(collection, Invoice)
+
+    await repo.transition(
+        "INV-1", [InvoiceStatus.EXCEPTION, InvoiceStatus.REJECTED], InvoiceStatus.INGESTION, expected_version=0
+    )
+
+    filter = collection.find_one_and_update.call_args[0][0]
+    assert filter["status"] == {"$in": [InvoiceStatus.EXCEPTION, InvoiceStatus.REJECTED]}
+    assert filter["version"] == {"$in": [0, None]}
+
+@pytest.mark.asyncio
+async def test_transition_stale_returns_none():
+    collection = MagicMock()
+    collection.find_one_and_update = AsyncMock(return_value=None)
+    repo = InvoiceRepository(collection, Invoice)
+
+    result = await repo.transition("INV-1", InvoiceStatus.AWAITING_APPROVAL, InvoiceStatus.REJECTED)
+
+    assert result is None
+
+@pytest.mark.asyncio
+async def test_claim_po_usage_once():
+    collection = MagicMock()
+    collection.find_one_and_update = AsyncMock(return_value={"matching": {
+        "has_po": True, "po_number": "PO-1", "po_usage": {"0": {"quantity": 2, "amount": 20.0}}
+    }})
+    repo = InvoiceRepository(collection, Invoice)
+
+    claimed = await repo.claim_po_usage("INV-1")
+
+    assert claimed.po_number == "PO-1" and claimed.po_usage["0"].amount == 20.0
+    args, kwargs = collection.find_one_and_update.call_args
+    # Only an invoice still holding usage matches, so a second claim gets None
+    assert args[0] == {"invoice_id": "INV-1", "matching.po_usage": {"$type": "object"}}
+    assert args[1] == {"$set": {"matching.po_usage": None}}
+    assert kwargs["return_document"] == ReturnDocument.BEFORE
+
+@pytest.mark.asyncio
+async def test_line_item_bands_filters_tenant_and_dates_in_the_query():
+    cursor = MagicMock()
+    cursor.skip.return_value.limit.return_value.to_list = AsyncMock(return_value=[
+        {"invoice_id": "INV-1", "data": {"invoice_date": datetime(2024, 1, 2)}, "line_item_minhash": [1, 2]}
+    ])
+    collection = MagicMock()
+    collection.find.return_value = cursor
+    repo = InvoiceRepository(collection, Invoice)
+
+    candidates = await repo.get_by_line_item_bands("acme", "Acme", [7], datetime(2024, 1, 1), datetime(2024, 1, 4), "INV-2")
+
+    query, projection = collection.find.call_args[0]
+    assert query["company_id"] == "acme"
+    assert query["data.invoice_date"] == {"$gte": datetime(2024, 1, 1), "$lte": datetime(2024, 1, 4)}
+    assert projection == {"invoice_id": 1, "data.invoice_date": 1, "line_item_minhash": 1}
+    assert candidates[0].line_item_minhash == [1, 2]
@@ -5,10 +5,11 @@ import pytest
 from unittest.mock import AsyncMock, MagicMock, patch
 from datetime import datetime
 from app.agents.matching import MatchingAgent
-from app.models.invoice import InvoiceStatus, InvoiceData, LineItem
+from app.models.invoice import InvoiceStatus, InvoiceData, LineItem, MatchingResults, POLineUsage
 from app.models.purchase_order import PurchaseOrder, POStatus
-from app.models.grn import GoodsReceiptNote, GRNStatus
-from app.models.config import MatchingTolerances
+from app.models.grn import ReceivedLine
+from app.models.config import CompanyConfig, ValidationRules
+from app.models.policy import DEFAULT_POLICY, compile_policy
 
 @pytest.mark.asyncio
 async def test_matching_success():
@@ -29,13 +30,12 @@ async def test_matching_success():
             ]
         )
         mock_invoice.data = data
+        mock_invoice.matching = None
         mock_db.invoices.get_by_field = AsyncMock(return_value=mock_invoice)
-        mock_db.invoices.update = AsyncMock()
+        mock_db.invoices.transition = AsyncMock()
         
         # Mock Config (Tolerances)
-        mock_config = MagicMock()
-        mock_config.matching_tolerances = MatchingTolerances()
-        mock_db.config.get_by_field = AsyncMock(return_value=mock_config)
+        mock_db.config.get_policy = AsyncMock(return_value=DEFAULT_POLICY)
         
         # Mock PO
         po_doc = {
@@ -52,23 +52,11 @@ async def test_matching_success():
                 {"item_id": 1, "description": "Widget", "quantity": 10, "unit_price": 10.0, "line_total": 100.0}
             ]
         }
-        mock_db.db.__getitem__.return_value.find_one = AsyncMock(return_value=po_doc)
         
-        # Mock GRN (Perfect match)
-        grn_doc = {
-            "grn_number": "GRN-1",
-            "po_number": "PO-100",
-            "company_id": "acme",
-            "vendor_id": "ven_1",
-            "received_by": "User",
-            "status": "RECEIVED",
-            "line_items": [
-                {"item_id": 1, "description": "Widget", "quantity": 10, "unit_price": 0.0, "line_total": 0.0}
-            ]
-        }
-        mock_cursor = AsyncMock()
-        mock_cursor.to_list.return_value = [grn_doc]
-        mock_db.db.__getitem__.return_value.find.return_value = mock_cursor
+        # Mock GRN totals (Perfect match)
+        received = [ReceivedLine(description="Widget", quantity=10, grn_count=1)]
+        mock_db.purchase_orders.get_with_receipts = AsyncMock(return_value=(PurchaseOrder(**po_doc), received))
+        mock_db.purchase_orders.record_usage = AsyncMock()
         
         agent = MatchingAgent()
         state = {"invoice_id": "inv_match", "company_id": "acme"}
@@ -87,24 +75,20 @@ async def test_matching_variance_price():
             line_items=[LineItem(item_id=1, description="Widget", quantity=10, unit_price=12.0, line_total=120.0)]
         )
         mock_invoice.data = data
+        mock_invoice.matching = None
         mock_db.invoices.get_by_field = AsyncMock(return_value=mock_invoice)
-        mock_db.invoices.update = AsyncMock()
-        mock_db.config.get_by_field = AsyncMock(return_value=MagicMock(matching_tolerances=MatchingTolerances()))
+        mock_db.invoices.transition = AsyncMock()
+        mock_db.config.get_policy = AsyncMock(return_value=DEFAULT_POLICY)
         
         po_doc = {
             "po_number": "PO-100", "company_id": "acme", "vendor_id": "ven_1", "vendor_name": "ABC", "requester_email": "a@a.com", "department": "IT", "po_date": datetime.now(),
             "subtotal": 100.0, "vat_amount": 0.0, "total": 100.0, "status": "ISSUED",
             "line_items": [{"item_id": 1, "description": "Widget", "quantity": 10, "unit_price": 10.0, "line_total": 100.0}]
         }
-        mock_db.db.__getitem__.return_value.find_one = AsyncMock(return_value=po_doc)
         
-        grn_doc = {
-            "grn_number": "GRN-1", "po_number": "PO-100", "company_id": "acme", "vendor_id": "ven_1", "received_by": "User", "status": "RECEIVED",
-            "line_items": [{"item_id": 1, "description": "Widget", "quantity": 10, "unit_price": 0.0, "line_total": 0.0}]
-        }
-        mock_cursor = AsyncMock()
-        mock_cursor.to_list.return_value = [grn_doc]
-        mock_db.db.__getitem__.return_value.find.return_value = mock_cursor
+        received = [ReceivedLine(description="Widget", quantity=10, grn_count=1)]
+        mock_db.purchase_orders.get_with_receipts = AsyncMock(return_value=(PurchaseOrder(**po_doc), received))
+        mock_db.purchase_orders.record_usage = AsyncMock()
         
         agent = MatchingAgent()
         state = {"invoice_id": "inv_var", "company_id": "acme"}
@@ -121,12 +105,13 @@ async def test_matching_missing_po_ref():
         # High value, so PO required
         data = InvoiceData(vendor_name="ABC", invoice_number="123", invoice_date=datetime.now(), total=100000.0, subtotal=100000.0, po_reference=None)
         mock_invoice.data = data
+        mock_invoice.matching = None
         mock_db.invoices.get_by_field = AsyncMock(return_value=mock_invoice)
-        mock_db.invoices.update = AsyncMock()
+        mock_db.invoices.transition = AsyncMock()
         
-        rule_config = MagicMock()
-        rule_config.validation_rules.require_po_above = 50000.0
-        mock_db.config.get_by_field = AsyncMock(return_value=rule_config)
+        rule_config = CompanyConfig(company_id="acme", company_name="Acme",
+                                    validation_rules=ValidationRules(require_po_above=50000.0))
+        mock_db.config.get_policy = AsyncMock(return_value=compile_policy(rule_config))
         
         agent = MatchingAgent()
         state = {"invoice_id": "inv_no_po", "company_id": "acme"}
@@ -134,3 +119,40 @@ async def test_matching_missing_po_ref():
         
         assert result["current_state"] == InvoiceStatus.AWAITING_APPROVAL
         assert result["matching_results"]["match_status"] == "NON_PO_APPROVAL_NEEDED"
+
+@pytest.mark.asyncio
+async def test_matching_po_ledger_balance_and_rematch():
+    with patch("app.agents.matching.db") as mock_db:
+        # 6 more widgets against a PO that earlier invoices have already drawn 80.00 of
+        mock_invoice = MagicMock()
+        mock_invoice.invoice_id = "inv_ledger"
+        mock_invoice.company_id = "acme"
+        mock_invoice.data = InvoiceData(
+            vendor_name="ABC", invoice_number="124", invoice_date=datetime.now(), total=60.0, subtotal=60.0,
+            po_reference="PO-100",
+            line_items=[LineItem(item_id=1, description="Widget", quantity=6, unit_price=10.0, line_total=60.0)]
+        )
+        previous = MatchingResults(has_po=True, po_number="PO-100", po_usage={"0": POLineUsage(quantity=6, amount=60.0)})
+        mock_invoice.matching = previous
+        mock_db.invoices.get_by_field = AsyncMock(return_value=mock_invoice)
+        mock_db.invoices.transition = AsyncMock()
+        mock_db.invoices.claim_po_usage = AsyncMock(return_value=previous)
+        mock_db.config.get_policy = AsyncMock(return_value=DEFAULT_POLICY)
+
+        po = PurchaseOrder(
+            po_number="PO-100", company_id="acme", vendor_id="ven_1", vendor_name="ABC", requester_email="a@a.com",
+            department="IT", po_date=datetime.now(), subtotal=100.0, vat_amount=0.0, total=100.0, invoiced_amount=80.0,
+            line_items=[LineItem(item_id=1, description="Widget", quantity=10, unit_price=10.0, line_total=100.0)]
+        )
+        received = [ReceivedLine(description="Widget", quantity=10, grn_count=1)]
+        mock_db.purchase_orders.get_with_receipts = AsyncMock(return_value=(po, received))
+        mock_db.purchase_orders.record_usage = AsyncMock()
+
+        result = await MatchingAgent().matching_node({"invoice_id": "inv_ledger", "company_id": "acme"})
+
+        # The earlier match of this invoice is released, then its new usage recorded
+        assert mock_db.purchase_orders.record_usage.await_args_list[0].args == ("PO-100", "acme", previous.po_usage)
+        assert mock_db.purchase_orders.record_usage.await_args_list[0].kwargs == {"sign": -1}
+        assert mock_db.purchase_orders.record_usage.await_args_list[1].args[2] == {"0": POLineUsage(quantity=6, amount=60.0)}
+        assert result["matching_results"]["match_status"] == "VARIANCE"
+        assert "Exceeds remaining PO balance: 60.00 against 20.00" in result["matching_results"]["details"]
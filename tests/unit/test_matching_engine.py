@@ -0,0 +1,75 @@
+import sys
+import os
+sys.path.append(os.getcwd())
+from datetime import datetime
+from app.models.invoice import InvoiceData, LineItem, POLineUsage
+from app.models.purchase_order import PurchaseOrder
+from app.models.grn import GoodsReceiptNote
+from app.models.policy import DEFAULT_POLICY
+from app.tools.matching_engine import POIndex, grn_lines, normalise_description, three_way_match
+
+def _line(description, quantity, unit_price, code=None):
+    return LineItem(item_id=1, description=description, product_code=code, quantity=quantity,
+                    unit_price=unit_price, line_total=round(quantity * unit_price, 2))
+
+def _po(*lines):
+    return PurchaseOrder(po_number="PO-1", company_id="acme", vendor_id="v1", vendor_name="ABC",
+                         requester_email="a@a.com", department="IT", po_date=datetime.now(),
+                         subtotal=0, vat_amount=0, total=0, line_items=list(lines))
+
+def _grn(number, *lines):
+    return GoodsReceiptNote(grn_number=number, po_number="PO-1", company_id="acme", vendor_id="v1",
+                            received_by="warehouse", line_items=list(lines))
+
+def _invoice(*lines):
+    subtotal = sum(line.line_total for line in lines)
+    return InvoiceData(vendor_name="ABC", invoice_number="1", invoice_date=datetime.now(),
+                       subtotal=subtotal, total=subtotal, line_items=list(lines))
+
+def test_normalise_description():
+    assert normalise_description("Widget, Blue (x10)") == "widget blue x10"
+    assert normalise_description("  WIDGET   blue x10 ") == "widget blue x10"
+
+def test_lines_matched_by_code_then_description_and_grns_aggregated():
+    po = _po(_line("Blue widget", 10, 5.0, code="W-1"), _line("Bolts M6", 100, 0.1))
+    grns = [_grn("G1", _line("widget (blue)", 4, 5.0, code="w-1"), _line("BOLTS, M6", 60, 0.1)),
+            _grn("G2", _line("Blue widget", 6, 5.0, code="W-1"), _line("bolts m6", 40, 0.1))]
+    index = POIndex(po.line_items, grn_lines(grns))
+
+    # Code wins over a differing description; normalised descriptions match otherwise
+    assert index.po_row(_line("Widgets - blue", 1, 5.0, code=" w-1 ")) == 0
+    assert index.po_row(_line("Bolts m6.", 1, 0.1)) == 1
+    assert index.po_row(_line("Nuts", 1, 0.1)) == -1
+    assert index.received(_line("anything", 1, 5.0, code="W-1")) == 10
+    assert index.received(_line("Bolts - M6", 1, 0.1)) == 100
+
+    results = three_way_match(_invoice(_line("Widgets - blue", 10, 5.0, code="W-1"), _line("Bolts M6", 100, 0.1)),
+                              po, grn_lines(grns), DEFAULT_POLICY)
+    assert results.match_status == "MATCHED"
+    assert results.price_variance == 0.0 and results.quantity_variance == 0.0
+
+def test_variances_are_filled():
+    po = _po(_line("Widget", 10, 10.0), _line("Gadget", 5, 20.0))
+    grns = [_grn("G1", _line("Widget", 8, 10.0), _line("Gadget", 5, 20.0))]
+    invoice = _invoice(_line("Widget", 10, 10.0), _line("Gadget", 5, 22.0), _line("Freight", 1, 15.0))
+
+    results = three_way_match(invoice, po, grn_lines(grns), DEFAULT_POLICY)
+
+    assert results.match_status == "VARIANCE"
+    assert not results.auto_approvable
+    assert results.price_variance == 10.0 # 5 x £2 over the PO price; Freight is not on the PO
+    assert results.quantity_variance == 3.0 # 2 Widgets and 1 Freight never received
+    # Drawn from each PO line at invoiced prices, for the PO ledger
+    assert results.po_usage == {"0": POLineUsage(quantity=10, amount=100.0), "1": POLineUsage(quantity=5, amount=110.0)}
+    assert results.details == ("Qty variance on Widget: Invoiced 10.0, Received 8.0; "
+                               "Price variance on Gadget: 10.00%; "
+                               "Qty variance on Freight: Invoiced 1.0, Received 0.0")
+
+def test_quantity_tolerance_applies():
+    po = _po(_line("Widget", 100, 1.0))
+    grns = [_grn("G1", _line("Widget", 98, 1.0))]
+    results = three_way_match(_invoice(_line("Widget", 100, 1.0)), po, grn_lines(grns), DEFAULT_POLICY)
+
+    # 2% short is inside the default 5% tolerance, but still reported as variance
+    assert results.match_status == "MATCHED"
+    assert results.quantity_variance == 2.0
@@ -0,0 +1,35 @@
+from app.models.invoice import LineItem
+from app.tools.minhash import (
+    BANDS, NUM_PERM, MinHashLSH, estimated_similarity, line_item_shingles, line_item_signature, lsh_bands
+)
+
+def _items(*descriptions):
+    return [LineItem(item_id=i, description=d, quantity=1, unit_price=1.0, line_total=1.0) for i, d in enumerate(descriptions)]
+
+def test_signature_ignores_line_order_and_formatting():
+    a = line_item_signature(_items("Office Chairs", "A4 Paper, 5 reams"))
+    b = line_item_signature(_items("a4 paper 5 reams", "OFFICE  CHAIRS"))
+
+    assert len(a) == NUM_PERM
+    assert a == b
+    assert line_item_signature([]) is None
+    assert line_item_shingles(["Pen"]) == {"pen"}
+
+def test_similarity_tracks_overlap():
+    base = line_item_signature(_items("Office chairs ergonomic", "Standing desk oak", "Monitor arm dual"))
+    ocr = line_item_signature(_items("0ffice chairs ergonornic", "Standing desk oak", "Monitor arm dual"))
+    other = line_item_signature(_items("Window cleaning monthly", "Coffee beans 1kg"))
+
+    assert estimated_similarity(base, ocr) > 0.7
+    assert estimated_similarity(base, other) < 0.2
+
+def test_lsh_finds_similar_signatures_only():
+    index = MinHashLSH()
+    index.add("INV-1", line_item_signature(_items("Toner cartridge black", "Printer maintenance visit")))
+    index.add("INV-2", line_item_signature(_items("Window cleaning monthly")))
+
+    bands = lsh_bands(line_item_signature(_items("Printer maintenance visit", "Toner cartridge black")))
+    assert len(bands) == BANDS and all(-2**63 <= key < 2**63 for key in bands)
+
+    matches = index.query(line_item_signature(_items("Printer maintenance visit", "Toner cartridge blaek")))
+    assert [key for key, _ in matches] == ["INV-1"]
@@ -0,0 +1,32 @@
+from datetime import datetime
+from bson import ObjectId
+from app.models.invoice import Invoice, InvoiceData, InvoiceStatus, LineItem, MatchingResults, POLineUsage, ValidationResults
+
+def _doc():
+    invoice = Invoice(
+        invoice_id="INV-1", company_id="acme", status=InvoiceStatus.MATCHING,
+        data=InvoiceData(
+            vendor_name="Acme", invoice_number="N-1", invoice_date=datetime(2024, 1, 1),
+            line_items=[LineItem(item_id=1, description="Widget", quantity=2, unit_price=5.0, line_total=10.0)],
+            total=12.0
+        ),
+        validation=ValidationResults(flags=["HIGH_VALUE"])
+    )
+    doc = invoice.to_mongo()
+    doc["_id"] = ObjectId()
+    return doc
+
+def test_from_mongo_builds_nested_models_and_keeps_the_document():
+    doc = _doc()
+    doc["matching"] = MatchingResults(
+        has_po=True, po_number="PO-1", po_usage={"0": POLineUsage(quantity=2, amount=10.0), "3": POLineUsage(quantity=1, amount=2.5)}
+    ).to_mongo()
+
+    invoice = Invoice.from_mongo(doc)
+
+    assert invoice.status is InvoiceStatus.MATCHING
+    assert isinstance(invoice.data.line_items[0], LineItem)
+    assert isinstance(invoice.matching.po_usage["3"], POLineUsage)
+    assert invoice.id == str(doc["_id"])
+    # The raw document is not mutated
+    assert "_id" in doc
@@ -17,7 +17,7 @@ async def test_get_system_health():
         mock_cursor_2 = MagicMock()
         mock_cursor_2.to_list = AsyncMock(return_value=mock_24h_res)
         
-        mock_db.invoices.collection.aggregate.side_effect = [mock_cursor_1, mock_cursor_2]
+        mock_db.reporting.invoices.collection.aggregate.side_effect = [mock_cursor_1, mock_cursor_2]
         
         health = await metrics_engine.get_system_health("acme_corp")
         
@@ -34,7 +34,7 @@ async def test_get_agent_performance():
         ]
         mock_cursor = MagicMock()
         mock_cursor.to_list = AsyncMock(return_value=mock_res)
-        mock_db.audit.collection.aggregate.return_value = mock_cursor
+        mock_db.reporting.audit.collection.aggregate.return_value = mock_cursor
         
         perf = await metrics_engine.get_agent_performance("extraction_agent", "acme_corp")
         
@@ -50,7 +50,7 @@ async def test_get_sla_compliance():
         ]
         mock_cursor = MagicMock()
         mock_cursor.to_list = AsyncMock(return_value=mock_res)
-        mock_db.invoices.collection.aggregate.return_value = mock_cursor
+        mock_db.reporting.invoices.collection.aggregate.return_value = mock_cursor
         
         sla = await metrics_engine.get_sla_compliance("acme_corp")
         
@@ -39,7 +39,7 @@ async def test_sod_violation(permissions):
                 "action": {"action_type": "USER_ACTION", "details": "Uploaded invoice"}
             }
         ])
-        mock_db.db["audit_events"].find.return_value = mock_audit_cursor
+        mock_db.audit.collection.find.return_value = mock_audit_cursor
         
         # 1. Creator attempts to Approve
         invoice_id = "inv_123"
@@ -0,0 +1,63 @@
+import random
+import pytest
+from app.models.config import ApprovalMatrix, ApprovalRule, CompanyConfig, GLMapping
+from app.models.policy import DEFAULT_POLICY, compile_policy
+
+def _linear_approvers(amount, rules):
+    """The original per-invoice scan over every rule, as the reference."""
+    required = set()
+    for rule in rules:
+        if amount >= rule.amount_min and (rule.amount_max is None or amount <= rule.amount_max):
+            if rule.specific_approvers:
+                required.update(rule.specific_approvers)
+            elif rule.required_role:
+                required.add(f"role:{rule.required_role}")
+    return sorted(required)
+
+def _config(rules=(), **kwargs):
+    return CompanyConfig(company_id="acme", company_name="Acme", approval_matrix=ApprovalMatrix(rules=list(rules)), **kwargs)
+
+def test_approval_index_matches_linear_scan():
+    rng = random.Random(7)
+    rules = []
+    for i in range(300):
+        low = rng.choice([0, 100, 1000, 5000]) + rng.randint(0, 20) * 50
+        high = None if rng.random() < 0.1 else low + rng.randint(0, 40) * 50
+        approvers = [f"user{rng.randint(0, 9)}"] if rng.random() < 0.5 else []
+        rules.append(ApprovalRule(rule_id=f"r{i}", amount_min=low, amount_max=high,
+                                  specific_approvers=approvers, required_role=rng.choice([None, "cfo", "manager"])))
+    policy = compile_policy(_config(rules))
+
+    # Every bound, both sides of it, and random amounts in between
+    amounts = {-1.0, 0.0, 1e9}
+    for rule in rules:
+        for bound in (rule.amount_min, rule.amount_max):
+            if bound is not None:
+                amounts.update({bound - 0.01, bound, bound + 0.01})
+    amounts.update(rng.uniform(0, 10000) for _ in range(500))
+
+    for amount in amounts:
+        assert policy.approvers_for(amount) == _linear_approvers(amount, rules), amount
+
+def test_bounds_are_inclusive_and_open_ended():
+    policy = compile_policy(_config([
+        ApprovalRule(rule_id="r1", amount_min=0, amount_max=1000, specific_approvers=["dept_head"]),
+        ApprovalRule(rule_id="r2", amount_min=1000, required_role="cfo"),
+    ]))
+
+    assert policy.approvers_for(-5) == []
+    assert policy.approvers_for(1000) == ["dept_head", "role:cfo"]
+    assert policy.approvers_for(1000.01) == ["role:cfo"]
+    assert policy.approvers_for(10**9) == ["role:cfo"]
+
+def test_gl_lookup_and_immutability():
+    policy = compile_policy(_config(gl_mapping=GLMapping(category_map={"Rent": "7200"}), version=3))
+
+    assert policy.version == 3
+    assert policy.gl_code_for("Rent") == "7200"
+    assert policy.gl_code_for("Unknown") == policy.gl_code_for(None) == "7400"
+    with pytest.raises(AttributeError):
+        policy.require_po_above = 10
+    with pytest.raises(TypeError):
+        policy.gl_by_category["Rent"] = "0000"
+    assert DEFAULT_POLICY.approvers_for(100) == []
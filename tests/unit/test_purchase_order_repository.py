@@ -0,0 +1,113 @@
+import pytest
+from datetime import datetime
+from unittest.mock import AsyncMock, MagicMock
+from app.repositories.purchase_order import PurchaseOrderRepository
+from app.models.purchase_order import PurchaseOrder
+from app.models.grn import GoodsReceiptNote
+from app.models.invoice import LineItem, POLineUsage
+
+PO_DOC = {
+    "_id": "65f000000000000000000001", "po_number": "PO-1", "company_id": "acme", "vendor_id": "v1",
+    "vendor_name": "ABC", "requester_email": "a@a.com", "department": "IT", "po_date": datetime(2024, 1, 1),
+    "subtotal": 100.0, "vat_amount": 0.0, "total": 100.0,
+    "line_items": [{"item_id": 1, "description": "Widget", "quantity": 10, "unit_price": 10.0, "line_total": 100.0}]
+}
+
+def _repo(docs):
+    collection = MagicMock()
+    collection.aggregate.return_value.to_list = AsyncMock(return_value=docs)
+    return PurchaseOrderRepository(collection, PurchaseOrder), collection
+
+@pytest.mark.asyncio
+async def test_get_with_receipts_one_pipeline():
+    repo, collection = _repo([{**PO_DOC, "received": [
+        {"description": "Widget", "quantity": 10.0, "grn_count": 3},
+        {"product_code": "X-9", "description": "Spare part", "quantity": 1.0, "grn_count": 1},
+    ]}])
+
+    po, received = await repo.get_with_receipts("PO-1", "acme")
+
+    assert po.po_number == "PO-1" and not hasattr(po, "received")
+    assert [(line.product_code, line.description, line.quantity, line.grn_count) for line in received] == [
+        (None, "Widget", 10.0, 3), ("X-9", "Spare part", 1.0, 1)
+    ]
+    collection.aggregate.assert_called_once()
+    pipeline = collection.aggregate.call_args[0][0]
+    assert pipeline[0] == {"$match": {"po_number": "PO-1", "company_id": "acme"}}
+    lookup = pipeline[-1]["$lookup"]
+    assert lookup["from"] == "goods_receipt_notes"
+    assert lookup["pipeline"][0] == {"$match": {"company_id": "acme"}}
+    # Received lines are summed server-side, with no cap on the number of GRNs
+    assert "$group" in lookup["pipeline"][2]
+    assert not any("$limit" in stage for stage in lookup["pipeline"])
+
+@pytest.mark.asyncio
+async def test_get_with_receipts_missing_po():
+    repo, _ = _repo([])
+    assert await repo.get_with_receipts("PO-404", "acme") is None
+
+@pytest.mark.asyncio
+async def test_record_usage_is_one_inc():
+    repo, collection = _repo([])
+    collection.update_one = AsyncMock()
+
+    await repo.record_usage("PO-1", "acme", {"0": POLineUsage(quantity=4, amount=40.0),
+                                              "2": POLineUsage(quantity=1, amount=2.5)}, sign=-1)
+
+    filter, update = collection.update_one.call_args[0]
+    assert filter == {"po_number": "PO-1", "company_id": "acme"}
+    assert update["$inc"] == {
+        "invoiced_amount": -42.5,
+        "ledger.0.invoiced_quantity": -4, "ledger.0.invoiced_amount": -40.0,
+        "ledger.2.invoiced_quantity": -1, "ledger.2.invoiced_amount": -2.5,
+    }
+
+class _Cursor:
+    def __init__(self, docs):
+        self._docs = iter(docs)
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        try:
+            return next(self._docs)
+        except StopIteration:
+            raise StopAsyncIteration
+
+@pytest.mark.asyncio
+async def test_post_grn_draws_down_po_lines():
+    repo, collection = _repo([])
+    collection.find.return_value = _Cursor([{"po_number": "PO-1", "company_id": "acme", "line_items": PO_DOC["line_items"]}])
+    collection.bulk_write = AsyncMock(return_value=MagicMock(bulk_api_result={"nMatched": 1, "nModified": 1}))
+    grns = collection.database.__getitem__.return_value
+    grns.insert_one = AsyncMock()
+    grns.update_many = AsyncMock()
+    grn = GoodsReceiptNote(grn_number="G1", po_number="PO-1", company_id="acme", vendor_id="v1", received_by="wh",
+                           line_items=[LineItem(item_id=1, description="widget", quantity=4, unit_price=0, line_total=0),
+                                       LineItem(item_id=2, description="Pallet", quantity=1, unit_price=0, line_total=0),
+                                       LineItem(item_id=3, description="Widget", quantity=1, unit_price=0, line_total=0)])
+    other_tenant = grn.model_copy(update={"grn_number": "G2", "company_id": "globex"})
+
+    await repo.post_grn(grn)
+    assert await repo.record_receipts([other_tenant]) == [other_tenant] # No such PO
+
+    grns.insert_one.assert_awaited_once()
+    assert collection.find.call_args[0][0] == {"po_number": {"$in": ["PO-1"]}}
+    collection.bulk_write.assert_awaited_once()
+    operation = collection.bulk_write.call_args[0][0][0]
+    # Valued at the PO price; the pallet is not on the PO. Skipped if the PO already counted G1.
+    assert operation._filter == {"po_number": "PO-1", "company_id": "acme", "receipted_grns": {"$ne": "G1"}}
+    assert operation._doc["$inc"] == {"ledger.0.received_quantity": 5, "ledger.0.received_amount": 50.0, "received_amount": 50.0}
+    assert operation._doc["$addToSet"] == {"receipted_grns": "G1"}
+    grns.update_many.assert_awaited_once_with({"$or": [{"grn_number": {"$in": ["G1"]}, "company_id": "acme"}]},
+                                              {"$set": {"ledger_applied": True}})
+
+@pytest.mark.asyncio
+async def test_apply_pending_receipts_reads_unapplied_grns():
+    repo, collection = _repo([])
+    grns = collection.database.__getitem__.return_value
+    grns.find.return_value = _Cursor([])
+
+    assert await repo.apply_pending_receipts({"po_number": {"$in": ["PO-1"]}}) == []
+    assert grns.find.call_args[0][0] == {"po_number": {"$in": ["PO-1"]}, "ledger_applied": {"$ne": True}}
@@ -6,7 +6,7 @@ from unittest.mock import AsyncMock, MagicMock, patch
 from datetime import datetime
 from app.agents.recording import RecordingAgent
 from app.models.invoice import InvoiceStatus, InvoiceData, LineItem
-from app.models.config import GLMapping
+from app.models.policy import DEFAULT_POLICY
 from app.models.accounting import EntryType
 
 @pytest.mark.asyncio
@@ -34,13 +34,12 @@ async def test_journal_entry_creation():
         mock_db.invoices.get_by_field = AsyncMock(return_value=mock_invoice)
         
         # Mock Config
-        mock_config = MagicMock()
-        mock_config.gl_mapping = GLMapping() # Use defaults (7400 for Office Supplies)
-        mock_db.config.get_by_field = AsyncMock(return_value=mock_config)
+        # Default GL mapping (7400 for Office Supplies)
+        mock_db.config.get_policy = AsyncMock(return_value=DEFAULT_POLICY)
         
         mock_db.db["journal_entries"].insert_one = AsyncMock()
         mock_db.db["vendors"].update_one = AsyncMock()
-        mock_db.invoices.update = AsyncMock()
+        mock_db.invoices.transition = AsyncMock()
         
         agent = RecordingAgent()
         state = {"invoice_id": "inv_rec", "company_id": "acme"}
@@ -0,0 +1,175 @@
+import sys
+import os
+sys.path.append(os.getcwd())
+import asyncio
+import pytest
+from datetime import datetime, timedelta
+from unittest.mock import AsyncMock, MagicMock, patch
+from app.agents.sla_timers import APPROVAL_BREACH, SLATimer, SLATimerWheel
+from app.models.invoice import InvoiceStatus
+
+NOW = datetime(2024, 6, 12, 9, 30)
+
+@pytest.fixture
+def timer_db():
+    with patch("app.agents.sla_timers.db") as mock_db, \
+         patch("app.agents.sla_timers.sla_monitor") as mock_monitor:
+        mock_db.db.sla_timers.bulk_write = AsyncMock()
+        mock_db.db.sla_timers.delete_many = AsyncMock()
+        mock_db.invoices.collection.find_one = AsyncMock()
+        mock_monitor.escalate_invoice = AsyncMock()
+        yield mock_db, mock_monitor
+
+@pytest.mark.asyncio
+async def test_schedule_payment_persists_upcoming_thresholds(timer_db):
+    mock_db, _ = timer_db
+    wheel = SLATimerWheel()
+    due = NOW + timedelta(days=5)
+
+    await wheel.schedule_payment("INV-1", due, now=NOW)
+
+    # WARNING (7 days out) is already crossed and fires at once; URGENT and CRITICAL wait
+    operations = mock_db.db.sla_timers.bulk_write.call_args[0][0]
+    assert len(operations) == 3 and len(wheel) == 3
+    assert wheel.next_fire_at() == due - timedelta(days=7)
+
+    # Due tomorrow: of the three thresholds crossed only CRITICAL is kept
+    await wheel.schedule_payment("INV-2", NOW + timedelta(hours=12), now=NOW)
+    assert [t.kind for t in wheel._timers.values() if t.invoice_id == "INV-2"] == ["CRITICAL"]
+
+@pytest.mark.asyncio
+async def test_fire_due_escalates_only_crossed_thresholds(timer_db):
+    mock_db, mock_monitor = timer_db
+    wheel = SLATimerWheel()
+    due = NOW + timedelta(days=2, hours=12)
+    await wheel.schedule_payment("INV-1", due, now=NOW - timedelta(days=30))
+    mock_db.invoices.collection.find_one.return_value = {
+        "status": InvoiceStatus.MATCHING, "urgency": "NORMAL", "data": {"due_date": due}
+    }
+
+    # Down for a week: WARNING and URGENT are both due, and one escalation to URGENT goes out
+    assert await wheel.fire_due(NOW) == 1
+    mock_monitor.escalate_invoice.assert_awaited_once()
+    invoice_id, reason, urgency = mock_monitor.escalate_invoice.call_args[0]
+    assert (invoice_id, urgency) == ("INV-1", "URGENT")
+    deleted = mock_db.db.sla_timers.delete_many.call_args[0][0]["$or"]
+    assert {d["kind"] for d in deleted} == {"WARNING", "URGENT"}
+    assert [t.kind for t in wheel._timers.values()] == ["CRITICAL"]
+
+    # Nothing else is due until CRITICAL
+    mock_monitor.escalate_invoice.reset_mock()
+    assert await wheel.fire_due(NOW + timedelta(hours=1)) == 0
+    mock_monitor.escalate_invoice.assert_not_awaited()
+
+@pytest.mark.asyncio
+async def test_stale_timers_do_not_fire(timer_db):
+    mock_db, mock_monitor = timer_db
+    wheel = SLATimerWheel()
+    await wheel.schedule_payment("INV-1", NOW + timedelta(hours=12), now=NOW - timedelta(hours=1))
+    await wheel.schedule_approval("INV-2", NOW - timedelta(hours=49))
+
+    async def find_one(query, projection):
+        if query["invoice_id"] == "INV-1":
+            return {"status": InvoiceStatus.PAID, "urgency": "NORMAL", "data": {"due_date": NOW + timedelta(hours=12)}}
+        # Approved and sent back for approval since; its clock restarted
+        return {"status": InvoiceStatus.AWAITING_APPROVAL, "sla_status": "COMPLIANT",
+                "status_changed_at": NOW - timedelta(hours=2), "updated_at": NOW - timedelta(hours=2)}
+    mock_db.invoices.collection.find_one.side_effect = find_one
+
+    assert await wheel.fire_due(NOW) == 0
+    mock_monitor.escalate_invoice.assert_not_awaited()
+    # The current visit keeps a timer of its own
+    assert list(wheel._timers.values()) == [SLATimer(NOW + timedelta(hours=46), "INV-2", APPROVAL_BREACH)]
+
+@pytest.mark.asyncio
+async def test_approval_breach_sets_sla_status(timer_db):
+    mock_db, mock_monitor = timer_db
+    wheel = SLATimerWheel()
+    await wheel.schedule_approval("INV-1", NOW - timedelta(hours=50))
+    mock_db.invoices.collection.find_one.return_value = {
+        "status": InvoiceStatus.AWAITING_APPROVAL, "sla_status": "AT_RISK", "updated_at": NOW - timedelta(hours=50)
+    }
+
+    assert await wheel.fire_due(NOW) == 1
+    args = mock_monitor.escalate_invoice.call_args[0]
+    assert args[0] == "INV-1" and args[2] == "CRITICAL" and args[3] == {"sla_status": "BREACHED"}
+
+@pytest.mark.asyncio
+async def test_approval_clock_ignores_other_writes(timer_db):
+    mock_db, mock_monitor = timer_db
+    wheel = SLATimerWheel()
+    await wheel.schedule_approval("INV-1", NOW - timedelta(hours=48))
+    # Waiting since the timer was set, but written to an hour ago without a status change
+    mock_db.invoices.collection.find_one.return_value = {
+        "status": InvoiceStatus.AWAITING_APPROVAL, "sla_status": "AT_RISK",
+        "status_changed_at": NOW - timedelta(hours=48), "updated_at": NOW - timedelta(hours=1)
+    }
+
+    assert await wheel.fire_due(NOW) == 1
+    assert "48.0h / 48h" in mock_monitor.escalate_invoice.call_args[0][1]
+
+@pytest.mark.asyncio
+async def test_rescheduling_replaces_the_timer(timer_db):
+    wheel = SLATimerWheel()
+    await wheel.schedule_approval("INV-1", NOW - timedelta(hours=50))
+    await wheel.schedule_approval("INV-1", NOW)
+
+    assert len(wheel) == 1
+    assert wheel.next_fire_at() == NOW + timedelta(hours=48)
+    assert await wheel.fire_due(NOW) == 0
+
+@pytest.mark.asyncio
+async def test_load_restores_persisted_timers(timer_db):
+    mock_db, _ = timer_db
+    cursor = MagicMock()
+    cursor.__aiter__.return_value = [
+        {"invoice_id": "INV-1", "kind": "CRITICAL", "fire_at": NOW},
+        {"invoice_id": "INV-2", "kind": APPROVAL_BREACH, "fire_at": NOW - timedelta(hours=1)},
+    ]
+    mock_db.db.sla_timers.find.return_value = cursor
+    wheel = SLATimerWheel()
+
+    assert await wheel.load() == 2
+    assert wheel.next_fire_at() == NOW - timedelta(hours=1)
+
+@pytest.mark.asyncio
+async def test_only_the_runner_holds_timers(timer_db):
+    mock_db, _ = timer_db
+    worker = SLATimerWheel(hold=False)
+    await worker.schedule_approval("INV-1", NOW)
+    # Persisted for the runner, not kept in memory
+    mock_db.db.sla_timers.bulk_write.assert_awaited_once()
+    assert len(worker) == 0
+
+    cursor = MagicMock()
+    cursor.__aiter__.return_value = [{"invoice_id": "INV-1", "kind": APPROVAL_BREACH, "fire_at": NOW + timedelta(hours=48)}]
+    mock_db.db.sla_timers.find.return_value = cursor
+    runner = SLATimerWheel(poll_seconds=60)
+    assert await runner.poll(NOW + timedelta(hours=48)) == 1
+    assert mock_db.db.sla_timers.find.call_args[0][0] == {"fire_at": {"$lte": NOW + timedelta(hours=48, seconds=60)}}
+    # Timers already held are not pushed twice
+    assert await runner.poll(NOW + timedelta(hours=48)) == 0
+    assert runner.next_fire_at() == NOW + timedelta(hours=48)
+
+@pytest.mark.asyncio
+async def test_run_fires_at_the_crossing(timer_db):
+    mock_db, mock_monitor = timer_db
+    wheel = SLATimerWheel()
+    task = asyncio.create_task(wheel.run())
+    try:
+        # Scheduled while the wheel sleeps with nothing to do
+        await asyncio.sleep(0.01)
+        fire_at = datetime.utcnow() + timedelta(milliseconds=50)
+        mock_db.invoices.collection.find_one.return_value = {
+            "status": InvoiceStatus.AWAITING_APPROVAL, "sla_status": "COMPLIANT",
+            "updated_at": fire_at - timedelta(hours=48)
+        }
+        await wheel.schedule_approval("INV-1", fire_at - timedelta(hours=48))
+        await asyncio.sleep(0.01)
+        mock_monitor.escalate_invoice.assert_not_awaited()
+        await asyncio.sleep(0.1)
+        mock_monitor.escalate_invoice.assert_awaited_once()
+    finally:
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
@@ -6,7 +6,7 @@ from unittest.mock import AsyncMock, MagicMock, patch
 from datetime import datetime
 from app.agents.validation import ValidationAgent
 from app.models.invoice import InvoiceStatus
-from app.models.vendor import Vendor, VerificationStatus
+from app.models.vendor import Vendor, VendorFeatures, VerificationStatus
 
 @pytest.mark.asyncio
 async def test_validation_node_success(mock_db, sample_invoice):
@@ -14,12 +14,19 @@ async def test_validation_node_success(mock_db, sample_invoice):
     sample_invoice.invoice_id = "inv_valid"
     sample_invoice.status = InvoiceStatus.EXTRACTION
     mock_db.invoices.get_by_field.return_value = sample_invoice
+    # Extraction counted this invoice along with ten earlier ones
+    total = sample_invoice.data.total
+    sample_invoice.vendor_features_recorded = ["INVOICE"]
+    mock_db.vendor_features.get.return_value = VendorFeatures(
+        company_id="acme", vendor_key="id:ven_1", invoice_count=11,
+        amount_sum=1000.0 + total, amount_sum_squares=10 * 100.0 ** 2 + total * total
+    )
     
     # Mock Vendor (Verified)
     mock_vendor = MagicMock(spec=Vendor)
     mock_vendor.vendor_id = "ven_1"
     mock_vendor.approval_status = "APPROVED" # Fixed field name
-    mock_db.vendors.get_by_field.return_value = mock_vendor
+    mock_db.vendors.resolve.return_value = mock_vendor
     
     # Mock Tools
     with patch("app.agents.validation.duplicate_detector") as mock_dup, \
@@ -32,10 +39,12 @@ async def test_validation_node_success(mock_db, sample_invoice):
         
         mock_db_local.invoices = mock_db.invoices
         mock_db_local.vendors = mock_db.vendors
+        mock_db_local.vendor_features = mock_db.vendor_features
         
         # Async calls
         mock_dup.check_duplicates = AsyncMock(return_value={"is_duplicate": False})
         mock_fraud.check_bank_details_change = AsyncMock(return_value=False)
+        mock_fraud.check_shared_bank_account = AsyncMock(return_value=[])
         mock_ver.initiate_verification = AsyncMock()
         mock_cm.prepare_context_for_llm = AsyncMock(return_value="mock context")
         mock_sm.retrieve_similar_cases = AsyncMock(return_value=[])
@@ -60,6 +69,9 @@ async def test_validation_node_success(mock_db, sample_invoice):
         
         assert result["current_state"] == InvoiceStatus.MATCHING
         assert result["validation_results"]["vat_valid"] is True
+        # Scored against the vendor's other invoices only
+        history = mock_fraud.analyze_fraud_risk.call_args.kwargs["vendor_features"]
+        assert (history.invoice_count, history.amount_mean, history.amount_stddev) == (10, 100.0, 0.0)
 
 @pytest.mark.asyncio
 async def test_validation_node_vat_failure(mock_db, sample_invoice):
@@ -77,9 +89,11 @@ async def test_validation_node_vat_failure(mock_db, sample_invoice):
         
         mock_db_local.invoices = mock_db.invoices
         mock_db_local.vendors = mock_db.vendors
+        mock_db_local.vendor_features = mock_db.vendor_features
         
         mock_dup.check_duplicates = AsyncMock(return_value={"is_duplicate": False})
         mock_fraud.check_bank_details_change = AsyncMock(return_value=False)
+        mock_fraud.check_shared_bank_account = AsyncMock(return_value=[])
         mock_vat.validate_vat = MagicMock(return_value={"valid": False, "details": "Wrong VAT"})
         mock_fraud.analyze_fraud_risk = MagicMock(return_value={"fraud_score": 0.1, "flags": []})
         mock_corr.generate_correction_request = AsyncMock()
@@ -114,9 +128,11 @@ async def test_validation_node_duplicate(mock_db, sample_invoice):
         
         mock_db_local.invoices = mock_db.invoices
         mock_db_local.vendors = mock_db.vendors
+        mock_db_local.vendor_features = mock_db.vendor_features
         
         mock_dup.check_duplicates = AsyncMock(return_value={"is_duplicate": True, "match_type": "EXACT", "conflicting_invoice_id": "OLD-123"})
         mock_fraud.check_bank_details_change = AsyncMock(return_value=False)
+        mock_fraud.check_shared_bank_account = AsyncMock(return_value=[])
         mock_vat.validate_vat = MagicMock(return_value={"valid": True})
         mock_fraud.analyze_fraud_risk = MagicMock(return_value={"fraud_score": 0.0, "flags": []})
         
@@ -136,3 +152,40 @@ async def test_validation_node_duplicate(mock_db, sample_invoice):
         
         assert result["current_state"] == InvoiceStatus.EXCEPTION
         assert result["validation_results"]["is_duplicate"] is True
+
+@pytest.mark.asyncio
+async def test_fuzzy_vendor_match_goes_to_review(mock_db, sample_invoice):
+    sample_invoice.invoice_id = "inv_fuzzy"
+    sample_invoice.status = InvoiceStatus.EXTRACTION
+    mock_db.invoices.get_by_field.return_value = sample_invoice
+    lookalike = Vendor(vendor_id="ven_9", company_id="acme", name="Test Vendors Ltd", approval_status="APPROVED")
+    # No exact match; the fuzzy lookup finds an approved vendor with a similar name
+    mock_db.vendors.resolve = AsyncMock(side_effect=[None, lookalike])
+
+    with patch("app.agents.validation.duplicate_detector") as mock_dup, \
+         patch("app.agents.validation.vat_validator") as mock_vat, \
+         patch("app.agents.validation.fraud_detector") as mock_fraud, \
+         patch("app.agents.validation.db") as mock_db_local, \
+         patch("app.agents.validation.semantic_memory") as mock_sm, \
+         patch("app.agents.validation.context_manager") as mock_cm:
+        mock_db_local.invoices = mock_db.invoices
+        mock_db_local.vendors = mock_db.vendors
+        mock_db_local.vendor_features = mock_db.vendor_features
+        mock_dup.check_duplicates = AsyncMock(return_value={"is_duplicate": False})
+        mock_vat.validate_vat = MagicMock(return_value={"valid": True, "details": "OK"})
+        mock_fraud.analyze_fraud_risk = MagicMock(return_value={"fraud_score": 0.0, "flags": []})
+        mock_cm.prepare_context_for_llm = AsyncMock(return_value="mock context")
+        mock_sm.retrieve_similar_cases = AsyncMock(return_value=[])
+
+        state = {"invoice_id": "inv_fuzzy", "company_id": "acme", "current_state": "VALIDATION",
+                 "invoice_data": sample_invoice.data.model_dump(), "errors": []}
+        result = await ValidationAgent().validation_node(state)
+
+    assert mock_db.vendors.resolve.await_args_list[0].kwargs["fuzzy"] is False
+    assert result["current_state"] == InvoiceStatus.AWAITING_APPROVAL
+    assert result["validation_results"]["vendor_approved"] is False
+    assert "VENDOR_FUZZY_MATCH: Test Vendors Ltd (ven_9)" in result["validation_results"]["flags"]
+    # Neither linked nor checked as if it were the vendor
+    updates = mock_db.invoices.transition.call_args.args[3]
+    assert "data.vendor_id" not in updates
+    mock_fraud.check_bank_details_change.assert_not_called()
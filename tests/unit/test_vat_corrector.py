@@ -0,0 +1,66 @@
+import sys
+import os
+sys.path.append(os.getcwd())
+import pytest
+from datetime import datetime, timedelta
+from unittest.mock import AsyncMock, MagicMock, patch
+from app.agents.vat_corrector import VATCorrector
+from app.models.invoice import CorrectionTracking, Invoice, InvoiceStatus
+from app.repositories.base import BulkWriteSummary
+
+NOW = datetime(2024, 6, 12, 9, 30)
+
+@pytest.mark.asyncio
+async def test_sweep_escalates_only_overdue_corrections_in_one_bulk_write():
+    cursor = MagicMock()
+    cursor.__aiter__.return_value = [{"invoice_id": "INV-1"}, {"invoice_id": "INV-2"}]
+    with patch("app.agents.vat_corrector.db") as mock_db:
+        mock_db.invoices.collection.find.return_value.batch_size.return_value = cursor
+        mock_db.invoices.bulk_update = AsyncMock(return_value=BulkWriteSummary(matched_count=1, modified_count=1))
+
+        escalated = await VATCorrector().sweep_timeouts(now=NOW)
+
+        query, projection = mock_db.invoices.collection.find.call_args[0]
+        assert query["status"] == InvoiceStatus.AWAITING_CORRECTION
+        assert query["correction_tracking.due_date"] == {"$lte": NOW}
+        assert projection == {"invoice_id": 1, "_id": 0}
+        mock_db.invoices.bulk_update.assert_awaited_once()
+        updates = mock_db.invoices.bulk_update.call_args[0][0]
+        assert [f for f, _ in updates] == [
+            {"invoice_id": "INV-1", "status": InvoiceStatus.AWAITING_CORRECTION},
+            {"invoice_id": "INV-2", "status": InvoiceStatus.AWAITING_CORRECTION},
+        ]
+        assert updates[0][1]["$set"]["status"] == InvoiceStatus.EXCEPTION
+        assert updates[0][1]["$set"]["correction_tracking.status"] == "TIMEOUT_ESCALATED"
+        assert updates[0][1]["$inc"] == {"version": 1}
+        # One of the two was resolved between the read and the write
+        assert escalated == 1
+
+@pytest.mark.asyncio
+async def test_sweep_with_nothing_overdue_writes_nothing():
+    cursor = MagicMock()
+    cursor.__aiter__.return_value = []
+    with patch("app.agents.vat_corrector.db") as mock_db:
+        mock_db.invoices.collection.find.return_value.batch_size.return_value = cursor
+        mock_db.invoices.bulk_update = AsyncMock()
+
+        assert await VATCorrector().sweep_timeouts(now=NOW) == 0
+        mock_db.invoices.bulk_update.assert_not_awaited()
+
+@pytest.mark.asyncio
+async def test_handle_timeout_reads_correction_tracking():
+    invoice = Invoice(invoice_id="INV-1", company_id="acme", status=InvoiceStatus.AWAITING_CORRECTION,
+                      correction_tracking=CorrectionTracking(due_date=datetime.utcnow() - timedelta(days=1)))
+    with patch("app.agents.vat_corrector.db") as mock_db:
+        mock_db.invoices.get_by_field = AsyncMock(return_value=invoice)
+        mock_db.invoices.transition = AsyncMock()
+
+        await VATCorrector().handle_timeout("INV-1")
+
+        args = mock_db.invoices.transition.call_args[0]
+        assert args[:3] == ("INV-1", InvoiceStatus.AWAITING_CORRECTION, InvoiceStatus.EXCEPTION)
+
+        invoice.correction_tracking.overridden = True
+        mock_db.invoices.transition.reset_mock()
+        await VATCorrector().handle_timeout("INV-1")
+        mock_db.invoices.transition.assert_not_awaited()
@@ -0,0 +1,127 @@
+import sys
+import os
+sys.path.append(os.getcwd())
+import random
+import pytest
+from datetime import datetime
+from unittest.mock import AsyncMock, MagicMock, patch
+from app.models.invoice import InvoiceData, InvoiceStatus, LineItem
+from app.tools.vat_engine import (
+    MATCH_CODES, MATCH_MIXED, MATCH_NONE, MATCH_RATE, VATBatch, check_invoice, solve_mixed_rates, tax_rate
+)
+from app.tools.vat_validator import VATValidator
+
+def _invoice(subtotal, vat, lines=()):
+    items = [LineItem(item_id=i, description="x", quantity=1, unit_price=net, line_total=net, tax_code=code)
+             for i, (net, code) in enumerate(lines, start=1)]
+    return InvoiceData(vendor_name="Acme", invoice_number="1", invoice_date=datetime(2024, 1, 1),
+                       subtotal=subtotal, vat_amount=vat, total=subtotal + vat, line_items=items)
+
+def test_tax_rate_codes():
+    assert tax_rate("S") == 0.20 and tax_rate(" r ") == 0.05 and tax_rate("Exempt") == 0.0
+    assert tax_rate("20%") == 0.20 and tax_rate("5") == 0.05 and tax_rate("0.05") == 0.05
+    assert tax_rate(None) is None and tax_rate("17.5%") is None and tax_rate("T9") is None
+
+def test_single_rate_without_codes():
+    check = check_invoice(_invoice(100.0, 5.0))
+    assert check.valid and check.match == MATCH_RATE and check.rate == 0.05
+
+def test_coded_lines_fix_each_rate():
+    check = check_invoice(_invoice(150.0, 20.5, [(100.0, "S"), (10.0, "R"), (40.0, "Z")]))
+    assert check.valid and check.match == MATCH_CODES
+    assert check.rate is None and check.line_rates == (0.20, 0.05, 0.0)
+
+    # Codes are trusted: 20% on everything no longer passes once a line says zero-rated
+    check = check_invoice(_invoice(150.0, 30.0, [(100.0, "S"), (50.0, "Z")]))
+    assert not check.valid and check.expected_vat == 20.0
+
+def test_uncoded_lines_take_one_rate_next_to_coded_ones():
+    check = check_invoice(_invoice(150.0, 30.0, [(100.0, "S"), (50.0, None)]))
+    assert check.valid and check.rate == 0.20 and check.line_rates == (0.20, 0.20)
+    check = check_invoice(_invoice(150.0, 20.0, [(100.0, "S"), (50.0, None)]))
+    assert check.valid and check.rate is None and check.line_rates == (0.20, 0.0)
+
+def test_mixed_rates_are_solved():
+    check = check_invoice(_invoice(150.0, 20.5, [(100.0, None), (10.0, None), (40.0, None)]))
+    assert check.valid and check.match == MATCH_MIXED
+    assert check.line_rates == (0.20, 0.05, 0.0) and check.expected_vat == 20.5
+
+def test_no_combination_is_invalid():
+    check = check_invoice(_invoice(150.0, 17.0, [(100.0, None), (50.0, None)]))
+    assert not check.valid and check.match == MATCH_NONE and check.expected_vat == 30.0
+
+def test_lines_not_adding_up_fall_back_to_subtotal():
+    # 20% of the subtotal, though the lines alone would suggest a mix
+    check = check_invoice(_invoice(200.0, 40.0, [(100.0, "Z"), (50.0, None)]))
+    assert check.valid and check.line_numbers == () and check.rate == 0.20
+
+def test_solver_respects_tolerance_and_budget():
+    rates = solve_mixed_rates([33.33, 66.67, 12.0], 6.67 + 0.6)
+    assert rates is not None and abs(sum(n * r for n, r in zip([33.33, 66.67, 12.0], rates)) - 7.27) <= 0.05
+    assert solve_mixed_rates([10.0, 10.0], 3.0) is None
+    with patch("app.tools.vat_engine.MAX_SOLVER_CELLS", 10):
+        assert solve_mixed_rates([100.0, 10.0], 20.5) is None
+
+def test_batch_matches_single_invoice_path():
+    rng = random.Random(11)
+    invoices = []
+    for _ in range(500):
+        lines = [(round(rng.uniform(1, 500), 2), rng.choice([None, None, "S", "R", "Z"])) for _ in range(rng.randint(0, 4))]
+        subtotal = round(sum(net for net, _ in lines), 2) or round(rng.uniform(1, 500), 2)
+        vat = rng.choice([round(subtotal * rng.choice([0.2, 0.05, 0.0]), 2), round(rng.uniform(0, subtotal * 0.2), 2),
+                          round(sum(net * rng.choice([0.2, 0.05, 0.0]) for net, _ in lines), 2)])
+        invoices.append(_invoice(subtotal, vat, lines))
+    assert VATBatch.from_invoices(invoices).checks() == [check_invoice(data) for data in invoices]
+
+def test_validator_details():
+    validator = VATValidator()
+    result = validator.validate_vat(_invoice(150.0, 20.5, [(100.0, None), (10.0, None), (40.0, None)]))
+    assert result["valid"] and result["mixed_rates"]
+    assert result["details"] == "Matches mixed rates: line 1 at 20%; line 2 at 5%; line 3 at 0%"
+    result = validator.validate_vat(_invoice(150.0, 30.0, [(100.0, "S"), (50.0, "Z")]))
+    assert not result["valid"] and "does not match the line tax codes (20.00)" in result["details"]
+
+@pytest.mark.asyncio
+async def test_revalidate_open_invoices_clears_mixed_rate_mismatches():
+    docs = [
+        {"invoice_id": "INV-1", "status": InvoiceStatus.MATCHING, "version": 3,
+         "data": {"subtotal": 150.0, "vat_amount": 20.5, "line_items": [{"item_id": 1, "line_total": 100.0},
+                                                                       {"item_id": 2, "line_total": 10.0},
+                                                                       {"item_id": 3, "line_total": 40.0}]}},
+        {"invoice_id": "INV-2", "status": InvoiceStatus.AWAITING_CORRECTION, "version": 2,
+         "validation": {"vendor_approved": True},
+         "data": {"subtotal": 100.0, "vat_amount": 5.0, "line_items": [{"item_id": 1, "line_total": 100.0, "tax_code": "R"}]}},
+        {"invoice_id": "INV-3", "status": InvoiceStatus.AWAITING_CORRECTION, "version": 2,
+         "data": {"subtotal": 100.0, "vat_amount": 15.0, "line_items": []}},
+        # Unapproved vendor: VAT was checked first, so approval is still ahead
+        {"invoice_id": "INV-4", "status": InvoiceStatus.AWAITING_CORRECTION, "version": 5,
+         "validation": {"vendor_approved": False},
+         "data": {"subtotal": 100.0, "vat_amount": 20.0, "line_items": []}},
+    ]
+    cursor = MagicMock()
+    cursor.__aiter__.return_value = docs
+    with patch("app.tools.vat_validator.db") as mock_db:
+        mock_db.invoices.collection.find.return_value.batch_size.return_value = cursor
+        mock_db.invoices.bulk_update = AsyncMock()
+        mock_db.invoices.transition = AsyncMock()
+
+        passed = await VATValidator().revalidate_open_invoices()
+
+        query, projection = mock_db.invoices.collection.find.call_args[0]
+        assert query["validation.vat_valid"] is False
+        assert "data.line_items.tax_code" in projection and "data.line_items" not in projection
+        assert "validation.vendor_approved" in projection
+        assert passed == 3
+        updates = mock_db.invoices.bulk_update.call_args[0][0]
+        assert [f["invoice_id"] for f, _ in updates] == ["INV-1", "INV-2", "INV-4"]
+        stage = updates[0][1][0]["$set"]
+        assert stage["validation.vat_valid"] is True
+        # Passing only at inferred mixed rates leaves that visible to reviewers
+        assert stage["validation.flags"]["$concatArrays"][1] == [
+            {"$literal": "VAT_MIXED_RATES: Matches mixed rates: line 1 at 20%; line 2 at 5%; line 3 at 0%"}
+        ]
+        assert "$filter" in updates[1][1][0]["$set"]["validation.flags"]
+        # Only invoices waiting on their vendor move on, from the version read, through the approval gate if unapproved
+        calls = [(c.args[:3], c.kwargs["expected_version"]) for c in mock_db.invoices.transition.await_args_list]
+        assert calls == [(("INV-2", InvoiceStatus.AWAITING_CORRECTION, InvoiceStatus.MATCHING), 2),
+                         (("INV-4", InvoiceStatus.AWAITING_CORRECTION, InvoiceStatus.AWAITING_APPROVAL), 5)]
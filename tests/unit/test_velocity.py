@@ -0,0 +1,96 @@
+import sys
+import os
+sys.path.append(os.getcwd())
+import random
+import pytest
+from datetime import datetime, timedelta
+from unittest.mock import AsyncMock, MagicMock, patch
+from app.models.config import ApprovalMatrix, ApprovalRule, CompanyConfig
+from app.models.policy import compile_policy
+from app.tools.velocity import RollingWindow, VelocityTracker, near_approval_threshold
+
+NOW = datetime(2024, 6, 12, 9, 30)
+
+POLICY = compile_policy(CompanyConfig(company_id="acme", company_name="Acme", approval_matrix=ApprovalMatrix(rules=[
+    ApprovalRule(rule_id="r1", amount_min=0, amount_max=5000, specific_approvers=["manager"]),
+    ApprovalRule(rule_id="r2", amount_min=5000.01, required_role="cfo"),
+])))
+
+def test_rolling_window_matches_brute_force():
+    rng = random.Random(5)
+    window = RollingWindow(width=60, buckets=60)
+    events = []
+    t = 0.0
+    for _ in range(3000):
+        t += rng.expovariate(1 / 40) # Bursty arrivals, gaps of up to a few hours
+        amount = round(rng.uniform(1, 500), 2)
+        window.add(t, amount, amount > 400)
+        events.append((t, amount))
+        # The window covers whole buckets: the current one and the 59 before it
+        oldest = (int(t // 60) - 59) * 60
+        inside = [a for at, a in events if at >= oldest]
+        assert window.count == len(inside)
+        assert window.amount == pytest.approx(sum(inside))
+        assert window.near == sum(a > 400 for a in inside)
+
+def test_snapshot_expires_windows():
+    tracker = VelocityTracker()
+    for i in range(5):
+        tracker.add(f"INV-{i}", "acme", "Acme Ltd", None, 100.0, NOW - timedelta(minutes=10 * i))
+    tracker.add("INV-old", "acme", "Acme Ltd", None, 50.0, NOW - timedelta(days=3))
+
+    snapshot = tracker.snapshot("acme", "ACME Limited", now=NOW) # Same normalised vendor name
+    assert (snapshot.count_1h, snapshot.amount_1h) == (5, 500.0)
+    assert (snapshot.count_24h, snapshot.count_30d, snapshot.amount_30d) == (5, 6, 550.0)
+
+    later = tracker.snapshot("acme", "Acme Ltd", now=NOW + timedelta(days=2))
+    assert (later.count_1h, later.count_24h, later.count_30d) == (0, 0, 6)
+    assert tracker.snapshot("acme", "Acme Ltd", now=NOW + timedelta(days=40)).count_30d == 0
+
+def test_keys_by_tenant_and_vendor_and_counts_once():
+    tracker = VelocityTracker()
+    assert tracker.add("INV-1", "acme", "Acme", "V1", 10.0, NOW)
+    assert not tracker.add("INV-1", "acme", "Acme", "V1", 10.0, NOW) # Re-extracted
+    tracker.add("INV-2", "globex", "Acme", "V1", 10.0, NOW)
+    tracker.add("INV-3", "acme", "Acme", None, 10.0, NOW)
+
+    assert tracker.snapshot("acme", "Acme", "V1", now=NOW).count_1h == 1
+    assert tracker.snapshot("globex", "Acme", "V1", now=NOW).count_1h == 1
+    assert tracker.snapshot("acme", "Acme", now=NOW).count_1h == 1
+    assert tracker.snapshot("acme", "Other", now=NOW).count_30d == 0
+
+def test_near_approval_threshold():
+    assert near_approval_threshold(POLICY, 4900.0)
+    assert near_approval_threshold(POLICY, 4750.0)
+    assert not near_approval_threshold(POLICY, 4700.0)
+    assert near_approval_threshold(POLICY, 5000.0) # The most the manager alone can approve
+    assert not near_approval_threshold(POLICY, 5000.01)
+    assert not near_approval_threshold(POLICY, 9000.0) # No bound above
+    assert POLICY.approval_index.next_bound(4900.0) == 5000
+    assert POLICY.approval_index.next_bound(5000.01) is None
+
+@pytest.mark.asyncio
+async def test_record_and_rebuild():
+    docs = [
+        {"invoice_id": f"INV-{i}", "company_id": "acme", "created_at": NOW - timedelta(hours=i),
+         "data": {"total": 4900.0, "vendor_name": "Acme", "vendor_id": "V1"}}
+        for i in range(4)
+    ]
+    cursor = MagicMock()
+    cursor.__aiter__.return_value = docs
+    tracker = VelocityTracker()
+    with patch("app.tools.velocity.db") as mock_db:
+        mock_db.invoices.collection.find.return_value.sort.return_value = cursor
+        mock_db.config.get_policy = AsyncMock(return_value=POLICY)
+
+        assert await tracker.rebuild(now=NOW) == 4
+
+        query, projection = mock_db.invoices.collection.find.call_args.args
+        assert query["created_at"] == {"$gte": NOW - timedelta(days=30)}
+        assert "data.line_items" not in projection and "raw_text" not in projection
+        mock_db.config.get_policy.assert_awaited_once_with("acme") # Once per tenant
+        snapshot = tracker.snapshot("acme", "Acme", "V1", now=NOW)
+        assert (snapshot.count_24h, snapshot.near_threshold_24h, snapshot.count_1h) == (4, 4, 1)
+
+        await tracker.record("INV-9", "acme", "Acme", "V1", 100.0, NOW)
+        assert tracker.snapshot("acme", "Acme", "V1", now=NOW).near_threshold_24h == 4
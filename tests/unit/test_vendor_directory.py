@@ -0,0 +1,104 @@
+import pytest
+from datetime import datetime
+from unittest.mock import MagicMock
+from app.models.vendor import BankDetails, Vendor
+from app.repositories.vendor import (
+    VendorDirectory, VendorRepository, bank_account_keys, normalise_name, normalise_vat
+)
+
+def _vendor(vendor_id, name, vat_number=None, updated_at=datetime(2024, 1, 1)):
+    return Vendor(vendor_id=vendor_id, company_id="acme", name=name, vat_number=vat_number, updated_at=updated_at)
+
+class _Cursor:
+    def __init__(self, docs):
+        self.docs = docs
+
+    def __aiter__(self):
+        return self._iterate()
+
+    async def _iterate(self):
+        for doc in self.docs:
+            yield doc
+
+def test_normalisation():
+    assert normalise_name("  ACME Supplies, Ltd. ") == normalise_name("Acme Supplies Limited") == "acme supplies"
+    assert normalise_name("Smith & Sons") == "smith and sons"
+    assert normalise_vat("gb 123 4567-89") == "GB123456789"
+
+def test_bank_account_keys():
+    domestic = BankDetails(account_name="A", account_number="1234567", sort_code="20-00-00")
+    iban = BankDetails(account_name="A", account_number="", iban="gb29 nwbk 2000 0001 2345 67")
+    foreign = BankDetails(account_name="A", account_number="998877", iban="DE89370400440532013000")
+
+    assert bank_account_keys(domestic) == {"uk:20000001234567"}
+    assert bank_account_keys(iban) == {"iban:GB29NWBK20000001234567", "uk:20000001234567"}
+    assert bank_account_keys(foreign) == {"iban:DE89370400440532013000"} # No sort code, account alone is ambiguous
+    assert bank_account_keys(None) == set()
+
+def test_shared_bank_accounts_follow_vendor_writes():
+    def with_bank(vendor_id, name, **bank):
+        vendor = _vendor(vendor_id, name)
+        vendor.bank_details = BankDetails(account_name=name, **bank)
+        return vendor
+
+    directory = VendorDirectory("acme")
+    v1 = with_bank("V1", "Acme", account_number="12345678", sort_code="200000")
+    directory.put(v1)
+    directory.put(with_bank("V2", "Globex", account_number="", iban="GB29NWBK20000012345678"))
+    directory.put(with_bank("V3", "Initech", account_number="87654321", sort_code="200000"))
+
+    assert directory.sharing_bank_account(v1) == ["V2"]
+    assert directory.sharing_bank_account(directory.get("V3")) == []
+
+    # V2 moves its account away, V3 moves onto V1's
+    directory.put(with_bank("V2", "Globex", account_number="11111111", sort_code="300000"))
+    directory.put(with_bank("V3", "Initech", account_number="12-345-678", sort_code="20 00 00"))
+    assert directory.sharing_bank_account(v1) == ["V3"]
+    directory.remove("V3")
+    assert directory.sharing_bank_account(v1) == []
+
+def test_exact_and_fuzzy_resolution():
+    directory = VendorDirectory("acme")
+    directory.put(_vendor("V1", "Acme Supplies Ltd", vat_number="GB123456789"))
+    directory.put(_vendor("V2", "Northwind Traders"))
+    directory.put(_vendor("V3", "Contoso Cleaning"))
+
+    assert directory.get("V2").name == "Northwind Traders"
+    assert directory.by_vat("GB 123 456 789").vendor_id == "V1"
+    assert directory.by_name("ACME SUPPLIES LIMITED").vendor_id == "V1"
+    # OCR misreads
+    assert directory.resolve(name="Acme Supp1ies Ltd").vendor_id == "V1"
+    assert directory.resolve(name="Northwlnd Tradrs").vendor_id == "V2"
+    assert directory.resolve(name="Northwlnd Tradrs", fuzzy=False) is None
+    assert directory.resolve(name="Globex Corporation") is None
+
+def test_updates_replace_index_entries():
+    directory = VendorDirectory("acme")
+    directory.put(_vendor("V1", "Acme Supplies", vat_number="GB1"))
+    directory.put(_vendor("V1", "Acme Industrial", vat_number="GB2", updated_at=datetime(2024, 2, 1)))
+
+    assert len(directory) == 1
+    assert directory.by_name("Acme Supplies") is None
+    assert directory.by_vat("GB1") is None
+    assert directory.resolve(name="Acme Industrail").vendor_id == "V1"
+    assert directory.synced_to == datetime(2024, 2, 1)
+
+    directory.remove("V1")
+    assert directory.match("Acme Industrial") == []
+
+@pytest.mark.asyncio
+async def test_directory_loads_once_then_refreshes_incrementally():
+    collection = MagicMock()
+    collection.find = MagicMock(return_value=_Cursor([_vendor("V1", "Acme").to_mongo()]))
+    repo = VendorRepository(collection, Vendor, refresh_interval=60)
+
+    assert (await repo.resolve("acme", name="acme ltd")).vendor_id == "V1"
+    await repo.get_by_vendor_id("V1", "acme")
+    collection.find.assert_called_once_with({"company_id": "acme"})
+
+    repo.refresh_interval = 0
+    collection.find.return_value = _Cursor([_vendor("V2", "Globex", updated_at=datetime(2024, 3, 1)).to_mongo()])
+    directory = await repo.directory("acme")
+
+    collection.find.assert_called_with({"company_id": "acme", "updated_at": {"$gte": datetime(2024, 1, 1)}})
+    assert len(directory) == 2
@@ -0,0 +1,159 @@
+import statistics
+import pytest
+from datetime import datetime
+from unittest.mock import AsyncMock, MagicMock
+from app.models.invoice import InvoiceData, InvoiceStatus
+from app.models.vendor import BankDetails, Vendor, VendorFeatures
+from app.repositories.base import BulkWriteSummary
+from app.repositories.vendor_features import VendorFeatureRepository
+from app.tools.fraud_detector import FraudDetector
+from app.tools.vat_validator import VATValidator
+
+AMOUNTS = [100.0, 120.0, 95.5, 130.0, 101.25, 99.0, 110.0, 118.0, 90.0, 105.0]
+
+def _features(amounts=AMOUNTS, vat_rates=None, exceptions=0):
+    return VendorFeatures(company_id="acme", vendor_key="id:V1", vendor_id="V1", invoice_count=len(amounts),
+                          amount_sum=sum(amounts), amount_sum_squares=sum(a * a for a in amounts),
+                          vat_rates=vat_rates or {}, exception_count=exceptions)
+
+def _repo(doc=None, claimed=True):
+    collection = MagicMock()
+    collection.find_one = AsyncMock(return_value=doc)
+    collection.find_one_and_update = AsyncMock(return_value=_features().to_mongo())
+    invoices = MagicMock()
+    invoices.update_one = AsyncMock(return_value=MagicMock(modified_count=int(claimed)))
+    return VendorFeatureRepository(collection, VendorFeatures, invoices=invoices), collection
+
+def test_running_statistics():
+    features = _features(vat_rates={"2000": 9, "0": 1}, exceptions=2)
+
+    assert features.amount_mean == pytest.approx(statistics.mean(AMOUNTS))
+    assert features.amount_stddev == pytest.approx(statistics.pstdev(AMOUNTS))
+    assert features.exception_rate == 0.2
+    assert features.usual_vat_rate() == (0.2, 0.9)
+    assert VendorFeatures(company_id="acme", vendor_key="name:x").usual_vat_rate() is None
+
+@pytest.mark.asyncio
+async def test_record_invoice_is_one_upsert_and_refreshes_cache():
+    repo, collection = _repo()
+    vendor = Vendor(vendor_id="V1", company_id="acme", name="Acme", payment_terms="NET60",
+                    bank_details=BankDetails(account_name="A", account_number="1", last_updated=datetime(2024, 5, 1)))
+
+    recorded = await repo.record_invoice("INV-1", "acme", "Acme", "V1", 120.0, 0.2, vendor)
+
+    filter, update = collection.find_one_and_update.call_args.args
+    assert filter == {"company_id": "acme", "vendor_key": "id:V1"}
+    assert update["$inc"] == {"invoice_count": 1, "amount_sum": 120.0, "amount_sum_squares": 14400.0, "vat_rates.2000": 1}
+    assert update["$set"]["payment_terms"] == "NET60" and update["$set"]["last_bank_change"] == datetime(2024, 5, 1)
+    assert collection.find_one_and_update.call_args.kwargs["upsert"] is True
+    # Served from this process's cache afterwards
+    assert await repo.get("acme", "Acme", "V1") is recorded
+    collection.find_one.assert_not_called()
+
+    await repo.record_exception("INV-2", "acme", "ACME Ltd")
+    filter, update = collection.find_one_and_update.call_args.args
+    assert filter["vendor_key"] == "name:acme" and update["$inc"] == {"exception_count": 1}
+
+@pytest.mark.asyncio
+async def test_recording_claims_the_invoice_once():
+    repo, collection = _repo()
+
+    await repo.record_invoice("INV-1", "acme", "Acme", "V1", 120.0)
+    filter, update = repo.invoices.update_one.call_args.args
+    assert filter == {"invoice_id": "INV-1", "vendor_features_recorded": {"$ne": "INVOICE"}}
+    assert update == {"$addToSet": {"vendor_features_recorded": "INVOICE"}}
+
+    # A retry finds the marker set and counts nothing
+    repo.invoices.update_one.return_value = MagicMock(modified_count=0)
+    collection.find_one_and_update.reset_mock()
+    assert await repo.record_invoice("INV-1", "acme", "Acme", "V1", 120.0) is None
+    assert await repo.record_exception("INV-1", "acme", "Acme", "V1") is None
+    collection.find_one_and_update.assert_not_called()
+    assert repo.invoices.update_one.call_args.args[0]["vendor_features_recorded"] == {"$ne": "EXCEPTION"}
+
+@pytest.mark.asyncio
+async def test_reads_are_cached_including_unknown_vendors():
+    repo, collection = _repo(doc=None)
+
+    assert await repo.get("acme", "Nobody") is None
+    assert await repo.get("acme", "Nobody") is None
+    collection.find_one.assert_awaited_once()
+
+@pytest.mark.asyncio
+async def test_rebuild_aggregates_invoice_history():
+    docs = [
+        {"company_id": "acme", "status": InvoiceStatus.PAID, "data": {"vendor_name": "Acme", "vendor_id": "V1", "total": 100.0, "vat_rate": 0.2}},
+        {"company_id": "acme", "status": InvoiceStatus.EXCEPTION, "data": {"vendor_name": "Acme", "vendor_id": "V1", "total": 50.0}},
+        {"company_id": "acme", "status": InvoiceStatus.PAID, "data": {"vendor_name": "Other Ltd", "total": 10.0, "vat_rate": 0.0}},
+    ]
+    cursor = MagicMock()
+    cursor.__aiter__.return_value = docs
+    repo, _ = _repo()
+    repo.bulk_upsert = AsyncMock(return_value=BulkWriteSummary(upserted_count=2))
+
+    assert await repo.rebuild(cursor) == 2
+
+    features, = repo.bulk_upsert.call_args.args
+    by_key = {f.vendor_key: f for f in features}
+    v1 = by_key["id:V1"]
+    assert (v1.invoice_count, v1.amount_sum, v1.amount_sum_squares, v1.exception_count) == (2, 150.0, 12500.0, 1)
+    assert v1.vat_rates == {"2000": 1} and by_key["name:other"].vat_rates == {"0": 1}
+    assert "last_bank_change" in repo.bulk_upsert.call_args.kwargs["insert_only"]
+
+def test_vat_rate_unusual_for_vendor():
+    validator = VATValidator()
+    invoice = InvoiceData(vendor_name="Acme", invoice_number="1", invoice_date=datetime(2024, 6, 10),
+                          subtotal=100.0, vat_amount=20.0, total=120.0)
+
+    assert validator.validate_vat(invoice)["unusual_for_vendor"] is False
+    assert validator.validate_vat(invoice, _features(vat_rates={"2000": 10}))["unusual_for_vendor"] is False
+    result = validator.validate_vat(invoice, _features(vat_rates={"0": 10}))
+    assert result["valid"] and result["unusual_for_vendor"]
+    assert result["details"] == "Matches Standard Rate (20%); vendor usually charges 0%"
+    # Mixed history is not a pattern
+    assert validator.validate_vat(invoice, _features(vat_rates={"0": 8, "2000": 2}))["unusual_for_vendor"] is False
+
+def test_amount_outlier_rule():
+    detector = FraudDetector()
+    history = _features()
+    invoice = lambda total: InvoiceData(vendor_name="Acme", invoice_number="1", invoice_date=datetime(2024, 6, 10),
+                                        total=total, line_items=[])
+
+    flags = lambda total, features: detector.analyze_fraud_risk(invoice(total), vendor_features=features)["flags"]
+    assert "AMOUNT_OUTLIER" in flags(185.5, history)
+    assert "AMOUNT_OUTLIER" not in flags(125.5, history)
+    assert "AMOUNT_OUTLIER" not in flags(185.5, _features(AMOUNTS[:5])) # Too little history
+
+def test_excluding_removes_one_invoice():
+    features = _features(AMOUNTS + [185.5], vat_rates={"2000": 10, "0": 1})
+
+    others = features.excluding(185.5, 0.0)
+    assert others.invoice_count == len(AMOUNTS)
+    assert others.amount_mean == pytest.approx(statistics.mean(AMOUNTS))
+    assert others.amount_stddev == pytest.approx(statistics.pstdev(AMOUNTS))
+    assert others.vat_rates == {"2000": 10}
+    assert features.invoice_count == len(AMOUNTS) + 1 # Cached features are left alone
+
+@pytest.mark.asyncio
+async def test_outlier_scored_against_other_invoices():
+    """An invoice counted at extraction must not pull the vendor's statistics towards itself."""
+    repo, collection = _repo()
+    stored = {}
+    async def upsert(filter, update, **kwargs):
+        doc = stored.setdefault("doc", {**filter, "invoice_count": 0, "amount_sum": 0.0, "amount_sum_squares": 0.0})
+        for field, value in update["$inc"].items():
+            doc[field] = doc.get(field, 0) + value
+        return doc
+    collection.find_one_and_update = AsyncMock(side_effect=upsert)
+    for n, amount in enumerate(AMOUNTS):
+        await repo.record_invoice(f"INV-{n}", "acme", "Acme", "V1", amount)
+    await repo.record_invoice("INV-X", "acme", "Acme", "V1", 185.5)
+
+    invoice = InvoiceData(vendor_name="Acme", vendor_id="V1", invoice_number="X", invoice_date=datetime(2024, 6, 10),
+                          total=185.5, line_items=[])
+    features = await repo.get("acme", "Acme", "V1")
+    detector = FraudDetector()
+    # Including itself, ten invoices cap the z-score at 3 and the rule could never fire
+    assert "AMOUNT_OUTLIER" not in detector.analyze_fraud_risk(invoice, vendor_features=features)["flags"]
+    others = features.excluding(invoice.total, invoice.vat_rate)
+    assert "AMOUNT_OUTLIER" in detector.analyze_fraud_risk(invoice, vendor_features=others)["flags"]